@@ -12,17 +12,13 @@ import time
 import logging
 from accounts.models import CustomUser
 from dashboard.models import BiometricRegistration, Course
+from dashboard.biometric_devices import device_topic
 from dashboard.mqtt_client import get_mqtt_client
 from django.utils import timezone
-from django.core.cache import cache
-from django.db.models import Max
 from threading import Lock
 
 logger = logging.getLogger(__name__)
 
-ENROLLMENT_LOCK_KEY = "biometric_enrollment_lock"
-ENROLLMENT_LOCK_TTL_SECONDS = 5 * 60
-
 # Global dictionaries to track enrollment mappings
 # template_id -> enrollment_id (for WebSocket routing)
 enrollment_id_map = {}
@@ -72,7 +68,7 @@ def start_fingerprint_enrollment(request):
     }
     """
     try:
-        from dashboard.enrollment_state import create_enrollment_state, cleanup_old_enrollments, get_all_states
+        from dashboard.enrollment_scheduler import EnrollmentRejected, request_enrollment
         
         data = json.loads(request.body)
         student_id = data.get('student_id')
@@ -107,216 +103,46 @@ def start_fingerprint_enrollment(request):
                 'message': f'Student with ID {student_id} not found'
             }, status=404)
         
-        # Global lock: allow only ONE active enrollment at a time to avoid slot conflicts.
-        lock_payload = {
-            'student_id': student.school_id,
-            'student_user_id': student.id,
-            'template_id': template_id,
-            'enrollment_id': enrollment_id,
-            'created_at': timezone.now().isoformat(),
-        }
-
-        lock_acquired = cache.add(ENROLLMENT_LOCK_KEY, lock_payload, timeout=ENROLLMENT_LOCK_TTL_SECONDS)
-        if not lock_acquired:
-            existing_lock = cache.get(ENROLLMENT_LOCK_KEY)
-            try:
-                if existing_lock and existing_lock.get('student_user_id') == student.id:
-                    cache.set(ENROLLMENT_LOCK_KEY, lock_payload, timeout=ENROLLMENT_LOCK_TTL_SECONDS)
-                else:
-                    locked_by = (existing_lock or {}).get('student_id') or 'another student'
-                    return JsonResponse({
-                        'status': 'blocked',
-                        'message': f'Another student is currently enrolling ({locked_by}). Please wait...'
-                    }, status=409)
-            except Exception:
-                return JsonResponse({
-                    'status': 'blocked',
-                    'message': 'Another student is currently enrolling. Please wait...'
-                }, status=409)
-
         # Get course by id
         try:
             course = Course.objects.get(id=course_id, is_active=True, deleted_at__isnull=True, is_archived=False)
         except Course.DoesNotExist:
-            cache.delete(ENROLLMENT_LOCK_KEY)
             return JsonResponse({
                 'status': 'error',
                 'message': 'Course not found'
             }, status=404)
         
-        # Check if already enrolled for this course
-        existing = BiometricRegistration.objects.filter(
-            student=student,
-            course=course,
-            is_active=True
-        ).first()
-        
-        # CRITICAL FIX: Clean up old enrollments from previous attempts
-        # This prevents state collision when re-registering
-        print(f"[API] Cleaning up old enrollments for user {student.id}, course {course_id}...")
-        cleanup_old_enrollments(student.id, course_id)
-        
-        # Allow re-enrollment: if already enrolled, we'll update with a new fingerprint
-        # This lets students re-register if they want to update their fingerprint
-        old_slot = None
-        if existing and existing.fingerprint_id:
-            old_slot = existing.fingerprint_id
-            print(f"[ENROLLMENT] Student {student_id} is re-enrolling. Old slot: {old_slot}")
-        
-        # Allocate fingerprint slot in reserved range >= 100 to avoid collisions with legacy IDs.
-        available_slot = None
+        # Join the enrollment queue: starts right away on a free sensor, otherwise waits
+        # for one in FIFO order (see dashboard/enrollment_scheduler.py)
         try:
-            if old_slot is not None and int(old_slot) >= 100:
-                available_slot = int(old_slot)
-        except Exception:
-            available_slot = None
-
-        if available_slot is None:
-            existing_student_slot = BiometricRegistration.objects.filter(
-                student=student,
-                is_active=True,
-                fingerprint_id__gte=100,
-            ).order_by('-created_at').values_list('fingerprint_id', flat=True).first()
-            try:
-                if existing_student_slot is not None and int(existing_student_slot) >= 100:
-                    available_slot = int(existing_student_slot)
-            except Exception:
-                available_slot = None
-
-        if available_slot is None:
-            max_existing_slot = BiometricRegistration.objects.aggregate(max_id=Max('fingerprint_id'))['max_id'] or 99
-            try:
-                max_existing_slot = int(max_existing_slot)
-            except Exception:
-                max_existing_slot = 99
-            available_slot = max(100, max_existing_slot + 1)
-
-        # Ensure we don't exceed sensor capacity (R307 typically supports 300 templates)
-        if available_slot and int(available_slot) > 300:
-            try:
-                cache.delete(ENROLLMENT_LOCK_KEY)
-            except Exception:
-                pass
+            ticket = request_enrollment(student, course, enrollment_id, template_id)
+        except EnrollmentRejected as e:
+            logger.warning(f"[API] Enrollment {enrollment_id} rejected: {e}")
             return JsonResponse({
                 'status': 'error',
-                'message': 'No available fingerprint slots (sensor capacity reached).'
-            }, status=400)
+                'message': str(e)
+            }, status=e.status)
         
-        # Create or update biometric registration
-        biometric, created = BiometricRegistration.objects.update_or_create(
-            student=student,
-            course=course,
-            defaults={
-                'fingerprint_id': available_slot,
-                'is_active': True,
-                'biometric_type': 'fingerprint'
-            }
-        )
-        
-        # CRITICAL FIX: Use centralized enrollment state instead of old mapping
-        logger.info(f"[API] Creating enrollment in centralized state...")
-        logger.info(f"[API]   enrollment_id: {enrollment_id}")
-        logger.info(f"[API]   template_id: {template_id}")
-        logger.info(f"[API]   slot: {available_slot}")
-        
-        create_enrollment_state(
-            enrollment_id=enrollment_id,
-            user_id=student.id,
-            course_id=course_id,
-            template_id=template_id,  # Store the template_id from frontend
-            is_re_registration=existing is not None,
-            old_fingerprint_id=existing.fingerprint_id if existing else None
-        )
-
-        try:
-            from dashboard.enrollment_state import _enrollment_states
-            if enrollment_id in _enrollment_states:
-                _enrollment_states[enrollment_id]['fingerprint_slot'] = available_slot
-        except Exception:
-            pass
-        
-        logger.info(f"[API] Enrollment created in centralized state with template_id={template_id}")
-        
-        # ==================== SEND ENROLLMENT REQUEST TO ESP32 VIA MQTT ====================
-        # This tells the ESP32 to start waiting for 3 finger scans
-        mqtt_client = get_mqtt_client()
-        
-        logger.info(f"[API] ===== SENDING MQTT ENROLLMENT REQUEST =====")
-        logger.info(f"[API] MQTT client exists: {mqtt_client is not None}")
-        logger.info(f"[API] MQTT is_connected: {mqtt_client.is_connected if mqtt_client else 'N/A'}")
-        
-        if not mqtt_client or not mqtt_client.is_connected:
-            try:
-                from dashboard.enrollment_state import delete_enrollment_state
-                delete_enrollment_state(enrollment_id)
-            except Exception:
-                pass
-
-            try:
-                current_lock = cache.get(ENROLLMENT_LOCK_KEY)
-                if current_lock and current_lock.get('student_user_id') == student.id:
-                    cache.delete(ENROLLMENT_LOCK_KEY)
-            except Exception:
-                pass
-
-            return JsonResponse(
-                {
-                    "status": "error",
-                    "message": "MQTT broker not connected. Please wait a moment and try again.",
-                },
-                status=503,
-            )
-
-        if mqtt_client and mqtt_client.is_connected:
-            enrollment_request = {
-                'action': 'start',
+        if ticket['queue_status'] == 'waiting':
+            logger.info(f"[API] Enrollment {enrollment_id} queued at position {ticket['queue_position']}")
+            return JsonResponse({
+                'status': 'queued',
+                'message': 'All sensors are busy. You will be called up automatically.',
+                'enrollment_id': enrollment_id,
                 'template_id': template_id,
-                'slot': available_slot,
-                'scans_required': 3
-            }
-            
-            topic = 'biometric/esp32/enroll/request'
-            logger.info(f"[API] Publishing to topic: {topic}")
-            logger.info(f"[API] Payload: {enrollment_request}")
-            
-            # Use retain=True so if ESP32 briefly disconnects (common on weak WiFi),
-            # it will still receive the latest start command immediately on reconnect.
-            success = mqtt_client.publish(topic, enrollment_request, qos=1, retain=True)
-            
-            logger.info(f"[API] MQTT publish result: {success}")
-            if success:
-                logger.info(f"[API] Sent enrollment request to ESP32")
-                logger.info(f"[API]   Template ID: {template_id}")
-                logger.info(f"[API]   Slot: {available_slot}")
-            else:
-                logger.warning(f"[API] Failed to publish enrollment request to ESP32")
-                try:
-                    from dashboard.enrollment_state import delete_enrollment_state
-                    delete_enrollment_state(enrollment_id)
-                except Exception:
-                    pass
-
-                try:
-                    current_lock = cache.get(ENROLLMENT_LOCK_KEY)
-                    if current_lock and current_lock.get('student_user_id') == student.id:
-                        cache.delete(ENROLLMENT_LOCK_KEY)
-                except Exception:
-                    pass
-
-                return JsonResponse(
-                    {
-                        "status": "error",
-                        "message": "Failed to send enrollment request to ESP32. Please try again.",
-                    },
-                    status=502,
-                )
+                'queue_position': ticket['queue_position'],
+                'eta_seconds': ticket['eta_seconds'],
+                'next_step': 'Keep this page open until a sensor is assigned to you'
+            }, status=202)
         
+        logger.info(f"[API] Enrollment {enrollment_id} started on {ticket['device_id']} (slot {ticket['slot']})")
         return JsonResponse({
             'status': 'success',
             'message': 'Enrollment started',
             'enrollment_id': enrollment_id,
             'template_id': template_id,
-            'slot': available_slot,
+            'slot': ticket['slot'],
+            'device_id': ticket['device_id'],
             'next_step': 'Place your finger on the sensor 3 times'
         })
         
@@ -328,13 +154,6 @@ def start_fingerprint_enrollment(request):
     except Exception as e:
         import traceback
         traceback.print_exc()
-        try:
-            # best-effort lock cleanup if we acquired it
-            current_lock = cache.get(ENROLLMENT_LOCK_KEY)
-            if current_lock and current_lock.get('template_id') == data.get('template_id'):
-                cache.delete(ENROLLMENT_LOCK_KEY)
-        except Exception:
-            pass
         return JsonResponse({
             'status': 'error',
             'message': str(e)
@@ -374,6 +193,14 @@ def cancel_fingerprint_enrollment(request):
                 'message': 'Student not found'
             }, status=404)
         
+        # Queued or running enrollment: leave the queue / free the sensor it holds
+        from dashboard.enrollment_scheduler import cancel_student_enrollment
+        if cancel_student_enrollment(student) is not None:
+            return JsonResponse({
+                'status': 'success',
+                'message': 'Enrollment cancelled'
+            })
+        
         # Find active enrollment
         biometric = BiometricRegistration.objects.filter(
             student=student,
@@ -386,14 +213,6 @@ def cancel_fingerprint_enrollment(request):
                 'message': 'No enrollment in progress'
             }, status=404)
         
-        # Release global lock (best-effort)
-        try:
-            current_lock = cache.get(ENROLLMENT_LOCK_KEY)
-            if current_lock and current_lock.get('student_user_id') == student.id:
-                cache.delete(ENROLLMENT_LOCK_KEY)
-        except Exception:
-            pass
-
         # Cancel via MQTT
         mqtt_client = get_mqtt_client()
         if mqtt_client and mqtt_client.is_connected and biometric.fingerprint_id:
@@ -402,7 +221,7 @@ def cancel_fingerprint_enrollment(request):
                     'action': 'cancel_enrollment',
                     'slot': biometric.fingerprint_id
                 }
-                mqtt_client.publish('biometric/esp32/enroll/request', cancel_request, qos=1)
+                mqtt_client.publish(device_topic(None, 'enroll/request'), cancel_request, qos=1)
                 logger.info(f"[API] Sent cancel enrollment request for slot {biometric.fingerprint_id}")
             except Exception as e:
                 logger.error(f"[API] Failed to send cancel request: {e}")
@@ -464,11 +283,15 @@ def get_enrollment_status(request):
                 'enrolled_at': bio.created_at.isoformat() if bio.created_at else None
             })
         
+        # Enrollment waiting for (or running on) a sensor: queue position, ETA, device
+        from dashboard.enrollment_scheduler import student_queue_status
+        
         return JsonResponse({
             'status': 'success',
             'student_id': student_id,
             'enrollments': enrollments,
-            'total_enrolled': sum(1 for e in enrollments if e['is_enrolled'])
+            'total_enrolled': sum(1 for e in enrollments if e['is_enrolled']),
+            'queue': student_queue_status(student)
         })
         
     except Exception as e:
@@ -663,7 +486,7 @@ def start_attendance_detection(request):
             'schedule_id': schedule_id
         }
         
-        topic = 'biometric/esp32/detect/request'
+        topic = device_topic(data.get('device_id'), 'detect/request')  # Default sensor unless one is named
         success = mqtt_client.publish(topic, detection_request, qos=1)
         
         if success:
@@ -836,7 +659,7 @@ def stop_attendance_detection(request):
             'session_id': session_id
         }
         
-        topic = 'biometric/esp32/detect/request'
+        topic = device_topic(data.get('device_id'), 'detect/request')
         success = mqtt_client.publish(topic, stop_request, qos=1)
         
         if success:
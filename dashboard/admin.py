@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Department, Program, Course, CourseSchedule, AdminNotification, UserTemporaryPassword
+from .models import Department, Program, Course, CourseSchedule, AdminNotification, UserTemporaryPassword, BiometricDevice, EnrollmentQueueEntry, DeviceTelemetry, SensorSlotMap, SlotReservation, AttendanceFinalization
 
 
 # ============================================
@@ -280,3 +280,66 @@ admin.site.index_title = "Welcome to Attendance System Administration"
 #    - Custom Users
 #
 # The ordering is controlled by the model Meta classes and admin registration order.
+
+
+@admin.register(BiometricDevice)
+class BiometricDeviceAdmin(admin.ModelAdmin):
+    """Admin interface for BiometricDevice model (fingerprint sensors taking enrollments)"""
+    list_display = ['device_id', 'name', 'location', 'is_active', 'payload_codec', 'created_at']
+    list_filter = ['is_active', 'payload_codec']
+    search_fields = ['device_id', 'name', 'location']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(EnrollmentQueueEntry)
+class EnrollmentQueueEntryAdmin(admin.ModelAdmin):
+    """Admin interface for EnrollmentQueueEntry model (fingerprint enrollment queue)"""
+    list_display = ['enrollment_id', 'student', 'course', 'status', 'device_id', 'slot', 'enqueued_at', 'started_at', 'finished_at']
+    list_filter = ['status', 'device_id', 'enqueued_at']
+    search_fields = ['enrollment_id', 'template_id', 'student__username', 'student__full_name', 'student__school_id']
+    readonly_fields = ['enqueued_at', 'started_at', 'finished_at']
+    
+    def get_queryset(self, request):
+        """Optimize queryset"""
+        qs = super().get_queryset(request)
+        return qs.select_related('student', 'course')
+
+
+@admin.register(DeviceTelemetry)
+class DeviceTelemetryAdmin(admin.ModelAdmin):
+    """Admin interface for DeviceTelemetry model (per-sensor health buckets, written by the MQTT ingest)"""
+    list_display = ['device_id', 'bucket_start', 'messages', 'heartbeats', 'detections', 'reconnects', 'rssi_avg', 'uptime_seconds']
+    list_filter = ['device_id']
+    date_hierarchy = 'bucket_start'
+    readonly_fields = [f.name for f in DeviceTelemetry._meta.fields]
+
+
+@admin.register(SensorSlotMap)
+class SensorSlotMapAdmin(admin.ModelAdmin):
+    """Admin interface for SensorSlotMap model (fingerprint slot bitmap per sensor)"""
+    list_display = ['device_id', 'capacity', 'used_slots', 'reconciled_at', 'updated_at']
+    readonly_fields = ['device_id', 'capacity', 'used_slots', 'reconciled_at', 'updated_at']
+    exclude = ['bitmap']
+
+    def used_slots(self, obj):
+        from .slot_allocator import bits_of
+        return bin(bits_of(obj.bitmap)).count('1')
+    used_slots.short_description = 'Used slots'
+
+
+@admin.register(SlotReservation)
+class SlotReservationAdmin(admin.ModelAdmin):
+    """Admin interface for SlotReservation model (slots held by the direct enrollment APIs)"""
+    list_display = ['reference', 'device_id', 'slot', 'expires_at', 'created_at']
+    list_filter = ['device_id']
+    search_fields = ['reference']
+    readonly_fields = ['reference', 'device_id', 'slot', 'expires_at', 'created_at']
+
+
+@admin.register(AttendanceFinalization)
+class AttendanceFinalizationAdmin(admin.ModelAdmin):
+    """Admin interface for AttendanceFinalization model (sessions finalized by the finalize_attendance scheduler)"""
+    list_display = ['course', 'session_date', 'session_end', 'finalized_at', 'created_records']
+    list_filter = ['session_date']
+    search_fields = ['course__code', 'course__name']
+    readonly_fields = ['course', 'session_date', 'session_end', 'finalized_at', 'created_records']
@@ -11,6 +11,7 @@ from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from .models import BiometricRegistration, CourseEnrollment, Course
+from .enrollment_state import _enrollment_states as enrollment_states
 from accounts.models import CustomUser
 
 logger = logging.getLogger(__name__)
@@ -18,9 +19,6 @@ logger = logging.getLogger(__name__)
 # ESP32 Server Address
 ESP32_SERVER = getattr(settings, 'ESP32_SERVER', 'http://192.168.1.8')  # Default to 192.168.1.8
 
-# In-memory store for current enrollment states (in production, use Redis or database)
-enrollment_states = {}
-
 @csrf_exempt
 @require_http_methods(["POST"])
 def api_start_enrollment(request):
@@ -256,23 +254,26 @@ def update_enrollment_progress(enrollment_id, current_scan, progress, message, f
     Called by ESP32 API endpoints when broadcasting updates
     """
     if enrollment_id in enrollment_states:
-        enrollment_states[enrollment_id].update({
+        fields = {
             'current_scan': current_scan,
             'progress': progress,
             'message': message,
             'updated_at': datetime.now().isoformat()
-        })
+        }
         
         if fingerprint_id:
-            enrollment_states[enrollment_id]['fingerprint_id'] = fingerprint_id
+            fields['fingerprint_id'] = fingerprint_id
         
         if error:
-            enrollment_states[enrollment_id]['error'] = error
-            enrollment_states[enrollment_id]['status'] = 'failed'
+            fields['error'] = error
+            fields['status'] = 'failed'
         
         # Auto-complete at 100%
         if progress >= 100:
-            enrollment_states[enrollment_id]['status'] = 'completed'
+            fields['status'] = 'completed'
+        
+        # One atomic write to the shared store
+        enrollment_states[enrollment_id].update(fields)
         
         logger.debug(f"[ENROLLMENT] Updated {enrollment_id}: Scan {current_scan}, Progress {progress}%")
 
@@ -1,10 +1,24 @@
 from django.apps import AppConfig
 import logging
 import os
+import sys
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+# Management commands that serve requests; every other command (migrate, finalize_attendance,
+# reconcile_fingerprint_slots, ...) must not take the ingest lease: a short-lived one would hold
+# it without a broker connection after exiting, a long-running one would become the ingest.
+SERVER_COMMANDS = {'runserver', 'runserver_plus'}
+
+
+def is_management_command():
+    """True when running under manage.py / django-admin with a command other than runserver"""
+    program = os.path.basename(sys.argv[0]) if sys.argv else ''
+    if program not in ('manage.py', 'django-admin', 'django-admin.py', '__main__.py'):
+        return False
+    return len(sys.argv) < 2 or sys.argv[1] not in SERVER_COMMANDS
+
 
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -12,16 +26,26 @@ class DashboardConfig(AppConfig):
     verbose_name = '📚 Institutional Setup'
     
     def ready(self):
-        """Initialize MQTT client when Django starts"""
+        """Join the MQTT ingest election when Django starts"""
+        # Cache invalidation must be wired in every process, including the dev server's reloader
+        from dashboard import biometric_devices, fingerprint_index, session_qr
+        fingerprint_index.connect_signals()
+        biometric_devices.connect_signals()
+        session_qr.connect_signals()
+
         try:
             # Django dev server (StatReloader) runs app init twice; only start MQTT in the main process.
             if settings.DEBUG and os.environ.get('RUN_MAIN') != 'true':
                 return
+            # Only web server processes compete for the ingest lease
+            if is_management_command():
+                return
 
-            from dashboard.mqtt_client import get_mqtt_client
-            mqtt_client = get_mqtt_client()
-            logger.info("[INIT] ✓ MQTT client initialized on Django startup")
+            # One process holds the broker connection; the rest publish through the outbox
+            from dashboard.mqtt_ingest import start_standby_ingest
+            start_standby_ingest()
+            logger.info("[INIT] ✓ MQTT ingest standby started on Django startup")
         except Exception as e:
-            logger.error(f"[INIT] ✗ Failed to initialize MQTT client: {e}")
+            logger.error(f"[INIT] ✗ Failed to start MQTT ingest standby: {e}")
             import traceback
             traceback.print_exc()
@@ -0,0 +1,292 @@
+"""
+Bulk ingest of offline attendance scans.
+Instructor devices keep collecting registered-QR and school-ID scans while the
+Wi-Fi is down and upload them in one request once the connection is back.
+
+The whole batch is resolved with a handful of set-based queries (students, QR
+registrations, enrollments, schedules, existing records) and written with a single
+bulk upsert inside one transaction, instead of one request + ~8 queries per scan.
+Present/late is decided from each scan's own timestamp (see attendance_rules), against
+the day's CourseSchedule or, for courses without one, the course-level days and times.
+A malformed item is rejected on its own; it never fails the rest of the batch.
+"""
+
+import logging
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .attendance_finalizer import course_days
+from .attendance_rules import determine_attendance_status, to_ph_time
+from .qr_registry import normalize_qr_key, sibling_courses
+from .session_qr import WEEKDAY_SHORT, now_ph
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 1000
+MAX_SCAN_AGE = timedelta(days=7)  # Older uploads are almost certainly stale device queues
+MAX_CLOCK_SKEW = timedelta(minutes=2)
+
+SCAN_KIND_QR = 'qr_code'
+SCAN_KIND_SCHOOL_ID = 'school_id'
+
+ScanResult = namedtuple('ScanResult', ['index', 'client_id', 'success', 'status', 'student_id', 'student_name', 'message'])
+
+
+class BatchValidationError(ValueError):
+    """The batch as a whole is unusable (not a list, too large, ...)"""
+
+
+def parse_scanned_at(value):
+    """
+    Parse a scan timestamp sent by the device.
+
+    Accepts ISO-8601 strings (naive values are PH local time) or epoch
+    seconds/milliseconds. Returns an aware PH datetime, or None.
+    """
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        seconds = value / 1000.0 if value > 1e11 else float(value)
+        try:
+            return to_ph_time(datetime.fromtimestamp(seconds, tz=dt_timezone.utc))
+        except (OverflowError, OSError, ValueError):
+            return None
+    try:
+        parsed = parse_datetime(str(value).strip())
+    except ValueError:
+        return None
+    return to_ph_time(parsed) if parsed else None
+
+
+def _scan_value(item, key):
+    """Stripped text of a qr_code/school_id field; None when it is not text or a number"""
+    value = item.get(key)
+    if value is None:
+        return ''
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        return None
+    return str(value).strip()
+
+
+def _extract_school_id(value):
+    match = re.search(r'\b(\d{6,})\b', value)
+    return match.group(1) if match else None
+
+
+def ingest_offline_scans(instructor, course, scans, current_time=None):
+    """
+    Record a batch of offline scans for one course.
+
+    Args:
+        instructor (CustomUser): Instructor uploading the batch (owner of `course`)
+        course (Course): Course the scans were taken for
+        scans (list[dict]): Items like {"qr_code": "...", "scanned_at": "...", "client_id": "..."}
+            or {"school_id": "...", "scanned_at": ...}
+        current_time (datetime): Override for "now" (defaults to PH time)
+
+    Returns:
+        list[ScanResult]: One result per input item, in input order
+
+    Raises:
+        BatchValidationError: If `scans` is not a list or exceeds MAX_BATCH_SIZE
+    """
+    from accounts.models import CustomUser
+    from dashboard.models import AttendanceRecord, CourseEnrollment, CourseSchedule, QRCodeRegistration
+
+    if not isinstance(scans, list):
+        raise BatchValidationError('scans must be a list.')
+    if len(scans) > MAX_BATCH_SIZE:
+        raise BatchValidationError(f'Too many scans in one batch (max {MAX_BATCH_SIZE}).')
+
+    current_time = current_time or now_ph()
+    results = [None] * len(scans)
+
+    def fail(index, client_id, message):
+        results[index] = ScanResult(index, client_id, False, None, None, None, message)
+
+    # 1) Validate items and collect lookup keys
+    pending = []  # (index, client_id, kind, raw_value, lookup_key, scanned_at)
+    for index, item in enumerate(scans):
+        if not isinstance(item, dict):
+            fail(index, None, 'Invalid scan item.')
+            continue
+        client_id = item.get('client_id')
+        qr_raw = _scan_value(item, 'qr_code')
+        school_raw = _scan_value(item, 'school_id')
+        if qr_raw is None or school_raw is None:
+            fail(index, client_id, 'qr_code and school_id must be text.')
+            continue
+        scanned_at = parse_scanned_at(item.get('scanned_at'))
+        if not qr_raw and not school_raw:
+            fail(index, client_id, 'Missing qr_code or school_id.')
+            continue
+        if scanned_at is None:
+            fail(index, client_id, 'Missing or invalid scanned_at.')
+            continue
+        if scanned_at > current_time + MAX_CLOCK_SKEW:
+            fail(index, client_id, 'Scan time is in the future.')
+            continue
+        if scanned_at < current_time - MAX_SCAN_AGE:
+            fail(index, client_id, 'Scan is too old to record.')
+            continue
+        if qr_raw:
+            pending.append((index, client_id, SCAN_KIND_QR, qr_raw, normalize_qr_key(qr_raw), scanned_at))
+        else:
+            pending.append((index, client_id, SCAN_KIND_SCHOOL_ID, school_raw, school_raw, scanned_at))
+
+    if not pending:
+        return results
+
+    # 2) Resolve students in bulk
+    sibling_course_ids = list(sibling_courses(course, instructor).values_list('id', flat=True))
+    if course.id not in sibling_course_ids:
+        sibling_course_ids.append(course.id)
+
+    qr_keys = {key for _, _, kind, _, key, _ in pending if kind == SCAN_KIND_QR and key}
+    student_by_qr = {}
+    if qr_keys:
+        # Registrations on this course win over sibling sections
+        rows = QRCodeRegistration.objects.filter(
+            qr_key__in=qr_keys,
+            course_id__in=sibling_course_ids,
+            is_active=True,
+        ).values_list('qr_key', 'student_id', 'course_id')
+        for key, student_id, reg_course_id in rows:
+            if key not in student_by_qr or reg_course_id == course.id:
+                student_by_qr[key] = student_id
+
+    school_values = {raw for _, _, kind, raw, _, _ in pending if kind == SCAN_KIND_SCHOOL_ID}
+    extracted_ids = {_extract_school_id(raw) for raw in school_values} - {None}
+    student_by_school_value = {}
+    if school_values:
+        lookup_values = school_values | extracted_ids
+        for qr_value, student_id in QRCodeRegistration.objects.filter(
+            qr_code__in=school_values, is_active=True
+        ).values_list('qr_code', 'student_id'):
+            student_by_school_value.setdefault(qr_value, student_id)
+        for student_id, school_id, username in CustomUser.objects.filter(
+            Q(school_id__in=lookup_values) | Q(username__in=lookup_values),
+            is_student=True
+        ).values_list('id', 'school_id', 'username'):
+            for value in (school_id, username):
+                if value:
+                    student_by_school_value.setdefault(value, student_id)
+
+    def student_for(kind, raw, key):
+        if kind == SCAN_KIND_QR:
+            return student_by_qr.get(key)
+        student_id = student_by_school_value.get(raw)
+        if student_id is None:
+            extracted = _extract_school_id(raw)
+            student_id = student_by_school_value.get(extracted) if extracted else None
+        return student_id
+
+    resolved = []  # (index, client_id, student_id, scanned_at)
+    for index, client_id, kind, raw, key, scanned_at in pending:
+        student_id = student_for(kind, raw, key)
+        if student_id is None:
+            if kind == SCAN_KIND_QR:
+                fail(index, client_id, f'QR code not registered for {course.code}. Please register it first.')
+            else:
+                fail(index, client_id, f'Student with ID {raw} not found.')
+            continue
+        resolved.append((index, client_id, student_id, scanned_at))
+
+    if not resolved:
+        return results
+
+    # 3) Enrollments, registrations, schedules, and existing records - one query each
+    student_ids = {student_id for _, _, student_id, _ in resolved}
+    students = {
+        student.id: student
+        for student in CustomUser.objects.filter(id__in=student_ids).only('id', 'full_name', 'username', 'school_id')
+    }
+    enrollment_by_student = dict(CourseEnrollment.objects.filter(
+        course=course, student_id__in=student_ids, is_active=True
+    ).values_list('student_id', 'id'))
+    registered_students = set(QRCodeRegistration.objects.filter(
+        course=course, student_id__in=student_ids, is_active=True
+    ).values_list('student_id', flat=True))
+    schedule_by_day = {}
+    for schedule in CourseSchedule.objects.filter(course=course).order_by('start_time'):
+        schedule_by_day.setdefault(schedule.day, schedule)
+    # Without CourseSchedule rows the course-level days/times apply (as in attendance_finalizer.session_end)
+    course_level_days = course_days(course) if not schedule_by_day else set()
+
+    scan_dates = {scanned_at.date() for _, _, _, scanned_at in resolved}
+    existing = {
+        (student_id, attendance_date, schedule_day): status
+        for student_id, attendance_date, schedule_day, status in AttendanceRecord.objects.filter(
+            course=course, student_id__in=student_ids, attendance_date__in=scan_dates
+        ).values_list('student_id', 'attendance_date', 'schedule_day', 'status')
+    }
+
+    # 4) Apply rules; the earliest scan per student/day wins within the batch
+    to_write = {}
+    for index, client_id, student_id, scanned_at in resolved:
+        student = students.get(student_id)
+        student_name = (student.full_name or student.username) if student else ''
+        if student_id not in enrollment_by_student:
+            fail(index, client_id, f'{student_name} is not enrolled in {course.code}.')
+            continue
+        if student_id not in registered_students:
+            fail(index, client_id, f"{student_name}'s QR code is NOT registered for {course.code}.")
+            continue
+
+        day_short = WEEKDAY_SHORT[scanned_at.weekday()]
+        schedule = schedule_by_day.get(day_short)
+        if schedule is None and day_short not in course_level_days:
+            fail(index, client_id, f'No class scheduled for {course.code} on {scanned_at.strftime("%A")}.')
+            continue
+
+        record_key = (student_id, scanned_at.date(), schedule.day if schedule else day_short)
+        if existing.get(record_key) in ('present', 'late'):
+            results[index] = ScanResult(index, client_id, True, existing[record_key], student_id, student_name, 'Already recorded.')
+            continue
+
+        status = determine_attendance_status(course, schedule, scanned_at)
+        previous = to_write.get(record_key)
+        if previous and previous['scanned_at'] <= scanned_at:
+            results[index] = ScanResult(index, client_id, True, previous['status'], student_id, student_name, 'Duplicate scan in batch.')
+            continue
+        if previous:
+            prev_index, prev_client_id = previous['origin']
+            results[prev_index] = ScanResult(prev_index, prev_client_id, True, status, student_id, student_name, 'Duplicate scan in batch.')
+        to_write[record_key] = {
+            'scanned_at': scanned_at,
+            'status': status,
+            'enrollment_id': enrollment_by_student[student_id],
+            'origin': (index, client_id),
+        }
+        results[index] = ScanResult(index, client_id, True, status, student_id, student_name, 'Marked as ' + status.title())
+
+    # 5) Single bulk upsert (absent/postponed placeholders are overwritten)
+    if to_write:
+        records = [
+            AttendanceRecord(
+                course=course,
+                student_id=student_id,
+                enrollment_id=entry['enrollment_id'],
+                attendance_date=attendance_date,
+                schedule_day=schedule_day,
+                attendance_time=entry['scanned_at'].time(),
+                status=entry['status'],
+            )
+            for (student_id, attendance_date, schedule_day), entry in to_write.items()
+        ]
+        with transaction.atomic():
+            AttendanceRecord.objects.bulk_create(
+                records,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['course', 'student', 'attendance_date', 'schedule_day'],
+                update_fields=['enrollment', 'attendance_time', 'status', 'updated_at'],
+            )
+        logger.info(f"[SCAN-BATCH] Recorded {len(records)} attendance records for {course.code} from {len(scans)} offline scans")
+
+    return results
@@ -0,0 +1,195 @@
+"""
+Attendance finalization scheduler.
+Absent/postponed records for students who did not scan used to be created lazily:
+student_dashboard_view ran finalize_all_course_attendance for every enrolled course on
+each page load and student_attendance_log_view ran it again, so hot read pages did the
+write work, thousands of times a day, and a course nobody looked at was never finalized.
+
+The finalize_attendance command now runs this module in a loop. Each pass computes the
+end of every session within ATTENDANCE_FINALIZE_LOOKBACK_HOURS from the course's
+CourseSchedule rows for that weekday (latest end_time), or from course.days/end_time
+when it has none - the same rule finalize_all_course_attendance applies. A session is
+due ATTENDANCE_FINALIZE_GRACE_SECONDS after it ends; it is claimed with an
+AttendanceFinalization row (unique per course and date, so only one process or pass
+finalizes it) and finalized once. Between passes the command sleeps until the next
+session is due, at most ATTENDANCE_FINALIZE_MAX_SLEEP seconds so schedule edits are
+picked up.
+
+Instructors closing or postponing attendance still finalize immediately (force=True).
+"""
+
+import logging
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ATTENDANCE_FINALIZE_GRACE_SECONDS = getattr(settings, 'ATTENDANCE_FINALIZE_GRACE_SECONDS', 300)
+ATTENDANCE_FINALIZE_LOOKBACK_HOURS = getattr(settings, 'ATTENDANCE_FINALIZE_LOOKBACK_HOURS', 24)
+ATTENDANCE_FINALIZE_MAX_SLEEP = getattr(settings, 'ATTENDANCE_FINALIZE_MAX_SLEEP', 60)  # Seconds
+
+PH_TZ = ZoneInfo('Asia/Manila')
+
+_WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+_DAY_NORM = {
+    'Monday': 'Mon', 'Mon': 'Mon', 'M': 'Mon',
+    'Tuesday': 'Tue', 'Tue': 'Tue', 'T': 'Tue',
+    'Wednesday': 'Wed', 'Wed': 'Wed', 'W': 'Wed',
+    'Thursday': 'Thu', 'Thu': 'Thu', 'Th': 'Thu',
+    'Friday': 'Fri', 'Fri': 'Fri', 'F': 'Fri',
+    'Saturday': 'Sat', 'Sat': 'Sat', 'S': 'Sat',
+    'Sunday': 'Sun', 'Sun': 'Sun', 'Su': 'Sun',
+}
+
+
+def _norm_day(day):
+    day = str(day or '').strip()
+    return _DAY_NORM.get(day, day)
+
+
+def course_days(course):
+    """Short day names ('Mon', ...) of the course-level schedule in course.days"""
+    return {_norm_day(d) for d in (course.days or '').split(',') if d.strip()}
+
+
+def session_end(course, session_date):
+    """
+    When the course's session on `session_date` ends (aware, Asia/Manila), or None if it
+    does not meet that day. Uses the prefetched course_schedules when present.
+    """
+    weekday = _WEEKDAYS[session_date.weekday()]
+    end_times = [
+        s.end_time for s in course.course_schedules.all()
+        if s.end_time and _norm_day(s.day) == weekday
+    ]
+    if not end_times:
+        if weekday not in course_days(course) or not course.end_time:
+            return None
+        end_times = [course.end_time]
+    return timezone.make_aware(datetime.combine(session_date, max(end_times)), PH_TZ)
+
+
+def _courses():
+    from dashboard.models import Course
+
+    return (
+        Course.objects.filter(is_active=True, deleted_at__isnull=True, is_archived=False)
+        .select_related('instructor')
+        .prefetch_related('course_schedules')
+    )
+
+
+def _sessions(courses, start, end):
+    """(course, session_date, session end) for sessions ending in [start, end), by end"""
+    sessions = []
+    first = start.astimezone(PH_TZ).date()
+    days = (end.astimezone(PH_TZ).date() - first).days + 1
+    for course in courses:
+        for offset in range(days):
+            session_date = first + timedelta(days=offset)
+            ends_at = session_end(course, session_date)
+            if ends_at and start <= ends_at < end:
+                sessions.append((course, session_date, ends_at))
+    sessions.sort(key=lambda s: s[2])
+    return sessions
+
+
+def due_sessions(now=None, grace=None, lookback_hours=None):
+    """Sessions that ended at least `grace` seconds ago within the lookback and are not finalized yet"""
+    from dashboard.models import AttendanceFinalization
+
+    now = now or timezone.now()
+    grace = ATTENDANCE_FINALIZE_GRACE_SECONDS if grace is None else grace
+    lookback_hours = ATTENDANCE_FINALIZE_LOOKBACK_HOURS if lookback_hours is None else lookback_hours
+    cutoff = now - timedelta(seconds=grace)
+    sessions = _sessions(_courses(), now - timedelta(hours=lookback_hours), cutoff + timedelta(microseconds=1))
+    if not sessions:
+        return []
+    finalized = set(
+        AttendanceFinalization.objects.filter(session_date__in={s[1] for s in sessions})
+        .values_list('course_id', 'session_date')
+    )
+    return [s for s in sessions if (s[0].id, s[1]) not in finalized]
+
+
+class SessionNotFinalized(Exception):
+    """finalize_all_course_attendance skipped the session (no end time, or not ended by its own rule)"""
+
+
+def finalize_session(course, session_date, ends_at):
+    """
+    Claim and finalize one session. Returns the number of records created, or None if
+    another process had already claimed it.
+
+    Raises:
+        SessionNotFinalized: Nothing was finalized; the claim is released so a later pass retries
+    """
+    from dashboard.models import AttendanceFinalization, AttendanceRecord
+    from dashboard.views import finalize_all_course_attendance
+
+    try:
+        with transaction.atomic():
+            claim = AttendanceFinalization.objects.create(course=course, session_date=session_date, session_end=ends_at)
+    except IntegrityError:
+        return None
+
+    finalized_records = AttendanceRecord.objects.filter(
+        course=course, attendance_date=session_date, status__in=['absent', 'postponed'],
+    )
+    try:
+        before = finalized_records.count()
+        if not finalize_all_course_attendance(course, course.instructor, force=False, session_date=session_date):
+            raise SessionNotFinalized(f"course={course.id} date={session_date} was skipped by finalize_all_course_attendance")
+        created = finalized_records.count() - before
+    except Exception:
+        # Release the claim so the next pass retries
+        claim.delete()
+        raise
+    AttendanceFinalization.objects.filter(pk=claim.pk).update(created_records=created)
+    logger.info(f"[FINALIZE] course={course.id} date={session_date} finalized: {created} record(s) created")
+    return created
+
+
+def finalize_due(now=None, grace=None, lookback_hours=None):
+    """
+    One scheduler pass: finalize every due session.
+
+    Returns:
+        dict: Sessions finalized, records created, sessions skipped (claimed elsewhere),
+        deferred (not finalized yet, retried next pass) and failed
+    """
+    result = {'finalized': 0, 'records': 0, 'skipped': 0, 'deferred': 0, 'failed': 0}
+    for course, session_date, ends_at in due_sessions(now, grace, lookback_hours):
+        try:
+            created = finalize_session(course, session_date, ends_at)
+        except SessionNotFinalized as e:
+            result['deferred'] += 1
+            logger.info(f"[FINALIZE] {e}; will retry")
+            continue
+        except Exception as e:
+            result['failed'] += 1
+            logger.error(f"[FINALIZE] course={course.id} date={session_date} failed: {e}")
+            continue
+        if created is None:
+            result['skipped'] += 1
+        else:
+            result['finalized'] += 1
+            result['records'] += created
+    return result
+
+
+def seconds_until_next(now=None, grace=None, max_sleep=None):
+    """Seconds until the next session becomes due, capped at max_sleep"""
+    now = now or timezone.now()
+    grace = ATTENDANCE_FINALIZE_GRACE_SECONDS if grace is None else grace
+    max_sleep = ATTENDANCE_FINALIZE_MAX_SLEEP if max_sleep is None else max_sleep
+    horizon = timedelta(seconds=max_sleep)
+    upcoming = _sessions(_courses(), now - timedelta(seconds=grace), now - timedelta(seconds=grace) + horizon)
+    if not upcoming:
+        return max_sleep
+    due_at = upcoming[0][2] + timedelta(seconds=grace)
+    return min(max_sleep, max(1.0, (due_at - now).total_seconds()))
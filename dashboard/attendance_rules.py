@@ -0,0 +1,86 @@
+"""
+Present/late rules for scanned attendance.
+Same rules as instructor_scan_student_qr_code_view, but evaluated at an explicit
+scan time so offline/batched scans and server-side ingest are judged by when the
+student actually scanned, not by when the record reached the server.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+try:
+    from zoneinfo import ZoneInfo
+    PH_TZ = ZoneInfo('Asia/Manila')
+except Exception:
+    PH_TZ = None
+
+
+def to_ph_time(value):
+    """Convert an aware datetime to PH time; naive values are assumed to already be PH local time"""
+    if PH_TZ is None:
+        return value
+    if value.tzinfo is None:
+        return value.replace(tzinfo=PH_TZ)
+    return value.astimezone(PH_TZ)
+
+
+def present_cutoff(course, schedule, on_date):
+    """
+    Datetime after which a scan counts as late, or None when no present-duration is configured.
+
+    The baseline is the instructor's QR/session open time when it falls on `on_date`,
+    otherwise the schedule start time on `on_date`.
+    """
+    try:
+        if schedule is not None and getattr(schedule, 'attendance_present_duration', None) is not None:
+            present_duration_minutes = int(schedule.attendance_present_duration or 0)
+        else:
+            present_duration_minutes = int(getattr(course, 'attendance_present_duration', 0) or 0)
+    except Exception:
+        present_duration_minutes = 0
+
+    if present_duration_minutes <= 0:
+        return None
+
+    qr_opened_at = None
+    if schedule is not None and getattr(schedule, 'qr_code_opened_at', None):
+        qr_opened_at = schedule.qr_code_opened_at
+    elif getattr(course, 'qr_code_opened_at', None):
+        qr_opened_at = course.qr_code_opened_at
+
+    if qr_opened_at and to_ph_time(qr_opened_at).date() == on_date:
+        return to_ph_time(qr_opened_at) + timedelta(minutes=present_duration_minutes)
+
+    start_time = getattr(schedule, 'start_time', None) or getattr(course, 'start_time', None)
+    if start_time:
+        return to_ph_time(datetime.combine(on_date, start_time)) + timedelta(minutes=present_duration_minutes)
+    return None
+
+
+def determine_attendance_status(course, schedule, scanned_at):
+    """
+    Decide 'present' or 'late' for a scan made at `scanned_at`.
+
+    Args:
+        course (Course): Course being attended
+        schedule (CourseSchedule): Day schedule the scan belongs to (may be None)
+        scanned_at (datetime): When the student scanned
+
+    Returns:
+        str: 'present' or 'late'
+    """
+    scanned_at = to_ph_time(scanned_at)
+    cutoff_dt = present_cutoff(course, schedule, scanned_at.date())
+    if cutoff_dt:
+        return 'late' if scanned_at > cutoff_dt else 'present'
+
+    end_time = None
+    if schedule is not None and getattr(schedule, 'attendance_end', None):
+        end_time = schedule.attendance_end
+    elif getattr(course, 'attendance_end', None):
+        end_time = course.attendance_end
+    if end_time and scanned_at.time() > end_time:
+        return 'late'
+    return 'present'
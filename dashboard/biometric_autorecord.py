@@ -0,0 +1,313 @@
+"""
+Server-side automatic attendance from fingerprint detections.
+Normally a match travels ESP32 -> MQTT -> detection log -> scanner page -> POST to
+instructor_biometric_scan_attendance_view, so nothing is recorded while the
+instructor's laptop sleeps. When the instructor opts a scanner session into
+auto-record (BiometricAutoRecordSession), the MQTT ingest hands each attendance
+detection to this module and the server records it itself; the page only displays
+the result.
+
+Detections are queued and written by one background thread in micro-batches: the
+first detection starts a BIOMETRIC_AUTO_RECORD_FLUSH_INTERVAL window, and everything
+that arrives in it is resolved with a handful of set-based queries (armed sessions,
+enrollments, schedules, existing records) and written with a single bulk upsert.
+Slots resolve through the cached fingerprint index, and present/late follows
+attendance_rules at the time of the scan. A session only takes detections from the
+sensor it was armed on, so a student enrolled in two courses scanning in one room is
+never recorded in the other room's course.
+
+Unlike the manual scan view, a student already marked present/late for the day is
+left alone: the sensor reports every touch, and a second touch must not turn
+'present' into 'late'.
+"""
+
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .attendance_rules import determine_attendance_status, to_ph_time
+from .biometric_devices import BIOMETRIC_DEFAULT_DEVICE_ID
+from .fingerprint_index import lookup_fingerprint
+from .session_qr import WEEKDAY_SHORT, now_ph
+
+logger = logging.getLogger(__name__)
+
+BIOMETRIC_AUTO_RECORD_FLUSH_INTERVAL = getattr(settings, 'BIOMETRIC_AUTO_RECORD_FLUSH_INTERVAL', 0.2)  # Seconds per micro-batch
+BIOMETRIC_AUTO_RECORD_MAX_BATCH = getattr(settings, 'BIOMETRIC_AUTO_RECORD_MAX_BATCH', 200)
+BIOMETRIC_AUTO_RECORD_QUEUE_SIZE = getattr(settings, 'BIOMETRIC_AUTO_RECORD_QUEUE_SIZE', 5000)
+BIOMETRIC_AUTO_RECORD_SESSION_HOURS = getattr(settings, 'BIOMETRIC_AUTO_RECORD_SESSION_HOURS', 6)  # Armed sessions expire after this
+
+OPEN_STATUSES = ('open', 'automatic')
+
+DAY_TOKENS = {
+    'M': 'Mon', 'T': 'Tue', 'W': 'Wed', 'Th': 'Thu', 'F': 'Fri', 'S': 'Sat', 'Su': 'Sun',
+    'Mon': 'Mon', 'Tue': 'Tue', 'Wed': 'Wed', 'Thu': 'Thu', 'Fri': 'Fri', 'Sat': 'Sat', 'Sun': 'Sun',
+}
+
+
+def schedule_day_from_id(schedule_id):
+    """Day short name from a scanner schedule_id like '12_Th_20250109'; '' when absent"""
+    parts = str(schedule_id or '').split('_')
+    return DAY_TOKENS.get(parts[1], '') if len(parts) >= 2 else ''
+
+
+# ======================== SESSIONS ========================
+
+def arm_auto_record(course, instructor, session_id='', schedule_id=None, device_id=None):
+    """
+    Opt `course`'s scanner session on sensor `device_id` into server-side recording
+    (replaces any earlier session; device_id None keeps the session's sensor)
+    """
+    from dashboard.models import BiometricAutoRecordSession
+
+    defaults = {
+        'armed_by': instructor,
+        'session_id': session_id or '',
+        'schedule_day': schedule_day_from_id(schedule_id),
+        'expires_at': timezone.now() + timedelta(hours=BIOMETRIC_AUTO_RECORD_SESSION_HOURS),
+    }
+    if device_id is not None:
+        defaults['device_id'] = device_id
+    session, _ = BiometricAutoRecordSession.objects.update_or_create(course=course, defaults=defaults)
+    logger.info(
+        f"[AUTO-RECORD] Armed for {course.code} on {session.device_id or BIOMETRIC_DEFAULT_DEVICE_ID} "
+        f"(session {session.session_id or '-'}, day {session.schedule_day or 'scan day'})"
+    )
+    return session
+
+
+def disarm_auto_record(course):
+    """Stop server-side recording for `course`; True if a session was armed"""
+    from dashboard.models import BiometricAutoRecordSession
+
+    deleted, _ = BiometricAutoRecordSession.objects.filter(course=course).delete()
+    if deleted:
+        logger.info(f"[AUTO-RECORD] Disarmed for {course.code}")
+    return bool(deleted)
+
+
+def auto_record_armed(course):
+    from dashboard.models import BiometricAutoRecordSession
+
+    return BiometricAutoRecordSession.objects.filter(course=course, expires_at__gt=timezone.now()).exists()
+
+
+# ======================== RECORDING ========================
+
+def _scanned_at(detection):
+    try:
+        parsed = parse_datetime(str(detection.get('timestamp') or ''))
+    except ValueError:
+        parsed = None
+    return to_ph_time(parsed) if parsed else now_ph()
+
+
+def record_detections(detections):
+    """
+    Record attendance for a batch of detection log entries (attendance mode).
+
+    Returns:
+        list[dict]: One outcome per detection that matched an armed course:
+        {'fingerprint_id', 'course_id', 'student_id', 'status', 'outcome'} with outcome
+        'recorded', 'already_recorded', 'not_enrolled' or 'attendance_closed'
+    """
+    from dashboard.models import (
+        AttendanceRecord, BiometricAutoRecordSession, CourseEnrollment, CourseSchedule, UserNotification,
+    )
+
+    sessions = list(
+        BiometricAutoRecordSession.objects.filter(expires_at__gt=timezone.now())
+        .select_related('course').order_by('-updated_at')
+    )
+    if not sessions:
+        return []
+    sessions_by_device = {}
+    for session in sessions:
+        sessions_by_device.setdefault(session.device_id or BIOMETRIC_DEFAULT_DEVICE_ID, []).append(session)
+
+    # 1) Slot -> (session, student) through the cached per-group index, among the
+    #    sessions armed on the sensor that reported the detection
+    matched = []  # (slot, session, student_id, scanned_at)
+    for detection in detections:
+        try:
+            slot = int(detection.get('fingerprint_id'))
+        except (TypeError, ValueError):
+            continue
+        if slot < 0:
+            continue
+        best = None
+        for session in sessions_by_device.get(detection.get('device_id') or BIOMETRIC_DEFAULT_DEVICE_ID, ()):
+            info = lookup_fingerprint(session.course, slot)
+            if info is None:
+                continue
+            if info['course_id'] == session.course_id:
+                best = (session, info)
+                break
+            best = best or (session, info)
+        if best:
+            matched.append((slot, best[0], best[1]['student_id'], _scanned_at(detection)))
+
+    if not matched:
+        return []
+
+    # 2) Enrollments, schedules and existing records - one query each
+    course_ids = {session.course_id for _, session, _, _ in matched}
+    student_ids = {student_id for _, _, student_id, _ in matched}
+    enrollment_by_key = {
+        (course_id, student_id): enrollment_id
+        for course_id, student_id, enrollment_id in CourseEnrollment.objects.filter(
+            course_id__in=course_ids, student_id__in=student_ids, is_active=True
+        ).values_list('course_id', 'student_id', 'id')
+    }
+    schedule_by_key = {}
+    for schedule in CourseSchedule.objects.filter(course_id__in=course_ids).order_by('start_time'):
+        schedule_by_key.setdefault((schedule.course_id, schedule.day), schedule)
+    recorded = set(AttendanceRecord.objects.filter(
+        course_id__in=course_ids,
+        student_id__in=student_ids,
+        attendance_date__in={scanned_at.date() for _, _, _, scanned_at in matched},
+        status__in=['present', 'late'],
+    ).values_list('course_id', 'student_id', 'attendance_date', 'schedule_day'))
+
+    # 3) Apply rules; the earliest scan per student/day wins within the batch
+    results = []
+    to_write = {}
+    for slot, session, student_id, scanned_at in matched:
+        course = session.course
+        result = {'fingerprint_id': slot, 'course_id': course.id, 'student_id': student_id, 'status': None}
+        results.append(result)
+        schedule_day = session.schedule_day or WEEKDAY_SHORT[scanned_at.weekday()]
+        schedule = schedule_by_key.get((course.id, schedule_day))
+        attendance_status = (getattr(schedule, 'attendance_status', None) or course.attendance_status)
+        if attendance_status not in OPEN_STATUSES:
+            result['outcome'] = 'attendance_closed'
+            continue
+        if (course.id, student_id) not in enrollment_by_key:
+            result['outcome'] = 'not_enrolled'
+            continue
+        record_key = (course.id, student_id, scanned_at.date(), schedule_day)
+        if record_key in recorded:
+            result['outcome'] = 'already_recorded'
+            continue
+        previous = to_write.get(record_key)
+        if previous and previous['scanned_at'] <= scanned_at:
+            result['outcome'] = 'already_recorded'
+            continue
+        result['status'] = determine_attendance_status(course, schedule, scanned_at)
+        result['outcome'] = 'recorded'
+        if previous:
+            previous['result']['outcome'] = 'already_recorded'
+        to_write[record_key] = {
+            'scanned_at': scanned_at,
+            'status': result['status'],
+            'enrollment_id': enrollment_by_key[(course.id, student_id)],
+            'course': course,
+            'result': result,
+        }
+
+    # 4) Single bulk upsert (absent/postponed placeholders are overwritten) plus notifications
+    if to_write:
+        records = [
+            AttendanceRecord(
+                course_id=course_id,
+                student_id=student_id,
+                enrollment_id=entry['enrollment_id'],
+                attendance_date=attendance_date,
+                schedule_day=schedule_day,
+                attendance_time=entry['scanned_at'].time(),
+                status=entry['status'],
+            )
+            for (course_id, student_id, attendance_date, schedule_day), entry in to_write.items()
+        ]
+        notifications = [
+            UserNotification(
+                user_id=student_id,
+                notification_type='attendance_marked',
+                title='Attendance Recorded - Biometric',
+                message=f"Your biometric attendance has been recorded as {entry['status'].upper()} in {entry['course'].code}",
+                category='attendance',
+                related_course=entry['course'],
+                related_user_id=entry['course'].instructor_id,
+                is_read=False,
+            )
+            for (_, student_id, _, _), entry in to_write.items()
+        ]
+        with transaction.atomic():
+            AttendanceRecord.objects.bulk_create(
+                records,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['course', 'student', 'attendance_date', 'schedule_day'],
+                update_fields=['enrollment', 'attendance_time', 'status', 'updated_at'],
+            )
+            UserNotification.objects.bulk_create(notifications, batch_size=500)
+
+        # Scanner pages long-polling in this process pick the new rows up right away
+        from .detection_log import notify_waiters
+        notify_waiters()
+
+    logger.info(
+        f"[AUTO-RECORD] Batch of {len(detections)} detection(s): {len(to_write)} recorded, "
+        f"{len(results) - len(to_write)} skipped"
+    )
+    return results
+
+
+# ======================== MICRO-BATCHING ========================
+
+_queue = queue.Queue(maxsize=BIOMETRIC_AUTO_RECORD_QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _run():
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + BIOMETRIC_AUTO_RECORD_FLUSH_INTERVAL
+        while len(batch) < BIOMETRIC_AUTO_RECORD_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        close_old_connections()
+        try:
+            record_detections(batch)
+        except Exception as e:
+            logger.error(f"[AUTO-RECORD] Failed to record {len(batch)} detection(s): {e}", exc_info=True)
+        finally:
+            close_old_connections()
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        with _worker_lock:
+            if _worker is None or not _worker.is_alive():
+                _worker = threading.Thread(target=_run, name='biometric-auto-record', daemon=True)
+                _worker.start()
+
+
+def submit_detection(entry):
+    """
+    Queue one attendance detection (a detection log entry) for the next micro-batch.
+    Cheap enough to call for every detection: sessions are only looked up when the
+    batch is flushed. Returns False when the queue is full and the detection is dropped
+    (the scanner page can still record it manually).
+    """
+    _ensure_worker()
+    try:
+        _queue.put_nowait(entry)
+        return True
+    except queue.Full:
+        logger.warning(f"[AUTO-RECORD] Queue full, dropping detection fingerprint_id={entry.get('fingerprint_id')}")
+        return False
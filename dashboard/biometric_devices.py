@@ -0,0 +1,120 @@
+"""
+Registry of fingerprint sensors and their MQTT topic namespaces.
+Each sensor publishes and subscribes under biometric/<device_id>/... (the firmware's
+DEVICE_ID build flag) and is registered as a BiometricDevice. The original sensor
+keeps device_id BIOMETRIC_DEFAULT_DEVICE_ID ('esp32'), so an install without any
+BiometricDevice rows behaves as before: one implicit sensor on biometric/esp32/...
+
+The server subscribes to biometric/+/<suffix> and learns the sender from the topic;
+messages from device ids that are not registered (or the implicit default) are ignored.
+Each registered sensor also gets a retained biometric/<device_id>/config message with
+its payload codec (see mqtt_codec.py), republished whenever the device is saved.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BIOMETRIC_DEFAULT_DEVICE_ID = getattr(settings, 'BIOMETRIC_DEFAULT_DEVICE_ID', 'esp32')
+BIOMETRIC_DEVICE_CACHE_SECONDS = getattr(settings, 'BIOMETRIC_DEVICE_CACHE_SECONDS', 10)  # Registry re-read interval
+
+TOPIC_ROOT = 'biometric'
+
+_lock = threading.Lock()
+_cached = {'loaded_at': None, 'active': [], 'known': set()}
+
+
+def device_topic(device_id, suffix):
+    """Topic `suffix` (e.g. 'enroll/request') in the namespace of `device_id` (default sensor when empty)"""
+    return f"{TOPIC_ROOT}/{device_id or BIOMETRIC_DEFAULT_DEVICE_ID}/{suffix}"
+
+
+def device_topic_filter(suffix):
+    """Subscription filter matching `suffix` from every sensor"""
+    return f"{TOPIC_ROOT}/+/{suffix}"
+
+
+def parse_device_topic(topic):
+    """
+    Split 'biometric/<device_id>/<suffix>'.
+
+    Returns:
+        tuple(str, str): (device_id, suffix), or (None, None) for other topics
+    """
+    parts = str(topic or '').split('/', 2)
+    if len(parts) < 3 or parts[0] != TOPIC_ROOT or not parts[1]:
+        return None, None
+    return parts[1], parts[2]
+
+
+def _registry():
+    now = time.monotonic()
+    with _lock:
+        if _cached['loaded_at'] is not None and now - _cached['loaded_at'] < BIOMETRIC_DEVICE_CACHE_SECONDS:
+            return _cached
+
+    from dashboard.models import BiometricDevice
+
+    registered = list(BiometricDevice.objects.values_list('device_id', 'is_active'))
+    if registered:
+        active = [device_id for device_id, is_active in registered if is_active]
+        known = {device_id for device_id, _ in registered}
+    else:
+        active = [BIOMETRIC_DEFAULT_DEVICE_ID]
+        known = {BIOMETRIC_DEFAULT_DEVICE_ID}
+    with _lock:
+        _cached.update(loaded_at=now, active=active, known=known)
+        return _cached
+
+
+def active_device_ids():
+    """Ids of the sensors that take new enrollments (the implicit default when none are registered)"""
+    return list(_registry()['active'])
+
+
+def is_known_device(device_id):
+    """Whether messages from `device_id` are handled (registered, active or not)"""
+    return device_id in _registry()['known']
+
+
+def forget_devices(**kwargs):
+    """Drop the cached registry (BiometricDevice save/delete signal handler)"""
+    with _lock:
+        _cached['loaded_at'] = None
+
+
+def publish_device_config(device_id, codec):
+    """Retained per-sensor settings the firmware applies on every (re)connect"""
+    from .mqtt_client import get_mqtt_client
+    sent = get_mqtt_client().publish(device_topic(device_id, 'config'), {'codec': codec}, qos=1, retain=True)
+    if not sent:
+        logger.warning(f"[DEVICES] Could not publish config for {device_id}; it is resent when the MQTT ingest starts")
+    return sent
+
+
+def publish_device_configs():
+    """Republish every registered sensor's config (called when this process becomes the MQTT ingest)"""
+    from dashboard.models import BiometricDevice
+    for device_id, codec in BiometricDevice.objects.values_list('device_id', 'payload_codec'):
+        publish_device_config(device_id, codec)
+
+
+def device_saved(sender, instance, **kwargs):
+    forget_devices()
+    try:
+        publish_device_config(instance.device_id, instance.payload_codec)
+    except Exception as e:
+        logger.warning(f"[DEVICES] Could not publish config for {instance.device_id}: {e}")
+
+
+def connect_signals():
+    """Refresh the cached registry when devices change (called from DashboardConfig.ready)"""
+    from django.db.models.signals import post_delete, post_save
+    from dashboard.models import BiometricDevice
+
+    post_save.connect(device_saved, sender=BiometricDevice, dispatch_uid='biometric_device_save')
+    post_delete.connect(forget_devices, sender=BiometricDevice, dispatch_uid='biometric_device_delete')
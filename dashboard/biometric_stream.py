@@ -0,0 +1,272 @@
+"""
+Push delivery for the instructor biometric scanner.
+Instead of polling biometric-pending every 2 s and the student lists every 3 s,
+the scanner keeps one long-poll request open per course group
+(instructor_biometric_stream_view). The request returns as soon as there is
+something new - resolved fingerprint detections from the detection log and
+scanned-student deltas - or after BIOMETRIC_STREAM_TIMEOUT seconds, and the page
+immediately opens the next one. Long-poll rather than WebSockets so it also works
+under plain WSGI.
+
+Held requests occupy a server thread each (gunicorn runs gthread workers, see Procfile),
+so at most BIOMETRIC_STREAM_MAX_HELD are held per process; beyond that a request is
+answered at once with retry_after and the page polls at that interval instead.
+
+Only detections from the course group's sensor are returned: the sensor the page asks
+for, else the sensors of the group's armed scanner sessions, else the default sensor.
+
+Detections are appended by the MQTT ingest, which is usually another process, so a held
+request finds them by polling the shared log: every BIOMETRIC_STREAM_CHECK_INTERVAL
+seconds it compares the log head (one cache get or one indexed query) and checks for
+attendance rows updated since its cursor (one indexed EXISTS), and only re-reads the
+log or the student rows when one of them moved. That poll is the real wake-up
+mechanism; the in-process notification only shortens the wait when the append
+happened in the same process. The fingerprint map is only looked up when there is a
+detection to resolve.
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .biometric_devices import BIOMETRIC_DEFAULT_DEVICE_ID
+from .detection_log import detection_head, read_detections, wait_for_detection
+from .fingerprint_index import fingerprint_map_for
+from .session_qr import now_ph
+
+logger = logging.getLogger(__name__)
+
+BIOMETRIC_STREAM_TIMEOUT = getattr(settings, 'BIOMETRIC_STREAM_TIMEOUT', 25)  # Seconds one long-poll is held open
+BIOMETRIC_STREAM_CHECK_INTERVAL = getattr(settings, 'BIOMETRIC_STREAM_CHECK_INTERVAL', 1.0)
+BIOMETRIC_STREAM_MAX_HELD = getattr(settings, 'BIOMETRIC_STREAM_MAX_HELD', 4)  # Held requests per process
+BIOMETRIC_STREAM_BUSY_RETRY = 2  # Seconds a request that could not be held waits before the next one
+SCANNED_DELTA_OVERLAP = timedelta(seconds=2)  # Re-send recent rows so late commits are not skipped
+
+
+_held = threading.BoundedSemaphore(max(1, BIOMETRIC_STREAM_MAX_HELD))
+
+
+def build_fingerprint_map(course):
+    """
+    Map fingerprint slot -> student for the course group of `course` (sibling sections
+    included, so a slot resolves even if the student registered under another section).
+    A registration on `course` itself wins over sibling sections. Served from the
+    cached per-group index (see fingerprint_index.py).
+
+    Returns:
+        dict[int, dict]: slot -> {'registration_id', 'student_id', 'student_name', 'student_email', 'fingerprint_id', 'course_id'}
+    """
+    return fingerprint_map_for(course)
+
+
+def resolve_detection(detection, course, fingerprint_map):
+    """
+    Turn one detection log entry into the item the scanner page expects
+    (student match, or an 'error' of retry / unregistered_fingerprint / not_registered_for_course).
+    """
+    from dashboard.models import BiometricRegistration
+
+    slot = detection.get('fingerprint_id')
+    try:
+        slot = int(slot)
+    except (TypeError, ValueError):
+        pass
+    confidence = detection.get('confidence', 0)
+    timestamp = detection.get('timestamp')
+
+    # Some devices send retry/hint events using fingerprint_id=-2; never treat them as not-registered
+    if slot == -2:
+        return {
+            'fingerprint_id': -2, 'student_id': None, 'student_name': 'Place finger again', 'error': 'retry',
+            'reason': detection.get('reason'), 'confidence': confidence, 'timestamp': timestamp,
+        }
+
+    # Legacy raw detections (no sensor-side match): guess from the course's enrolled fingerprints
+    if detection.get('needs_matching') and detection.get('match_type') != 'hardware':
+        if not fingerprint_map:
+            return {
+                'fingerprint_id': -1, 'student_id': None, 'student_name': 'No biometric students enrolled',
+                'confidence': 0, 'timestamp': timestamp, 'error': 'unregistered_fingerprint',
+            }
+        # One enrolled student must be them; otherwise the most recent enrollment (highest slot)
+        info = max(fingerprint_map.values(), key=lambda item: item.get('fingerprint_id') or 0)
+        return {
+            'fingerprint_id': info['fingerprint_id'], 'fingerprint_template_id': info['fingerprint_id'],
+            'student_id': info['student_id'], 'student_name': info['student_name'],
+            'student_email': info['student_email'], 'confidence': detection.get('quality', 0), 'timestamp': timestamp,
+        }
+
+    # Sentinel for "unregistered" published by the ESP32
+    if slot == -1:
+        return {
+            'fingerprint_id': -1, 'student_id': None, 'student_name': 'Unregistered',
+            'error': 'unregistered_fingerprint', 'confidence': confidence, 'timestamp': timestamp,
+        }
+
+    info = fingerprint_map.get(slot)
+    if info:
+        return {
+            'fingerprint_id': slot, 'fingerprint_template_id': info['fingerprint_id'],
+            'student_id': info['student_id'], 'student_name': info['student_name'],
+            'student_email': info['student_email'], 'confidence': confidence, 'timestamp': timestamp,
+        }
+
+    # Not in this course group: report the owner (if any) so the page can say so
+    owner = BiometricRegistration.objects.filter(
+        fingerprint_id=slot, is_active=True
+    ).values('student_id', 'student__full_name', 'student__username', 'student__email').first()
+    if owner:
+        return {
+            'fingerprint_id': slot, 'student_id': owner['student_id'],
+            'student_name': owner['student__full_name'] or owner['student__username'],
+            'student_email': owner['student__email'] or '', 'confidence': confidence, 'timestamp': timestamp,
+            'error': 'not_registered_for_course',
+        }
+    name = f'Fingerprint ID {slot} not enrolled' if detection.get('match_type') == 'hardware' else 'Not registered for this course'
+    return {
+        'fingerprint_id': slot, 'student_id': None, 'student_name': name, 'confidence': confidence,
+        'timestamp': timestamp, 'error': 'not_registered_for_course',
+    }
+
+
+def scanned_student_changes(course, since=None):
+    """
+    Today's biometric attendance for `course` changed after `since` (all of today's when None).
+
+    Returns:
+        tuple(list[dict], bool, str): Student rows (latest per student, same shape as
+        instructor_get_biometric_students_view plus 'student_id'), whether anything is
+        newer than `since`, and the cursor to send next time
+    """
+    from django.utils import timezone
+    from dashboard.models import AttendanceRecord, BiometricRegistration
+
+    queried_at = timezone.now()
+    records = AttendanceRecord.objects.filter(
+        course=course,
+        attendance_date=now_ph().date(),
+        status__in=['present', 'late'],
+        student_id__in=BiometricRegistration.objects.filter(course=course, is_active=True).values('student_id'),
+    )
+    if since is not None:
+        records = records.filter(updated_at__gt=since - SCANNED_DELTA_OVERLAP)
+
+    students_by_id = {}
+    changed = since is None
+    cursor = since
+    for record in records.select_related('student').order_by('-attendance_time'):
+        if since is None or record.updated_at > since:
+            changed = True
+        if cursor is None or record.updated_at > cursor:
+            cursor = record.updated_at
+        if record.student_id in students_by_id:
+            continue
+        students_by_id[record.student_id] = {
+            'student_id': record.student_id,
+            'name': record.student.full_name,
+            'id': record.student.school_id or 'N/A',
+            'time': record.attendance_time.strftime('%I:%M %p') if record.attendance_time else 'N/A',
+            'status': record.status,
+            'scan_method': 'biometric',
+        }
+    # A snapshot with nothing scanned yet still needs a cursor, or the next call would be a snapshot too
+    cursor = cursor or queried_at
+    return list(students_by_id.values()), changed, cursor.isoformat()
+
+
+def scanner_devices(course, device_id=None):
+    """
+    Sensors whose detections belong on `course`'s scanner: `device_id` when the page names
+    one, else the sensors of the course group's armed scanner sessions, else the default sensor
+    """
+    if device_id:
+        return {device_id}
+    from dashboard.models import BiometricAutoRecordSession
+    from .qr_registry import sibling_courses
+
+    armed = BiometricAutoRecordSession.objects.filter(
+        course__in=sibling_courses(course), expires_at__gt=timezone.now(),
+    ).values_list('device_id', flat=True)
+    return {armed_device or BIOMETRIC_DEFAULT_DEVICE_ID for armed_device in armed} or {BIOMETRIC_DEFAULT_DEVICE_ID}
+
+
+def _from_devices(entries, devices):
+    # Entries logged before detections carried a device_id came from the default sensor
+    return [entry for entry in entries if (entry.get('device_id') or BIOMETRIC_DEFAULT_DEVICE_ID) in devices]
+
+
+def _attendance_changed(course, since):
+    """Cheap check for scanned-student changes after `since` (before building the rows)"""
+    from dashboard.models import AttendanceRecord
+
+    return AttendanceRecord.objects.filter(
+        course=course, attendance_date=now_ph().date(), updated_at__gt=since,
+    ).exists()
+
+
+def parse_since(value):
+    """Scanned-student cursor from a query parameter; None when missing or malformed"""
+    if not value:
+        return None
+    try:
+        return parse_datetime(value)
+    except ValueError:
+        return None
+
+
+def wait_for_scanner_updates(course, after=None, since=None, timeout=BIOMETRIC_STREAM_TIMEOUT, device_id=None):
+    """
+    Hold until there are new detections from the course group's sensor (after detection
+    cursor `after`, see scanner_devices) or scanned-student changes (after `since`), or
+    `timeout` seconds pass. A first call (since=None) returns the current snapshot straight away.
+
+    When BIOMETRIC_STREAM_MAX_HELD requests are already held in this process, answers
+    straight away with 'retry_after' (seconds) instead of holding.
+
+    Returns:
+        dict: {'pending': [...], 'students': [...], 'cursor': int, 'since': str[, 'retry_after': int]}
+    """
+    held = _held.acquire(blocking=False)
+    try:
+        deadline = time.monotonic() + (max(0, timeout) if held else 0)
+        devices = scanner_devices(course, device_id)
+        head = detection_head('attendance')
+        entries, cursor = read_detections('attendance', after)
+        entries = _from_devices(entries, devices)
+        students, changed, since_cursor = scanned_student_changes(course, since)
+        while not (entries or changed):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_for_detection(min(BIOMETRIC_STREAM_CHECK_INTERVAL, remaining))
+            latest = detection_head('attendance')
+            # Re-read when the head moved, or entries behind it were held back last time
+            if latest != head or cursor < latest:
+                head = latest
+                entries, cursor = read_detections('attendance', cursor)
+                entries = _from_devices(entries, devices)
+            if _attendance_changed(course, parse_since(since_cursor)):
+                students, changed, since_cursor = scanned_student_changes(course, since)
+    finally:
+        if held:
+            _held.release()
+
+    pending = []
+    if entries:
+        fingerprint_map = build_fingerprint_map(course)
+        pending = [resolve_detection(entry, course, fingerprint_map) for entry in entries]
+        logger.info(f"[BIOMETRIC-STREAM] {course.code}: {len(pending)} detection(s), cursor {cursor}")
+    updates = {
+        'pending': pending,
+        'students': students if changed else [],
+        'cursor': cursor,
+        'since': since_cursor,
+    }
+    if not held:
+        updates['retry_after'] = BIOMETRIC_STREAM_BUSY_RETRY
+    return updates
@@ -1,6 +1,11 @@
 """
 Biometric utility functions for fingerprint registration and verification.
 Handles encryption/decryption of biometric data and database operations.
+
+Stored biometric data is "<template>:<HMAC-SHA256 hex digest>". The digest is also kept
+in BiometricRegistration.biometric_digest so duplicate/match checks are one indexed
+equality lookup on (biometric_digest, course, is_active) instead of HMAC-verifying
+every registration of the course in Python.
 """
 
 import hashlib
@@ -16,6 +21,24 @@ BIOMETRIC_ENCRYPTION_KEY = getattr(settings, 'BIOMETRIC_ENCRYPTION_KEY', 'defaul
 BIOMETRIC_ALGORITHM = 'sha256'
 
 
+def biometric_digest(biometric_template):
+    """HMAC-SHA256 hex digest of a raw template ('' when empty)"""
+    if not biometric_template:
+        return ''
+    return hmac.new(
+        BIOMETRIC_ENCRYPTION_KEY.encode('utf-8'),
+        biometric_template.encode('utf-8'),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def stored_biometric_digest(stored_template):
+    """Digest part of stored (encrypted) biometric data ('' when not in template:digest form)"""
+    if not stored_template or ':' not in stored_template:
+        return ''
+    return stored_template.rsplit(':', 1)[1]
+
+
 def encrypt_biometric_data(biometric_template):
     """
     Encrypt biometric fingerprint template using HMAC.
@@ -32,11 +55,7 @@ def encrypt_biometric_data(biometric_template):
             return None
         
         # Create HMAC signature of the biometric data
-        signature = hmac.new(
-            BIOMETRIC_ENCRYPTION_KEY.encode('utf-8'),
-            biometric_template.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
+        signature = biometric_digest(biometric_template)
         
         # Return combination of original + signature for verification
         encrypted = f"{biometric_template}:{signature}"
@@ -71,11 +90,7 @@ def verify_biometric_match(stored_template, new_template):
         stored_original, stored_signature = stored_template.rsplit(':', 1)
         
         # Create signature for new template using same key
-        new_signature = hmac.new(
-            BIOMETRIC_ENCRYPTION_KEY.encode('utf-8'),
-            new_template.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
+        new_signature = biometric_digest(new_template)
         
         # Compare templates and signatures using constant-time comparison
         # to prevent timing attacks
@@ -269,9 +284,10 @@ def check_fingerprint_uniqueness(biometric_template, course_id, exclude_student_
     """
     Check if fingerprint is unique ONLY within the specific course.
     Student can have the same fingerprint in different courses.
+    Single indexed lookup on (biometric_digest, course, is_active).
     
     Args:
-        biometric_template (str): Encrypted biometric template
+        biometric_template (str): Raw biometric template (as sent by the ESP32)
         course_id (int): Course ID to check against
         exclude_student_id (int): Student ID to exclude from uniqueness check (own fingerprint)
         
@@ -283,23 +299,25 @@ def check_fingerprint_uniqueness(biometric_template, course_id, exclude_student_
     try:
         # Check if any other student has this fingerprint in THIS SPECIFIC COURSE ONLY
         # This allows the same fingerprint to be used in different courses
+        digest = biometric_digest(biometric_template)
         existing = BiometricRegistration.objects.filter(
+            biometric_digest=digest,
             course_id=course_id,
             is_active=True
-        )
+        ) if digest else BiometricRegistration.objects.none()
         
         if exclude_student_id:
             existing = existing.exclude(student_id=exclude_student_id)
         
-        for record in existing:
-            if verify_biometric_match(record.biometric_data, biometric_template):
-                logger.warning(f"Fingerprint duplicate detected in course {course_id}")
-                return {
-                    'is_unique': False,
-                    'message': f'This fingerprint is already registered by another student in this course.',
-                    'duplicate_student_id': record.student_id,
-                    'course_id': course_id
-                }
+        duplicate_student_id = existing.values_list('student_id', flat=True).first()
+        if duplicate_student_id is not None:
+            logger.warning(f"Fingerprint duplicate detected in course {course_id}")
+            return {
+                'is_unique': False,
+                'message': f'This fingerprint is already registered by another student in this course.',
+                'duplicate_student_id': duplicate_student_id,
+                'course_id': course_id
+            }
         
         logger.info(f"Fingerprint is unique for course {course_id}")
         return {
@@ -0,0 +1,290 @@
+"""
+Append-only fingerprint detection log.
+Detections from the ESP32 (MQTT or the HTTP fallback endpoint) are appended with a
+monotonically increasing sequence number per mode ('attendance' / 'registration').
+Consumers never remove anything: each polling session keeps its own cursor and asks
+for "everything after seq N", so concurrent appends cannot overwrite each other and
+one scanner tab cannot swallow detections another tab has not seen yet.
+
+Storage follows the enrollment state store (see enrollment_state.py):
+- 'cache': one key per entry plus an atomic cache.incr() head counter
+- 'db':    the FingerprintDetection table (autoincrement id is the sequence)
+- 'auto':  'cache' unless the default cache is process-local, then 'db'
+Entries expire after DETECTION_LOG_TTL seconds, matching the old 60 s queue.
+
+Neither backend loses entries under concurrency: a sequence number is handed out before
+its entry is visible (cache incr() before set(), a database id before the insert
+commits), so reads stop in front of a missing number until the entry after it is older
+than DETECTION_LOG_SETTLE_SECONDS, and the cursor only moves past entries delivered or
+skipped for good. A consumer that fell behind pages through the backlog.
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .enrollment_state import default_cache_is_process_local
+
+logger = logging.getLogger(__name__)
+
+DETECTION_LOG_BACKEND = getattr(settings, 'DETECTION_LOG_BACKEND', 'auto')
+DETECTION_LOG_TTL = getattr(settings, 'DETECTION_LOG_TTL', 60)  # Seconds an entry stays readable
+DETECTION_LOG_MAX_READ = getattr(settings, 'DETECTION_LOG_MAX_READ', 50)  # Entries returned per read
+DETECTION_LOG_REPLAY_SECONDS = getattr(settings, 'DETECTION_LOG_REPLAY_SECONDS', 10)  # History a new consumer sees
+DETECTION_LOG_SETTLE_SECONDS = getattr(settings, 'DETECTION_LOG_SETTLE_SECONDS', 2)  # Longest an append stays invisible after getting its seq
+DETECTION_LOG_MAX_BACKLOG = 1000  # Seqs a lagging consumer pages through; older ones have expired at any real detection rate
+
+DETECTION_MODES = ('attendance', 'registration')
+
+
+def normalize_mode(mode):
+    mode = str(mode or 'attendance').lower()
+    return mode if mode in DETECTION_MODES else 'attendance'
+
+
+def _settled_before():
+    """Entries stamped before this (ISO) can no longer have an earlier seq still in flight"""
+    return (timezone.now() - timedelta(seconds=DETECTION_LOG_SETTLE_SECONDS)).isoformat()
+
+
+class CacheDetectionLog:
+    """Entries under fp_detection:<mode>:<seq>; head counter under fp_detection_head:<mode>"""
+
+    ENTRY_KEY = 'fp_detection:{}:{}'
+    HEAD_KEY = 'fp_detection_head:{}'
+
+    def __init__(self, ttl=DETECTION_LOG_TTL):
+        from django.core.cache import cache
+        self.cache = cache
+        self.ttl = ttl
+
+    def _next_seq(self, mode):
+        key = self.HEAD_KEY.format(mode)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Counter missing (first use or evicted): restart above any seq handed out before
+            self.cache.add(key, int(time.time() * 1000), timeout=None)
+            return self.cache.incr(key)
+
+    def append(self, mode, entry):
+        seq = self._next_seq(mode)
+        entry['seq'] = seq
+        self.cache.set(self.ENTRY_KEY.format(mode, seq), entry, timeout=self.ttl)
+        return seq
+
+    def head(self, mode):
+        return int(self.cache.get(self.HEAD_KEY.format(mode)) or 0)
+
+    def read(self, mode, after, limit):
+        """
+        Up to `limit` entries after `after`, and the seq of the last one in an unbroken run
+        as the cursor. A seq is handed out by incr() before its entry is set, so a missing
+        key may be an append still in flight: reading stops in front of it unless the entry
+        after it is older than DETECTION_LOG_SETTLE_SECONDS (then the missing one expired or
+        was lost). A consumer more than DETECTION_LOG_MAX_BACKLOG seqs behind resumes there.
+        """
+        head = self.head(mode)
+        if after >= head:
+            return [], head  # Nothing new (a head below the cursor means the log was reset)
+        start = max(after + 1, 1)
+        if head - start >= DETECTION_LOG_MAX_BACKLOG:
+            start = head - DETECTION_LOG_MAX_BACKLOG + 1
+            logger.warning(f"[DETECTION-LOG] Cursor {after} is more than {DETECTION_LOG_MAX_BACKLOG} {mode} entries behind, resuming at {start}")
+        keys = [self.ENTRY_KEY.format(mode, seq) for seq in range(start, head + 1)]
+        found = self.cache.get_many(keys)
+        settled = _settled_before()
+        entries, cursor, gap = [], start - 1, False
+        for key in keys:
+            entry = found.get(key)
+            if entry is None:
+                gap = True
+                continue
+            if gap and entry.get('timestamp', '') >= settled:
+                break
+            entries.append(entry)
+            cursor, gap = entry['seq'], False
+            if len(entries) == limit:
+                break
+        return entries, cursor
+
+
+class DatabaseDetectionLog:
+    """Entries in the FingerprintDetection table"""
+
+    PRUNE_EVERY = 50  # Appends between purges of expired rows
+
+    def __init__(self, ttl=DETECTION_LOG_TTL):
+        self.ttl = ttl
+
+    def _live(self, mode):
+        from dashboard.models import FingerprintDetection
+        return FingerprintDetection.objects.filter(
+            mode=mode, created_at__gte=timezone.now() - timedelta(seconds=self.ttl)
+        )
+
+    def append(self, mode, entry):
+        from dashboard.models import FingerprintDetection
+        row = FingerprintDetection.objects.create(mode=mode, payload=entry)
+        entry['seq'] = row.id
+        if row.id % self.PRUNE_EVERY == 0:
+            # Keep the newest row: SQLite reuses ids once a table is empty, which would move seq backwards
+            FingerprintDetection.objects.filter(
+                created_at__lt=timezone.now() - timedelta(seconds=self.ttl)
+            ).exclude(id=row.id).delete()
+        return row.id
+
+    def head(self, mode):
+        from dashboard.models import FingerprintDetection
+        return FingerprintDetection.objects.filter(mode=mode).order_by('-id').values_list('id', flat=True).first() or 0
+
+    def read(self, mode, after, limit):
+        """
+        Up to `limit` entries after `after`, and the cursor: the last id read in an unbroken
+        run. Ids are handed out before the insert commits, so on Postgres a lower id can
+        become visible after a higher one. Rows of both modes share the id sequence, so the
+        run is checked across modes: reading stops in front of a missing id unless the row
+        after it is older than DETECTION_LOG_SETTLE_SECONDS (then the missing id was rolled
+        back or purged). Expired rows and rows of the other mode are passed over.
+        """
+        from dashboard.models import FingerprintDetection
+
+        rows = list(
+            FingerprintDetection.objects.filter(id__gt=after).order_by('id')
+            .values_list('id', 'mode', 'created_at', 'payload')[:DETECTION_LOG_MAX_BACKLOG]
+        )
+        if not rows:
+            # Nothing new: keep the cursor, unless the log was reset below it
+            last_id = FingerprintDetection.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            return [], min(after, last_id)
+        now = timezone.now()
+        settled = now - timedelta(seconds=DETECTION_LOG_SETTLE_SECONDS)
+        expired = now - timedelta(seconds=self.ttl)
+        entries, cursor = [], after
+        for seq, row_mode, created_at, payload in rows:
+            if seq != cursor + 1 and created_at >= settled:
+                break
+            cursor = seq
+            if row_mode != mode or created_at < expired:
+                continue
+            payload['seq'] = seq
+            entries.append(payload)
+            if len(entries) == limit:
+                break
+        return entries, cursor
+
+
+_log = None
+_log_lock = threading.Lock()
+_appended = threading.Condition()  # Wakes waiting stream requests in this process on append
+
+
+def get_detection_log():
+    """Get the process-wide detection log, picking the backend on first use"""
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                backend = DETECTION_LOG_BACKEND
+                if backend == 'auto':
+                    backend = 'db' if default_cache_is_process_local() else 'cache'
+                if backend == 'cache':
+                    _log = CacheDetectionLog()
+                elif backend == 'db':
+                    _log = DatabaseDetectionLog()
+                else:
+                    raise ValueError(f"Unknown DETECTION_LOG_BACKEND: {DETECTION_LOG_BACKEND}")
+                logger.info(f"[DETECTION-LOG] Using '{backend}' detection log backend")
+    return _log
+
+
+def append_detection(mode, fingerprint_id, confidence=0, match_type=None, reason=None, **extra):
+    """
+    Append one fingerprint detection.
+
+    Returns:
+        dict: The stored entry, including its 'seq'
+    """
+    mode = normalize_mode(mode)
+    now = timezone.now()
+    entry = {
+        'fingerprint_id': fingerprint_id,
+        'confidence': confidence,
+        'timestamp': now.isoformat(),
+        'key': f"fingerprint_detection_{mode}_{fingerprint_id}_{int(now.timestamp() * 1000)}",
+        'match_type': match_type,
+        'reason': reason,
+        **extra,
+    }
+    get_detection_log().append(mode, entry)
+    logger.info(f"[DETECTION-LOG] Appended {mode} detection seq={entry['seq']} fingerprint_id={fingerprint_id}")
+    notify_waiters()
+    return entry
+
+
+def notify_waiters():
+    """Wake stream requests waiting in this process (new detection, or attendance written for one)"""
+    with _appended:
+        _appended.notify_all()
+
+
+def wait_for_detection(timeout):
+    """
+    Block until a detection is appended in this process (or notify_waiters() is
+    called), or `timeout` seconds pass.
+    Appends made by other processes are only seen by re-reading the log.
+    """
+    with _appended:
+        return _appended.wait(timeout)
+
+
+def detection_head(mode):
+    """
+    Sequence number of the newest detection (one cache get or one indexed query): a cheap
+    "anything new?" check for waiters in processes that did not append it
+    """
+    return get_detection_log().head(normalize_mode(mode))
+
+
+def recent_detections(mode, limit=DETECTION_LOG_MAX_READ):
+    """
+    The newest live detections, without a cursor.
+
+    Returns:
+        tuple(list[dict], int): Up to `limit` entries in sequence order, and the current head
+    """
+    mode = normalize_mode(mode)
+    log = get_detection_log()
+    entries, head = log.read(mode, max(0, log.head(mode) - limit), limit)
+    return entries, head
+
+
+def read_detections(mode, after=None, limit=DETECTION_LOG_MAX_READ):
+    """
+    Detections appended after sequence number `after`.
+
+    A consumer without a cursor (after=None) gets the last DETECTION_LOG_REPLAY_SECONDS
+    of history, so a scanner opened right after a finger was placed still sees it.
+
+    Returns:
+        tuple(list[dict], int): Entries in sequence order, and the cursor to send next time
+    """
+    if after is None:
+        entries, head = recent_detections(mode)
+        cutoff = (timezone.now() - timedelta(seconds=DETECTION_LOG_REPLAY_SECONDS)).isoformat()
+        return [entry for entry in entries if entry.get('timestamp', '') >= cutoff][-limit:], head
+    # A head below the cursor means the log was reset; the returned head resyncs the consumer
+    return get_detection_log().read(normalize_mode(mode), after, limit)
+
+
+def parse_cursor(value):
+    """Cursor from a query parameter; None when missing or malformed"""
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor >= 0 else None
@@ -0,0 +1,278 @@
+"""
+Per-sensor telemetry: heartbeats, Wi-Fi RSSI and message rates.
+The MQTT ingest records every message a sensor sends in memory: a fixed-size ring buffer
+of recent samples per device (DEVICE_TELEMETRY_RING_SIZE, for RSSI trends) and running
+counters for the current DEVICE_TELEMETRY_BUCKET_SECONDS bucket. Finished buckets are
+downsampled into one DeviceTelemetry row per device (counts, RSSI min/avg/max and
+sample sum/count, last uptime, reconnects), so the database grows by one small row per sensor per bucket
+instead of one per message.
+
+A reconnect is counted when the sensor's reported uptime goes backwards (reboot) or when
+no heartbeat arrived for DEVICE_HEARTBEAT_GAP_SECONDS (the firmware sends one every 30 s).
+
+device_health() aggregates the last hours of buckets with one GROUP BY query: the RSSI
+average is weighted by samples (sum/count, not an average of bucket averages) and uptime
+comes from the newest bucket that reported one. In the ingest process the buckets not
+yet written are merged in from memory.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEVICE_TELEMETRY_RING_SIZE = getattr(settings, 'DEVICE_TELEMETRY_RING_SIZE', 512)  # Samples kept per device
+DEVICE_TELEMETRY_BUCKET_SECONDS = getattr(settings, 'DEVICE_TELEMETRY_BUCKET_SECONDS', 60)
+DEVICE_TELEMETRY_RETENTION_DAYS = getattr(settings, 'DEVICE_TELEMETRY_RETENTION_DAYS', 30)
+DEVICE_HEARTBEAT_GAP_SECONDS = getattr(settings, 'DEVICE_HEARTBEAT_GAP_SECONDS', 90)
+
+
+class _DeviceRing:
+    """
+    Recent samples of one sensor, (epoch seconds, kind, rssi, uptime_seconds), plus running
+    counters for the buckets not yet written, so a busy bucket is counted exactly even
+    when the ring wraps
+    """
+
+    def __init__(self):
+        self.samples = deque(maxlen=DEVICE_TELEMETRY_RING_SIZE)
+        self.buckets = {}  # bucket start (epoch) -> counters
+        self.last_heartbeat = None
+        self.last_uptime = None
+
+
+_lock = threading.Lock()
+_rings = {}
+_next_flush = None  # Epoch at which the oldest open bucket is finished
+
+
+def _bucket_start(epoch):
+    return epoch - epoch % DEVICE_TELEMETRY_BUCKET_SECONDS
+
+
+def _new_counters():
+    return {
+        'messages': 0, 'heartbeats': 0, 'detections': 0, 'enroll_messages': 0, 'reconnects': 0,
+        'rssi_min': None, 'rssi_max': None, 'rssi_sum': 0, 'rssi_count': 0, 'uptime_seconds': None, 'last_seen': 0,
+    }
+
+
+def record(device_id, kind, rssi=None, uptime_seconds=None, now=None):
+    """Add one sample for `device_id` (cheap; the database is only touched on bucket flush)"""
+    global _next_flush
+    now = time.time() if now is None else now
+    bucket = _bucket_start(now)
+    with _lock:
+        ring = _rings.get(device_id)
+        if ring is None:
+            ring = _rings[device_id] = _DeviceRing()
+        counters = ring.buckets.get(bucket)
+        if counters is None:
+            counters = ring.buckets[bucket] = _new_counters()
+        counters['messages'] += 1
+        counters['last_seen'] = now
+        if kind == 'status':
+            counters['heartbeats'] += 1
+            if ring.last_uptime is not None and uptime_seconds is not None and uptime_seconds < ring.last_uptime:
+                counters['reconnects'] += 1  # Rebooted
+            elif ring.last_heartbeat is not None and now - ring.last_heartbeat > DEVICE_HEARTBEAT_GAP_SECONDS:
+                counters['reconnects'] += 1  # Dropped off and came back
+            ring.last_heartbeat = now
+            if uptime_seconds is not None:
+                ring.last_uptime = counters['uptime_seconds'] = uptime_seconds
+        elif kind == 'detection':
+            counters['detections'] += 1
+        elif kind == 'enroll':
+            counters['enroll_messages'] += 1
+        if rssi is not None:
+            counters['rssi_min'] = rssi if counters['rssi_min'] is None else min(counters['rssi_min'], rssi)
+            counters['rssi_max'] = rssi if counters['rssi_max'] is None else max(counters['rssi_max'], rssi)
+            counters['rssi_sum'] += rssi
+            counters['rssi_count'] += 1
+        ring.samples.append((now, kind, rssi, uptime_seconds))
+        if _next_flush is None:
+            _next_flush = bucket + DEVICE_TELEMETRY_BUCKET_SECONDS
+        due = now >= _next_flush
+    if due:
+        flush(now)
+
+
+def record_status(device_id, payload):
+    """
+    Message on biometric/<device_id>/status. Only the periodic heartbeat carries
+    uptime_seconds; command replies on the same topic count as plain messages.
+    """
+    def number(key):
+        try:
+            return int(payload.get(key))
+        except (TypeError, ValueError):
+            return None
+    uptime_seconds = number('uptime_seconds')
+    kind = 'status' if uptime_seconds is not None else 'message'
+    record(device_id, kind, rssi=number('wifi_signal'), uptime_seconds=uptime_seconds)
+
+
+def _fields(counters):
+    """DeviceTelemetry fields from one bucket's counters"""
+    return {
+        'messages': counters['messages'],
+        'heartbeats': counters['heartbeats'],
+        'detections': counters['detections'],
+        'enroll_messages': counters['enroll_messages'],
+        'reconnects': counters['reconnects'],
+        'rssi_min': counters['rssi_min'],
+        'rssi_max': counters['rssi_max'],
+        'rssi_avg': round(counters['rssi_sum'] / counters['rssi_count'], 1) if counters['rssi_count'] else None,
+        'rssi_sum': counters['rssi_sum'],
+        'rssi_count': counters['rssi_count'],
+        'uptime_seconds': counters['uptime_seconds'],
+        'last_seen': datetime.fromtimestamp(counters['last_seen'], tz=dt_timezone.utc),
+    }
+
+
+def flush(now=None):
+    """
+    Write every finished bucket as a DeviceTelemetry row and drop it from memory
+    (called on bucket rollover and periodically by the MQTT ingest).
+
+    Returns:
+        int: Rows written
+    """
+    global _next_flush
+    from dashboard.models import DeviceTelemetry
+
+    now = time.time() if now is None else now
+    current = _bucket_start(now)
+    with _lock:
+        finished = []
+        for device_id, ring in _rings.items():
+            for bucket in [b for b in ring.buckets if b < current]:
+                finished.append((device_id, bucket, ring.buckets.pop(bucket)))
+        _next_flush = current + DEVICE_TELEMETRY_BUCKET_SECONDS
+
+    if not finished:
+        return 0
+    rows = [
+        DeviceTelemetry(
+            device_id=device_id,
+            bucket_start=datetime.fromtimestamp(bucket, tz=dt_timezone.utc),
+            bucket_seconds=DEVICE_TELEMETRY_BUCKET_SECONDS,
+            **_fields(counters),
+        )
+        for device_id, bucket, counters in finished
+    ]
+    try:
+        DeviceTelemetry.objects.bulk_create(rows, ignore_conflicts=True)
+    except Exception as e:
+        logger.error(f"[TELEMETRY] Could not write {len(rows)} bucket(s): {e}")
+        return 0
+    if int(current // DEVICE_TELEMETRY_BUCKET_SECONDS) % 60 == 0:
+        DeviceTelemetry.objects.filter(
+            bucket_start__lt=timezone.now() - timedelta(days=DEVICE_TELEMETRY_RETENTION_DAYS)
+        ).delete()
+    return len(rows)
+
+
+def _live_buckets():
+    """Fields of the buckets still in memory, merged per device"""
+    with _lock:
+        open_buckets = {
+            device_id: [dict(counters) for counters in ring.buckets.values()]
+            for device_id, ring in _rings.items() if ring.buckets
+        }
+    live = {}
+    for device_id, buckets in open_buckets.items():
+        merged = _new_counters()
+        for counters in buckets:
+            for key in ('messages', 'heartbeats', 'detections', 'enroll_messages', 'reconnects', 'rssi_sum', 'rssi_count'):
+                merged[key] += counters[key]
+            for key, pick in (('rssi_min', min), ('rssi_max', max)):
+                values = [v for v in (merged[key], counters[key]) if v is not None]
+                merged[key] = pick(values) if values else None
+            if counters['last_seen'] >= merged['last_seen']:
+                merged['last_seen'] = counters['last_seen']
+                if counters['uptime_seconds'] is not None:
+                    merged['uptime_seconds'] = counters['uptime_seconds']
+        live[device_id] = _fields(merged)
+    return live
+
+
+def device_health(hours=1):
+    """
+    Aggregated health per sensor over the last `hours`: message and detection rates, last
+    seen, uptime, reconnects and RSSI. One aggregate query plus the unflushed in-memory bucket.
+
+    Returns:
+        list[dict]: One entry per sensor that sent anything in the window, by device_id
+    """
+    from django.db.models import Max, Min, OuterRef, Subquery, Sum
+    from dashboard.models import DeviceTelemetry
+
+    window_start = timezone.now() - timedelta(hours=hours)
+    buckets = DeviceTelemetry.objects.filter(bucket_start__gte=window_start)
+    latest_uptime = (
+        buckets.filter(device_id=OuterRef('device_id'), uptime_seconds__isnull=False)
+        .order_by('-bucket_start').values('uptime_seconds')[:1]
+    )
+    rows = (
+        buckets.values('device_id')
+        .annotate(
+            messages=Sum('messages'), heartbeats=Sum('heartbeats'), detections=Sum('detections'),
+            enroll_messages=Sum('enroll_messages'), reconnects=Sum('reconnects'), last_seen=Max('last_seen'),
+            uptime_seconds=Subquery(latest_uptime), rssi_min=Min('rssi_min'), rssi_max=Max('rssi_max'),
+            rssi_sum=Sum('rssi_sum'), rssi_count=Sum('rssi_count'),
+        )
+        .order_by()
+    )
+    health = {row['device_id']: dict(row) for row in rows}
+
+    for device_id, live in _live_buckets().items():
+        entry = health.setdefault(device_id, {'device_id': device_id})
+        for key in ('messages', 'heartbeats', 'detections', 'enroll_messages', 'reconnects', 'rssi_sum', 'rssi_count'):
+            entry[key] = (entry.get(key) or 0) + live[key]
+        entry['last_seen'] = max(v for v in (entry.get('last_seen'), live['last_seen']) if v is not None)
+        if live['uptime_seconds'] is not None:
+            # Open buckets are newer than every written one
+            entry['uptime_seconds'] = live['uptime_seconds']
+        if live['rssi_count']:
+            for key, pick in (('rssi_min', min), ('rssi_max', max)):
+                entry[key] = pick(v for v in (entry.get(key), live[key]) if v is not None)
+
+    now = timezone.now()
+    minutes = hours * 60
+    result = []
+    for device_id in sorted(health):
+        entry = health[device_id]
+        last_seen = entry.get('last_seen')
+        seconds_since = (now - last_seen).total_seconds() if last_seen else None
+        result.append({
+            'device_id': device_id,
+            'online': seconds_since is not None and seconds_since <= DEVICE_HEARTBEAT_GAP_SECONDS,
+            'last_seen': last_seen.isoformat() if last_seen else None,
+            'seconds_since_seen': round(seconds_since) if seconds_since is not None else None,
+            'uptime_seconds': entry.get('uptime_seconds'),
+            'reconnects': entry.get('reconnects') or 0,
+            'messages_per_minute': round((entry.get('messages') or 0) / minutes, 2),
+            'detections_per_minute': round((entry.get('detections') or 0) / minutes, 2),
+            'heartbeats': entry.get('heartbeats') or 0,
+            'rssi': {
+                'min': entry.get('rssi_min'),
+                'avg': round(entry['rssi_sum'] / entry['rssi_count'], 1) if entry.get('rssi_count') else None,
+                'max': entry.get('rssi_max'),
+            },
+        })
+    return result
+
+
+def recent_rssi(device_id, limit=60):
+    """RSSI trend from the in-memory ring (ingest process only): [(iso time, rssi)]"""
+    with _lock:
+        ring = _rings.get(device_id)
+        samples = [(s[0], s[2]) for s in ring.samples if s[2] is not None] if ring else []
+    return [(datetime.fromtimestamp(ts, tz=dt_timezone.utc).isoformat(), rssi) for ts, rssi in samples[-limit:]]
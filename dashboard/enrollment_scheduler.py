@@ -0,0 +1,463 @@
+"""
+Fair fingerprint enrollment scheduler.
+Enrolling used to take one global cache lock, so the whole institution could enroll a
+single fingerprint at a time and everyone else was turned away with "another student
+is enrolling". Requests now join a FIFO queue (EnrollmentQueueEntry) and are handed
+to free sensors from the device registry (biometric_devices) in arrival order, so
+throughput grows with the number of sensors.
+
+An 'active' entry is the lock on its sensor: the database allows one per device_id
+(and one per fingerprint slot), so two workers dispatching at once cannot start two
+enrollments on the same sensor. A sensor is released when the ESP32 reports
+success/error/cancelled (finish_enrollment), when the student cancels, or when the
+lease of BIOMETRIC_ENROLLMENT_LEASE_SECONDS runs out (the old lock TTL); every
+release dispatches the next student in line.
+
+Queue position and an ETA (position / sensors x recent average enrollment time) are
+reported by queue_status() and exposed through the enrollment status APIs.
+"""
+
+import logging
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .biometric_devices import active_device_ids, device_topic
+from .slot_allocator import (
+    BIOMETRIC_SLOT_MIN, SlotsExhausted, allocate_slot, mark_slot, release_if_unregistered, release_slot,
+)
+
+logger = logging.getLogger(__name__)
+
+BIOMETRIC_ENROLLMENT_LEASE_SECONDS = getattr(settings, 'BIOMETRIC_ENROLLMENT_LEASE_SECONDS', 5 * 60)  # Sensor hold before it is reclaimed
+BIOMETRIC_ENROLLMENT_DEFAULT_SECONDS = getattr(settings, 'BIOMETRIC_ENROLLMENT_DEFAULT_SECONDS', 60)  # ETA per enrollment before any history
+ENROLLMENT_ETA_SAMPLE = 20  # Recent finished enrollments averaged for the ETA
+
+LIVE_STATUSES = ('waiting', 'active')
+
+
+class EnrollmentRejected(Exception):
+    """The enrollment could not be queued or started; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _mqtt_client():
+    from .mqtt_client import get_mqtt_client
+    return get_mqtt_client()
+
+
+def _broadcast(enrollment_id, **event):
+    """Push a scan_update to the student's enrollment WebSocket (best-effort)"""
+    try:
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+
+        async_to_sync(get_channel_layer().group_send)(
+            f"biometric_enrollment_{enrollment_id}", {'type': 'scan_update', **event}
+        )
+    except Exception as e:
+        logger.debug(f"[ENROLL-QUEUE] Could not broadcast to {enrollment_id}: {e}")
+
+
+def _device_name(device_id):
+    from dashboard.models import BiometricDevice
+    return BiometricDevice.objects.filter(device_id=device_id).values_list('name', flat=True).first() or device_id
+
+
+# ======================== QUEUE ========================
+
+def request_enrollment(student, course, enrollment_id, template_id):
+    """
+    Queue an enrollment and start it straight away if a sensor is free.
+
+    A student already waiting keeps their place in line (the entry takes the new ids);
+    a student already enrolling restarts on the sensor they hold.
+
+    Returns:
+        dict: queue_status() of the entry - 'queue_status' is 'active' (started) or 'waiting'
+
+    Raises:
+        EnrollmentRejected: MQTT is down, or the enrollment failed to start
+    """
+    from dashboard.enrollment_state import cleanup_old_enrollments, create_enrollment_state, get_enrollment_state
+    from dashboard.models import BiometricRegistration, EnrollmentQueueEntry
+
+    mqtt_client = _mqtt_client()
+    if not mqtt_client or not mqtt_client.is_connected:
+        raise EnrollmentRejected('MQTT broker not connected. Please wait a moment and try again.', status=503)
+
+    # Clean up states from previous attempts so a re-registration does not collide with them
+    cleanup_old_enrollments(student.id, course.id)
+    existing = BiometricRegistration.objects.filter(student=student, course=course, is_active=True).first()
+    create_enrollment_state(
+        enrollment_id=enrollment_id,
+        user_id=student.id,
+        course_id=course.id,
+        template_id=template_id,
+        is_re_registration=existing is not None,
+        old_fingerprint_id=existing.fingerprint_id if existing else None,
+    )
+
+    restart = None
+    with transaction.atomic():
+        entry = EnrollmentQueueEntry.objects.select_for_update().filter(
+            student=student, status__in=LIVE_STATUSES
+        ).first()
+        if entry is None:
+            entry = EnrollmentQueueEntry.objects.create(
+                enrollment_id=enrollment_id, template_id=template_id, student=student, course=course,
+            )
+        else:
+            if entry.enrollment_id != enrollment_id:
+                _drop_state(entry.enrollment_id)
+            entry.enrollment_id = enrollment_id
+            entry.template_id = template_id
+            entry.course = course
+            if entry.status == 'active':
+                entry.lease_expires_at = timezone.now() + timedelta(seconds=BIOMETRIC_ENROLLMENT_LEASE_SECONDS)
+                restart = entry
+            entry.save(update_fields=['enrollment_id', 'template_id', 'course', 'lease_expires_at'])
+
+    if restart is not None:
+        logger.info(f"[ENROLL-QUEUE] {student.school_id} restarts enrollment on {entry.device_id}")
+        _start_on_device(entry)
+    else:
+        dispatch()
+
+    status = queue_status(enrollment_id) or {'queue_status': 'failed'}
+    if status['queue_status'] == 'failed':
+        state = get_enrollment_state(enrollment_id) or {}
+        raise EnrollmentRejected(state.get('error') or 'Failed to send enrollment request to ESP32. Please try again.', status=502)
+    if status['queue_status'] == 'waiting':
+        _mark_waiting(enrollment_id, status)
+    return status
+
+
+def _mark_waiting(enrollment_id, status):
+    from dashboard.enrollment_state import set_enrollment_fields
+
+    minutes = max(1, round(status['eta_seconds'] / 60))
+    set_enrollment_fields(
+        enrollment_id,
+        status='queued',
+        message=f"All sensors are busy. You are number {status['queue_position']} in line (about {minutes} min).",
+        queue_position=status['queue_position'],
+        eta_seconds=status['eta_seconds'],
+    )
+
+
+def _drop_state(enrollment_id):
+    from dashboard.enrollment_state import delete_enrollment_state
+    try:
+        delete_enrollment_state(enrollment_id)
+    except Exception:
+        pass
+
+
+def _allocate_slot(entry, device_id):
+    """
+    Fingerprint slot for `entry` on `device_id`: the student's existing slot in the
+    reserved range, otherwise a free one from the sensor's slot map.
+
+    Returns:
+        tuple(int, bool): The slot and whether it was newly allocated
+
+    Raises:
+        SlotsExhausted: The sensor is full
+    """
+    from dashboard.models import BiometricRegistration
+
+    own_slots = list(BiometricRegistration.objects.filter(
+        student_id=entry.student_id, is_active=True, fingerprint_id__gte=BIOMETRIC_SLOT_MIN,
+    ).order_by('-created_at').values_list('course_id', 'fingerprint_id'))
+    for course_id, slot in own_slots:
+        if course_id == entry.course_id:
+            mark_slot(device_id, slot)
+            return slot, False
+    if own_slots:
+        mark_slot(device_id, own_slots[0][1])
+        return own_slots[0][1], False
+    return allocate_slot(device_id), True
+
+
+def _free_devices():
+    from dashboard.models import EnrollmentQueueEntry
+
+    busy = set(EnrollmentQueueEntry.objects.filter(status='active').values_list('device_id', flat=True))
+    return [device_id for device_id in active_device_ids() if device_id not in busy]
+
+
+def _claim_next(device_id):
+    """Mark the oldest waiting entry active on `device_id`; None if the queue is empty or another worker won"""
+    from dashboard.models import EnrollmentQueueEntry
+
+    try:
+        with transaction.atomic():
+            entry = (
+                EnrollmentQueueEntry.objects.select_for_update(skip_locked=True)
+                .filter(status='waiting').order_by('enqueued_at', 'id').first()
+            )
+            if entry is None:
+                return None
+            try:
+                slot, new_slot = _allocate_slot(entry, device_id)
+            except SlotsExhausted:
+                _fail(entry, 'No available fingerprint slots (sensor capacity reached).')
+                return entry
+            now = timezone.now()
+            claimed = EnrollmentQueueEntry.objects.filter(pk=entry.pk, status='waiting').update(
+                status='active',
+                device_id=device_id,
+                slot=slot,
+                started_at=now,
+                lease_expires_at=now + timedelta(seconds=BIOMETRIC_ENROLLMENT_LEASE_SECONDS),
+            )
+    except IntegrityError:
+        # Another worker started something on this sensor (or slot) first; the slot
+        # reservation was rolled back with it
+        return None
+    if not claimed:
+        if new_slot:
+            release_slot(device_id, slot)
+        return None
+    entry.refresh_from_db()
+    return entry
+
+
+def dispatch():
+    """
+    Hand free sensors to the oldest waiting enrollments and start them.
+
+    Returns:
+        list: Entries started by this call
+    """
+    expire_leases()
+    started = []
+    for _ in range(len(active_device_ids()) + 1):
+        free = _free_devices()
+        if not free:
+            break
+        entry = _claim_next(free[0])
+        if entry is None:
+            break
+        if entry.status == 'active' and _start_on_device(entry):
+            started.append(entry)
+    return started
+
+
+def _start_on_device(entry):
+    """Register the slot and send the start command to the entry's sensor; False (and released) on failure"""
+    from dashboard.enrollment_state import create_enrollment_state, set_enrollment_fields
+    from dashboard.models import BiometricRegistration
+
+    BiometricRegistration.objects.update_or_create(
+        student_id=entry.student_id,
+        course_id=entry.course_id,
+        defaults={'fingerprint_id': entry.slot, 'is_active': True, 'biometric_type': 'fingerprint'},
+    )
+
+    device_name = _device_name(entry.device_id)
+    fields = {
+        'status': 'processing',
+        'message': f'Sensor {device_name} is ready. Place your finger on it.',
+        'fingerprint_slot': entry.slot,
+        'device_id': entry.device_id,
+        'device_name': device_name,
+        'queue_position': 0,
+        'eta_seconds': 0,
+    }
+    if set_enrollment_fields(entry.enrollment_id, **fields) is None:
+        # Waited longer than the state TTL
+        create_enrollment_state(entry.enrollment_id, entry.student_id, entry.course_id, template_id=entry.template_id)
+        set_enrollment_fields(entry.enrollment_id, **fields)
+
+    topic = device_topic(entry.device_id, 'enroll/request')
+    enrollment_request = {
+        'action': 'start',
+        'template_id': entry.template_id,
+        'slot': entry.slot,
+        'scans_required': 3,
+    }
+    mqtt_client = _mqtt_client()
+    # retain=True so a sensor that briefly drops off WiFi still gets the start command on reconnect
+    sent = bool(mqtt_client and mqtt_client.is_connected and mqtt_client.publish(topic, enrollment_request, qos=1, retain=True))
+    if not sent:
+        logger.warning(f"[ENROLL-QUEUE] Failed to publish start for {entry.enrollment_id} to {topic}")
+        _fail(entry, 'Failed to send enrollment request to ESP32. Please try again.')
+        return False
+
+    logger.info(f"[ENROLL-QUEUE] Started {entry.enrollment_id} on {entry.device_id} (slot {entry.slot})")
+    _broadcast(
+        entry.enrollment_id, status='assigned', slot=entry.slot, step=0, success=True, progress=0,
+        message=fields['message'], template_id=entry.template_id,
+    )
+    return True
+
+
+def _fail(entry, message):
+    from dashboard.enrollment_state import update_enrollment_state
+    from dashboard.models import EnrollmentQueueEntry
+
+    EnrollmentQueueEntry.objects.filter(pk=entry.pk, status__in=LIVE_STATUSES).update(
+        status='failed', finished_at=timezone.now(), lease_expires_at=None,
+    )
+    entry.status = 'failed'
+    update_enrollment_state(entry.enrollment_id, progress=0, message=message, status='failed', error=message)
+
+
+def finish_enrollment(template_id=None, enrollment_id=None, outcome='done'):
+    """
+    Release the sensor (or queue place) of an enrollment that ended - outcome 'done',
+    'failed' or 'cancelled' - and start the next student in line.
+
+    Returns:
+        bool: True if a live entry was released
+    """
+    from dashboard.models import EnrollmentQueueEntry
+
+    entries = EnrollmentQueueEntry.objects.filter(status__in=LIVE_STATUSES)
+    if enrollment_id:
+        entries = entries.filter(enrollment_id=enrollment_id)
+    elif template_id:
+        entries = entries.filter(template_id=template_id)
+    else:
+        return False
+    held_slots = list(entries.filter(status='active').values_list('device_id', 'slot'))
+    released = entries.update(status=outcome, finished_at=timezone.now(), lease_expires_at=None)
+    if released:
+        logger.info(f"[ENROLL-QUEUE] Released {enrollment_id or template_id} ({outcome})")
+        if outcome != 'done':
+            for device_id, slot in held_slots:
+                release_if_unregistered(device_id, slot)
+        dispatch()
+    return bool(released)
+
+
+def cancel_student_enrollment(student):
+    """
+    Cancel the student's queued or running enrollment; a running one is also cancelled
+    on its sensor.
+
+    Returns:
+        EnrollmentQueueEntry or None: The cancelled entry
+    """
+    from dashboard.models import EnrollmentQueueEntry
+
+    entry = EnrollmentQueueEntry.objects.filter(student=student, status__in=LIVE_STATUSES).first()
+    if entry is None:
+        return None
+    if entry.status == 'active':
+        mqtt_client = _mqtt_client()
+        if mqtt_client and mqtt_client.is_connected:
+            mqtt_client.publish(
+                device_topic(entry.device_id, 'enroll/request'),
+                {'action': 'cancel_enrollment', 'slot': entry.slot}, qos=1,
+            )
+    finish_enrollment(enrollment_id=entry.enrollment_id, outcome='cancelled')
+    return entry
+
+
+def expire_leases():
+    """Reclaim sensors whose enrollment outlived its lease (sensor went quiet, tab closed, ...)"""
+    from dashboard.enrollment_state import update_enrollment_state
+    from dashboard.models import EnrollmentQueueEntry
+
+    expired = list(EnrollmentQueueEntry.objects.filter(status='active', lease_expires_at__lt=timezone.now()))
+    for entry in expired:
+        if not EnrollmentQueueEntry.objects.filter(pk=entry.pk, status='active').update(
+            status='failed', finished_at=timezone.now(), lease_expires_at=None,
+        ):
+            continue
+        logger.warning(f"[ENROLL-QUEUE] Lease expired for {entry.enrollment_id} on {entry.device_id}")
+        release_if_unregistered(entry.device_id, entry.slot)
+        update_enrollment_state(entry.enrollment_id, progress=0, message='Enrollment timed out', status='failed', error='Enrollment timed out')
+        try:
+            mqtt_client = _mqtt_client()
+            if mqtt_client and mqtt_client.is_connected:
+                mqtt_client.publish(
+                    device_topic(entry.device_id, 'enroll/request'),
+                    {'action': 'cancel_enrollment', 'slot': entry.slot}, qos=1,
+                )
+        except Exception:
+            pass
+    return len(expired)
+
+
+def device_for_template(template_id):
+    """Sensor an enrollment ran on (for confirm/completion messages); the default sensor if unknown"""
+    from dashboard.models import EnrollmentQueueEntry
+
+    if not template_id:
+        return None
+    return (
+        EnrollmentQueueEntry.objects.filter(template_id=template_id).exclude(device_id='')
+        .order_by('-id').values_list('device_id', flat=True).first()
+    )
+
+
+# ======================== STATUS ========================
+
+def average_enrollment_seconds():
+    """Mean duration of the last ENROLLMENT_ETA_SAMPLE completed enrollments"""
+    from dashboard.models import EnrollmentQueueEntry
+
+    rows = EnrollmentQueueEntry.objects.filter(
+        status='done', started_at__isnull=False, finished_at__isnull=False,
+    ).order_by('-finished_at').values_list('started_at', 'finished_at')[:ENROLLMENT_ETA_SAMPLE]
+    durations = [(finished - started).total_seconds() for started, finished in rows if finished > started]
+    return sum(durations) / len(durations) if durations else BIOMETRIC_ENROLLMENT_DEFAULT_SECONDS
+
+
+def queue_status(enrollment_id):
+    """
+    Where an enrollment stands in the queue.
+
+    Returns:
+        dict or None: {'queue_status', 'queue_position', 'eta_seconds', 'device_id', 'slot'} -
+        position 0 and ETA 0 once a sensor is assigned; None for enrollments not in the queue
+    """
+    from django.db.models import Q
+    from dashboard.models import EnrollmentQueueEntry
+
+    entry = EnrollmentQueueEntry.objects.filter(enrollment_id=enrollment_id).first()
+    if entry is None:
+        return None
+    if entry.status == 'waiting':
+        # Picks up sensors freed by an expired lease or newly registered
+        expire_leases()
+        if _free_devices():
+            dispatch()
+            entry.refresh_from_db()
+
+    status = {
+        'queue_status': entry.status,
+        'queue_position': 0,
+        'eta_seconds': 0,
+        'device_id': entry.device_id or None,
+        'slot': entry.slot,
+    }
+    if entry.status == 'waiting':
+        ahead = EnrollmentQueueEntry.objects.filter(status='waiting').filter(
+            Q(enqueued_at__lt=entry.enqueued_at) | Q(enqueued_at=entry.enqueued_at, id__lt=entry.id)
+        ).count()
+        position = ahead + 1
+        sensors = max(1, len(active_device_ids()))
+        status['queue_position'] = position
+        status['eta_seconds'] = int(math.ceil(position / sensors) * average_enrollment_seconds())
+    return status
+
+
+def student_queue_status(student):
+    """queue_status() of the student's live enrollment, or None"""
+    from dashboard.models import EnrollmentQueueEntry
+
+    enrollment_id = EnrollmentQueueEntry.objects.filter(
+        student=student, status__in=LIVE_STATUSES
+    ).values_list('enrollment_id', flat=True).first()
+    return queue_status(enrollment_id) if enrollment_id else None
@@ -5,15 +5,303 @@ Single source of truth for all enrollment states used by:
 - WebSocket consumers
 - MQTT Bridge
 - Frontend applications
+
+States live in a store shared by every worker process, so the MQTT thread in one
+gunicorn worker and the polling request served by another see the same session:
+- 'cache': the default Django cache (Redis/Memcached/file/DB cache)
+- 'db':    the EnrollmentSessionState table
+- 'auto':  'cache' unless the default cache is process-local (LocMem/Dummy), then 'db'
+
+Each state expires ENROLLMENT_STATE_TTL seconds after its last write. Field updates
+are atomic per enrollment (cache lock / SELECT ... FOR UPDATE), and template_id has
+its own index so MQTT messages resolve their enrollment with one lookup. Reads go
+through a short-lived in-process copy (ENROLLMENT_STATE_LOCAL_TTL) so busy polling
+does not hit the shared store on every request.
 """
 
+import json
 import logging
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+ENROLLMENT_STATE_BACKEND = getattr(settings, 'ENROLLMENT_STATE_BACKEND', 'auto')
+ENROLLMENT_STATE_TTL = getattr(settings, 'ENROLLMENT_STATE_TTL', 900)  # Seconds after the last write
+ENROLLMENT_STATE_LOCAL_TTL = getattr(settings, 'ENROLLMENT_STATE_LOCAL_TTL', 0.5)  # In-process read-through copy
+
+_LOCK_TIMEOUT = 5  # Seconds a cache-backend field lock may be held
+_LOCK_WAIT = 2.0  # Seconds to wait for it before writing anyway
+
+
+# ======================== STORES ========================
+
+class CacheStateStore:
+    """States in the default Django cache: one key per state, one per template_id, one id list"""
+
+    STATE_KEY = 'enrollment_state:{}'
+    TEMPLATE_KEY = 'enrollment_state_template:{}'
+    LOCK_KEY = 'enrollment_state_lock:{}'
+    IDS_KEY = 'enrollment_state_ids'
+
+    def __init__(self, ttl=ENROLLMENT_STATE_TTL):
+        from django.core.cache import cache
+        self.cache = cache
+        self.ttl = ttl
+
+    @contextmanager
+    def _lock(self, name):
+        key = self.LOCK_KEY.format(name)
+        deadline = time.monotonic() + _LOCK_WAIT
+        acquired = self.cache.add(key, 1, timeout=_LOCK_TIMEOUT)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.01)
+            acquired = self.cache.add(key, 1, timeout=_LOCK_TIMEOUT)
+        if not acquired:
+            logger.warning(f"[STATE] Lock {key} still held after {_LOCK_WAIT}s - writing anyway")
+        try:
+            yield
+        finally:
+            if acquired:
+                self.cache.delete(key)
+
+    def _track_id(self, enrollment_id, present):
+        with self._lock('ids'):
+            ids = set(self.cache.get(self.IDS_KEY) or ())
+            if present:
+                ids.add(enrollment_id)
+            else:
+                ids.discard(enrollment_id)
+            self.cache.set(self.IDS_KEY, sorted(ids), timeout=self.ttl)
+
+    def get(self, enrollment_id):
+        return self.cache.get(self.STATE_KEY.format(enrollment_id))
+
+    def put(self, enrollment_id, state):
+        with self._lock(enrollment_id):
+            previous = self.get(enrollment_id)
+            self.cache.set(self.STATE_KEY.format(enrollment_id), state, timeout=self.ttl)
+            self._reindex(enrollment_id, previous, state)
+        self._track_id(enrollment_id, True)
+        return state
+
+    def update(self, enrollment_id, fields):
+        with self._lock(enrollment_id):
+            state = self.get(enrollment_id)
+            if state is None:
+                return None
+            previous = dict(state)
+            state.update(fields)
+            self.cache.set(self.STATE_KEY.format(enrollment_id), state, timeout=self.ttl)
+            self._reindex(enrollment_id, previous, state)
+            return state
+
+    def _reindex(self, enrollment_id, previous, state):
+        old_template = (previous or {}).get('template_id')
+        new_template = state.get('template_id')
+        if old_template and old_template != new_template:
+            self.cache.delete(self.TEMPLATE_KEY.format(old_template))
+        if new_template:
+            self.cache.set(self.TEMPLATE_KEY.format(new_template), enrollment_id, timeout=self.ttl)
+
+    def delete(self, enrollment_id):
+        with self._lock(enrollment_id):
+            state = self.get(enrollment_id)
+            if state is None:
+                return False
+            self.cache.delete(self.STATE_KEY.format(enrollment_id))
+            if state.get('template_id'):
+                self.cache.delete(self.TEMPLATE_KEY.format(state['template_id']))
+        self._track_id(enrollment_id, False)
+        return True
+
+    def find_by_template(self, template_id):
+        return self.cache.get(self.TEMPLATE_KEY.format(template_id))
+
+    def all(self):
+        ids = self.cache.get(self.IDS_KEY) or []
+        keys = {self.STATE_KEY.format(eid): eid for eid in ids}
+        found = self.cache.get_many(list(keys))
+        return {keys[key]: state for key, state in found.items()}
+
+
+class DatabaseStateStore:
+    """States in the EnrollmentSessionState table (template_id is an indexed column)"""
+
+    def __init__(self, ttl=ENROLLMENT_STATE_TTL):
+        self.ttl = ttl
+
+    def _live(self):
+        from dashboard.models import EnrollmentSessionState
+        return EnrollmentSessionState.objects.filter(expires_at__gt=timezone.now())
+
+    def _row_fields(self, state):
+        return {
+            'template_id': str(state.get('template_id') or ''),
+            'user_id': state.get('user_id'),
+            'course_id': state.get('course_id'),
+            'data': state,
+            'expires_at': timezone.now() + timedelta(seconds=self.ttl),
+        }
+
+    def get(self, enrollment_id):
+        data = self._live().filter(enrollment_id=enrollment_id).values_list('data', flat=True).first()
+        return data
+
+    def put(self, enrollment_id, state):
+        from dashboard.models import EnrollmentSessionState
+        # Opportunistic purge; expired rows are already invisible to reads
+        EnrollmentSessionState.objects.filter(expires_at__lte=timezone.now()).delete()
+        EnrollmentSessionState.objects.update_or_create(enrollment_id=enrollment_id, defaults=self._row_fields(state))
+        return state
+
+    def update(self, enrollment_id, fields):
+        from django.db import transaction
+        with transaction.atomic():
+            row = self._live().select_for_update().filter(enrollment_id=enrollment_id).first()
+            if row is None:
+                return None
+            state = dict(row.data or {})
+            state.update(fields)
+            for name, value in self._row_fields(state).items():
+                setattr(row, name, value)
+            row.save()
+            return state
+
+    def delete(self, enrollment_id):
+        from dashboard.models import EnrollmentSessionState
+        deleted, _ = EnrollmentSessionState.objects.filter(enrollment_id=enrollment_id).delete()
+        return bool(deleted)
+
+    def find_by_template(self, template_id):
+        return self._live().filter(template_id=str(template_id)).order_by('-updated_at').values_list(
+            'enrollment_id', flat=True
+        ).first()
+
+    def all(self):
+        return dict(self._live().values_list('enrollment_id', 'data'))
+
+
+def default_cache_is_process_local():
+    """True when the default cache lives inside each process (LocMem/Dummy) and so is not shared"""
+    cache_backend = settings.CACHES.get('default', {}).get('BACKEND', '').lower()
+    return 'locmem' in cache_backend or 'dummy' in cache_backend
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """Get the process-wide state store, picking the backend on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = ENROLLMENT_STATE_BACKEND
+                if backend == 'auto':
+                    backend = 'db' if default_cache_is_process_local() else 'cache'
+                if backend == 'cache':
+                    _store = CacheStateStore()
+                elif backend == 'db':
+                    _store = DatabaseStateStore()
+                else:
+                    raise ValueError(f"Unknown ENROLLMENT_STATE_BACKEND: {ENROLLMENT_STATE_BACKEND}")
+                logger.info(f"[STATE] Using '{backend}' enrollment state backend")
+    return _store
+
+
+# ======================== LOCAL READ-THROUGH LAYER ========================
+
+_local_states = {}  # enrollment_id -> (expires monotonic, state)
+_local_lock = threading.Lock()
+
+
+def _remember(enrollment_id, state):
+    with _local_lock:
+        if state is None:
+            _local_states.pop(enrollment_id, None)
+        else:
+            _local_states[enrollment_id] = (time.monotonic() + ENROLLMENT_STATE_LOCAL_TTL, state)
+
+
+def _load_state(enrollment_id):
+    with _local_lock:
+        cached = _local_states.get(enrollment_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    state = get_state_store().get(enrollment_id)
+    _remember(enrollment_id, state)
+    return state
+
+
+class EnrollmentState(dict):
+    """
+    Copy of one stored state. Item assignment and update() are written back as atomic
+    field updates, so legacy `_enrollment_states[eid]['message'] = ...` code keeps working.
+    Nested values (e.g. state['scans'].append) are NOT written back - assign the list instead.
+    """
+
+    def __init__(self, enrollment_id, state):
+        super().__init__(state)
+        self.enrollment_id = enrollment_id
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        set_enrollment_fields(self.enrollment_id, **{key: value})
+
+    def update(self, *args, **kwargs):
+        fields = dict(*args, **kwargs)
+        super().update(fields)
+        set_enrollment_fields(self.enrollment_id, **fields)
+
+
+class EnrollmentStateMap(MutableMapping):
+    """Dict-like view over the shared store for code that still uses _enrollment_states"""
+
+    def __getitem__(self, enrollment_id):
+        state = _load_state(enrollment_id)
+        if state is None:
+            raise KeyError(enrollment_id)
+        return EnrollmentState(enrollment_id, state)
+
+    def __setitem__(self, enrollment_id, state):
+        _put_state(enrollment_id, dict(state))
+
+    def __delitem__(self, enrollment_id):
+        if not delete_enrollment_state(enrollment_id):
+            raise KeyError(enrollment_id)
+
+    def __contains__(self, enrollment_id):
+        return _load_state(enrollment_id) is not None
+
+    def __iter__(self):
+        return iter(get_state_store().all())
+
+    def __len__(self):
+        return len(get_state_store().all())
+
+    def items(self):
+        return [(eid, EnrollmentState(eid, state)) for eid, state in get_state_store().all().items()]
+
+
 # ======================== GLOBAL STATE (Single Source of Truth) ========================
-_enrollment_states = {}
+_enrollment_states = EnrollmentStateMap()
+
+
+def _put_state(enrollment_id, state):
+    state.setdefault('template_id', enrollment_id)  # For MQTT matching
+    # Round-trip through JSON so the cache and DB backends store exactly the same thing
+    state = json.loads(json.dumps(state, default=str))
+    get_state_store().put(enrollment_id, state)
+    _remember(enrollment_id, state)
+    return state
 
 
 def create_enrollment_state(enrollment_id, user_id, course_id, template_id=None, is_re_registration=False, old_fingerprint_id=None):
@@ -23,7 +311,7 @@ def create_enrollment_state(enrollment_id, user_id, course_id, template_id=None,
     """
     if enrollment_id in _enrollment_states:
         logger.warning(f"[STATE] Enrollment {enrollment_id} already exists, overwriting")
-    
+
     state = {
         'status': 'processing',
         'current_scan': 0,
@@ -37,8 +325,8 @@ def create_enrollment_state(enrollment_id, user_id, course_id, template_id=None,
         'old_fingerprint_id': old_fingerprint_id,
         'template_id': template_id or enrollment_id  # For MQTT matching
     }
-    
-    _enrollment_states[enrollment_id] = state
+
+    state = _put_state(enrollment_id, state)
     logger.info(f"[STATE] ✓ Created enrollment state: {enrollment_id}")
     return state
 
@@ -48,20 +336,29 @@ def get_enrollment_state(enrollment_id):
     if enrollment_id not in _enrollment_states:
         logger.warning(f"[STATE] Enrollment {enrollment_id} not found")
         return None
-    
+
     return _enrollment_states[enrollment_id]
 
 
 def find_enrollment_id_by_template_id(template_id):
-    """Find enrollment_id by template_id"""
+    """Find enrollment_id by template_id (index lookup in the shared store)"""
     if not template_id:
         return None
 
-    for enrollment_id, state in list(_enrollment_states.items()):
-        if state.get('template_id') == template_id:
-            return enrollment_id
+    return get_state_store().find_by_template(template_id)
 
-    return None
+
+def set_enrollment_fields(enrollment_id, **fields):
+    """
+    Atomically set arbitrary fields of a stored state (refreshes its TTL)
+
+    Returns:
+        dict: The updated state, or None if the enrollment does not exist (or expired)
+    """
+    fields = json.loads(json.dumps(fields, default=str))
+    state = get_state_store().update(enrollment_id, fields)
+    _remember(enrollment_id, state)
+    return state
 
 
 def update_enrollment_state(enrollment_id, current_scan=None, progress=None, message=None, status=None, error=None, fingerprint_id=None):
@@ -69,54 +366,35 @@ def update_enrollment_state(enrollment_id, current_scan=None, progress=None, mes
     Update enrollment state - called by MQTT bridge and other handlers
     Used by polling API (/api/enrollment-status/) to serve updates
     """
-    if enrollment_id not in _enrollment_states:
-        logger.warning(f"[STATE] Attempted to update non-existent enrollment: {enrollment_id}")
-        return False
-    
-    state = _enrollment_states[enrollment_id]
-    updated = False
-    
     # Update only provided fields
-    if current_scan is not None:
-        state['current_scan'] = current_scan
-        updated = True
-        logger.debug(f"[STATE] Updated {enrollment_id}: current_scan={current_scan}")
-    
-    if progress is not None:
-        state['progress'] = progress
-        updated = True
-        logger.debug(f"[STATE] Updated {enrollment_id}: progress={progress}%")
-    
-    if message is not None:
-        state['message'] = message
-        updated = True
-        logger.debug(f"[STATE] Updated {enrollment_id}: message={message}")
-    
-    if status is not None:
-        state['status'] = status
-        updated = True
-        logger.debug(f"[STATE] Updated {enrollment_id}: status={status}")
-    
+    fields = {
+        name: value for name, value in (
+            ('current_scan', current_scan),
+            ('progress', progress),
+            ('message', message),
+            ('status', status),
+            ('error', error),
+            ('fingerprint_id', fingerprint_id),
+        ) if value is not None
+    }
     if error is not None:
-        state['error'] = error
-        updated = True
         logger.error(f"[STATE] Updated {enrollment_id}: error={error}")
 
-    if fingerprint_id is not None:
-        state['fingerprint_id'] = fingerprint_id
-        updated = True
-        logger.debug(f"[STATE] Updated {enrollment_id}: fingerprint_id={fingerprint_id}")
-    
-    if updated:
+    state = set_enrollment_fields(enrollment_id, **fields)
+    if state is None:
+        logger.warning(f"[STATE] Attempted to update non-existent enrollment: {enrollment_id}")
+        return False
+
+    if fields:
         logger.info(f"[STATE] ✓ Enrollment state updated: {enrollment_id} -> scan={state.get('current_scan')}, progress={state.get('progress')}%, status={state.get('status')}")
-    
+
     return True
 
 
 def delete_enrollment_state(enrollment_id):
     """Delete enrollment state when enrollment is complete"""
-    if enrollment_id in _enrollment_states:
-        del _enrollment_states[enrollment_id]
+    _remember(enrollment_id, None)
+    if get_state_store().delete(enrollment_id):
         logger.info(f"[STATE] ✓ Deleted enrollment state: {enrollment_id}")
         return True
     return False
@@ -128,18 +406,18 @@ def cleanup_old_enrollments(user_id, course_id):
     Called when user re-registers to prevent state collision
     """
     removed = []
-    for eid, state in list(_enrollment_states.items()):
+    for eid, state in get_state_store().all().items():
         if state.get('user_id') == user_id and state.get('course_id') == course_id:
-            del _enrollment_states[eid]
+            delete_enrollment_state(eid)
             removed.append(eid)
             logger.info(f"[STATE] ✓ Cleaned up old enrollment for re-registration: {eid}")
-    
+
     if removed:
         logger.info(f"[STATE] Removed {len(removed)} old enrollments: {removed}")
-    
+
     return removed
 
 
 def get_all_states():
     """Get all enrollment states (for debugging)"""
-    return _enrollment_states.copy()
+    return get_state_store().all()
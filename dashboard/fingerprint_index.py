@@ -0,0 +1,238 @@
+"""
+Cached fingerprint slot -> student index per course group.
+Every biometric poll and scan used to query the sibling sections and all their
+active BiometricRegistration rows to rebuild the slot map. The map only changes
+when someone enrolls, re-enrolls or is dropped, so it is now built once per course
+group and kept in process memory, tagged with the group's version number.
+
+Invalidation: post_save/post_delete signals on BiometricRegistration,
+CourseEnrollment and Course bump the version of the affected group. Versions live
+in the shared cache, or in the CacheVersion table when the default cache is
+process-local (same rule as enrollment_state), so a bump in one worker invalidates
+every worker. A process re-reads the version at most every
+FINGERPRINT_INDEX_CHECK_INTERVAL seconds; bumps made in the same process take
+effect immediately. Bulk queryset.update() calls bypass signals and must call
+invalidate_course_group() themselves.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .enrollment_state import default_cache_is_process_local
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_INDEX_CHECK_INTERVAL = getattr(settings, 'FINGERPRINT_INDEX_CHECK_INTERVAL', 1.0)
+FINGERPRINT_INDEX_STATS_LOG_EVERY = 500  # Lookups between stats log lines
+
+_lock = threading.Lock()
+_local = {}  # group key -> {'version', 'checked_at', 'slots'}
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def course_group_key(course):
+    """Identity of a course group: the fields sibling_courses() matches on"""
+    raw = f"{course.instructor_id}|{course.code}|{course.name}|{course.semester}|{course.school_year}"
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+# ======================== VERSIONS ========================
+
+def _version_key(group_key):
+    return f'fingerprint_index_version:{group_key}'
+
+
+def read_version(key):
+    """Shared version counter `key` (cache, or CacheVersion when the cache is process-local)"""
+    if default_cache_is_process_local():
+        from dashboard.models import CacheVersion
+        return CacheVersion.objects.filter(key=key).values_list('version', flat=True).first() or 0
+    from django.core.cache import cache
+    return cache.get(key) or 0
+
+
+def bump_version(key):
+    """Increment shared version counter `key`, seen by every process on its next read_version()"""
+    if default_cache_is_process_local():
+        from django.db.models import F
+        from dashboard.models import CacheVersion
+        if not CacheVersion.objects.filter(key=key).update(version=F('version') + 1):
+            CacheVersion.objects.get_or_create(key=key, defaults={'version': 1})
+        return
+    from django.core.cache import cache
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Start from a clock value so a version evicted from the cache never repeats
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        cache.incr(key)
+
+
+def invalidate_course_group(course):
+    """Drop the cached index of `course`'s group in every process"""
+    group_key = course_group_key(course)
+    with _lock:
+        _local.pop(group_key, None)
+        _stats['invalidations'] += 1
+    try:
+        bump_version(_version_key(group_key))
+    except Exception as e:
+        logger.warning(f"[FP-INDEX] Could not bump version for {course.code}: {e}")
+
+
+# ======================== INDEX ========================
+
+def _build_slots(course):
+    """slot -> {course_id: entry} for every active registration in the group"""
+    from dashboard.models import BiometricRegistration
+    from .qr_registry import sibling_courses
+
+    rows = BiometricRegistration.objects.filter(
+        course__in=sibling_courses(course),
+        is_active=True,
+        fingerprint_id__isnull=False,
+    ).values_list(
+        'id', 'fingerprint_id', 'course_id', 'student_id', 'student__full_name', 'student__username', 'student__email'
+    )
+    slots = {}
+    for registration_id, fingerprint_id, course_id, student_id, full_name, username, email in rows:
+        try:
+            slot = int(fingerprint_id)
+        except (TypeError, ValueError):
+            continue
+        slots.setdefault(slot, {})[course_id] = {
+            'registration_id': registration_id,
+            'student_id': student_id,
+            'student_name': full_name or username,
+            'student_email': email,
+            'fingerprint_id': fingerprint_id,
+            'course_id': course_id,
+        }
+    return slots
+
+
+def _group_slots(course):
+    group_key = course_group_key(course)
+    now = time.monotonic()
+    with _lock:
+        entry = _local.get(group_key)
+    if entry and now - entry['checked_at'] < FINGERPRINT_INDEX_CHECK_INTERVAL:
+        _count('hits')
+        return entry['slots']
+
+    version = read_version(_version_key(group_key))
+    if entry and entry['version'] == version:
+        with _lock:
+            entry['checked_at'] = now
+        _count('hits')
+        return entry['slots']
+
+    slots = _build_slots(course)
+    with _lock:
+        _local[group_key] = {'version': version, 'checked_at': now, 'slots': slots}
+    _count('misses')
+    logger.info(f"[FP-INDEX] Built index for {course.code} group (version {version}, {len(slots)} slots)")
+    return slots
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+        lookups = _stats['hits'] + _stats['misses']
+    if lookups % FINGERPRINT_INDEX_STATS_LOG_EVERY == 0:
+        logger.info(f"[FP-INDEX] {fingerprint_index_stats()}")
+
+
+def lookup_fingerprint(course, slot):
+    """
+    Student registered under fingerprint `slot` in `course`'s group; a registration on
+    `course` itself wins over sibling sections.
+
+    Returns:
+        dict or None: {'registration_id', 'student_id', 'student_name', 'student_email', 'fingerprint_id', 'course_id'}
+    """
+    try:
+        slot = int(slot)
+    except (TypeError, ValueError):
+        return None
+    by_course = _group_slots(course).get(slot)
+    if not by_course:
+        return None
+    return by_course.get(course.id) or next(iter(by_course.values()))
+
+
+def fingerprint_map_for(course):
+    """Whole slot -> entry map for `course` (same preference as lookup_fingerprint)"""
+    return {
+        slot: by_course.get(course.id) or next(iter(by_course.values()))
+        for slot, by_course in _group_slots(course).items()
+    }
+
+
+def fingerprint_index_stats():
+    """Per-process counters: hits, misses (rebuilds), invalidations, cached groups"""
+    with _lock:
+        stats = dict(_stats)
+        stats['groups'] = len(_local)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+    return stats
+
+
+# ======================== SIGNALS ========================
+
+def invalidate_courses(course_ids):
+    """Invalidate the groups of the given course ids (for bulk queryset.update() callers)"""
+    from dashboard.models import Course
+    courses = Course.objects.filter(id__in=set(course_ids)).only(
+        'id', 'instructor_id', 'code', 'name', 'semester', 'school_year'
+    )
+    invalidated = set()
+    for course in courses:
+        group_key = course_group_key(course)
+        if group_key not in invalidated:
+            invalidated.add(group_key)
+            invalidate_course_group(course)
+
+
+def _registration_changed(sender, instance, **kwargs):
+    invalidate_courses([instance.course_id])
+
+
+GROUP_FIELDS = ('instructor_id', 'code', 'name', 'semester', 'school_year', 'is_active', 'deleted_at', 'is_archived')
+
+
+def _course_saving(sender, instance, **kwargs):
+    # Courses are saved on every attendance open/close; only membership changes matter.
+    # A section that moves (rename, archive, delete) invalidates both its old and new group.
+    if instance.pk is None:
+        return
+    previous = sender.objects.filter(pk=instance.pk).only(*GROUP_FIELDS).first()
+    if previous is None:
+        return
+    if any(getattr(previous, field) != getattr(instance, field) for field in GROUP_FIELDS):
+        if course_group_key(previous) != course_group_key(instance):
+            invalidate_course_group(previous)
+        instance._fingerprint_group_moved = True
+
+
+def _course_saved(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_fingerprint_group_moved', False):
+        invalidate_course_group(instance)
+        instance._fingerprint_group_moved = False
+
+
+def connect_signals():
+    """Hook cache invalidation to the models the index is built from (called from DashboardConfig.ready)"""
+    from django.db.models.signals import post_delete, post_save, pre_save
+    from dashboard.models import BiometricRegistration, Course, CourseEnrollment
+
+    for model in (BiometricRegistration, CourseEnrollment):
+        post_save.connect(_registration_changed, sender=model, dispatch_uid=f'fp_index_{model.__name__}_save')
+        post_delete.connect(_registration_changed, sender=model, dispatch_uid=f'fp_index_{model.__name__}_delete')
+    pre_save.connect(_course_saving, sender=Course, dispatch_uid='fp_index_course_pre_save')
+    post_save.connect(_course_saved, sender=Course, dispatch_uid='fp_index_course_save')
@@ -0,0 +1,50 @@
+"""
+Recompute QRCodeRegistration.qr_key for rows written outside Model.save()
+(raw SQL imports, QuerySet.update(), restored backups).
+
+Usage: python manage.py backfill_qr_keys [--batch-size 1000] [--dry-run]
+"""
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Backfill the normalized qr_key column on QR code registrations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows updated per bulk_update')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows are stale')
+
+    def handle(self, *args, **options):
+        from dashboard.models import QRCodeRegistration
+        from dashboard.qr_registry import normalize_qr_key
+
+        batch_size = max(1, options['batch_size'])
+        dry_run = options['dry_run']
+
+        self.stdout.write(self.style.SUCCESS('=' * 70))
+        self.stdout.write(self.style.SUCCESS('QR KEY BACKFILL' + (' (DRY RUN)' if dry_run else '')))
+        self.stdout.write(self.style.SUCCESS('=' * 70))
+
+        scanned = 0
+        stale = 0
+        pending = []
+        for reg in QRCodeRegistration.objects.only('id', 'qr_code', 'qr_key').iterator(chunk_size=batch_size):
+            scanned += 1
+            qr_key = normalize_qr_key(reg.qr_code)
+            if reg.qr_key == qr_key:
+                continue
+            stale += 1
+            if dry_run:
+                continue
+            reg.qr_key = qr_key
+            pending.append(reg)
+            if len(pending) >= batch_size:
+                QRCodeRegistration.objects.bulk_update(pending, ['qr_key'])
+                pending = []
+        if pending:
+            QRCodeRegistration.objects.bulk_update(pending, ['qr_key'])
+
+        verb = 'would be updated' if dry_run else 'updated'
+        self.stdout.write(f'Scanned {scanned} registrations, {stale} {verb}')
+        self.stdout.write(self.style.SUCCESS('=' * 70))
@@ -0,0 +1,324 @@
+"""
+Throughput benchmark for the two MQTT ingest paths.
+
+Starts a LoopbackBroker (dashboard/mqtt_loopback.py) on localhost - broker.hivemq.com is
+never contacted - and a fleet of simulated ESP32 sensors, each its own paho client,
+replaying a mix of fingerprint detections and enrollment progress
+(started -> 3 x progress -> ready_for_confirmation) as fast as possible or at --rate.
+
+Paths:
+  client  - dashboard.mqtt_client.MQTTClientManager (the ingest used by the web app),
+            sensors publish under biometric/<device_id>/...
+  bridge  - mqtt_bridge.MQTTBridge (the standalone bridge script),
+            every sensor publishes under biometric/esp32/... as that script expects
+
+Each message carries its send time (in the reason/message text field for --codec compact1);
+the real handlers are wrapped to record when they finish. Reports end-to-end msgs/s, latency (publish -> handler done) and handler time
+percentiles, and drops (messages never handled within --drain-timeout, plus those the
+client's worker pool discarded). Messages carry a firmware-style msg_id; with
+--replay-share a share of them is published a second time, as a broker redelivery
+would, and the report shows how many of those the dedup window dropped.
+
+Runs against a throwaway test database so the real data is never touched.
+
+Usage: python manage.py benchmark_mqtt_ingest --devices 8 --messages 250 --rate 0
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import random
+import time
+import uuid
+
+import paho.mqtt.client as mqtt
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from dashboard.mqtt_codec import CODEC_COMPACT_V1, CODEC_JSON, encode_payload
+
+PATHS = ['client', 'bridge']
+ENROLL_SEQUENCE = [('started', 0), ('progress', 1), ('progress', 2), ('progress', 3), ('ready_for_confirmation', 3)]
+
+
+def sent_at(data):
+    """The bench_ts stamp of a handled message (JSON field, or the text field of a compact frame)"""
+    if not isinstance(data, dict):
+        return None
+    if 'bench_ts' in data:
+        return data['bench_ts']
+    try:
+        return float(data.get('reason') or data.get('message'))
+    except (TypeError, ValueError):
+        return None
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    """Collects handler completions for messages stamped with bench_ts"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.handler_times = []
+        self.last_done = None
+
+    def wrap(self, target, name):
+        original = getattr(target, name)
+
+        def instrumented(data, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(data, *args, **kwargs)
+            finally:
+                done = time.perf_counter()
+                stamp = sent_at(data)
+                if stamp is not None:
+                    with self.lock:
+                        self.latencies.append(done - stamp)
+                        self.handler_times.append(done - started)
+                        self.last_done = done
+
+        setattr(target, name, instrumented)
+
+    @property
+    def handled(self):
+        with self.lock:
+            return len(self.latencies)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark MQTT ingest throughput against a local broker and simulated ESP32 sensors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=8, help='Simulated ESP32 sensors')
+        parser.add_argument('--messages', type=int, default=250, help='Messages published per sensor')
+        parser.add_argument('--rate', type=float, default=0, help='Messages/s per sensor (0 = as fast as possible)')
+        parser.add_argument('--enroll-share', type=float, default=0.2, help='Share of traffic that is enrollment progress')
+        parser.add_argument('--codec', choices=[CODEC_JSON, CODEC_COMPACT_V1], default=CODEC_JSON, help='Sensor payload encoding')
+        parser.add_argument('--paths', default=','.join(PATHS), help=f'Comma-separated subset of {",".join(PATHS)}')
+        parser.add_argument('--replay-share', type=float, default=0, help='Share of messages published twice (redelivery); replays must be dropped')
+        parser.add_argument('--drain-timeout', type=float, default=30, help='Seconds to wait for handlers after the last publish')
+        parser.add_argument('--verbose-app-logs', action='store_true', help='Keep dashboard/django/MQTT log output during the run')
+
+    def handle(self, *args, **options):
+        paths = [p.strip() for p in options['paths'].split(',') if p.strip()]
+        unknown = set(paths) - set(PATHS)
+        if unknown:
+            raise CommandError(f'Unknown path(s): {", ".join(sorted(unknown))}')
+
+        devices = max(1, options['devices'])
+        messages = max(1, options['messages'])
+
+        quiet_loggers = [] if options['verbose_app_logs'] else ['dashboard', 'django', 'accounts', 'mqtt_bridge']
+        saved_levels = {name: logging.getLogger(name).level for name in quiet_loggers}
+        for name in quiet_loggers:
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+
+        from dashboard.mqtt_loopback import LoopbackBroker
+
+        old_name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            # Handlers write from worker threads; see loadtest_attendance_scans for why WAL + IMMEDIATE
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'benchmark_mqtt_ingest.sqlite3')
+            connection.settings_dict.setdefault('OPTIONS', {}).update({
+                'timeout': 30,
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': 'PRAGMA journal_mode=WAL;',
+            })
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        broker = LoopbackBroker().start()
+        try:
+            self.stdout.write(self.style.SUCCESS('=' * 104))
+            self.stdout.write(self.style.SUCCESS('MQTT INGEST THROUGHPUT BENCHMARK'))
+            self.stdout.write(self.style.SUCCESS('=' * 104))
+            rate = f"{options['rate']:g} msg/s" if options['rate'] > 0 else 'unthrottled'
+            self.stdout.write(f"Broker 127.0.0.1:{broker.port}; {devices} sensor(s) x {messages} messages, {rate}, "
+                              f"enroll share {options['enroll_share']:.0%}, codec {options['codec']}, database={connection.vendor}")
+            self.stdout.write(
+                f"{'path':<8} {'sent':>7} {'handled':>8} {'dropped':>8} {'msg/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+                f"{'p99 ms':>9} {'max ms':>9} {'hdl p50':>8} {'hdl p95':>8}"
+            )
+            for path in paths:
+                self._run_path(path, broker, devices, messages, options)
+            self.stdout.write(self.style.SUCCESS('=' * 104))
+        finally:
+            broker.stop()
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            for name, level in saved_levels.items():
+                logging.getLogger(name).setLevel(level)
+
+    # ======================== TARGETS ========================
+
+    def _start_client(self, broker, recorder):
+        from dashboard import mqtt_client
+        from dashboard.biometric_devices import device_topic_filter
+
+        mqtt_client.MQTT_BROKER, mqtt_client.MQTT_PORT = broker.host, broker.port
+        target = mqtt_client.MQTTClientManager()
+        recorder.wrap(target, '_handle_fingerprint_result')
+        recorder.wrap(target, '_handle_enroll_response')
+        target.subscribe(device_topic_filter(mqtt_client.TOPIC_ENROLL_RESPONSE), qos=1)
+        target.subscribe(device_topic_filter(mqtt_client.TOPIC_FINGERPRINT_RESULT), qos=1)
+        target.connect_async()
+        return target
+
+    def _start_bridge(self, broker, recorder):
+        try:
+            import mqtt_bridge
+        except Exception as e:
+            raise CommandError(f'mqtt_bridge could not be imported: {e}')
+
+        mqtt_bridge.MQTT_BROKER, mqtt_bridge.MQTT_PORT = broker.host, broker.port
+        target = mqtt_bridge.MQTTBridge()
+        recorder.wrap(target, 'handle_fingerprint_detection')
+        recorder.wrap(target, 'handle_enrollment_response')
+        target.connect()
+        return target
+
+    # ======================== RUN ========================
+
+    def _seed(self, path, devices):
+        """Registered sensors and one live enrollment per sensor (template ids to replay)"""
+        from dashboard.enrollment_state import create_enrollment_state
+        from dashboard.models import BiometricDevice
+
+        cache.clear()
+        BiometricDevice.objects.all().delete()
+        device_ids = [f'bench-{i:02d}' for i in range(devices)]
+        if path == 'client':
+            BiometricDevice.objects.bulk_create([BiometricDevice(device_id=d, name=d) for d in device_ids])
+        templates = {}
+        for device_id in device_ids:
+            template_id = uuid.uuid4().hex
+            create_enrollment_state(f'bench_{template_id}', None, None, template_id=template_id)
+            templates[device_id] = template_id
+        return device_ids, templates
+
+    def _traffic(self, messages, enroll_share, template_id):
+        """(suffix, payload) list for one sensor with enrollment progress spread evenly through detections"""
+        traffic = []
+        enroll_step = 0
+        owed = 0.0
+        for i in range(messages):
+            owed += enroll_share
+            if owed >= 1:
+                owed -= 1
+                status, step = ENROLL_SEQUENCE[enroll_step % len(ENROLL_SEQUENCE)]
+                enroll_step += 1
+                traffic.append(('enroll/response', {
+                    'status': status, 'step': step, 'slot': 100, 'template_id': template_id,
+                    'success': True, 'quality': 80, 'message': f'Scan {step}/3',
+                }))
+            else:
+                traffic.append(('fingerprint', {
+                    'fingerprint_id': 100 + i % 50, 'confidence': 120, 'mode': 'attendance', 'match_type': 'match',
+                }))
+        return traffic
+
+    def _connect_fleet(self, broker, device_ids):
+        fleet = []
+        for device_id in device_ids:
+            sensor = mqtt.Client(client_id=f'{device_id}-{uuid.uuid4().hex[:6]}', protocol=mqtt.MQTTv311)
+            sensor.connect(broker.host, broker.port, keepalive=60)
+            sensor.loop_start()
+            fleet.append(sensor)
+        return fleet
+
+    def _publish(self, sensor, namespace, traffic, rate, codec, replay_share, sent_counter):
+        interval = 1.0 / rate if rate > 0 else 0
+        boot_id = random.getrandbits(32)
+        replays_owed = 0.0
+        start = time.perf_counter()
+        for i, (suffix, payload) in enumerate(traffic):
+            if interval:
+                delay = start + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            stamp = time.perf_counter()
+            if codec == CODEC_COMPACT_V1:
+                payload['reason' if suffix == 'fingerprint' else 'message'] = repr(stamp)
+            else:
+                payload['bench_ts'] = stamp
+            payload['msg_id'] = f'{boot_id:x}-{i + 1}'
+            # QoS 0, like the firmware's PubSubClient
+            encoded = encode_payload(payload, codec)
+            sensor.publish(f'biometric/{namespace}/{suffix}', encoded, qos=0)
+            replays_owed += replay_share
+            replayed = replays_owed >= 1
+            if replayed:
+                replays_owed -= 1
+                sensor.publish(f'biometric/{namespace}/{suffix}', encoded, qos=0)
+            with sent_counter['lock']:
+                sent_counter['sent'] += 1
+                sent_counter['replayed'] += int(replayed)
+
+    def _run_path(self, path, broker, devices, messages, options):
+        device_ids, templates = self._seed(path, devices)
+        recorder = Recorder()
+        target = self._start_client(broker, recorder) if path == 'client' else self._start_bridge(broker, recorder)
+
+        deadline = time.monotonic() + 10
+        while not target.is_connected and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if not target.is_connected:
+            raise CommandError(f'{path}: could not connect to the loopback broker')
+        time.sleep(0.2)  # Let the SUBSCRIBE land before the first publish
+
+        fleet = self._connect_fleet(broker, device_ids)
+        sent_counter = {'sent': 0, 'replayed': 0, 'lock': threading.Lock()}
+        publishers = [
+            threading.Thread(target=self._publish, args=(
+                sensor, device_id if path == 'client' else 'esp32',
+                self._traffic(messages, options['enroll_share'], templates[device_id]),
+                options['rate'], options['codec'], options['replay_share'], sent_counter,
+            ))
+            for sensor, device_id in zip(fleet, device_ids)
+        ]
+        started = time.perf_counter()
+        for thread in publishers:
+            thread.start()
+        for thread in publishers:
+            thread.join()
+
+        total = sent_counter['sent']
+        deadline = time.monotonic() + options['drain_timeout']
+        while recorder.handled < total and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        pool_dropped = 0
+        if path == 'client':
+            pool_dropped = target.workers.stats()['dropped']
+        replays_dropped = target.dedup.stats()['duplicates']
+        for sensor in fleet:
+            sensor.loop_stop()
+            sensor.disconnect()
+        target.disconnect()
+        connections.close_all()
+
+        handled = recorder.handled
+        elapsed = (recorder.last_done or time.perf_counter()) - started
+        latencies = recorder.latencies
+        handler_times = recorder.handler_times
+        self.stdout.write(
+            f"{path:<8} {total:>7} {handled:>8} {total - handled:>8} {handled / elapsed if elapsed > 0 else 0:>9.0f} "
+            f"{percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 95) * 1000:>9.1f} "
+            f"{percentile(latencies, 99) * 1000:>9.1f} {max(latencies or [0]) * 1000:>9.1f} "
+            f"{percentile(handler_times, 50) * 1000:>8.2f} {percentile(handler_times, 95) * 1000:>8.2f}"
+        )
+        if pool_dropped:
+            self.stdout.write(self.style.WARNING(f"{path}: worker pool dropped {pool_dropped} message(s) on overflow"))
+        if sent_counter['replayed']:
+            style = self.style.SUCCESS if replays_dropped == sent_counter['replayed'] else self.style.WARNING
+            self.stdout.write(style(f"{path}: dedup window dropped {replays_dropped} of {sent_counter['replayed']} replayed message(s)"))
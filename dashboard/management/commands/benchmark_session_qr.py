@@ -0,0 +1,107 @@
+"""
+Benchmark the session QR resolver against a growing number of courses.
+
+Runs against a throwaway test database so the real data is never touched.
+
+Usage: python manage.py benchmark_session_qr --sizes 100,500,2000 --iterations 200
+"""
+
+import statistics
+import time
+from datetime import time as dtime
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class Command(BaseCommand):
+    help = 'Benchmark session QR resolution latency as the number of courses grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,500,2000', help='Comma-separated course counts to benchmark')
+        parser.add_argument('--iterations', type=int, default=200, help='Lookups per scenario')
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        iterations = max(1, options['iterations'])
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(self.style.SUCCESS('=' * 86))
+            self.stdout.write(self.style.SUCCESS('SESSION QR RESOLVER BENCHMARK'))
+            self.stdout.write(self.style.SUCCESS('=' * 86))
+            self.stdout.write(f"{'courses':>8} {'index build ms':>15} {'stored p50 ms':>14} {'derived p50 ms':>15} {'miss p50 ms':>12} {'queries/scan':>13}")
+            for size in sizes:
+                self._run_size(size, iterations)
+            self.stdout.write(self.style.SUCCESS('=' * 86))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run_size(self, size, iterations):
+        from accounts.models import CustomUser
+        from dashboard.models import Course, CourseSchedule
+        from dashboard.session_qr import (
+            WEEKDAY_SHORT, build_session_qr_index, derive_session_qr_code, now_ph, resolve_session_qr,
+        )
+
+        CourseSchedule.objects.all().delete()
+        Course.objects.all().delete()
+        cache.clear()
+
+        current_time = now_ph()
+        today = current_time.date()
+        day_short = WEEKDAY_SHORT[today.weekday()]
+
+        instructor, _ = CustomUser.objects.get_or_create(
+            username='bench_instructor',
+            defaults={'email': 'bench_instructor@example.com', 'is_teacher': True, 'is_approved': True},
+        )
+
+        # bulk_create skips Course.save(), so codes are assigned explicitly here
+        Course.objects.bulk_create([
+            Course(
+                code=f'BENCH {i}', name=f'Bench Course {i}', year_level=1, section=str(i),
+                instructor=instructor, days=day_short, start_time=dtime(8, 0), end_time=dtime(9, 0),
+                enrollment_code=f'B{i:07d}', qr_code=f'C{i:015d}', attendance_status='open',
+            )
+            for i in range(size)
+        ], batch_size=500)
+        courses = list(Course.objects.order_by('id').values_list('id', 'code', 'section'))
+        CourseSchedule.objects.bulk_create([
+            CourseSchedule(
+                course_id=course_id, day=day_short, day_order=today.weekday() + 1,
+                start_time=dtime(8, 0), end_time=dtime(9, 0), qr_code=f'S{course_id:015d}', qr_code_date=today,
+            )
+            for course_id, _, _ in courses
+        ], batch_size=500)
+
+        # Targets sit at the end of the table, where the old linear scan was slowest
+        last_id, last_code, last_section = courses[-1]
+        stored_code = f'S{last_id:015d}'
+        derived_code = derive_session_qr_code(last_id, last_code, last_section, day_short, today)
+
+        build_start = time.perf_counter()
+        build_session_qr_index(today)
+        build_ms = (time.perf_counter() - build_start) * 1000
+
+        def measure(code, expect_match):
+            samples = []
+            with CaptureQueriesContext(connection) as ctx:
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    match = resolve_session_qr(code, current_time)
+                    samples.append((time.perf_counter() - start) * 1000)
+                    if bool(match) != expect_match:
+                        raise RuntimeError(f'Unexpected resolver result for {code}: {match}')
+            return statistics.median(samples), len(ctx.captured_queries) / iterations
+
+        stored_p50, stored_queries = measure(stored_code, True)
+        derived_p50, _ = measure(derived_code, True)
+        miss_p50, _ = measure('FFFFFFFFFFFFFFFF', False)
+
+        self.stdout.write(
+            f"{size:>8} {build_ms:>15.2f} {stored_p50:>14.3f} {derived_p50:>15.3f} {miss_p50:>12.3f} {stored_queries:>13.1f}"
+        )
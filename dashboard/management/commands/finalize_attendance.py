@@ -0,0 +1,50 @@
+# dashboard/management/commands/finalize_attendance.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard.attendance_finalizer import (
+    ATTENDANCE_FINALIZE_GRACE_SECONDS,
+    ATTENDANCE_FINALIZE_LOOKBACK_HOURS,
+    ATTENDANCE_FINALIZE_MAX_SLEEP,
+    finalize_due,
+    seconds_until_next,
+)
+
+
+class Command(BaseCommand):
+    help = 'Run the attendance finalization scheduler: mark students absent/postponed once each session has ended'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Finalize the sessions due now and exit (for cron)')
+        parser.add_argument('--grace', type=int, default=ATTENDANCE_FINALIZE_GRACE_SECONDS, help='Seconds after a session ends before it is finalized')
+        parser.add_argument('--lookback-hours', type=int, default=ATTENDANCE_FINALIZE_LOOKBACK_HOURS, help='Finalize sessions that ended up to this many hours ago')
+        parser.add_argument('--max-sleep', type=int, default=ATTENDANCE_FINALIZE_MAX_SLEEP, help='Longest wait between passes in seconds')
+
+    def handle(self, *args, **options):
+        grace, lookback_hours = options['grace'], options['lookback_hours']
+        if options['once']:
+            self._report(finalize_due(grace=grace, lookback_hours=lookback_hours))
+            return
+
+        self.stdout.write(f'Attendance finalizer started; sessions are finalized {grace}s after they end')
+        try:
+            while True:
+                try:
+                    self._report(finalize_due(grace=grace, lookback_hours=lookback_hours), quiet=True)
+                    wait = seconds_until_next(grace=grace, max_sleep=options['max_sleep'])
+                except Exception as e:
+                    # Database unavailable or similar: retry on the next pass
+                    self.stderr.write(f'Finalization pass failed: {e}')
+                    wait = options['max_sleep']
+                time.sleep(wait)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping attendance finalizer...')
+        self.stdout.write(self.style.SUCCESS('Attendance finalizer stopped.'))
+
+    def _report(self, result, quiet=False):
+        if quiet and not any(result.values()):
+            return
+        line = (f"{result['finalized']} session(s) finalized, {result['records']} record(s) created, "
+                f"{result['skipped']} already claimed, {result['deferred']} deferred, {result['failed']} failed")
+        self.stdout.write(self.style.ERROR(line) if result['failed'] else self.style.SUCCESS(line))
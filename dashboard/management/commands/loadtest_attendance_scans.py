@@ -0,0 +1,252 @@
+"""
+Burst load test for the attendance scan endpoints.
+
+Seeds a throwaway test database with one instructor, a few sections of a subject and
+N students (enrolled, QR-registered and fingerprint-registered), opens attendance for
+today, then fires every student's scan at once from a thread pool through the Django
+test client - the "whole section scans in the first five minutes" pattern.
+
+Scenarios:
+  student_qr     - students scan the instructor's session QR (student_scan_qr_attendance_view)
+  instructor_qr  - instructor scans students' registered QR (instructor_scan_student_qr_code_view)
+  biometric      - fingerprint matches posted by the instructor page (instructor_biometric_scan_attendance_view)
+
+Reports p50/p95/p99 latency, throughput and SQL queries per request for each scenario.
+
+Usage: python manage.py loadtest_attendance_scans --students 300 --sections 4 --concurrency 16
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as dtime
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+SCENARIOS = ['student_qr', 'instructor_qr', 'biometric']
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Burst load test for the QR / biometric attendance scan endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200, help='Students scanning in the burst')
+        parser.add_argument('--sections', type=int, default=4, help='Sections (courses) the students are spread across')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client threads')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'Comma-separated subset of {",".join(SCENARIOS)}')
+        parser.add_argument('--verbose-app-logs', action='store_true', help='Keep dashboard/django log output during the run')
+
+    def handle(self, *args, **options):
+        scenarios = [s.strip() for s in options['scenarios'].split(',') if s.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenario(s): {", ".join(sorted(unknown))}')
+
+        students = max(1, options['students'])
+        sections = max(1, min(options['sections'], students))
+        concurrency = max(1, options['concurrency'])
+
+        quiet_loggers = [] if options['verbose_app_logs'] else ['dashboard', 'django', 'accounts']
+        saved_levels = {name: logging.getLogger(name).level for name in quiet_loggers}
+        for name in quiet_loggers:
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+        old_name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            # The default in-memory test DB fails concurrent writers with "table is locked";
+            # a WAL file DB with IMMEDIATE transactions and a busy timeout makes them queue instead
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'loadtest_attendance_scans.sqlite3')
+            connection.settings_dict.setdefault('OPTIONS', {}).update({
+                'timeout': 30,
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': 'PRAGMA journal_mode=WAL;',
+            })
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(self.style.SUCCESS('=' * 96))
+            self.stdout.write(self.style.SUCCESS('ATTENDANCE SCAN BURST LOAD TEST'))
+            self.stdout.write(self.style.SUCCESS('=' * 96))
+            seed_start = time.perf_counter()
+            fixture = self._seed(students, sections)
+            self.stdout.write(f"Seeded {students} students across {sections} section(s) in {time.perf_counter() - seed_start:.1f}s; "
+                              f"concurrency={concurrency}, database={connection.vendor}")
+            self.stdout.write(
+                f"{'scenario':<14} {'requests':>8} {'ok':>6} {'failed':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                f"{'max ms':>9} {'req/s':>8} {'q/req':>7} {'max q':>6}"
+            )
+            for scenario in scenarios:
+                self._run_scenario(scenario, fixture, concurrency)
+            self.stdout.write(self.style.SUCCESS('=' * 96))
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            for name, level in saved_levels.items():
+                logging.getLogger(name).setLevel(level)
+
+    def _seed(self, students, sections):
+        from django.contrib.auth.hashers import make_password
+        from accounts.models import CustomUser
+        from dashboard.models import (
+            AttendanceRecord, BiometricRegistration, Course, CourseEnrollment, CourseSchedule, QRCodeRegistration,
+        )
+        from dashboard.qr_registry import normalize_qr_key
+        from dashboard.session_qr import WEEKDAY_SHORT, now_ph
+
+        cache.clear()
+        current_time = now_ph()
+        today = current_time.date()
+        day_short = WEEKDAY_SHORT[today.weekday()]
+
+        instructor = CustomUser.objects.create(
+            username='load_instructor', email='load_instructor@example.com',
+            is_teacher=True, is_approved=True, password=make_password(None),
+        )
+
+        # bulk_create skips Course.save(), so codes are assigned explicitly here
+        Course.objects.bulk_create([
+            Course(
+                code='LOAD 101', name='Load Test Subject', year_level=1, section=chr(ord('A') + i % 26) + (str(i // 26) if i >= 26 else ''),
+                instructor=instructor, days=day_short, start_time=dtime(0, 0), end_time=dtime(23, 59),
+                enrollment_code=f'L{i:07d}', qr_code=f'LOADC{i:011d}', attendance_status='open',
+                attendance_present_duration=15, qr_code_opened_at=current_time,
+            )
+            for i in range(sections)
+        ])
+        courses = list(Course.objects.filter(instructor=instructor).order_by('id'))
+        CourseSchedule.objects.bulk_create([
+            CourseSchedule(
+                course=course, day=day_short, day_order=today.weekday() + 1,
+                start_time=dtime(0, 0), end_time=dtime(23, 59), qr_code=f'LOADS{course.id:011d}', qr_code_date=today,
+                attendance_status='open', attendance_present_duration=15, qr_code_opened_at=current_time,
+            )
+            for course in courses
+        ])
+        schedules = {s.course_id: s for s in CourseSchedule.objects.filter(course__in=courses)}
+
+        password = make_password(None)
+        CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f'load_student_{i}', email=f'load_student_{i}@example.com', password=password,
+                is_student=True, is_approved=True, full_name=f'Load Student {i}', school_id=f'9{i:08d}',
+            )
+            for i in range(students)
+        ], batch_size=500)
+        student_rows = list(CustomUser.objects.filter(is_student=True, username__startswith='load_student_').order_by('id'))
+
+        enrollments, qr_regs, bio_regs, plan = [], [], [], []
+        for i, student in enumerate(student_rows):
+            course = courses[i % len(courses)]
+            qr_value = f'{i:032x}'
+            enrollments.append(CourseEnrollment(
+                course=course, student=student, full_name=student.full_name, year_level=1, section=course.section,
+                email=student.email, student_id_number=student.school_id, course_code=course.code,
+                course_name=course.name, course_section=course.section, is_active=True,
+            ))
+            # bulk_create skips QRCodeRegistration.save(), so qr_key is set here
+            qr_regs.append(QRCodeRegistration(
+                course=course, student=student, qr_code=qr_value, qr_key=normalize_qr_key(qr_value),
+                registered_by=instructor, is_active=True,
+            ))
+            fingerprint_id = i // len(courses) + 1  # R307 slots are per sensor, unique within a section
+            bio_regs.append(BiometricRegistration(
+                course=course, student=student, biometric_data='load-test', fingerprint_id=fingerprint_id, is_active=True,
+            ))
+            plan.append({
+                'student': student, 'course': course, 'schedule': schedules[course.id],
+                'qr_value': qr_value, 'fingerprint_id': fingerprint_id,
+            })
+        CourseEnrollment.objects.bulk_create(enrollments, batch_size=500)
+        QRCodeRegistration.objects.bulk_create(qr_regs, batch_size=500)
+        BiometricRegistration.objects.bulk_create(bio_regs, batch_size=500)
+        AttendanceRecord.objects.all().delete()
+
+        return {'instructor': instructor, 'plan': plan}
+
+    def _build_requests(self, scenario, fixture):
+        """(client, url, payload) per scan; logins happen here, outside the timed burst"""
+        instructor = fixture['instructor']
+        requests_ = []
+        for entry in fixture['plan']:
+            client = Client()
+            if scenario == 'student_qr':
+                client.force_login(entry['student'])
+                url = reverse('dashboard:student_scan_qr_attendance')
+                payload = {'qr_code': entry['schedule'].qr_code}
+            elif scenario == 'instructor_qr':
+                client.force_login(instructor)
+                url = reverse('dashboard:instructor_scan_student_qr_code')
+                payload = {'qr_code': entry['qr_value'], 'course_id': entry['course'].id}
+            else:
+                client.force_login(instructor)
+                url = reverse('dashboard:instructor_biometric_scan_attendance')
+                payload = {'course_id': entry['course'].id, 'fingerprint_id': str(entry['fingerprint_id'])}
+            requests_.append((client, url, json.dumps(payload)))
+        return requests_
+
+    def _run_scenario(self, scenario, fixture, concurrency):
+        from dashboard.models import AttendanceRecord
+
+        AttendanceRecord.objects.all().delete()
+        cache.clear()
+        requests_ = self._build_requests(scenario, fixture)
+
+        lock = threading.Lock()
+        latencies, query_counts = [], []
+        outcome = {'ok': 0, 'failed': 0}
+        start_gate = threading.Event()
+
+        def fire(item):
+            client, url, body = item
+            start_gate.wait()
+            with CaptureQueriesContext(connections['default']) as ctx:
+                started = time.perf_counter()
+                response = client.post(url, body, content_type='application/json')
+                elapsed = (time.perf_counter() - started) * 1000
+            try:
+                ok = response.status_code == 200 and response.json().get('success') is True
+            except ValueError:
+                ok = False
+            with lock:
+                latencies.append(elapsed)
+                query_counts.append(len(ctx.captured_queries))
+                outcome['ok' if ok else 'failed'] += 1
+            connections.close_all()
+
+        # Views print debug output; keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = [pool.submit(fire, item) for item in requests_]
+                burst_start = time.perf_counter()
+                start_gate.set()
+                for future in futures:
+                    future.result()
+                wall = time.perf_counter() - burst_start
+
+        total = len(latencies)
+        self.stdout.write(
+            f"{scenario:<14} {total:>8} {outcome['ok']:>6} {outcome['failed']:>6} "
+            f"{statistics.median(latencies):>9.2f} {percentile(latencies, 95):>9.2f} {percentile(latencies, 99):>9.2f} "
+            f"{max(latencies):>9.2f} {total / wall if wall else 0:>8.1f} "
+            f"{sum(query_counts) / total:>7.1f} {max(query_counts):>6}"
+        )
@@ -0,0 +1,23 @@
+# dashboard/management/commands/mqtt_ingest.py
+from django.core.management.base import BaseCommand
+
+from dashboard.mqtt_ingest import MQTT_INGEST_LEASE_SECONDS, get_ingest
+
+
+class Command(BaseCommand):
+    help = 'Run the MQTT ingest: hold the broker connection and publish queued outbox messages (stands by while another process holds the lease)'
+
+    def handle(self, *args, **options):
+        ingest = get_ingest()
+        self.stdout.write(
+            f'MQTT ingest {ingest.holder} started; takes over within {MQTT_INGEST_LEASE_SECONDS}s if another ingest is running'
+        )
+        thread = ingest.start()
+        try:
+            while thread.is_alive():
+                thread.join(1)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping MQTT ingest...')
+            ingest.stop()
+            thread.join()
+        self.stdout.write(self.style.SUCCESS('MQTT ingest stopped.'))
@@ -0,0 +1,257 @@
+"""
+Set-based integrity scan for QR / fingerprint registrations and enrollments.
+
+Every check is a single GROUP BY/HAVING or anti-join query evaluated by the database
+and streamed with .iterator(); nothing loads whole tables into Python.
+
+Checks:
+  duplicate_qr_keys        - active registrations sharing a normalized qr_key within one course
+  qr_key_collisions        - one qr_key registered to different students (any courses)
+  qr_code_id_collisions    - CustomUser.qr_code_id shared by several accounts
+  duplicate_fingerprints   - one fingerprint_id mapped to different students within a course
+  dangling_fingerprints    - active fingerprint registrations without an active enrollment / live course
+  orphaned_enrollments     - active enrollments in deleted/archived/inactive courses or for inactive students
+  orphaned_qr_registrations - active QR registrations without an active enrollment
+
+Incremental mode (--incremental) only re-checks keys touched since the previous run
+(registrations/courses by updated_at, enrollments by enrolled_at/deleted_at, users by id
+watermark). Changes without a timestamp (e.g. a student deactivated) are only seen by
+a full run, so keep a periodic full scan scheduled.
+
+Usage:
+    python manage.py qr_integrity_check
+    python manage.py qr_integrity_check --incremental --limit 50
+    python manage.py qr_integrity_check --checks duplicate_qr_keys,dangling_fingerprints --fail-on-issues
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+
+CHECKS = [
+    'duplicate_qr_keys',
+    'qr_key_collisions',
+    'qr_code_id_collisions',
+    'duplicate_fingerprints',
+    'dangling_fingerprints',
+    'orphaned_enrollments',
+    'orphaned_qr_registrations',
+]
+
+
+class Command(BaseCommand):
+    help = 'Find duplicate/colliding QR keys, dangling fingerprint IDs and orphaned enrollments with set-based queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', default=','.join(CHECKS), help='Comma-separated subset of checks to run')
+        parser.add_argument('--incremental', action='store_true', help='Only re-check rows changed since the last recorded run')
+        parser.add_argument('--state-file', default=None, help='Where the last-run watermark is kept (default QR_INTEGRITY_STATE_FILE)')
+        parser.add_argument('--limit', type=int, default=20, help='Findings printed per check (all are counted)')
+        parser.add_argument('--fail-on-issues', action='store_true', help='Exit with an error if anything is found')
+
+    def handle(self, *args, **options):
+        from accounts.models import CustomUser
+
+        checks = [c.strip() for c in options['checks'].split(',') if c.strip()]
+        unknown = set(checks) - set(CHECKS)
+        if unknown:
+            raise CommandError(f'Unknown check(s): {", ".join(sorted(unknown))}')
+
+        state_file = options['state_file'] or getattr(
+            settings, 'QR_INTEGRITY_STATE_FILE', os.path.join(tempfile.gettempdir(), 'qr_integrity_state.json')
+        )
+        started_at = timezone.now()
+        max_user_id = CustomUser.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        since, last_user_id = None, 0
+        if options['incremental']:
+            since, last_user_id = self._load_state(state_file)
+            if since is None:
+                self.stdout.write(self.style.WARNING('No previous run recorded - running a full scan.'))
+
+        self.stdout.write(self.style.SUCCESS('=' * 90))
+        self.stdout.write(self.style.SUCCESS('QR / BIOMETRIC INTEGRITY CHECK' + (f' (changes since {since:%Y-%m-%d %H:%M:%S})' if since else ' (full)')))
+        self.stdout.write(self.style.SUCCESS('=' * 90))
+
+        scope = self._changed_scope(since, last_user_id) if since else None
+        totals = {}
+        for check in checks:
+            queryset, describe = getattr(self, f'_check_{check}')(scope)
+            totals[check] = self._report(check, queryset, describe, options['limit'])
+
+        self.stdout.write(self.style.SUCCESS('\n' + '=' * 90))
+        self.stdout.write(self.style.SUCCESS('SUMMARY'))
+        self.stdout.write(self.style.SUCCESS('=' * 90))
+        for check, count in totals.items():
+            style = self.style.ERROR if count else self.style.SUCCESS
+            self.stdout.write(style(f'{check:<28} {count}'))
+
+        self._save_state(state_file, started_at, max_user_id)
+
+        if options['fail_on_issues'] and any(totals.values()):
+            raise CommandError(f'{sum(totals.values())} integrity issue(s) found.')
+
+    # ------------------------------------------------------------------ state
+
+    def _load_state(self, state_file):
+        try:
+            with open(state_file) as fh:
+                state = json.load(fh)
+            return datetime.fromisoformat(state['last_run']), int(state.get('max_user_id', 0))
+        except (OSError, ValueError, KeyError):
+            return None, 0
+
+    def _save_state(self, state_file, started_at, max_user_id):
+        try:
+            with open(state_file, 'w') as fh:
+                json.dump({'last_run': started_at.isoformat(), 'max_user_id': max_user_id}, fh)
+        except OSError as e:
+            self.stdout.write(self.style.WARNING(f'Could not record run state in {state_file}: {e}'))
+
+    def _changed_scope(self, since, last_user_id):
+        """Subqueries of keys touched since the last run"""
+        from dashboard.models import BiometricRegistration, Course, CourseEnrollment, QRCodeRegistration
+
+        changed_qr = QRCodeRegistration.objects.filter(updated_at__gte=since)
+        changed_bio = BiometricRegistration.objects.filter(updated_at__gte=since)
+        changed_courses = Course.objects.filter(updated_at__gte=since)
+        changed_enrollments = CourseEnrollment.objects.filter(Q(enrolled_at__gte=since) | Q(deleted_at__gte=since))
+        return {
+            'qr_keys': changed_qr.values('qr_key'),
+            'fingerprint_ids': changed_bio.values('fingerprint_id'),
+            'course_ids': changed_courses.values('id'),
+            'enrollment_student_ids': changed_enrollments.values('student_id'),
+            'qr_student_ids': changed_qr.values('student_id'),
+            'since': since,
+            'last_user_id': last_user_id,
+        }
+
+    # ----------------------------------------------------------------- checks
+    # Each returns (queryset of dict rows, formatter)
+
+    def _check_duplicate_qr_keys(self, scope):
+        from dashboard.models import QRCodeRegistration
+
+        qs = QRCodeRegistration.objects.filter(is_active=True).exclude(qr_key='')
+        if scope:
+            qs = qs.filter(qr_key__in=scope['qr_keys'])
+        qs = qs.values('course_id', 'course__code', 'course__section', 'qr_key').annotate(
+            registrations=Count('id'), students=Count('student', distinct=True)
+        ).filter(registrations__gt=1).order_by('course__code', 'course__section')
+        return qs, lambda r: (f"{r['course__code']} ({r['course__section']}) qr_key={r['qr_key'][:40]} "
+                              f"registrations={r['registrations']} students={r['students']}")
+
+    def _check_qr_key_collisions(self, scope):
+        from dashboard.models import QRCodeRegistration
+
+        qs = QRCodeRegistration.objects.filter(is_active=True).exclude(qr_key='')
+        if scope:
+            qs = qs.filter(qr_key__in=scope['qr_keys'])
+        qs = qs.values('qr_key').annotate(
+            students=Count('student', distinct=True), courses=Count('course', distinct=True)
+        ).filter(students__gt=1).order_by('-students')
+        return qs, lambda r: f"qr_key={r['qr_key'][:40]} students={r['students']} courses={r['courses']}"
+
+    def _check_qr_code_id_collisions(self, scope):
+        from accounts.models import CustomUser
+
+        qs = CustomUser.objects.exclude(qr_code_id__isnull=True).exclude(qr_code_id='')
+        if scope:
+            touched = CustomUser.objects.filter(
+                Q(id__gt=scope['last_user_id']) | Q(id__in=scope['qr_student_ids'])
+            ).values('qr_code_id')
+            qs = qs.filter(qr_code_id__in=touched)
+        qs = qs.values('qr_code_id').annotate(accounts=Count('id')).filter(accounts__gt=1).order_by('-accounts')
+        return qs, lambda r: f"qr_code_id={r['qr_code_id'][:40]} accounts={r['accounts']}"
+
+    def _check_duplicate_fingerprints(self, scope):
+        from dashboard.models import BiometricRegistration
+
+        qs = BiometricRegistration.objects.filter(is_active=True, fingerprint_id__isnull=False)
+        if scope:
+            qs = qs.filter(fingerprint_id__in=scope['fingerprint_ids'])
+        qs = qs.values('course_id', 'course__code', 'course__section', 'fingerprint_id').annotate(
+            students=Count('student', distinct=True)
+        ).filter(students__gt=1).order_by('course__code', 'fingerprint_id')
+        return qs, lambda r: (f"{r['course__code']} ({r['course__section']}) fingerprint_id={r['fingerprint_id']} "
+                              f"students={r['students']}")
+
+    def _check_dangling_fingerprints(self, scope):
+        from dashboard.models import BiometricRegistration, CourseEnrollment
+
+        active_enrollment = CourseEnrollment.objects.filter(
+            course_id=OuterRef('course_id'), student_id=OuterRef('student_id'), is_active=True, deleted_at__isnull=True
+        )
+        qs = BiometricRegistration.objects.filter(is_active=True, fingerprint_id__isnull=False).filter(
+            ~Exists(active_enrollment)
+            | Q(course__deleted_at__isnull=False)
+            | Q(course__is_active=False)
+            | Q(course__is_archived=True)
+        )
+        if scope:
+            qs = qs.filter(
+                Q(updated_at__gte=scope['since'])
+                | Q(course_id__in=scope['course_ids'])
+                | Q(student_id__in=scope['enrollment_student_ids'])
+            )
+        qs = qs.values('id', 'fingerprint_id', 'course__code', 'course__section', 'student__full_name', 'student__school_id').order_by('course__code', 'fingerprint_id')
+        return qs, lambda r: (f"{r['course__code']} ({r['course__section']}) fingerprint_id={r['fingerprint_id']} "
+                              f"{r['student__full_name']} ({r['student__school_id']}) registration={r['id']}")
+
+    def _check_orphaned_enrollments(self, scope):
+        from dashboard.models import CourseEnrollment
+
+        qs = CourseEnrollment.objects.filter(is_active=True, deleted_at__isnull=True).filter(
+            Q(course__deleted_at__isnull=False)
+            | Q(course__is_active=False)
+            | Q(course__is_archived=True)
+            | Q(student__is_active=False)
+            | Q(student__is_student=False)
+        )
+        if scope:
+            qs = qs.filter(
+                Q(enrolled_at__gte=scope['since'])
+                | Q(course_id__in=scope['course_ids'])
+                | Q(student_id__gt=scope['last_user_id'])
+            )
+        qs = qs.values('id', 'course__code', 'course__section', 'student__full_name', 'student__school_id').order_by('course__code', 'id')
+        return qs, lambda r: (f"{r['course__code']} ({r['course__section']}) {r['student__full_name']} "
+                              f"({r['student__school_id']}) enrollment={r['id']}")
+
+    def _check_orphaned_qr_registrations(self, scope):
+        from dashboard.models import CourseEnrollment, QRCodeRegistration
+
+        active_enrollment = CourseEnrollment.objects.filter(
+            course_id=OuterRef('course_id'), student_id=OuterRef('student_id'), is_active=True, deleted_at__isnull=True
+        )
+        qs = QRCodeRegistration.objects.filter(is_active=True).filter(~Exists(active_enrollment))
+        if scope:
+            qs = qs.filter(
+                Q(updated_at__gte=scope['since'])
+                | Q(course_id__in=scope['course_ids'])
+                | Q(student_id__in=scope['enrollment_student_ids'])
+            )
+        qs = qs.values('id', 'course__code', 'course__section', 'student__full_name', 'student__school_id').order_by('course__code', 'id')
+        return qs, lambda r: (f"{r['course__code']} ({r['course__section']}) {r['student__full_name']} "
+                              f"({r['student__school_id']}) registration={r['id']}")
+
+    # ----------------------------------------------------------------- output
+
+    def _report(self, check, queryset, describe, limit):
+        self.stdout.write(f'\n[{check}]')
+        count = 0
+        for row in queryset.iterator(chunk_size=2000):
+            count += 1
+            if count <= limit:
+                self.stdout.write(self.style.WARNING(f'  - {describe(row)}'))
+        if count > limit:
+            self.stdout.write(f'  ... and {count - limit} more')
+        if not count:
+            self.stdout.write(self.style.SUCCESS('  ✓ none'))
+        return count
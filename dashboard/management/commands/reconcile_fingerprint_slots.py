@@ -0,0 +1,136 @@
+"""
+Compare each sensor's fingerprint template table with its slot map (dashboard.slot_allocator).
+
+One exchange per sensor: the command publishes {"command": "list_templates"} on
+biometric/<device_id>/command and the firmware answers on biometric/<device_id>/templates
+with its capacity and a bitmap of occupied slots. All sensors are asked at once and
+the replies are diffed against the database:
+
+  orphaned  - templates on the sensor that no active registration, enrollment or slot
+              reservation holds
+  missing   - slots of active registrations whose template is gone from the sensor
+              (those students have to enroll again; reenroll_fingerprints.py used to
+              be the only way to find them)
+  unmapped  - templates held by a registration but not yet in the slot map
+
+Dry run by default. --apply rewrites the slot maps and deletes orphaned templates
+from the sensors (one delete_templates command per sensor); --gc first frees slots
+of deactivated registrations.
+
+Usage:
+    python manage.py reconcile_fingerprint_slots
+    python manage.py reconcile_fingerprint_slots --device lab-1 --apply
+    python manage.py reconcile_fingerprint_slots --gc --apply --fail-on-issues
+"""
+
+import json
+import threading
+import time
+import uuid
+
+import paho.mqtt.client as mqtt
+from django.core.management.base import BaseCommand, CommandError
+
+TOPIC_TEMPLATES = 'templates'
+
+
+class Command(BaseCommand):
+    help = "Diff each fingerprint sensor's template table against its slot map and optionally repair it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', action='append', dest='devices', help='Sensor to reconcile (repeatable; default all active sensors)')
+        parser.add_argument('--apply', action='store_true', help='Rewrite slot maps and delete orphaned templates from the sensors')
+        parser.add_argument('--gc', action='store_true', help='Free slots of deactivated registrations first')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for sensors to report (a full scan takes a few seconds)')
+        parser.add_argument('--limit', type=int, default=20, help='Slots printed per category (all are counted)')
+        parser.add_argument('--fail-on-issues', action='store_true', help='Exit with an error if anything is out of sync')
+
+    def handle(self, *args, **options):
+        from dashboard.biometric_devices import active_device_ids, device_topic, device_topic_filter, parse_device_topic
+        from dashboard.mqtt_client import MQTT_BROKER, MQTT_PORT
+        from dashboard.slot_allocator import collect_garbage, delete_templates_command, reconcile_sensor
+
+        devices = options['devices'] or active_device_ids()
+        if not devices:
+            raise CommandError('No active sensors registered')
+
+        self.stdout.write(self.style.SUCCESS('=' * 90))
+        self.stdout.write(self.style.SUCCESS('FINGERPRINT SLOT RECONCILIATION' + ('' if options['apply'] else ' (dry run)')))
+        self.stdout.write(self.style.SUCCESS('=' * 90))
+
+        if options['gc']:
+            freed = collect_garbage() if options['apply'] else 0
+            self.stdout.write(f"Garbage collection: {freed} slot(s) of deactivated registrations freed"
+                              + ('' if options['apply'] else ' (skipped in dry run)'))
+
+        replies = {}
+        all_replied = threading.Event()
+
+        def on_message(client, userdata, msg):
+            device_id, _ = parse_device_topic(msg.topic)
+            if device_id not in devices:
+                return
+            try:
+                replies[device_id] = json.loads(msg.payload.decode(errors='replace'))
+            except ValueError:
+                return
+            if len(replies) == len(devices):
+                all_replied.set()
+
+        client = mqtt.Client(client_id=f'slot-reconcile-{uuid.uuid4().hex[:8]}', protocol=mqtt.MQTTv311)
+        client.on_message = on_message
+        try:
+            client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
+        except OSError as e:
+            raise CommandError(f'Could not connect to MQTT broker {MQTT_BROKER}:{MQTT_PORT}: {e}')
+        client.loop_start()
+        try:
+            client.subscribe(device_topic_filter(TOPIC_TEMPLATES), qos=1)
+            time.sleep(0.5)  # Let the SUBACK arrive before the sensors answer
+            for device_id in devices:
+                client.publish(device_topic(device_id, 'command'), json.dumps({'command': 'list_templates'}), qos=1)
+            all_replied.wait(options['timeout'])
+
+            issues = 0
+            for device_id in devices:
+                reply = replies.get(device_id)
+                if reply is None:
+                    issues += 1
+                    self.stdout.write(self.style.ERROR(f"\n{device_id}: no answer within {options['timeout']:.0f}s"))
+                    continue
+                try:
+                    sensor_bitmap = bytes.fromhex(reply.get('bitmap') or '')
+                except ValueError:
+                    issues += 1
+                    self.stdout.write(self.style.ERROR(f"\n{device_id}: unreadable template bitmap"))
+                    continue
+                report = reconcile_sensor(device_id, sensor_bitmap, capacity=reply.get('capacity'), apply=options['apply'])
+                issues += self._print_report(report, options['limit'])
+                if options['apply'] and report['orphaned']:
+                    client.publish(
+                        device_topic(device_id, 'command'), json.dumps(delete_templates_command(report['orphaned'])), qos=1,
+                    ).wait_for_publish(5)
+                    self.stdout.write(f"  deleted {len(report['orphaned'])} orphaned template(s) from the sensor")
+        finally:
+            client.loop_stop()
+            client.disconnect()
+
+        self.stdout.write(self.style.SUCCESS('=' * 90))
+        if issues and options['fail_on_issues']:
+            raise CommandError(f'{issues} sensor issue(s) found')
+
+    def _print_report(self, report, limit):
+        def shown(slots):
+            return ', '.join(str(s) for s in slots[:limit]) + (' ...' if len(slots) > limit else '')
+
+        self.stdout.write(f"\n{report['device_id']}: {report['sensor_templates']} template(s) on the sensor, "
+                          f"{report['mapped_slots']} slot(s) mapped, capacity {report['capacity']}")
+        issues = 0
+        for key, label in (('orphaned', 'orphaned templates'), ('missing', 'missing templates (re-enroll)'), ('unmapped', 'unmapped templates')):
+            slots = report[key]
+            if slots:
+                issues += 1
+                self.stdout.write(self.style.WARNING(f"  {label}: {len(slots)} -> {shown(slots)}"))
+        if not issues:
+            self.stdout.write(self.style.SUCCESS('  in sync'))
+        return issues
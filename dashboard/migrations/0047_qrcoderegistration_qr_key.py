@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_qr_keys(apps, schema_editor):
+    from dashboard.qr_registry import normalize_qr_key
+
+    QRCodeRegistration = apps.get_model('dashboard', 'QRCodeRegistration')
+    pending = []
+    for reg in QRCodeRegistration.objects.only('id', 'qr_code').iterator(chunk_size=1000):
+        reg.qr_key = normalize_qr_key(reg.qr_code)
+        pending.append(reg)
+        if len(pending) >= 1000:
+            QRCodeRegistration.objects.bulk_update(pending, ['qr_key'])
+            pending = []
+    if pending:
+        QRCodeRegistration.objects.bulk_update(pending, ['qr_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0046_remove_biometricregistration_unique_student_fingerprint_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qrcoderegistration',
+            name='qr_key',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Normalized QR code used for scan lookups (extracted 32-hex id, lowercase)', max_length=500),
+        ),
+        migrations.RunPython(backfill_qr_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='qrcoderegistration',
+            index=models.Index(fields=['qr_key', 'course', 'is_active'], name='qrreg_key_course_active_idx'),
+        ),
+    ]
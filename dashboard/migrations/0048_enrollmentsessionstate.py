@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0047_qrcoderegistration_qr_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollmentSessionState',
+            fields=[
+                ('enrollment_id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('template_id', models.CharField(blank=True, db_index=True, help_text='Template ID the sensor reports back over MQTT', max_length=100)),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('course_id', models.IntegerField(blank=True, null=True)),
+                ('data', models.JSONField(default=dict, help_text='Full enrollment state (status, progress, message, ...)')),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Enrollment Session State',
+                'verbose_name_plural': 'Enrollment Session States',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0048_enrollmentsessionstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FingerprintDetection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(default='attendance', help_text='attendance or registration', max_length=20)),
+                ('payload', models.JSONField(default=dict, help_text='fingerprint_id, confidence, match_type, reason, timestamp, key')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Fingerprint Detection',
+                'verbose_name_plural': 'Fingerprint Detections',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['mode', 'id'], name='dashboard_f_mode_0f685d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0050_cacheversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BiometricAutoRecordSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(blank=True, help_text='Scanner session id sent with start_detection', max_length=100)),
+                ('schedule_day', models.CharField(blank=True, help_text='Schedule day the scanner was opened for (blank = day of the scan)', max_length=10)),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='Disarmed automatically after this time')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('armed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='biometric_auto_record_sessions', to=settings.AUTH_USER_MODEL)),
+                ('course', models.OneToOneField(help_text='Course being scanned', on_delete=django.db.models.deletion.CASCADE, related_name='biometric_auto_record', to='dashboard.course')),
+            ],
+            options={
+                'verbose_name': 'Biometric Auto-Record Session',
+                'verbose_name_plural': 'Biometric Auto-Record Sessions',
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0051_biometricautorecordsession'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BiometricDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.SlugField(help_text='Topic namespace: biometric/<device_id>/... (firmware DEVICE_ID)', unique=True)),
+                ('name', models.CharField(blank=True, help_text="Display name, e.g. 'Library counter'", max_length=100)),
+                ('location', models.CharField(blank=True, max_length=150)),
+                ('is_active', models.BooleanField(default=True, help_text='Inactive sensors are not given new enrollments')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Biometric Device',
+                'verbose_name_plural': 'Biometric Devices',
+                'ordering': ['device_id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EnrollmentQueueEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enrollment_id', models.CharField(help_text='Frontend enrollment id (WebSocket group)', max_length=100, unique=True)),
+                ('template_id', models.CharField(db_index=True, help_text='Template ID the sensor reports back over MQTT', max_length=100)),
+                ('status', models.CharField(choices=[('waiting', 'Waiting for a sensor'), ('active', 'Enrolling'), ('done', 'Done'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], db_index=True, default='waiting', max_length=20)),
+                ('device_id', models.CharField(blank=True, help_text='Sensor assigned when the enrollment starts', max_length=50)),
+                ('slot', models.IntegerField(blank=True, help_text='Fingerprint slot reserved for this enrollment', null=True)),
+                ('enqueued_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('lease_expires_at', models.DateTimeField(blank=True, help_text='Sensor is released if the enrollment is still active after this', null=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollment_queue_entries', to='dashboard.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollment_queue_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Enrollment Queue Entry',
+                'verbose_name_plural': 'Enrollment Queue Entries',
+                'ordering': ['enqueued_at', 'id'],
+                'indexes': [models.Index(fields=['status', 'enqueued_at'], name='dashboard_e_status_aa3d2b_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('device_id',), name='uq_active_enrollment_per_device'), models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('slot',), name='uq_active_enrollment_slot')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0052_biometricdevice_enrollmentqueueentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MQTTOutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=200)),
+                ('payload', models.TextField(blank=True, help_text='Serialized payload (JSON for dicts, empty clears a retained message)')),
+                ('qos', models.PositiveSmallIntegerField(default=1)),
+                ('retain', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'MQTT Outbox Message',
+                'verbose_name_plural': 'MQTT Outbox Messages',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ServiceLease',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('holder', models.CharField(blank=True, help_text='host:pid of the process holding the lease', max_length=200)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('details', models.JSONField(blank=True, default=dict, help_text='State published by the holder (e.g. broker connection)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Service Lease',
+                'verbose_name_plural': 'Service Leases',
+            },
+        ),
+    ]
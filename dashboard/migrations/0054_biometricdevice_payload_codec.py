@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0053_servicelease_mqttoutboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='biometricdevice',
+            name='payload_codec',
+            field=models.CharField(choices=[('json', 'JSON'), ('compact1', 'Compact binary v1')], default='json', help_text='Encoding the sensor is told to use for its messages (see dashboard.mqtt_codec); JSON is always accepted', max_length=20),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0054_biometricdevice_payload_codec'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceTelemetry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=50)),
+                ('bucket_start', models.DateTimeField(db_index=True)),
+                ('bucket_seconds', models.PositiveIntegerField(default=60)),
+                ('messages', models.PositiveIntegerField(default=0)),
+                ('heartbeats', models.PositiveIntegerField(default=0)),
+                ('detections', models.PositiveIntegerField(default=0)),
+                ('enroll_messages', models.PositiveIntegerField(default=0)),
+                ('reconnects', models.PositiveIntegerField(default=0)),
+                ('rssi_min', models.SmallIntegerField(blank=True, null=True)),
+                ('rssi_max', models.SmallIntegerField(blank=True, null=True)),
+                ('rssi_avg', models.FloatField(blank=True, null=True)),
+                ('uptime_seconds', models.PositiveIntegerField(blank=True, help_text='Last uptime the sensor reported in the bucket', null=True)),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Device Telemetry',
+                'verbose_name_plural': 'Device Telemetry',
+                'ordering': ['-bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('device_id', 'bucket_start'), name='uq_device_telemetry_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_biometric_digests(apps, schema_editor):
+    from dashboard.biometric_utils import stored_biometric_digest
+
+    BiometricRegistration = apps.get_model('dashboard', 'BiometricRegistration')
+    pending = []
+    for reg in BiometricRegistration.objects.only('id', 'biometric_data').iterator(chunk_size=1000):
+        reg.biometric_digest = stored_biometric_digest(reg.biometric_data)
+        pending.append(reg)
+        if len(pending) >= 1000:
+            BiometricRegistration.objects.bulk_update(pending, ['biometric_digest'])
+            pending = []
+    if pending:
+        BiometricRegistration.objects.bulk_update(pending, ['biometric_digest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0055_devicetelemetry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='biometricregistration',
+            name='biometric_digest',
+            field=models.CharField(blank=True, default='', editable=False, help_text='HMAC digest part of biometric_data, used for indexed duplicate/match lookups', max_length=64),
+        ),
+        migrations.RunPython(backfill_biometric_digests, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='biometricregistration',
+            index=models.Index(fields=['biometric_digest', 'course', 'is_active'], name='bioreg_digest_course_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0056_biometricregistration_biometric_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorSlotMap',
+            fields=[
+                ('device_id', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('capacity', models.PositiveSmallIntegerField(default=300, help_text='Highest slot the sensor can store')),
+                ('bitmap', models.BinaryField(default=bytes, help_text='Occupied slots, bit n = slot n')),
+                ('reconciled_at', models.DateTimeField(blank=True, help_text='Last time the bitmap was checked against the sensor', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Sensor Slot Map',
+                'verbose_name_plural': 'Sensor Slot Maps',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0057_sensorslotmap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceFinalization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_date', models.DateField(help_text='Date of the session (Asia/Manila)')),
+                ('session_end', models.DateTimeField(help_text='When the last schedule of the day ended')),
+                ('finalized_at', models.DateTimeField(auto_now_add=True)),
+                ('created_records', models.PositiveIntegerField(default=0, help_text='Absent/postponed records created')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_finalizations', to='dashboard.course')),
+            ],
+            options={
+                'verbose_name': 'Attendance Finalization',
+                'verbose_name_plural': 'Attendance Finalizations',
+                'ordering': ['-session_date', 'course'],
+                'constraints': [models.UniqueConstraint(fields=('course', 'session_date'), name='uq_attendance_finalization_session')],
+            },
+        ),
+    ]
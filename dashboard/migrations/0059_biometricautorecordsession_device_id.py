@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0058_attendancefinalization'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='biometricautorecordsession',
+            name='device_id',
+            field=models.CharField(blank=True, help_text='Sensor the scanner session runs on (blank = default sensor); only its detections are recorded', max_length=50),
+        ),
+    ]
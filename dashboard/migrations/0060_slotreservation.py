@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0059_biometricautorecordsession_device_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(help_text='Who holds the slot, e.g. student_<id>', max_length=100, unique=True)),
+                ('device_id', models.CharField(max_length=50)),
+                ('slot', models.IntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='Slot is collected after this unless a registration holds it')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Slot Reservation',
+                'verbose_name_plural': 'Slot Reservations',
+            },
+        ),
+    ]
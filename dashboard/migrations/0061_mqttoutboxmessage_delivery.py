@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0060_slotreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mqttoutboxmessage',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, help_text='When the broker acknowledged it', null=True),
+        ),
+        migrations.AddField(
+            model_name='mqttoutboxmessage',
+            name='failed',
+            field=models.BooleanField(default=False, help_text='Publish failed or not delivered within MQTT_OUTBOX_TTL'),
+        ),
+        migrations.AddField(
+            model_name='mqttoutboxmessage',
+            name='sent_at',
+            field=models.DateTimeField(blank=True, help_text='When the ingest process handed it to the broker client', null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:38
+
+from django.db import migrations, models
+
+
+def backfill_rssi_samples(apps, schema_editor):
+    # Older buckets only kept the average: count each as one sample of it
+    DeviceTelemetry = apps.get_model('dashboard', 'DeviceTelemetry')
+    pending = []
+    for row in DeviceTelemetry.objects.filter(rssi_avg__isnull=False).only('id', 'rssi_avg').iterator(chunk_size=1000):
+        row.rssi_sum, row.rssi_count = round(row.rssi_avg), 1
+        pending.append(row)
+        if len(pending) >= 1000:
+            DeviceTelemetry.objects.bulk_update(pending, ['rssi_sum', 'rssi_count'])
+            pending = []
+    if pending:
+        DeviceTelemetry.objects.bulk_update(pending, ['rssi_sum', 'rssi_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0061_mqttoutboxmessage_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicetelemetry',
+            name='rssi_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of RSSI samples in the bucket'),
+        ),
+        migrations.AddField(
+            model_name='devicetelemetry',
+            name='rssi_sum',
+            field=models.IntegerField(default=0, help_text='Sum of the RSSI samples, so averages over buckets can be weighted'),
+        ),
+        migrations.RunPython(backfill_rssi_samples, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@
 from django.db import models
 from django.db.models import Q
 from accounts.models import CustomUser
+from .mqtt_codec import CODEC_CHOICES, CODEC_JSON
 
 class Department(models.Model):
     """Model for departments/colleges"""
@@ -431,6 +432,7 @@ class QRCodeRegistration(models.Model):
     student = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='qr_registrations', help_text="Student who owns this QR code")
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='qr_registrations', help_text="Course this QR code is registered for")
     qr_code = models.CharField(max_length=500, help_text="QR code value/ID (can be school ID, UUID, or custom value)")
+    qr_key = models.CharField(max_length=500, blank=True, default='', editable=False, help_text="Normalized QR code used for scan lookups (extracted 32-hex id, lowercase)")
     registered_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='qr_registrations_created', help_text="Instructor who registered this QR code")
     is_active = models.BooleanField(default=True, help_text="Whether this QR code registration is active")
     
@@ -462,10 +464,20 @@ class QRCodeRegistration(models.Model):
             # NOTE: Removed global index on qr_code to allow same QR across courses
             # models.Index(fields=['qr_code']),  # REMOVED - was causing global unique constraint
             models.Index(fields=['course', 'is_active']),
+            models.Index(fields=['qr_key', 'course', 'is_active'], name='qrreg_key_course_active_idx'),
         ]
     
     def __str__(self):
         return f"{self.student.full_name} - {self.course.code} - {self.qr_code[:20]}"
+    
+    def save(self, *args, **kwargs):
+        # Keep the lookup key in sync with the stored QR value
+        from .qr_registry import normalize_qr_key
+        self.qr_key = normalize_qr_key(self.qr_code)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'qr_code' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'qr_key'}
+        super().save(*args, **kwargs)
 
 
 class InstructorRegistrationStatus(models.Model):
@@ -492,6 +504,7 @@ class BiometricRegistration(models.Model):
     student = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='biometric_registrations', help_text="Student who owns this biometric data")
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='biometric_registrations', help_text="Course this biometric is registered for")
     biometric_data = models.TextField(help_text="Encrypted biometric data (fingerprint template)")
+    biometric_digest = models.CharField(max_length=64, blank=True, default='', editable=False, help_text="HMAC digest part of biometric_data, used for indexed duplicate/match lookups")
     biometric_type = models.CharField(max_length=50, default='fingerprint', help_text="Type of biometric (e.g., fingerprint, face)")
     fingerprint_id = models.IntegerField(null=True, blank=True, help_text="Unique fingerprint ID assigned by the Arduino R307 sensor")
     is_active = models.BooleanField(default=True, help_text="Whether this biometric registration is active")
@@ -510,8 +523,317 @@ class BiometricRegistration(models.Model):
             models.Index(fields=['course', 'is_active']),
             models.Index(fields=['student', 'is_active']),
             models.Index(fields=['fingerprint_id', 'course', 'is_active']),  # Optimize fingerprint + course lookups
+            models.Index(fields=['biometric_digest', 'course', 'is_active'], name='bioreg_digest_course_idx'),
         ]
     
     def __str__(self):
         return f"{self.student.full_name} - {self.course.code} - {self.biometric_type}"
+    
+    def save(self, *args, **kwargs):
+        # Keep the lookup digest in sync with the stored biometric data
+        from .biometric_utils import stored_biometric_digest
+        self.biometric_digest = stored_biometric_digest(self.biometric_data)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'biometric_data' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'biometric_digest'}
+        super().save(*args, **kwargs)
+
+
+
+class EnrollmentSessionState(models.Model):
+    """
+    Shared state of an in-progress fingerprint enrollment session (database backend of
+    dashboard.enrollment_state). Lets every worker process see progress pushed by the
+    MQTT thread of another; rows are ignored once expires_at has passed.
+    """
+    enrollment_id = models.CharField(max_length=100, primary_key=True)
+    template_id = models.CharField(max_length=100, blank=True, db_index=True, help_text="Template ID the sensor reports back over MQTT")
+    user_id = models.IntegerField(null=True, blank=True)
+    course_id = models.IntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict, help_text="Full enrollment state (status, progress, message, ...)")
+    expires_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Enrollment Session State'
+        verbose_name_plural = 'Enrollment Session States'
+
+    def __str__(self):
+        return f"{self.enrollment_id} ({self.data.get('status', 'unknown')})"
+
+
+class FingerprintDetection(models.Model):
+    """
+    Append-only log of fingerprint detections reported by the ESP32 (database backend
+    of dashboard.detection_log). The autoincrement id is the sequence number pollers
+    use as their cursor; rows older than DETECTION_LOG_TTL are ignored and purged.
+    """
+    mode = models.CharField(max_length=20, default='attendance', help_text="attendance or registration")
+    payload = models.JSONField(default=dict, help_text="fingerprint_id, confidence, match_type, reason, timestamp, key")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Fingerprint Detection'
+        verbose_name_plural = 'Fingerprint Detections'
+        indexes = [
+            models.Index(fields=['mode', 'id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.mode} fingerprint_id={self.payload.get('fingerprint_id')}"
+
+
+class CacheVersion(models.Model):
+    """
+    Shared version counters for caches kept in process memory (used by
+    dashboard.fingerprint_index and dashboard.session_qr when the default cache is
+    process-local). Bumping a key tells every worker its cached copy is stale.
+    """
+    key = models.CharField(max_length=200, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Cache Version'
+        verbose_name_plural = 'Cache Versions'
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
+class BiometricAutoRecordSession(models.Model):
+    """
+    A biometric scanner session the instructor opted into server-side recording for
+    (see dashboard.biometric_autorecord). While it is armed and attendance is open,
+    fingerprint matches arriving over MQTT are written as AttendanceRecords directly,
+    without waiting for the scanner page to post them.
+    """
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, related_name='biometric_auto_record', help_text="Course being scanned")
+    armed_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='biometric_auto_record_sessions')
+    session_id = models.CharField(max_length=100, blank=True, help_text="Scanner session id sent with start_detection")
+    device_id = models.CharField(max_length=50, blank=True, help_text="Sensor the scanner session runs on (blank = default sensor); only its detections are recorded")
+    schedule_day = models.CharField(max_length=10, blank=True, help_text="Schedule day the scanner was opened for (blank = day of the scan)")
+    expires_at = models.DateTimeField(db_index=True, help_text="Disarmed automatically after this time")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Biometric Auto-Record Session'
+        verbose_name_plural = 'Biometric Auto-Record Sessions'
+
+    def __str__(self):
+        return f"{self.course.code} auto-record ({self.session_id or 'no session'})"
+
+
+class BiometricDevice(models.Model):
+    """
+    A fingerprint sensor (ESP32 + R307) talking MQTT under biometric/<device_id>/...
+    (see dashboard.biometric_devices). Each sensor enrolls one student at a time; the
+    enrollment scheduler hands waiting students to whichever active sensor is free.
+    With no rows at all, the single legacy 'esp32' sensor is used.
+    """
+    device_id = models.SlugField(max_length=50, unique=True, help_text="Topic namespace: biometric/<device_id>/... (firmware DEVICE_ID)")
+    name = models.CharField(max_length=100, blank=True, help_text="Display name, e.g. 'Library counter'")
+    location = models.CharField(max_length=150, blank=True)
+    is_active = models.BooleanField(default=True, help_text="Inactive sensors are not given new enrollments")
+    payload_codec = models.CharField(
+        max_length=20, choices=CODEC_CHOICES, default=CODEC_JSON,
+        help_text="Encoding the sensor is told to use for its messages (see dashboard.mqtt_codec); JSON is always accepted",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['device_id']
+        verbose_name = 'Biometric Device'
+        verbose_name_plural = 'Biometric Devices'
+
+    def __str__(self):
+        return self.name or self.device_id
+
+
+class EnrollmentQueueEntry(models.Model):
+    """
+    One fingerprint enrollment request in the FIFO queue of
+    dashboard.enrollment_scheduler. An 'active' row is the lock on its sensor: at most
+    one per device_id (and per slot), enforced by the database.
+    """
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting for a sensor'),
+        ('active', 'Enrolling'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    enrollment_id = models.CharField(max_length=100, unique=True, help_text="Frontend enrollment id (WebSocket group)")
+    template_id = models.CharField(max_length=100, db_index=True, help_text="Template ID the sensor reports back over MQTT")
+    student = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='enrollment_queue_entries')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollment_queue_entries')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting', db_index=True)
+    device_id = models.CharField(max_length=50, blank=True, help_text="Sensor assigned when the enrollment starts")
+    slot = models.IntegerField(null=True, blank=True, help_text="Fingerprint slot reserved for this enrollment")
+    enqueued_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, help_text="Sensor is released if the enrollment is still active after this")
 
+    class Meta:
+        ordering = ['enqueued_at', 'id']
+        verbose_name = 'Enrollment Queue Entry'
+        verbose_name_plural = 'Enrollment Queue Entries'
+        constraints = [
+            models.UniqueConstraint(fields=['device_id'], condition=Q(status='active'), name='uq_active_enrollment_per_device'),
+            models.UniqueConstraint(fields=['slot'], condition=Q(status='active'), name='uq_active_enrollment_slot'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'enqueued_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.enrollment_id} ({self.status}{' on ' + self.device_id if self.device_id else ''})"
+
+
+class SensorSlotMap(models.Model):
+    """
+    Template table of one fingerprint sensor as a bitmap (see dashboard.slot_allocator):
+    bit n of `bitmap` (little-endian) is set while slot n holds, or is reserved for, a
+    template on that sensor.
+    """
+    device_id = models.CharField(max_length=50, primary_key=True)
+    capacity = models.PositiveSmallIntegerField(default=300, help_text="Highest slot the sensor can store")
+    bitmap = models.BinaryField(default=bytes, help_text="Occupied slots, bit n = slot n")
+    reconciled_at = models.DateTimeField(null=True, blank=True, help_text="Last time the bitmap was checked against the sensor")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Sensor Slot Map'
+        verbose_name_plural = 'Sensor Slot Maps'
+
+    def __str__(self):
+        return f"{self.device_id} slots"
+
+
+class SlotReservation(models.Model):
+    """
+    A fingerprint slot handed to an enrollment that does not go through the enrollment
+    queue (the direct enrollment APIs), held until its registration exists or it
+    expires (see dashboard.slot_allocator). One per reference, so a retry reuses it.
+    """
+    reference = models.CharField(max_length=100, unique=True, help_text="Who holds the slot, e.g. student_<id>")
+    device_id = models.CharField(max_length=50)
+    slot = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True, help_text="Slot is collected after this unless a registration holds it")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Slot Reservation'
+        verbose_name_plural = 'Slot Reservations'
+
+    def __str__(self):
+        return f"slot {self.slot} on {self.device_id} for {self.reference}"
+
+
+class ServiceLease(models.Model):
+    """
+    A named lease held by one process at a time - leader election for singleton
+    background services such as the MQTT ingest (see dashboard.mqtt_ingest). The
+    holder renews it well before expires_at; anyone may take it over after that.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    holder = models.CharField(max_length=200, blank=True, help_text="host:pid of the process holding the lease")
+    expires_at = models.DateTimeField(db_index=True)
+    details = models.JSONField(default=dict, blank=True, help_text="State published by the holder (e.g. broker connection)")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Service Lease'
+        verbose_name_plural = 'Service Leases'
+
+    def __str__(self):
+        return f"{self.name} held by {self.holder or 'nobody'}"
+
+
+class MQTTOutboxMessage(models.Model):
+    """
+    An MQTT publish requested by a process without a broker connection (web workers).
+    The ingest process publishes the rows in id order and records the outcome:
+    delivered_at once the broker acknowledged the message, failed when the publish failed
+    or it was not delivered within MQTT_OUTBOX_TTL. Rows are deleted after
+    MQTT_OUTBOX_RETENTION (see dashboard.mqtt_ingest).
+    """
+    topic = models.CharField(max_length=200)
+    payload = models.TextField(blank=True, help_text="Serialized payload (JSON for dicts, empty clears a retained message)")
+    qos = models.PositiveSmallIntegerField(default=1)
+    retain = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    sent_at = models.DateTimeField(null=True, blank=True, help_text="When the ingest process handed it to the broker client")
+    delivered_at = models.DateTimeField(null=True, blank=True, help_text="When the broker acknowledged it")
+    failed = models.BooleanField(default=False, help_text="Publish failed or not delivered within MQTT_OUTBOX_TTL")
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'MQTT Outbox Message'
+        verbose_name_plural = 'MQTT Outbox Messages'
+
+    def __str__(self):
+        return f"#{self.id} {self.topic}"
+
+
+class DeviceTelemetry(models.Model):
+    """
+    One downsampled bucket of a sensor's MQTT traffic (see dashboard.device_telemetry):
+    message counts, heartbeats, RSSI range and sample sum/count, and reconnects within
+    bucket_seconds.
+    """
+    device_id = models.CharField(max_length=50)
+    bucket_start = models.DateTimeField(db_index=True)
+    bucket_seconds = models.PositiveIntegerField(default=60)
+    messages = models.PositiveIntegerField(default=0)
+    heartbeats = models.PositiveIntegerField(default=0)
+    detections = models.PositiveIntegerField(default=0)
+    enroll_messages = models.PositiveIntegerField(default=0)
+    reconnects = models.PositiveIntegerField(default=0)
+    rssi_min = models.SmallIntegerField(null=True, blank=True)
+    rssi_max = models.SmallIntegerField(null=True, blank=True)
+    rssi_avg = models.FloatField(null=True, blank=True)
+    rssi_sum = models.IntegerField(default=0, help_text="Sum of the RSSI samples, so averages over buckets can be weighted")
+    rssi_count = models.PositiveIntegerField(default=0, help_text="Number of RSSI samples in the bucket")
+    uptime_seconds = models.PositiveIntegerField(null=True, blank=True, help_text="Last uptime the sensor reported in the bucket")
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-bucket_start']
+        verbose_name = 'Device Telemetry'
+        verbose_name_plural = 'Device Telemetry'
+        constraints = [
+            models.UniqueConstraint(fields=['device_id', 'bucket_start'], name='uq_device_telemetry_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} @ {self.bucket_start:%Y-%m-%d %H:%M}"
+
+
+class AttendanceFinalization(models.Model):
+    """
+    Claim that a course session has been finalized (absent/postponed records created for
+    students who did not scan) by the finalize_attendance scheduler; the unique
+    (course, session_date) makes finalization happen exactly once per session.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='attendance_finalizations')
+    session_date = models.DateField(help_text="Date of the session (Asia/Manila)")
+    session_end = models.DateTimeField(help_text="When the last schedule of the day ended")
+    finalized_at = models.DateTimeField(auto_now_add=True)
+    created_records = models.PositiveIntegerField(default=0, help_text="Absent/postponed records created")
+
+    class Meta:
+        ordering = ['-session_date', 'course']
+        verbose_name = 'Attendance Finalization'
+        verbose_name_plural = 'Attendance Finalizations'
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'session_date'], name='uq_attendance_finalization_session'),
+        ]
+
+    def __str__(self):
+        return f"{self.course_id} @ {self.session_date}"
@@ -1,6 +1,6 @@
 """
 Global MQTT Client for Django
-Handles all MQTT communication with ESP32 fingerprint sensor
+Handles all MQTT communication with the ESP32 fingerprint sensors
 Used by enrollment APIs and other backend processes
 """
 
@@ -10,29 +10,63 @@ import logging
 import socket
 import time
 import threading
-from django.core.cache import cache
-from django.utils import timezone
+from collections import deque
+from concurrent.futures import Future
 
-logger = logging.getLogger(__name__)
+from django.conf import settings
+
+from . import device_telemetry
+from .biometric_devices import device_topic, device_topic_filter, is_known_device, parse_device_topic
+from .mqtt_codec import decode_payload
+from .mqtt_dedup import DedupWindow
+from .mqtt_workers import MessageWorkerPool
 
+logger = logging.getLogger(__name__)
 
-TOPIC_ENROLL_RESPONSE = "biometric/esp32/enroll/response"
-TOPIC_FINGERPRINT_RESULT = "biometric/esp32/fingerprint"
 
-ENROLLMENT_LOCK_KEY = "biometric_enrollment_lock"
+# Topic suffixes under biometric/<device_id>/ (see biometric_devices.py); every sensor is subscribed
+TOPIC_ENROLL_RESPONSE = "enroll/response"
+TOPIC_FINGERPRINT_RESULT = "fingerprint"
+TOPIC_STATUS = "status"  # Heartbeat every 30 s (device telemetry)
 
 # Global MQTT client instance
 _mqtt_client = None
 _mqtt_connected = False
 
 # MQTT Configuration
-MQTT_BROKER = "broker.hivemq.com"  # HiveMQ is most reliable
-MQTT_PORT = 1883
+MQTT_BROKER = getattr(settings, 'MQTT_BROKER', "broker.hivemq.com")  # HiveMQ is most reliable
+MQTT_PORT = getattr(settings, 'MQTT_PORT', 1883)
 MQTT_CLIENT_ID = "django_server_" + str(int(time.time()))  # Unique ID to avoid client conflicts
 MQTT_KEEPALIVE = 60  # Standard keepalive
 MQTT_RECONNECT_MIN = 1
 MQTT_RECONNECT_MAX = 8
 
+# Publishes made while the broker is unreachable wait here and go out on reconnect
+MQTT_PUBLISH_QUEUE_SIZE = getattr(settings, 'MQTT_PUBLISH_QUEUE_SIZE', 200)  # Oldest is dropped when full
+MQTT_PUBLISH_QUEUE_TTL = getattr(settings, 'MQTT_PUBLISH_QUEUE_TTL', 60)  # Seconds before a queued command is stale
+PUBLISH_LATENCY_SAMPLES = 500
+
+
+class PublishHandle(Future):
+    """
+    Delivery of one publish. Resolves to True once the broker acknowledged it (written to
+    the socket for QoS 0) and to False when it was dropped, went stale or failed.
+    Callers may check done(), wait with result(timeout=...) or ignore it.
+    """
+
+    def __init__(self, topic, payload, qos, retain):
+        super().__init__()
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.queued_at = time.monotonic()
+        self.set_running_or_notify_cancel()
+
+    def resolve(self, delivered):
+        if not self.done():
+            self.set_result(delivered)
+
 
 class MQTTClientManager:
     """Manages the global MQTT client connection and publishes"""
@@ -45,6 +79,13 @@ class MQTTClientManager:
         self._connection_thread = None
         self._loop_started = False
         self._subscribed_topics = []  # Track subscribed topics for re-subscription on reconnect
+        self._publish_lock = threading.RLock()
+        self._outbox = deque()  # PublishHandles waiting for a connection, oldest first
+        self._inflight = {}  # mid -> PublishHandle awaiting the broker's ack
+        self._latencies = deque(maxlen=PUBLISH_LATENCY_SAMPLES)  # Seconds from publish() to ack
+        self._counters = {'published': 0, 'acked': 0, 'dropped': 0, 'expired': 0, 'failed': 0}
+        self.workers = MessageWorkerPool(on_drop=self._on_worker_drop)  # Inbound handlers run here, off the network thread
+        self.dedup = DedupWindow()  # Replays dropped before they reach the workers
     
     def connect_async(self):
         """Connect to MQTT broker in background thread (non-blocking)"""
@@ -126,6 +167,10 @@ class MQTTClientManager:
             for topic in self._subscribed_topics:
                 client.subscribe(topic, qos=1)
                 logger.info(f"[MQTT] ✓ Subscribed to {topic}")
+
+            flushed = self._flush_outbox()
+            if flushed:
+                logger.info(f"[MQTT] ✓ Flushed {flushed} publishes queued while disconnected")
         else:
             logger.error(f"[MQTT] ✗ Connection failed with code {rc_val}")
             self.is_connected = False
@@ -169,31 +214,63 @@ class MQTTClientManager:
             logger.warning(f"[MQTT] Client not connected yet, {topic} will be subscribed on reconnect")
             return False
     
-    def _on_publish(self, client, userdata, mid):
-        """Callback when message is published"""
+    def _on_publish(self, client, userdata, mid, *args):
+        """Callback when message is published (compatible with paho-mqtt v1/v2)"""
         logger.debug(f"[MQTT] Message {mid} published")
+        with self._publish_lock:
+            handle = self._inflight.pop(mid, None)
+            if handle:
+                self._delivered(handle)
     
     def _on_message(self, client, userdata, msg):
-        """Callback when message is received"""
-        payload_raw = msg.payload.decode(errors="replace")
-        logger.debug(f"[MQTT] Received on {msg.topic}: {payload_raw}")
+        """Callback when message is received; the handler runs on the worker pool"""
+        payload, codec = decode_payload(msg.payload)
+        if payload is None:
+            logger.warning(f"[MQTT] Could not parse {codec} payload on {msg.topic}")
+            return
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[MQTT] Received on {msg.topic} ({codec}, {len(msg.payload)} bytes): {payload}")
 
-        try:
-            payload = json.loads(payload_raw)
-        except Exception:
-            logger.warning(f"[MQTT] Could not parse JSON payload on {msg.topic}")
+        device_id, suffix = parse_device_topic(msg.topic)
+        if device_id is None:
+            return
+        if isinstance(payload, dict) and self.dedup.is_duplicate(device_id, payload.get('msg_id')):
+            logger.info(f"[MQTT] Dropped replayed message {payload.get('msg_id')} on {msg.topic}")
             return
 
+        if suffix == TOPIC_ENROLL_RESPONSE:
+            # One enrollment's progress must be applied in order; the sensor's when it has no template id yet
+            key = f"enroll:{payload.get('template_id') or device_id}" if isinstance(payload, dict) else device_id
+            self.workers.submit(key, self._handle_message, msg.topic, device_id, suffix, payload)
+        elif suffix == TOPIC_FINGERPRINT_RESULT:
+            self.workers.submit(f"detect:{device_id}", self._handle_message, msg.topic, device_id, suffix, payload)
+        elif suffix == TOPIC_STATUS:
+            self.workers.submit(f"status:{device_id}", self._handle_message, msg.topic, device_id, suffix, payload)
+
+    def _on_worker_drop(self, key, handler, args):
+        """A message dropped on worker overflow was never handled: let its redelivery through"""
+        topic, device_id, suffix, payload = args
+        if isinstance(payload, dict):
+            self.dedup.forget(device_id, payload.get('msg_id'))
+
+    def _handle_message(self, topic, device_id, suffix, payload):
         try:
-            if msg.topic == TOPIC_ENROLL_RESPONSE:
-                self._handle_enroll_response(payload)
-            elif msg.topic == TOPIC_FINGERPRINT_RESULT:
-                self._handle_fingerprint_result(payload)
+            if not is_known_device(device_id):
+                logger.warning(f"[MQTT] Ignoring {topic}: device '{device_id}' is not registered")
+                return
+            if suffix == TOPIC_ENROLL_RESPONSE:
+                device_telemetry.record(device_id, 'enroll')
+                self._handle_enroll_response(payload, device_id)
+            elif suffix == TOPIC_FINGERPRINT_RESULT:
+                device_telemetry.record(device_id, 'detection')
+                self._handle_fingerprint_result(payload, device_id)
+            elif suffix == TOPIC_STATUS:
+                device_telemetry.record_status(device_id, payload if isinstance(payload, dict) else {})
         except Exception as e:
-            logger.error(f"[MQTT] Error handling message on {msg.topic}: {e}")
+            logger.error(f"[MQTT] Error handling message on {topic}: {e}")
 
 
-    def _handle_fingerprint_result(self, data):
+    def _handle_fingerprint_result(self, data, device_id=None):
         try:
             fingerprint_id = data.get("fingerprint_id")
             confidence = data.get("confidence", 0)
@@ -210,39 +287,26 @@ class MQTTClientManager:
             if mode_norm not in {"attendance", "registration"}:
                 mode_norm = "attendance"
 
-            detections_queue_key = (
-                "fingerprint_detections_queue_registration"
-                if mode_norm == "registration"
-                else "fingerprint_detections_queue_attendance"
-            )
-
             logger.info(
-                f"[MQTT] Fingerprint result received: mode={mode_norm} id={fingerprint_id} conf={confidence} match_type={match_type}"
+                f"[MQTT] Fingerprint result received from {device_id}: mode={mode_norm} id={fingerprint_id} conf={confidence} match_type={match_type}"
             )
 
-            detection_key = f"fingerprint_detection_{mode_norm}_{fingerprint_id}_{int(timezone.now().timestamp() * 1000)}"
-
-            queue = cache.get(detections_queue_key, [])
-            queue.append(
-                {
-                    "fingerprint_id": fingerprint_id,
-                    "confidence": confidence,
-                    "timestamp": timezone.now().isoformat(),
-                    "key": detection_key,
-                    "match_type": match_type,
-                    "reason": reason,
-                }
+            from .detection_log import append_detection
+            entry = append_detection(
+                mode_norm, fingerprint_id, confidence, match_type=match_type, reason=reason, device_id=device_id
             )
 
-            queue = queue[-50:]
-            cache.set(detections_queue_key, queue, 60)
+            logger.info(f"[MQTT] Logged fingerprint detection -> {mode_norm} seq={entry['seq']}")
 
-            logger.info(f"[MQTT] Queued fingerprint detection -> {detections_queue_key} (size={len(queue)})")
+            if mode_norm == "attendance" and fingerprint_id >= 0:
+                # Recorded server-side when the scanner session opted into auto-record
+                from .biometric_autorecord import submit_detection
+                submit_detection(entry)
         except Exception as e:
             logger.warning(f"[MQTT] Error handling fingerprint result: {e}")
 
 
-    def _handle_enroll_response(self, data):
+    def _handle_enroll_response(self, data, device_id=None):
         status = data.get("status")
         template_id = data.get("template_id")
         step = data.get("step")
@@ -269,19 +333,21 @@ class MQTTClientManager:
 
         from dashboard.enrollment_state import find_enrollment_id_by_template_id, update_enrollment_state
 
+        # Release the sensor when the enrollment ends (success/error/cancelled)
+        # so the next student in the queue can start on it.
+        if status in {"success", "error", "cancelled"} and template_id:
+            try:
+                from .enrollment_scheduler import finish_enrollment
+                outcome = {"success": "done", "error": "failed", "cancelled": "cancelled"}[status]
+                finish_enrollment(template_id=template_id, outcome=outcome)
+            except Exception as e:
+                logger.error(f"[MQTT] Could not release sensor {device_id} for template_id={template_id}: {e}")
+
         enrollment_id = find_enrollment_id_by_template_id(template_id)
         if not enrollment_id:
             logger.warning(f"[MQTT] No active enrollment found for template_id={template_id}")
             return
 
-        # Release global lock when enrollment ends (success/error/cancelled)
-        # so another student can start.
-        if status in {"success", "error", "cancelled"}:
-            try:
-                cache.delete(ENROLLMENT_LOCK_KEY)
-            except Exception:
-                pass
-
         if status == "progress":
             update_enrollment_state(
                 enrollment_id,
@@ -294,7 +360,7 @@ class MQTTClientManager:
             # Clear retained enroll/request start message to prevent replay after ESP32 reconnect.
             # Clearing retained is done by publishing a zero-length payload with retain=True.
             try:
-                self.publish("biometric/esp32/enroll/request", "", qos=1, retain=True)
+                self.publish(device_topic(device_id, "enroll/request"), "", qos=1, retain=True)
             except Exception:
                 pass
 
@@ -376,7 +442,7 @@ class MQTTClientManager:
     
     def publish(self, topic, payload, qos=1, retain=False):
         """
-        Publish a message to MQTT broker with retry logic
+        Publish a message to the MQTT broker without waiting for it
         
         Args:
             topic: MQTT topic
@@ -385,61 +451,147 @@ class MQTTClientManager:
             retain: Whether to retain the message
             
         Returns:
-            bool: True if publish was successful, False otherwise
+            bool: True if the message was sent or queued for the next connection, False if it failed
         """
-        if not self.client:
-            logger.error(f"[MQTT] ✗ Client not initialized, cannot publish to {topic}")
-            return False
-        
-        # Wait for connection with exponential backoff (up to 5 seconds total)
-        wait_time = 0
-        max_wait = 50  # 50 * 0.1 = 5 seconds
-        
-        while not self.is_connected and wait_time < max_wait:
-            if wait_time == 0:
-                logger.warning(f"[MQTT] Client not connected to {topic}, waiting for reconnection...")
-            time.sleep(0.1)
-            wait_time += 1
+        handle = self.publish_async(topic, payload, qos=qos, retain=retain)
+        return not handle.done() or handle.result()
+
+    def publish_async(self, topic, payload, qos=1, retain=False):
+        """
+        Send a message now, or queue it until the broker is reachable; never blocks.
         
-        if not self.is_connected:
-            logger.error(f"[MQTT] ✗ Still not connected after {wait_time/10:.1f}s, cannot publish to {topic}")
-            return False
+        Returns:
+            PublishHandle: Resolves True when the broker has the message
+        """
+        if isinstance(payload, dict):
+            payload = json.dumps(payload)
+        handle = PublishHandle(topic, payload, qos, retain)
         
-        try:
-            # Convert dict to JSON if needed
-            if isinstance(payload, dict):
-                payload = json.dumps(payload)
-            
-            result = self.client.publish(topic, payload, qos=qos, retain=retain)
-            
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                logger.info(f"[MQTT] ✓ Published to {topic}")
-                return True
+        with self._publish_lock:
+            # Always through the queue, so a message never overtakes one queued before it
+            self._outbox.append(handle)
+            while len(self._outbox) > MQTT_PUBLISH_QUEUE_SIZE:
+                dropped = self._outbox.popleft()
+                self._counters['dropped'] += 1
+                logger.error(f"[MQTT] ✗ Publish queue full, dropped message to {dropped.topic}")
+                dropped.resolve(False)
+            if self.client and self.is_connected:
+                self._flush_outbox()
             else:
-                logger.error(f"[MQTT] ✗ Publish failed with code {result.rc}")
-                return False
+                logger.warning(f"[MQTT] Not connected, queued publish to {topic} ({len(self._outbox)} waiting)")
+        return handle
+
+    def _send(self, handle):
+        """Hand one message to paho; requeues it at the front if the connection just dropped"""
+        try:
+            result = self.client.publish(handle.topic, handle.payload, qos=handle.qos, retain=handle.retain)
         except Exception as e:
-            logger.error(f"[MQTT] ✗ Error publishing to {topic}: {e}")
+            logger.error(f"[MQTT] ✗ Error publishing to {handle.topic}: {e}")
+            self._counters['failed'] += 1
+            handle.resolve(False)
+            return False
+        
+        if result.rc == mqtt.MQTT_ERR_NO_CONN:
+            self._outbox.appendleft(handle)
+            return False
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            logger.error(f"[MQTT] ✗ Publish failed with code {result.rc}")
+            self._counters['failed'] += 1
+            handle.resolve(False)
             return False
+        
+        self._counters['published'] += 1
+        logger.info(f"[MQTT] ✓ Published to {handle.topic}")
+        if result.is_published():
+            self._delivered(handle)
+        else:
+            self._inflight[result.mid] = handle
+        return True
+
+    def _delivered(self, handle):
+        self._counters['acked'] += 1
+        self._latencies.append(time.monotonic() - handle.queued_at)
+        handle.resolve(True)
+
+    def _flush_outbox(self):
+        """Send queued messages in order while connected; stale ones resolve as failed"""
+        stale_before = time.monotonic() - MQTT_PUBLISH_QUEUE_TTL
+        with self._publish_lock:
+            flushed = 0
+            while self._outbox and self.is_connected:
+                handle = self._outbox.popleft()
+                if handle.queued_at < stale_before:
+                    self._counters['expired'] += 1
+                    handle.resolve(False)
+                    continue
+                if not self._send(handle):
+                    break
+                flushed += 1
+        return flushed
+
+    def publish_stats(self):
+        """Outbox depth, in-flight count, counters and publish-to-ack latency (ms) over recent messages"""
+        with self._publish_lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'connected': self.is_connected,
+                'outbox_depth': len(self._outbox),
+                'inflight': len(self._inflight),
+                **self._counters,
+            }
+        if latencies:
+            def pick(q):
+                return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1)
+            stats['latency_ms'] = {'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': pick(1.0)}
+        return stats
     
     def disconnect(self):
-        """Disconnect from broker"""
+        """Disconnect from broker; unsent publishes resolve as failed, received messages are still handled"""
         if self.client:
             self.client.loop_stop()
             self.client.disconnect()
             logger.info("[MQTT] Disconnected")
+        with self._publish_lock:
+            pending = list(self._outbox) + list(self._inflight.values())
+            self._outbox.clear()
+            self._inflight.clear()
+        for handle in pending:
+            handle.resolve(False)
+        self.workers.stop()
 
 
 # Global instance
-def get_mqtt_client():
-    """Get or create the global MQTT client"""
+def start_broker_client():
+    """Create the broker connection for this process (the MQTT ingest, see mqtt_ingest.py)"""
     global _mqtt_client
     
     if _mqtt_client is None:
         _mqtt_client = MQTTClientManager()
         _mqtt_client.connect_async()  # Non-blocking connection
 
-        _mqtt_client.subscribe(TOPIC_ENROLL_RESPONSE, qos=1)
-        _mqtt_client.subscribe(TOPIC_FINGERPRINT_RESULT, qos=1)
+        _mqtt_client.subscribe(device_topic_filter(TOPIC_ENROLL_RESPONSE), qos=1)
+        _mqtt_client.subscribe(device_topic_filter(TOPIC_FINGERPRINT_RESULT), qos=1)
+        _mqtt_client.subscribe(device_topic_filter(TOPIC_STATUS), qos=1)
     
     return _mqtt_client
+
+
+def stop_broker_client():
+    """Drop this process's broker connection (the ingest lease moved elsewhere)"""
+    global _mqtt_client
+    
+    if _mqtt_client is not None:
+        _mqtt_client.disconnect()
+        _mqtt_client = None
+
+
+def get_mqtt_client():
+    """
+    Get the publisher for this process: the broker client in the MQTT ingest process,
+    the shared outbox everywhere else
+    """
+    if _mqtt_client is not None:
+        return _mqtt_client
+    
+    from .mqtt_ingest import get_outbox_publisher
+    return get_outbox_publisher()
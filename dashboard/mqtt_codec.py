@@ -0,0 +1,173 @@
+"""
+Payload codec for ESP32 <-> server MQTT messages.
+Plain JSON is the default and always accepted. Sensors whose BiometricDevice has
+payload_codec='compact1' are told so on their retained biometric/<device_id>/config
+topic and then send fixed-layout binary frames instead: a detection is 13 bytes
+instead of ~90 bytes of JSON, and decoding it is a single struct.unpack.
+
+Frames are recognised by their first byte (MAGIC_V1; JSON starts with '{'), so one
+subscription serves both encodings and a sensor that ignores the config keeps working.
+All integers are big-endian.
+
+  detection (fingerprint)       C1 01 | id:int16 | confidence:uint16 | timestamp:uint32 |
+                                mode:uint8 | match_type:uint8 | reason_len:uint8 reason
+  enroll response               C1 02 | status:uint8 | step:uint8 | slot:uint16 (FFFF none) |
+                                flags:uint8 (bit0 success) | quality:uint8 (FF none) |
+                                template_len:uint8 template_id | message_len:uint8 message
+
+Either frame may end with an 8-byte message id trailer, boot:uint32 | seq:uint32,
+decoded to msg_id "<boot hex>-<seq>" like the JSON field (see dashboard.mqtt_dedup).
+"""
+
+import json
+import logging
+import struct
+
+logger = logging.getLogger(__name__)
+
+CODEC_JSON = 'json'
+CODEC_COMPACT_V1 = 'compact1'
+CODEC_CHOICES = [
+    (CODEC_JSON, 'JSON'),
+    (CODEC_COMPACT_V1, 'Compact binary v1'),
+]
+
+MAGIC_V1 = 0xC1
+TYPE_DETECTION = 0x01
+TYPE_ENROLL_RESPONSE = 0x02
+
+MODES = ['attendance', 'registration']
+MATCH_TYPES = [None, 'hardware', 'hint']
+ENROLL_STATUSES = [
+    'started', 'progress', 'ready_for_confirmation', 'capture_failed', 'waiting',
+    'success', 'error', 'cancelled', 'blocked', 'failed',
+]
+
+_DETECTION = struct.Struct('!BBhHIBB')
+_ENROLL = struct.Struct('!BBBBHBB')
+_MSG_ID = struct.Struct('!II')
+
+
+def _index(values, value):
+    try:
+        return values.index(value)
+    except ValueError:
+        return 0
+
+
+def _short_text(value):
+    data = str(value or '').encode()[:255]
+    return bytes([len(data)]) + data
+
+
+def _read_text(raw, offset):
+    length = raw[offset]
+    end = offset + 1 + length
+    if end > len(raw):
+        raise ValueError('truncated text field')
+    return raw[offset + 1:end].decode(errors='replace'), end
+
+
+def _msg_id_trailer(msg_id):
+    """boot:uint32 | seq:uint32 for a "<boot hex>-<seq>" msg_id; empty when absent or malformed"""
+    try:
+        boot, seq = str(msg_id).split('-', 1)
+        return _MSG_ID.pack(int(boot, 16) & 0xFFFFFFFF, int(seq) & 0xFFFFFFFF)
+    except ValueError:
+        return b''
+
+
+def encode_detection(fingerprint_id, confidence=0, timestamp=0, mode='attendance', match_type=None, reason=None, msg_id=None):
+    """Compact v1 detection frame (what compact firmware publishes on .../fingerprint)"""
+    return _DETECTION.pack(
+        MAGIC_V1, TYPE_DETECTION, int(fingerprint_id), max(0, min(int(confidence or 0), 0xFFFF)),
+        int(timestamp or 0) & 0xFFFFFFFF, _index(MODES, mode), _index(MATCH_TYPES, match_type),
+    ) + _short_text(reason) + (_msg_id_trailer(msg_id) if msg_id else b'')
+
+
+def encode_enroll_response(status, step=0, slot=None, success=True, quality=None, template_id=None, message=None, msg_id=None):
+    """Compact v1 enrollment response frame (.../enroll/response)"""
+    return _ENROLL.pack(
+        MAGIC_V1, TYPE_ENROLL_RESPONSE, _index(ENROLL_STATUSES, status), int(step or 0),
+        0xFFFF if slot is None else int(slot), 1 if success else 0, 0xFF if quality is None else int(quality),
+    ) + _short_text(template_id) + _short_text(message) + (_msg_id_trailer(msg_id) if msg_id else b'')
+
+
+def encode_payload(payload, codec=CODEC_JSON):
+    """
+    Encode a device message dict: JSON text, or a compact frame when `codec` is compact
+    and the dict is a detection (has fingerprint_id) or an enrollment response (has status).
+    """
+    if codec == CODEC_COMPACT_V1:
+        if 'fingerprint_id' in payload:
+            return encode_detection(
+                payload['fingerprint_id'], payload.get('confidence'), payload.get('timestamp'),
+                payload.get('mode', 'attendance'), payload.get('match_type'), payload.get('reason'),
+                payload.get('msg_id'),
+            )
+        if 'status' in payload:
+            return encode_enroll_response(
+                payload['status'], payload.get('step'), payload.get('slot'), payload.get('success', True),
+                payload.get('quality'), payload.get('template_id'), payload.get('message'),
+                payload.get('msg_id'),
+            )
+    return json.dumps(payload)
+
+
+def _read_msg_id(raw, offset):
+    if len(raw) - offset < _MSG_ID.size:
+        return None
+    boot, seq = _MSG_ID.unpack_from(raw, offset)
+    return f'{boot:x}-{seq}'
+
+
+def _decode_compact(raw):
+    frame_type = raw[1]
+    if frame_type == TYPE_DETECTION:
+        _, _, fingerprint_id, confidence, timestamp, mode, match_type = _DETECTION.unpack_from(raw)
+        reason, offset = _read_text(raw, _DETECTION.size)
+        return {
+            'fingerprint_id': fingerprint_id,
+            'confidence': confidence,
+            'timestamp': timestamp,
+            'mode': MODES[mode] if mode < len(MODES) else 'attendance',
+            'match_type': MATCH_TYPES[match_type] if match_type < len(MATCH_TYPES) else None,
+            'reason': reason or None,
+            'msg_id': _read_msg_id(raw, offset),
+        }
+    if frame_type == TYPE_ENROLL_RESPONSE:
+        _, _, status, step, slot, flags, quality = _ENROLL.unpack_from(raw)
+        template_id, offset = _read_text(raw, _ENROLL.size)
+        message, offset = _read_text(raw, offset)
+        return {
+            'status': ENROLL_STATUSES[status] if status < len(ENROLL_STATUSES) else 'error',
+            'step': step,
+            'slot': None if slot == 0xFFFF else slot,
+            'success': bool(flags & 0x01),
+            'quality': None if quality == 0xFF else quality,
+            'template_id': template_id or None,
+            'message': message,
+            'msg_id': _read_msg_id(raw, offset),
+        }
+    raise ValueError(f'unknown frame type {frame_type:#x}')
+
+
+def decode_payload(raw):
+    """
+    Decode a device message (compact frame or JSON).
+
+    Returns:
+        tuple(dict or None, str): The message (None when undecodable) and the codec it used
+    """
+    if isinstance(raw, str):
+        raw = raw.encode()
+    if raw[:1] == bytes([MAGIC_V1]):
+        try:
+            return _decode_compact(raw), CODEC_COMPACT_V1
+        except (ValueError, IndexError, struct.error) as e:
+            logger.warning(f"[MQTT-CODEC] Bad compact frame ({len(raw)} bytes): {e}")
+            return None, CODEC_COMPACT_V1
+    try:
+        return json.loads(raw.decode(errors='replace')), CODEC_JSON
+    except ValueError:
+        return None, CODEC_JSON
@@ -0,0 +1,84 @@
+"""
+Replay filter for device MQTT messages.
+The server subscribes with QoS 1 and clean_session=False, so after a reconnect the
+broker redelivers whatever it had queued, and a sensor that lost its connection
+mid-publish sends again. Handling such a message twice used to apply the same
+enrollment step twice, append duplicate detections and broadcast them twice.
+
+Firmware stamps every message with msg_id "<boot id>-<sequence>" (the boot id is
+random per power-up, so sequences restarting at 1 after a reboot are new messages).
+MQTTClientManager and mqtt_bridge check (device, msg_id) against a DedupWindow on the
+network thread and drop replays before any cache, database or channel-layer work.
+
+The window is an LRU of at most MQTT_DEDUP_SIZE ids, each remembered for
+MQTT_DEDUP_TTL seconds after it was last seen (a replay refreshes it). Messages
+without msg_id (older firmware) are passed through. An id is forgotten again when the
+worker pool drops its message on overflow, so the broker's redelivery is handled.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+MQTT_DEDUP_SIZE = getattr(settings, 'MQTT_DEDUP_SIZE', 10000)
+MQTT_DEDUP_TTL = getattr(settings, 'MQTT_DEDUP_TTL', 600)  # Seconds
+
+
+class DedupWindow:
+    """Bounded, time-windowed set of recently seen message ids, oldest-seen first"""
+
+    def __init__(self, size=MQTT_DEDUP_SIZE, ttl=MQTT_DEDUP_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._seen = OrderedDict()  # key -> monotonic time last seen
+        self._lock = threading.Lock()
+        self._counters = {'checked': 0, 'duplicates': 0, 'unidentified': 0, 'expired': 0, 'evicted': 0, 'forgotten': 0}
+
+    def is_duplicate(self, device_id, msg_id):
+        """
+        Record (device_id, msg_id) and tell whether it was already seen inside the window.
+        A message without msg_id is never a duplicate.
+        """
+        if msg_id in (None, ''):
+            with self._lock:
+                self._counters['unidentified'] += 1
+            return False
+        key = (device_id, str(msg_id))
+        now = time.monotonic()
+        with self._lock:
+            self._counters['checked'] += 1
+            self._expire(now)
+            if key in self._seen:
+                self._seen[key] = now
+                self._seen.move_to_end(key)
+                self._counters['duplicates'] += 1
+                return True
+            self._seen[key] = now
+            if len(self._seen) > self.size:
+                self._seen.popitem(last=False)
+                self._counters['evicted'] += 1
+            return False
+
+    def forget(self, device_id, msg_id):
+        """Drop (device_id, msg_id) from the window - the message was never handled, so a redelivery must go through"""
+        if msg_id in (None, ''):
+            return
+        with self._lock:
+            if self._seen.pop((device_id, str(msg_id)), None) is not None:
+                self._counters['forgotten'] += 1
+
+    def _expire(self, now):
+        # Entries are ordered by last seen, so expired ones are always at the front
+        cutoff = now - self.ttl
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if seen_at >= cutoff:
+                break
+            self._seen.popitem(last=False)
+            self._counters['expired'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._seen), 'capacity': self.size, 'ttl': self.ttl, **self._counters}
@@ -0,0 +1,433 @@
+"""
+Single MQTT ingest per deployment.
+Every web worker used to open its own broker connection from DashboardConfig.ready(),
+so with N gunicorn workers each detection and enrollment response was handled N
+times. Now exactly one process - the ingest - holds the broker connection: it
+subscribes, handles inbound messages and publishes. Every other process publishes
+through a shared outbox (MQTTOutboxMessage rows) that the ingest drains every
+MQTT_OUTBOX_POLL_INTERVAL seconds, recording on each row whether the broker
+acknowledged it so the publisher's handle reports delivery, not just the insert.
+
+The ingest role is a lease (ServiceLease 'mqtt-ingest') renewed every third of
+MQTT_INGEST_LEASE_SECONDS. MQTT_ROLE picks who competes for it:
+- 'auto': every web process runs a standby thread; the first one to take the lease
+  connects, the others take over within MQTT_INGEST_LEASE_SECONDS if it dies
+- 'web':  web processes never connect; run `python manage.py mqtt_ingest` as its own
+  process (several copies give hot standbys)
+A holder that cannot renew its lease disconnects before the lease runs out, so two
+processes never consume at the same time. Lease and outbox live in the database
+because the default cache may be process-local.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MQTT_ROLE = getattr(settings, 'MQTT_ROLE', 'auto')
+MQTT_INGEST_LEASE_SECONDS = getattr(settings, 'MQTT_INGEST_LEASE_SECONDS', 15)
+MQTT_OUTBOX_POLL_INTERVAL = getattr(settings, 'MQTT_OUTBOX_POLL_INTERVAL', 0.1)  # Seconds between outbox drains
+MQTT_OUTBOX_TTL = getattr(settings, 'MQTT_OUTBOX_TTL', 60)  # Undelivered commands older than this are marked failed
+MQTT_OUTBOX_RETENTION = getattr(settings, 'MQTT_OUTBOX_RETENTION', 2 * MQTT_OUTBOX_TTL)  # Rows are deleted this long after being queued
+MQTT_OUTBOX_BATCH = 100  # Rows published per drain
+OUTBOX_WATCH_INTERVAL = 0.5  # Seconds between delivery checks for waiting publish_async handles
+INGEST_STATUS_CACHE_SECONDS = 1.0  # How long publishers trust the last lease read
+
+LEASE_NAME = 'mqtt-ingest'
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ======================== LEASE ========================
+
+def acquire_lease(holder, details=None):
+    """Take or renew the ingest lease for `holder`; False while another live process holds it"""
+    from dashboard.models import ServiceLease
+
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=MQTT_INGEST_LEASE_SECONDS)
+    details = details or {}
+    if ServiceLease.objects.filter(name=LEASE_NAME).filter(Q(holder=holder) | Q(expires_at__lt=now)).update(
+        holder=holder, expires_at=expires_at, details=details,
+    ):
+        return True
+    try:
+        with transaction.atomic():
+            ServiceLease.objects.create(name=LEASE_NAME, holder=holder, expires_at=expires_at, details=details)
+        return True
+    except IntegrityError:
+        return False
+
+
+def release_lease(holder):
+    from dashboard.models import ServiceLease
+    ServiceLease.objects.filter(name=LEASE_NAME, holder=holder).update(expires_at=timezone.now())
+
+
+_status_lock = threading.Lock()
+_status = {'read_at': None, 'value': None}
+
+
+def ingest_status():
+    """
+    The live ingest as seen from any process (re-read at most every INGEST_STATUS_CACHE_SECONDS).
+
+    Returns:
+        dict or None: {'holder', 'connected', 'expires_at'}, None when no process holds the lease
+    """
+    now = time.monotonic()
+    with _status_lock:
+        if _status['read_at'] is not None and now - _status['read_at'] < INGEST_STATUS_CACHE_SECONDS:
+            return _status['value']
+
+    from dashboard.models import ServiceLease
+
+    lease = ServiceLease.objects.filter(name=LEASE_NAME, expires_at__gt=timezone.now()).first()
+    value = None
+    if lease:
+        value = {
+            'holder': lease.holder,
+            'connected': bool(lease.details.get('connected')),
+            'expires_at': lease.expires_at.isoformat(),
+        }
+    with _status_lock:
+        _status.update(read_at=now, value=value)
+    return value
+
+
+# ======================== OUTBOX ========================
+
+class _OutboxWatcher:
+    """
+    Resolves OutboxPublisher.publish_async handles from their rows: True once the ingest
+    set delivered_at, False once it set failed or the row was purged. One polling thread
+    per process, running only while handles are waiting.
+    """
+
+    def __init__(self):
+        self._handles = {}  # Outbox row id -> PublishHandle
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, row_id, handle):
+        with self._lock:
+            self._handles[row_id] = handle
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='mqtt-outbox-watch', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        from django.db import connection
+
+        try:
+            while True:
+                with self._lock:
+                    if not self._handles:
+                        self._thread = None
+                        return
+                    ids = list(self._handles)
+                try:
+                    close_old_connections()
+                    self._check(ids)
+                except Exception as e:
+                    logger.warning(f"[MQTT-INGEST] Could not read outbox delivery state: {e}")
+                time.sleep(OUTBOX_WATCH_INTERVAL)
+        finally:
+            connection.close()
+
+    def _check(self, ids):
+        from dashboard.models import MQTTOutboxMessage
+
+        rows = {
+            row_id: (delivered_at, failed)
+            for row_id, delivered_at, failed in MQTTOutboxMessage.objects.filter(id__in=ids)
+            .values_list('id', 'delivered_at', 'failed')
+        }
+        for row_id in ids:
+            delivered_at, failed = rows.get(row_id, (None, True))  # Purged rows count as failed
+            if delivered_at is None and not failed:
+                continue
+            with self._lock:
+                handle = self._handles.pop(row_id, None)
+            if handle:
+                handle.resolve(delivered_at is not None)
+
+
+_watcher = _OutboxWatcher()
+
+
+class OutboxPublisher:
+    """
+    Stand-in for MQTTClientManager in processes without a broker connection: publish()
+    queues the message for the ingest process instead of sending it.
+    """
+
+    @property
+    def is_connected(self):
+        try:
+            status = ingest_status()
+        except Exception as e:
+            logger.warning(f"[MQTT-INGEST] Could not read ingest status: {e}")
+            return False
+        return bool(status and status['connected'])
+
+    def _enqueue(self, topic, payload, qos, retain):
+        """The queued MQTTOutboxMessage, or None when no ingest is running"""
+        from dashboard.models import MQTTOutboxMessage
+
+        if not self.is_connected:
+            logger.error(f"[MQTT-INGEST] ✗ No connected ingest process, cannot publish to {topic}")
+            return None
+        if isinstance(payload, dict):
+            payload = json.dumps(payload)
+        row = MQTTOutboxMessage.objects.create(topic=topic, payload=payload or '', qos=qos, retain=retain)
+        logger.info(f"[MQTT-INGEST] Queued publish to {topic}")
+        return row
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        """
+        Queue a publish for the ingest process without waiting for it (like
+        MQTTClientManager.publish, True means queued); False when no ingest is running
+        """
+        return self._enqueue(topic, payload, qos, retain) is not None
+
+    def publish_async(self, topic, payload, qos=1, retain=False):
+        """
+        Same interface as MQTTClientManager.publish_async: queue the message and return a
+        handle that resolves True once the broker acknowledged it, and False if no ingest
+        is running or the ingest could not deliver it within MQTT_OUTBOX_TTL.
+        """
+        from .mqtt_client import PublishHandle
+
+        handle = PublishHandle(topic, payload, qos, retain)
+        row = self._enqueue(topic, payload, qos, retain)
+        if row is None:
+            handle.resolve(False)
+        else:
+            _watcher.watch(row.id, handle)
+        return handle
+
+    def subscribe(self, topic, qos=1):
+        # Subscriptions belong to the ingest process
+        return False
+
+
+_publisher = OutboxPublisher()
+
+
+def get_outbox_publisher():
+    return _publisher
+
+
+_awaiting = {}  # Outbox row id -> PublishHandle of a sent row awaiting the broker (ingest thread only)
+
+
+def _record_outcomes(now):
+    """Write delivered_at/failed for sent rows whose broker handle has resolved"""
+    from dashboard.models import MQTTOutboxMessage
+
+    done = [(row_id, handle.result()) for row_id, handle in _awaiting.items() if handle.done()]
+    for row_id, _ in done:
+        del _awaiting[row_id]
+    delivered = [row_id for row_id, ok in done if ok]
+    failed = [row_id for row_id, ok in done if not ok]
+    if delivered:
+        MQTTOutboxMessage.objects.filter(id__in=delivered).update(delivered_at=now)
+    if failed:
+        MQTTOutboxMessage.objects.filter(id__in=failed).update(failed=True)
+
+
+def forget_outbox_handles():
+    """Drop the broker handles of a closed connection; their rows expire as failed"""
+    _awaiting.clear()
+
+
+def drain_outbox(client):
+    """
+    Publish queued outbox rows through `client` in id order and record their delivery:
+    each row is sent once (sent_at), then gets delivered_at when the broker acknowledges
+    it or failed when the publish fails. Rows not delivered within MQTT_OUTBOX_TTL are
+    marked failed; rows older than MQTT_OUTBOX_RETENTION are deleted.
+
+    Returns:
+        int: Rows published
+    """
+    from dashboard.models import MQTTOutboxMessage
+
+    now = timezone.now()
+    _record_outcomes(now)
+    MQTTOutboxMessage.objects.filter(created_at__lt=now - timedelta(seconds=MQTT_OUTBOX_RETENTION)).delete()
+    expired = MQTTOutboxMessage.objects.filter(
+        delivered_at__isnull=True, failed=False, created_at__lt=now - timedelta(seconds=MQTT_OUTBOX_TTL),
+    )
+    for row_id in expired.values_list('id', flat=True):
+        _awaiting.pop(row_id, None)
+    expired_count = expired.update(failed=True)
+    if expired_count:
+        logger.warning(f"[MQTT-INGEST] {expired_count} outbox message(s) not delivered within {MQTT_OUTBOX_TTL}s")
+
+    published, failed = [], []
+    for row in MQTTOutboxMessage.objects.filter(sent_at__isnull=True, failed=False).order_by('id')[:MQTT_OUTBOX_BATCH]:
+        if not client.is_connected:
+            break
+        handle = client.publish_async(row.topic, row.payload, qos=row.qos, retain=row.retain)
+        if handle.done() and not handle.result():
+            failed.append(row.id)
+            continue
+        _awaiting[row.id] = handle
+        published.append(row.id)
+    if published:
+        MQTTOutboxMessage.objects.filter(id__in=published).update(sent_at=now)
+    if failed:
+        MQTTOutboxMessage.objects.filter(id__in=failed).update(sent_at=now, failed=True)
+    _record_outcomes(now)
+    return len(published)
+
+
+def outbox_depth():
+    """Rows still waiting to be sent"""
+    from dashboard.models import MQTTOutboxMessage
+    return MQTTOutboxMessage.objects.filter(sent_at__isnull=True, failed=False).count()
+
+
+# ======================== INGEST ========================
+
+class MQTTIngest:
+    """Competes for the ingest lease; while holding it, owns the broker connection and drains the outbox"""
+
+    def __init__(self, holder=PROCESS_ID):
+        self.holder = holder
+        self.client = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._reported_connected = False
+        self._valid_until = 0  # Monotonic time our lease is known to run until
+
+    @property
+    def is_leader(self):
+        return self.client is not None
+
+    def _take_over(self):
+        from .mqtt_client import start_broker_client
+        logger.info(f"[MQTT-INGEST] {self.holder} took the ingest lease, connecting to broker")
+        self.client = start_broker_client()
+        try:
+            # Queued until the connection is up
+            from .biometric_devices import publish_device_configs
+            publish_device_configs()
+        except Exception as e:
+            logger.warning(f"[MQTT-INGEST] Could not republish device configs: {e}")
+
+    def _step_down(self, reason):
+        from .mqtt_client import stop_broker_client
+        logger.warning(f"[MQTT-INGEST] {self.holder} stepping down: {reason}")
+        stop_broker_client()
+        forget_outbox_handles()
+        self.client = None
+
+    def _renew(self):
+        self._reported_connected = bool(self.client and self.client.is_connected)
+        details = {'connected': self._reported_connected, 'pid': os.getpid()}
+        try:
+            held = acquire_lease(self.holder, details)
+        except Exception as e:
+            logger.warning(f"[MQTT-INGEST] Lease renewal failed: {e}")
+            if self.is_leader and time.monotonic() > self._valid_until:
+                self._step_down('lease could not be renewed')
+            return self.is_leader
+        if held:
+            # Leave a margin so we disconnect before anyone else may take over
+            self._valid_until = time.monotonic() + MQTT_INGEST_LEASE_SECONDS * 2 / 3
+            if not self.is_leader:
+                self._take_over()
+        elif self.is_leader:
+            self._step_down('lease taken by another process')
+        return held
+
+    def _flush_telemetry(self):
+        # Buckets of sensors that went quiet are written here rather than on their next message
+        try:
+            from .device_telemetry import flush
+            flush()
+        except Exception as e:
+            logger.warning(f"[MQTT-INGEST] Telemetry flush failed: {e}")
+
+    def run_forever(self):
+        renew_every = MQTT_INGEST_LEASE_SECONDS / 3
+        while not self._stop.is_set():
+            close_old_connections()
+            leading = self._renew()
+            if leading:
+                self._flush_telemetry()
+            next_renewal = time.monotonic() + renew_every
+            while leading and not self._stop.is_set() and time.monotonic() < next_renewal:
+                try:
+                    drain_outbox(self.client)
+                except Exception as e:
+                    logger.error(f"[MQTT-INGEST] Outbox drain failed: {e}")
+                if bool(self.client and self.client.is_connected) != self._reported_connected:
+                    break  # Publish the new broker state now instead of at the next renewal
+                self._stop.wait(MQTT_OUTBOX_POLL_INTERVAL)
+            if not leading:
+                self._stop.wait(renew_every)
+        if self.is_leader:
+            self._step_down('shutting down')
+            release_lease(self.holder)
+
+    def start(self):
+        """Run in a daemon thread (once per instance)"""
+        with _ingest_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run_forever, name='mqtt-ingest', daemon=True)
+                self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+
+_ingest = None
+_ingest_lock = threading.Lock()
+
+
+def get_ingest():
+    """The process-wide MQTTIngest (one lease holder id per process)"""
+    global _ingest
+    with _ingest_lock:
+        if _ingest is None:
+            _ingest = MQTTIngest()
+    return _ingest
+
+
+def start_standby_ingest():
+    """Compete for the ingest lease from this web process (MQTT_ROLE='auto'); no-op for 'web'"""
+    if MQTT_ROLE != 'auto':
+        logger.info(f"[MQTT-INGEST] MQTT_ROLE={MQTT_ROLE}: publishing through the outbox only")
+        return None
+    ingest = get_ingest()
+    ingest.start()
+    return ingest
+
+
+def mqtt_ingest_stats():
+    """Role, lease holder, outbox depth and, in the ingest process, publish and handler stats (for the health check)"""
+    stats = {'role': MQTT_ROLE, 'process': PROCESS_ID, 'is_ingest': bool(_ingest and _ingest.is_leader)}
+    if _ingest and _ingest.client:
+        stats['publish'] = _ingest.client.publish_stats()
+        stats['handlers'] = _ingest.client.workers.stats()
+        stats['dedup'] = _ingest.client.dedup.stats()
+    try:
+        stats['ingest'] = ingest_status()
+        stats['outbox_depth'] = outbox_depth()
+    except Exception as e:
+        stats['error'] = str(e)
+    return stats
@@ -0,0 +1,243 @@
+"""
+Minimal MQTT 3.1.1 broker for benchmarks and offline development.
+Listens on localhost and implements just what the ESP32 firmware, MQTTClientManager
+and mqtt_bridge use: CONNECT, PUBLISH (QoS 0/1, retained messages), SUBSCRIBE with
+'+'/'#' filters, UNSUBSCRIBE, PINGREQ and DISCONNECT. QoS 2 is granted as QoS 1, and
+sessions are not persisted. Not meant to face a real network.
+
+    broker = LoopbackBroker().start()
+    ... connect clients to broker.host:broker.port ...
+    broker.stop()
+"""
+
+import logging
+import socket
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT filter matching with single-level '+' and multi-level '#' wildcards"""
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for index, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts) or (part != '+' and part != topic_parts[index]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _utf8(value):
+    data = value.encode()
+    return struct.pack('!H', len(data)) + data
+
+
+def _packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+class _Session:
+    """One client connection; reads on its own thread, writes under a lock"""
+
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.client_id = ''
+        self.subscriptions = {}  # filter -> granted qos
+        self._write_lock = threading.Lock()
+        self._next_packet_id = 0
+
+    def send(self, data):
+        with self._write_lock:
+            self.sock.sendall(data)
+
+    def deliver(self, topic, payload, qos, retain=False):
+        body = _utf8(topic)
+        if qos:
+            with self._write_lock:
+                self._next_packet_id = self._next_packet_id % 65535 + 1
+                packet_id = self._next_packet_id
+            body += struct.pack('!H', packet_id)
+        self.send(_packet(PUBLISH, (qos << 1) | int(retain), body + payload))
+
+    def _read_exact(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('client closed the connection')
+            data.extend(chunk)
+        return bytes(data)
+
+    def _read_packet(self):
+        header = self._read_exact(1)[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = self._read_exact(1)[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        return header >> 4, header & 0x0F, self._read_exact(length) if length else b''
+
+    def run(self):
+        try:
+            while not self.broker.stopping:
+                packet_type, flags, body = self._read_packet()
+                if packet_type == CONNECT:
+                    self._on_connect(body)
+                elif packet_type == PUBLISH:
+                    self._on_publish(flags, body)
+                elif packet_type == SUBSCRIBE:
+                    self._on_subscribe(body)
+                elif packet_type == UNSUBSCRIBE:
+                    self._on_unsubscribe(body)
+                elif packet_type == PINGREQ:
+                    self.send(_packet(PINGRESP, 0, b''))
+                elif packet_type == DISCONNECT:
+                    break
+                # PUBACK from subscribers needs no action: nothing is redelivered
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.broker.remove_session(self)
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def _on_connect(self, body):
+        name_length = struct.unpack('!H', body[:2])[0]
+        offset = 2 + name_length + 4  # Protocol name, level, connect flags, keepalive
+        id_length = struct.unpack('!H', body[offset:offset + 2])[0]
+        self.client_id = body[offset + 2:offset + 2 + id_length].decode(errors='replace')
+        self.send(_packet(CONNACK, 0, b'\x00\x00'))
+
+    def _on_publish(self, flags, body):
+        qos = (flags >> 1) & 0x03
+        topic_length = struct.unpack('!H', body[:2])[0]
+        topic = body[2:2 + topic_length].decode()
+        offset = 2 + topic_length
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            self.send(_packet(PUBACK, 0, packet_id))
+        self.broker.route(topic, body[offset:], qos, retain=bool(flags & 0x01))
+
+    def _on_subscribe(self, body):
+        packet_id, offset, granted = body[:2], 2, bytearray()
+        new_filters = []
+        while offset < len(body):
+            filter_length = struct.unpack('!H', body[offset:offset + 2])[0]
+            topic_filter = body[offset + 2:offset + 2 + filter_length].decode()
+            qos = min(body[offset + 2 + filter_length], 1)
+            offset += 3 + filter_length
+            self.subscriptions[topic_filter] = qos
+            new_filters.append(topic_filter)
+            granted.append(qos)
+        self.send(_packet(SUBACK, 0, packet_id + bytes(granted)))
+        for topic, payload in self.broker.retained_for(new_filters):
+            self.deliver(topic, payload, 0, retain=True)
+
+    def _on_unsubscribe(self, body):
+        offset = 2
+        while offset < len(body):
+            filter_length = struct.unpack('!H', body[offset:offset + 2])[0]
+            self.subscriptions.pop(body[offset + 2:offset + 2 + filter_length].decode(), None)
+            offset += 2 + filter_length
+        self.send(_packet(UNSUBACK, 0, body[:2]))
+
+
+class LoopbackBroker:
+    """Threaded localhost broker; port 0 picks a free port (read it back from .port)"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.stopping = False
+        self.routed = 0  # Messages delivered to subscribers
+        self.received = 0  # PUBLISH packets accepted from clients
+        self._sessions = []
+        self._retained = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        self._server = socket.create_server((self.host, self.port))
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept, name='mqtt-loopback', daemon=True).start()
+        logger.info(f"[MQTT-LOOPBACK] Listening on {self.host}:{self.port}")
+        return self
+
+    def _accept(self):
+        while not self.stopping:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(self, sock)
+            with self._lock:
+                self._sessions.append(session)
+            threading.Thread(target=session.run, name='mqtt-loopback-session', daemon=True).start()
+
+    def remove_session(self, session):
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+
+    def route(self, topic, payload, qos, retain=False):
+        with self._lock:
+            self.received += 1
+            if retain:
+                if payload:
+                    self._retained[topic] = payload
+                else:
+                    self._retained.pop(topic, None)
+            targets = []
+            for session in self._sessions:
+                granted = [q for f, q in session.subscriptions.items() if topic_matches(f, topic)]
+                if granted:
+                    targets.append((session, min(qos, max(granted))))
+        for session, delivery_qos in targets:
+            try:
+                session.deliver(topic, payload, delivery_qos)
+                with self._lock:
+                    self.routed += 1
+            except OSError:
+                self.remove_session(session)
+
+    def retained_for(self, topic_filters):
+        with self._lock:
+            return [
+                (topic, payload) for topic, payload in self._retained.items()
+                if any(topic_matches(f, topic) for f in topic_filters)
+            ]
+
+    def stop(self):
+        self.stopping = True
+        if self._server:
+            self._server.close()
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            try:
+                session.sock.close()
+            except OSError:
+                pass
@@ -0,0 +1,189 @@
+"""
+Worker pool for inbound MQTT messages.
+paho calls on_message on its network-loop thread; running the handlers there (enrollment
+state writes, detection log appends, channel-layer group_send) meant one slow database
+or channel layer call stalled keepalives and every message behind it.
+MQTTClientManager now only parses the payload on that thread and submits the handler here.
+
+Ordering: each message carries a key (template_id for enrollment responses, the sensor
+for detections) and every key always lands on the same worker lane, so messages with
+the same key are handled in arrival order while different keys run in parallel.
+
+Each lane holds at most MQTT_WORKER_QUEUE_SIZE messages. When a lane is full,
+MQTT_WORKER_OVERFLOW decides:
+- 'block':       the network thread waits up to MQTT_WORKER_BLOCK_SECONDS for room
+                 (backpressure to the broker), then drops the new message
+- 'drop_oldest': the oldest queued message of the lane is dropped
+- 'drop_newest': the new message is dropped
+A dropped message is passed to on_drop(key, handler, args), so the caller can forget it
+(MQTTClientManager removes its msg_id from the replay filter, letting a redelivery through).
+"""
+
+import logging
+import threading
+import time
+import zlib
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+MQTT_WORKER_THREADS = getattr(settings, 'MQTT_WORKER_THREADS', 4)
+MQTT_WORKER_QUEUE_SIZE = getattr(settings, 'MQTT_WORKER_QUEUE_SIZE', 500)  # Per lane
+MQTT_WORKER_OVERFLOW = getattr(settings, 'MQTT_WORKER_OVERFLOW', 'block')
+MQTT_WORKER_BLOCK_SECONDS = getattr(settings, 'MQTT_WORKER_BLOCK_SECONDS', 1.0)
+HANDLER_TIME_SAMPLES = 500
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+
+class _Lane:
+    """One worker thread and its bounded FIFO"""
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f'mqtt-worker-{self.index}', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.items and not self.pool.stopping:
+                    self.cond.wait()
+                if not self.items:
+                    return
+                key, handler, args = self.items.popleft()
+                self.cond.notify_all()  # Room for a blocked submitter
+            close_old_connections()
+            started = time.monotonic()
+            try:
+                handler(*args)
+            except Exception as e:
+                self.pool.count('errors')
+                logger.error(f"[MQTT-WORKER] Handler for key {key!r} failed: {e}", exc_info=True)
+            finally:
+                self.pool.record_handler_time(time.monotonic() - started)
+                close_old_connections()
+
+
+class MessageWorkerPool:
+    """Bounded, key-ordered worker pool (see module docstring)"""
+
+    def __init__(self, threads=MQTT_WORKER_THREADS, queue_size=MQTT_WORKER_QUEUE_SIZE, overflow=MQTT_WORKER_OVERFLOW, on_drop=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown MQTT_WORKER_OVERFLOW: {overflow}")
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.on_drop = on_drop
+        self.stopping = False
+        self._lanes = [_Lane(self, index) for index in range(max(1, threads))]
+        self._started = False
+        self._lock = threading.Lock()
+        self._counters = {'submitted': 0, 'handled': 0, 'dropped': 0, 'errors': 0}
+        self._handler_times = deque(maxlen=HANDLER_TIME_SAMPLES)
+        self._handler_total = 0.0
+        self._handler_max = 0.0
+        self._max_depth = 0
+
+    def _lane_for(self, key):
+        # crc32 rather than hash(): stable across processes, so lane assignment is reproducible in logs
+        return self._lanes[zlib.crc32(str(key).encode()) % len(self._lanes)]
+
+    def _ensure_started(self):
+        if not self._started:
+            with self._lock:
+                if not self._started:
+                    for lane in self._lanes:
+                        lane.start()
+                    self._started = True
+
+    def submit(self, key, handler, *args):
+        """
+        Queue handler(*args) behind earlier messages with the same key.
+
+        Returns:
+            bool: False when the message was dropped by the overflow policy
+        """
+        self._ensure_started()
+        lane = self._lane_for(key)
+        dropped = None
+        with lane.cond:
+            if len(lane.items) >= self.queue_size:
+                if self.overflow == 'block':
+                    lane.cond.wait_for(lambda: len(lane.items) < self.queue_size, timeout=MQTT_WORKER_BLOCK_SECONDS)
+                if len(lane.items) >= self.queue_size:
+                    self.count('dropped')
+                    if self.overflow != 'drop_oldest':
+                        logger.warning(f"[MQTT-WORKER] Lane {lane.index} full ({self.overflow}), dropped message for key {key!r}")
+                        self._dropped((key, handler, args))
+                        return False
+                    dropped = lane.items.popleft()
+                    logger.warning(f"[MQTT-WORKER] Lane {lane.index} full, dropped oldest message for key {dropped[0]!r}")
+            lane.items.append((key, handler, args))
+            depth = len(lane.items)
+            lane.cond.notify_all()
+        if dropped:
+            self._dropped(dropped)
+        self.count('submitted')
+        with self._lock:
+            self._max_depth = max(self._max_depth, depth)
+        return True
+
+    def _dropped(self, item):
+        if self.on_drop:
+            try:
+                self.on_drop(*item)
+            except Exception as e:
+                logger.error(f"[MQTT-WORKER] on_drop failed for key {item[0]!r}: {e}")
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def record_handler_time(self, seconds):
+        with self._lock:
+            self._counters['handled'] += 1
+            self._handler_times.append(seconds)
+            self._handler_total += seconds
+            self._handler_max = max(self._handler_max, seconds)
+
+    def stop(self):
+        """Let the workers finish what is queued, then exit"""
+        self.stopping = True
+        for lane in self._lanes:
+            with lane.cond:
+                lane.cond.notify_all()
+
+    def stats(self):
+        """Queue depth per lane, counters and handler time (ms)"""
+        depths = []
+        for lane in self._lanes:
+            with lane.cond:
+                depths.append(len(lane.items))
+        with self._lock:
+            times = sorted(self._handler_times)
+            stats = {
+                'threads': len(self._lanes),
+                'overflow': self.overflow,
+                'queue_size': self.queue_size,
+                'depth': sum(depths),
+                'lane_depths': depths,
+                'max_depth': self._max_depth,
+                **self._counters,
+            }
+            handled = self._counters['handled']
+            if handled:
+                stats['handler_ms'] = {
+                    'avg': round(self._handler_total / handled * 1000, 2),
+                    'p95': round(times[min(len(times) - 1, int(0.95 * len(times)))] * 1000, 2),
+                    'max': round(self._handler_max * 1000, 2),
+                }
+        return stats
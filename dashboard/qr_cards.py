@@ -0,0 +1,381 @@
+"""
+Printable student QR cards.
+Builds one card per enrolled student of a course (or every course of a program):
+the student's registered QR (QRCodeRegistration.qr_code, falling back to
+CustomUser.qr_code_id) rendered with render_qr_png, plus name / school ID / course.
+
+Cards are rendered in one lazily started, spawn-context process pool shared by every
+export in the process (QR_CARD_MAX_WORKERS processes), with a bounded number of cards
+in flight per export and at most QR_CARD_MAX_EXPORTS exports streaming at once -
+further requests get CardExportBusy (HTTP 503) instead of queueing behind them.
+Output is written incrementally:
+- ZIP: streamed chunk by chunk (PNGs stored, not recompressed) - nothing is buffered
+- PDF: A4 sheets composed and streamed page by page
+"""
+
+import logging
+import multiprocessing
+import re
+import threading
+import zipfile
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+QR_CARD_MAX_WORKERS = getattr(settings, 'QR_CARD_MAX_WORKERS', 2)
+QR_CARD_MAX_EXPORTS = getattr(settings, 'QR_CARD_MAX_EXPORTS', 2)  # Exports streaming at once per process
+QR_CARD_WINDOW_PER_WORKER = 4  # Cards queued or held per export, per worker
+QR_CARD_SIZE = (600, 780)  # px: 250-375 px QR plus three text lines
+QR_CARD_PAGE_SIZE = (1240, 1754)  # A4 at 150 dpi
+QR_CARD_PAGE_GRID = (2, 2)  # columns x rows per printed page
+
+QRCard = namedtuple('QRCard', ['student_id', 'school_id', 'full_name', 'course_label', 'qr_value'])
+
+
+class CardExportBusy(Exception):
+    """Raised when QR_CARD_MAX_EXPORTS exports are already streaming"""
+
+
+def collect_qr_cards(courses):
+    """
+    Cards for every actively enrolled student of `courses`, plus students who have no QR yet.
+
+    Args:
+        courses (QuerySet[Course]): Courses to include
+
+    Returns:
+        tuple(list[QRCard], list[str]): Cards in course/name order, and names of students without a QR
+    """
+    from dashboard.models import CourseEnrollment, QRCodeRegistration
+
+    registered = {
+        (course_id, student_id): qr_code
+        for course_id, student_id, qr_code in QRCodeRegistration.objects.filter(
+            course__in=courses, is_active=True
+        ).values_list('course_id', 'student_id', 'qr_code')
+    }
+
+    cards, missing = [], []
+    rows = CourseEnrollment.objects.filter(
+        course__in=courses, is_active=True, deleted_at__isnull=True
+    ).order_by('course__code', 'course__section', 'student__full_name').values_list(
+        'course_id', 'course__code', 'course__section', 'student_id', 'student__school_id',
+        'student__full_name', 'student__username', 'student__qr_code_id',
+    )
+    for course_id, code, section, student_id, school_id, full_name, username, qr_code_id in rows.iterator():
+        name = full_name or username
+        qr_value = registered.get((course_id, student_id)) or qr_code_id
+        if not qr_value:
+            missing.append(f'{name} ({school_id or username}) - {code} {section}')
+            continue
+        cards.append(QRCard(student_id, school_id or '', name, f'{code} - {section}', qr_value))
+    return cards, missing
+
+
+def render_qr_card(card):
+    """
+    Render one printable card as PNG bytes. Runs in the pool's worker processes.
+
+    Returns:
+        tuple(QRCard, bytes)
+    """
+    from PIL import Image, ImageDraw
+    from dashboard.qr_image_cache import render_qr_png
+
+    qr_img = Image.open(BytesIO(render_qr_png(card.qr_value, target_size=360))).convert('L')
+    width, height = QR_CARD_SIZE
+    canvas = Image.new('L', (width, height), color=255)
+    canvas.paste(qr_img, ((width - qr_img.width) // 2, 30))
+
+    draw = ImageDraw.Draw(canvas)
+    draw.rectangle([0, 0, width - 1, height - 1], outline=153, width=2)
+    text_top = 30 + qr_img.height + 30
+    for offset, (text, size) in enumerate([(card.full_name, 30), (card.school_id, 26), (card.course_label, 22)]):
+        try:
+            draw.text((width // 2, text_top + offset * 48), text[:40], fill=0, anchor='mt', font_size=size)
+        except TypeError:
+            # Pillow < 10.1 has no font_size argument
+            draw.text((width // 2, text_top + offset * 48), text[:40], fill=0, anchor='mt')
+
+    buffer = BytesIO()
+    canvas.save(buffer, format='PNG', compress_level=6)  # Grayscale, no optimize pass: ~4x faster to encode
+    return card, buffer.getvalue()
+
+
+class _ExportStream:
+    """Iterator over one export's chunks that gives its slot back exactly once, when exhausted or closed"""
+
+    def __init__(self, chunks, release):
+        self._chunks = chunks
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        # StreamingHttpResponse calls this even if the client left before the first chunk
+        release, self._release = self._release, None
+        if release is not None:
+            try:
+                self._chunks.close()
+            finally:
+                release()
+
+
+class CardRenderPool:
+    """Lazily started process pool shared by all card exports, with a cap on concurrent exports"""
+
+    def __init__(self, max_workers=QR_CARD_MAX_WORKERS, max_exports=QR_CARD_MAX_EXPORTS):
+        self.max_workers = max(1, int(max_workers))
+        self.max_exports = max(1, int(max_exports))
+        self._exports = threading.BoundedSemaphore(self.max_exports)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.started_exports = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a web worker that may hold MQTT/DB threads and sockets
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                logger.info(f"[QR-CARDS] Started render pool with {self.max_workers} worker(s)")
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def export(self, chunks):
+        """
+        Reserve an export slot for the `chunks` generator.
+
+        Returns:
+            Iterator over `chunks` that releases the slot when exhausted or closed
+
+        Raises:
+            CardExportBusy: QR_CARD_MAX_EXPORTS exports are already streaming
+        """
+        if not self._exports.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            chunks.close()
+            raise CardExportBusy(f'{self.max_exports} QR card exports are already running')
+        with self._lock:
+            self.started_exports += 1
+        return _ExportStream(chunks, self._exports.release)
+
+    def iter_rendered(self, cards):
+        """
+        Yield (card, png_bytes) in input order.
+        At most max_workers * QR_CARD_WINDOW_PER_WORKER cards of this export are queued or held at once;
+        cards still queued when the consumer stops are cancelled.
+        """
+        if not cards:
+            return
+        window = self.max_workers * QR_CARD_WINDOW_PER_WORKER
+        executor = self._get_executor()
+        pending = deque()
+        cards_iter = iter(cards)
+        try:
+            for card in cards_iter:
+                pending.append(executor.submit(render_qr_card, card))
+                if len(pending) >= window:
+                    break
+            while pending:
+                yield pending.popleft().result()
+                next_card = next(cards_iter, None)
+                if next_card is not None:
+                    pending.append(executor.submit(render_qr_card, next_card))
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_exports': self.max_exports,
+                'started_exports': self.started_exports,
+                'rejected': self.rejected,
+                'started': self._executor is not None,
+            }
+
+
+_card_pool = None
+_card_pool_lock = threading.Lock()
+
+
+def get_card_pool():
+    """Get the process-wide card render pool (created on first use)"""
+    global _card_pool
+    if _card_pool is None:
+        with _card_pool_lock:
+            if _card_pool is None:
+                _card_pool = CardRenderPool()
+    return _card_pool
+
+
+def iter_rendered_cards(cards):
+    """Yield (card, png_bytes) in input order, rendered in the shared pool"""
+    return get_card_pool().iter_rendered(cards)
+
+
+def _safe(text):
+    return re.sub(r'[^A-Za-z0-9]+', '_', text or '').strip('_')
+
+
+def card_filename(card):
+    """<school id>_<name>_<course code>_<section>.png - a student enrolled in several courses gets one file per course"""
+    return f"{card.school_id or card.student_id}_{_safe(card.full_name) or 'student'}_{_safe(card.course_label) or 'course'}.png"
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that hands back what was written so far"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_qr_cards_zip(cards, missing=None):
+    """Generator of ZIP bytes: one PNG per card, plus MISSING_QR.txt when some students had no QR"""
+    sink = _ChunkSink()
+    used_names = set()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for card, png in iter_rendered_cards(cards):
+            name = card_filename(card)
+            if name in used_names:
+                # Same code and section in different school years
+                stem, number = name[:-4], 2
+                while f'{stem}_{number}.png' in used_names:
+                    number += 1
+                name = f'{stem}_{number}.png'
+            used_names.add(name)
+            archive.writestr(name, png)
+            yield sink.drain()
+        if missing:
+            archive.writestr('MISSING_QR.txt', 'Students without a registered QR code:\n' + '\n'.join(missing) + '\n')
+    yield sink.drain()
+
+
+def _pdf_object(number, body, stream=None):
+    head = f'{number} 0 obj\n'.encode() + body
+    if stream is None:
+        return head + b'\nendobj\n'
+    return head + b'\nstream\n' + stream + b'\nendstream\nendobj\n'
+
+
+def _iter_card_pages(cards):
+    """Yield composed grayscale A4 pages (PIL images), QR_CARD_PAGE_GRID cards each"""
+    from PIL import Image
+
+    columns, rows = QR_CARD_PAGE_GRID
+    per_page = columns * rows
+    page_w, page_h = QR_CARD_PAGE_SIZE
+    cell_w, cell_h = page_w // columns, page_h // rows
+
+    page, slot = None, 0
+    for _, png in iter_rendered_cards(cards):
+        if page is None:
+            page = Image.new('L', QR_CARD_PAGE_SIZE, color=255)
+        card_img = Image.open(BytesIO(png)).convert('L')
+        col, row = slot % columns, slot // columns
+        page.paste(card_img, (col * cell_w + (cell_w - card_img.width) // 2, row * cell_h + (cell_h - card_img.height) // 2))
+        slot += 1
+        if slot == per_page:
+            yield page
+            page, slot = None, 0
+    if page is not None:
+        yield page
+
+
+def stream_qr_cards_pdf(cards):
+    """
+    Generator of PDF bytes, one A4 page at a time.
+    Minimal PDF 1.4 writer: each page is a single lossless (Flate, DeviceGray) image, so
+    only the page being composed is ever held in memory. Object 1 is the catalog and
+    object 2 the page tree; both are written last, when the page list is known.
+    """
+    import zlib
+
+    page_w_pt, page_h_pt = 595, 842  # A4 in points
+    offset = 0
+    xref = {}
+    page_refs = []
+    next_number = 3
+
+    def emit(number, body, stream=None):
+        nonlocal offset
+        xref[number] = offset
+        data = _pdf_object(number, body, stream)
+        offset += len(data)
+        return data
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    offset += len(header)
+    yield header
+
+    for page in _iter_card_pages(cards):
+        image_no, content_no, page_no = next_number, next_number + 1, next_number + 2
+        next_number += 3
+        pixels = zlib.compress(page.tobytes(), 6)
+        content = f'q {page_w_pt} 0 0 {page_h_pt} 0 0 cm /Im0 Do Q'.encode()
+        chunk = emit(image_no, (
+            f'<< /Type /XObject /Subtype /Image /Width {page.width} /Height {page.height} '
+            f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(pixels)} >>'
+        ).encode(), pixels)
+        chunk += emit(content_no, f'<< /Length {len(content)} >>'.encode(), content)
+        chunk += emit(page_no, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w_pt} {page_h_pt}] '
+            f'/Resources << /XObject << /Im0 {image_no} 0 R >> >> /Contents {content_no} 0 R >>'
+        ).encode())
+        page_refs.append(page_no)
+        yield chunk
+
+    kids = ' '.join(f'{number} 0 R' for number in page_refs)
+    tail = emit(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_refs)} >>'.encode())
+    tail += emit(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    xref_offset = offset
+    size = next_number
+    lines = [f'xref\n0 {size}\n', '0000000000 65535 f \n']
+    for number in range(1, size):
+        lines.append(f'{xref[number]:010d} 00000 n \n' if number in xref else '0000000000 65535 f \n')
+    lines.append(f'trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+    yield tail + ''.join(lines).encode()
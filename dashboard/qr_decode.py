@@ -0,0 +1,168 @@
+"""
+Server-side QR decoding for the instructor camera-assist fallback.
+Frames are downscaled and converted to grayscale before pyzbar runs, and the decode
+itself happens in a small process pool so web workers only wait on a future instead
+of burning CPU. The pool is bounded twice: QR_DECODE_MAX_WORKERS processes, and at
+most QR_DECODE_MAX_PENDING frames queued or running - beyond that callers get
+DecodePoolBusy immediately (HTTP 503) rather than piling up behind each other.
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+QR_DECODE_MAX_WORKERS = getattr(settings, 'QR_DECODE_MAX_WORKERS', 2)
+QR_DECODE_MAX_PENDING = getattr(settings, 'QR_DECODE_MAX_PENDING', 8)
+QR_DECODE_MAX_DIMENSION = getattr(settings, 'QR_DECODE_MAX_DIMENSION', 1024)  # Longest side after downscale
+QR_DECODE_MAX_FRAMES = getattr(settings, 'QR_DECODE_MAX_FRAMES', 4)  # Frames accepted per request
+QR_DECODE_MAX_FRAME_BYTES = getattr(settings, 'QR_DECODE_MAX_FRAME_BYTES', 4 * 1024 * 1024)
+QR_DECODE_TIMEOUT = getattr(settings, 'QR_DECODE_TIMEOUT', 10)  # Seconds to wait for one request's frames
+
+
+class DecodePoolBusy(Exception):
+    """Too many frames already queued for decoding"""
+
+
+def decode_frame(image_bytes, max_dimension=QR_DECODE_MAX_DIMENSION):
+    """
+    Decode QR codes from one encoded image (PNG/JPEG/WebP bytes).
+    Runs inside the pool's worker processes, so it only depends on PIL/pyzbar.
+
+    Returns:
+        list[str]: Decoded texts (empty if none found)
+    """
+    from io import BytesIO
+    from PIL import Image
+    from pyzbar.pyzbar import decode as pyzbar_decode
+
+    img = Image.open(BytesIO(image_bytes))
+    img.draft('L', (max_dimension, max_dimension))  # JPEG: decode at reduced scale directly
+    img = img.convert('L')
+    original = img
+    if max(img.size) > max_dimension:
+        img = img.copy()
+        img.thumbnail((max_dimension, max_dimension), Image.BILINEAR)
+
+    results = pyzbar_decode(img)
+    if not results and img is not original:
+        # Small/distant codes can vanish in the downscale; retry at the received size
+        results = pyzbar_decode(original)
+
+    decoded = []
+    for r in results:
+        try:
+            decoded.append(r.data.decode('utf-8'))
+        except Exception:
+            decoded.append(str(r.data))
+    return decoded
+
+
+class DecodePool:
+    """Lazily started process pool with a hard cap on queued + running frames"""
+
+    def __init__(self, max_workers=QR_DECODE_MAX_WORKERS, max_pending=QR_DECODE_MAX_PENDING):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.submitted = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a web worker that may hold MQTT/DB threads and sockets
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                logger.info(f"[QR-DECODE] Started decode pool with {self.max_workers} worker(s)")
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def decode_frames(self, frames, max_dimension=QR_DECODE_MAX_DIMENSION, timeout=QR_DECODE_TIMEOUT):
+        """
+        Decode a small batch of frames in the pool.
+
+        Returns:
+            list[list[str]]: Decoded texts per frame, in input order
+
+        Raises:
+            DecodePoolBusy: The pending-frame limit would be exceeded
+            concurrent.futures.TimeoutError: Frames did not finish within `timeout`
+        """
+        acquired = 0
+        for _ in frames:
+            if not self._slots.acquire(blocking=False):
+                for _ in range(acquired):
+                    self._slots.release()
+                with self._lock:
+                    self.rejected += 1
+                raise DecodePoolBusy(f'Decode queue is full ({self.max_pending} frames pending)')
+            acquired += 1
+
+        futures = []
+        try:
+            executor = self._get_executor()
+            for frame in frames:
+                future = executor.submit(decode_frame, frame, max_dimension)
+                future.add_done_callback(lambda _f: self._slots.release())
+                futures.append(future)
+        except BrokenProcessPool:
+            self._reset_executor()
+            for _ in range(acquired - len(futures)):
+                self._slots.release()
+            raise
+        except Exception:
+            for _ in range(acquired - len(futures)):
+                self._slots.release()
+            raise
+        with self._lock:
+            self.submitted += len(futures)
+
+        try:
+            return [future.result(timeout=timeout) for future in futures]
+        except FutureTimeoutError:
+            for future in futures:
+                future.cancel()
+            raise
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'started': self._executor is not None,
+            }
+
+
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+
+def get_decode_pool():
+    """Get the process-wide decode pool (created on first use)"""
+    global _decode_pool
+    if _decode_pool is None:
+        with _decode_pool_lock:
+            if _decode_pool is None:
+                _decode_pool = DecodePool()
+    return _decode_pool
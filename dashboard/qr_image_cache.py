@@ -0,0 +1,172 @@
+"""
+Rendered QR image cache.
+Keeps recently rendered session QR PNGs in a bounded, per-process LRU so repeated
+fetches from instructor tabs (my_classes.html re-checks every 60 s) cost a dictionary
+lookup instead of a qrcode/PIL encode. Entries carry a strong ETag so browsers can
+revalidate with If-None-Match and get a 304.
+
+Keys are (course_id, schedule_id, date_str, token_version); a new session code or a
+new signed-token rotation window is simply a new key, old ones age out of the LRU.
+"""
+
+import functools
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+QR_IMAGE_CACHE_MAX_ENTRIES = getattr(settings, 'QR_IMAGE_CACHE_MAX_ENTRIES', 512)
+
+# Smallest valid PNG, used when PIL itself is unavailable
+FALLBACK_PNG = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00\x00\tpHYs\x00\x00\x0b\x13\x00\x00\x0b\x13\x01\x00\x9a\x9c\x18\x00\x00\x00\nIDATx\x9cc\xf8\x00\x00\x00\x01\x00\x01\x00\x00\x00\x00IEND\xaeB`\x82'
+
+
+def make_etag(image_data):
+    """Strong ETag derived from the PNG bytes"""
+    return '"' + hashlib.sha256(image_data).hexdigest()[:32] + '"'
+
+
+def etag_matches(request, etag):
+    """True if the request's If-None-Match header covers `etag` (weak comparison, RFC 7232)"""
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    return any(tag[2:] == etag if tag.startswith('W/') else tag == etag for tag in candidates)
+
+
+class QRImageCache:
+    """Thread-safe bounded LRU of rendered PNG bytes and their ETags"""
+
+    def __init__(self, max_entries=QR_IMAGE_CACHE_MAX_ENTRIES):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (image_data, etag) for `key`, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, image_data):
+        """Store rendered bytes under `key` and return (image_data, etag)"""
+        entry = (image_data, make_etag(image_data))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_qr_image_cache = QRImageCache()
+
+
+def get_qr_image_cache():
+    """Get the process-wide QR image cache"""
+    return _qr_image_cache
+
+
+@functools.lru_cache(maxsize=16)
+def placeholder_png(text, fill='black', size=200):
+    """
+    Render (once per process) a plain placeholder PNG such as 'Unauthorized' or 'Error'.
+
+    Returns:
+        bytes: PNG image data
+    """
+    try:
+        from PIL import Image, ImageDraw
+        img = Image.new('RGB', (size, size), color='white')
+        draw = ImageDraw.Draw(img)
+        draw.text((size // 2, size // 2), text, fill=fill, anchor='mm')
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+    except Exception as e:
+        logger.error(f"Error creating QR placeholder image '{text}': {str(e)}")
+        return FALLBACK_PNG
+
+
+def render_qr_png(data, target_size=250):
+    """
+    Encode `data` as a QR PNG sized for on-screen scanning (~250-375 px).
+
+    Raises:
+        ImportError: qrcode[pil] is not installed
+        Exception: the image could not be rendered
+    """
+    import qrcode
+    from PIL import Image
+
+    qr = qrcode.QRCode(
+        version=None,  # Auto-determine version based on data
+        error_correction=qrcode.constants.ERROR_CORRECT_M,  # Medium error correction
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data.strip())
+    qr.make(fit=True)
+
+    try:
+        img = qr.make_image(fill_color="black", back_color="white")
+    except Exception as img_error:
+        logger.warning(f"Error creating QR code image with colors: {str(img_error)}, trying default")
+        img = qr.make_image()
+
+    # Keep at least target_size for visibility, at most 1.5x for payload size
+    current_size = img.size
+    if current_size[0] < target_size or current_size[1] < target_size:
+        scale_factor = max(target_size / current_size[0], target_size / current_size[1])
+        img = img.resize((int(current_size[0] * scale_factor), int(current_size[1] * scale_factor)), Image.LANCZOS)
+    elif current_size[0] > target_size * 1.5 or current_size[1] > target_size * 1.5:
+        scale_factor = min(target_size * 1.5 / current_size[0], target_size * 1.5 / current_size[1])
+        img = img.resize((int(current_size[0] * scale_factor), int(current_size[1] * scale_factor)), Image.LANCZOS)
+
+    # Some PIL modes don't save to PNG cleanly
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGB')
+
+    buffer = BytesIO()
+    try:
+        img.save(buffer, format='PNG', optimize=True, compress_level=6)
+    except Exception as save_error:
+        logger.error(f"Error saving QR code image: {str(save_error)}, retrying without optimization")
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+
+    image_data = buffer.getvalue()
+    if len(image_data) < 100:  # PNG files should be at least 100 bytes
+        raise Exception(f"Generated image data is too small: {len(image_data)} bytes")
+    return image_data
@@ -0,0 +1,85 @@
+"""
+Registered student QR lookups.
+QRCodeRegistration.qr_code stores whatever the scanner produced (a bare 32-hex id,
+the same id in upper case, or a full URL carrying ?qr_code=...). The canonical
+form is kept in QRCodeRegistration.qr_key so scans resolve with one indexed
+equality lookup on (qr_key, course, is_active) instead of iexact/icontains scans.
+"""
+
+import logging
+import re
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+logger = logging.getLogger(__name__)
+
+QR_ID_PATTERN = re.compile(r'([a-f0-9]{32})', flags=re.IGNORECASE)
+
+
+def normalize_qr_key(raw_value):
+    """
+    Canonical lookup key for a scanned/registered QR value.
+    - Extract the 32-hex id from URL query (?qr_code= / ?qr=) or surrounding text
+    - Lowercase to avoid case-sensitivity issues
+    """
+    raw = (raw_value or '').strip()
+    if not raw:
+        return ''
+
+    candidate = None
+    try:
+        if raw.startswith('http://') or raw.startswith('https://'):
+            from urllib.parse import urlparse, parse_qs
+            parsed = urlparse(raw)
+            q = parse_qs(parsed.query or '')
+            candidate = (q.get('qr_code') or q.get('qr') or [None])[0]
+            if not candidate:
+                m = QR_ID_PATTERN.search(raw)
+                candidate = m.group(1) if m else None
+        else:
+            m = QR_ID_PATTERN.search(raw)
+            candidate = m.group(1) if m else None
+    except Exception:
+        candidate = None
+
+    return (candidate or raw).strip().lower()
+
+
+def sibling_courses(course, instructor=None):
+    """Active sections of the same subject taught by the same instructor (includes `course`)"""
+    from dashboard.models import Course
+
+    return Course.objects.filter(
+        instructor=instructor or course.instructor,
+        code=course.code,
+        name=course.name,
+        semester=course.semester,
+        school_year=course.school_year,
+        is_active=True,
+        deleted_at__isnull=True,
+        is_archived=False
+    )
+
+
+def resolve_registered_qr(qr_value, course, instructor=None):
+    """
+    Find the active registration for a scanned QR in `course` or one of its sibling sections.
+    One query: the sibling set is a subquery, and a registration on `course` itself wins.
+
+    Returns:
+        QRCodeRegistration or None
+    """
+    from dashboard.models import QRCodeRegistration
+
+    qr_key = normalize_qr_key(qr_value)
+    if not qr_key:
+        return None
+
+    return QRCodeRegistration.objects.filter(
+        Q(course=course) | Q(course__in=sibling_courses(course, instructor).values('id')),
+        qr_key=qr_key,
+        is_active=True
+    ).select_related('student', 'course').order_by(
+        Case(When(course=course, then=Value(0)), default=Value(1), output_field=IntegerField()),
+        '-created_at'
+    ).first()
@@ -0,0 +1,345 @@
+"""
+Session QR code resolver.
+Maps a scanned session QR code straight to (course, schedule, date) for the
+student attendance scanner, instead of walking every active course.
+
+Two sources of truth are consulted, both in constant time:
+- Stored codes: CourseSchedule.qr_code / Course.qr_code (unique, indexed columns)
+- Derived codes: sha256(f"{id}_{code}_{section}_{day}_{YYYYMMDD}")[:16] for today's
+  schedules, precomputed once per day into the shared cache (one key per token)
+
+The derived index is tagged with a shared version (see fingerprint_index.read_version)
+that post_save/post_delete signals on Course and CourseSchedule bump when a course's
+code, section, day or visibility changes, so every process rebuilds it on its next
+lookup instead of serving stale codes until the hourly expiry.
+
+Signed rotating tokens (SESSION_QR_SIGNED_TOKENS) carry their own course/schedule id,
+date and rotation window, and are verified with an HMAC before any DB read:
+    QS1-<course_id>-<schedule_id>-<YYYYMMDD>-<window>-<SIGNATURE>   (ids/window in base36)
+The legacy 16-hex codes above keep validating while instructors migrate.
+"""
+
+import hashlib
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+logger = logging.getLogger(__name__)
+
+try:
+    from zoneinfo import ZoneInfo
+    PH_TZ = ZoneInfo('Asia/Manila')
+except Exception:
+    PH_TZ = None
+
+WEEKDAY_SHORT = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Derived-token index lives in the shared cache, one small key per token
+SESSION_QR_INDEX_TIMEOUT = 3600  # Rebuilt hourly so renamed courses/sections are picked up
+SESSION_QR_INDEX_BUILT_KEY = "session_qr_index_built_{date}_{version}"
+SESSION_QR_TOKEN_KEY = "session_qr_token_{date}_{version}_{token}"
+SESSION_QR_VERSION_KEY = "session_qr_index_version"
+
+# Signed rotating tokens
+SIGNED_TOKEN_PREFIX = "QS1"
+SIGNED_TOKEN_SALT = "dashboard.session_qr.signed_token"
+SIGNED_TOKEN_SIGNATURE_LENGTH = 20  # 80-bit truncated HMAC-SHA256, uppercase hex
+
+SessionQRMatch = namedtuple('SessionQRMatch', ['course', 'schedule', 'date'])
+SignedSessionToken = namedtuple('SignedSessionToken', ['course_id', 'schedule_id', 'date', 'window'])
+
+
+def now_ph():
+    """Current time in Philippines timezone (naive local time if zoneinfo is unavailable)"""
+    return datetime.now(PH_TZ) if PH_TZ else datetime.now()
+
+
+def derive_session_qr_code(course_id, course_code, course_section, day, on_date):
+    """Derived 16-hex session code, same formula used by instructor_qr_code_view / my_classes"""
+    qr_data = f"{course_id}_{course_code}_{course_section or ''}_{day}_{on_date.strftime('%Y%m%d')}"
+    return hashlib.sha256(qr_data.encode()).hexdigest()[:16].upper()
+
+
+def signed_tokens_enabled():
+    """Whether instructor QR codes should carry signed rotating tokens"""
+    return bool(getattr(settings, 'SESSION_QR_SIGNED_TOKENS', False))
+
+
+def rotation_seconds():
+    """Length of one signed-token rotation window in seconds"""
+    return max(1, int(getattr(settings, 'SESSION_QR_ROTATION_SECONDS', 30)))
+
+
+def current_rotation_window(current_time=None):
+    """Index of the rotation window containing `current_time`"""
+    current_time = current_time or now_ph()
+    return int(current_time.timestamp()) // rotation_seconds()
+
+
+def _to_base36(value):
+    digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    value = int(value)
+    if value == 0:
+        return '0'
+    out = ''
+    while value:
+        value, rem = divmod(value, 36)
+        out = digits[rem] + out
+    return out
+
+
+def _sign(body):
+    return salted_hmac(SIGNED_TOKEN_SALT, body, algorithm='sha256').hexdigest()[:SIGNED_TOKEN_SIGNATURE_LENGTH].upper()
+
+
+def make_signed_session_token(course_id, schedule_id=None, current_time=None):
+    """
+    Build a signed session token for the current rotation window.
+
+    Args:
+        course_id (int): Course the session belongs to
+        schedule_id (int): Day schedule id, or None for course-level sessions
+        current_time (datetime): Override for "now" (defaults to PH time)
+
+    Returns:
+        str: Token such as QS1-2F-7A-20250114-1C9X3K-0A1B2C3D4E5F60718293
+    """
+    current_time = current_time or now_ph()
+    body = '-'.join([
+        SIGNED_TOKEN_PREFIX,
+        _to_base36(course_id),
+        _to_base36(schedule_id or 0),
+        current_time.strftime('%Y%m%d'),
+        _to_base36(current_rotation_window(current_time)),
+    ])
+    return f"{body}-{_sign(body)}"
+
+
+def is_signed_session_token(value):
+    return (value or '').strip().upper().startswith(SIGNED_TOKEN_PREFIX + '-')
+
+
+def verify_signed_session_token(value, current_time=None):
+    """
+    Verify a signed session token without touching the database.
+
+    A token is accepted only on its own date, and only for its rotation window
+    plus SESSION_QR_ROTATION_GRACE_WINDOWS older windows (clock skew / display lag).
+
+    Returns:
+        SignedSessionToken or None
+    """
+    token = (value or '').strip().upper()
+    parts = token.split('-')
+    if len(parts) != 6 or parts[0] != SIGNED_TOKEN_PREFIX:
+        return None
+
+    body, signature = '-'.join(parts[:5]), parts[5]
+    if not constant_time_compare(_sign(body), signature):
+        logger.warning(f"[SESSION-QR] Rejected signed token with bad signature: {body}")
+        return None
+
+    try:
+        course_id = int(parts[1], 36)
+        schedule_id = int(parts[2], 36) or None
+        token_date = datetime.strptime(parts[3], '%Y%m%d').date()
+        window = int(parts[4], 36)
+    except ValueError:
+        return None
+
+    current_time = current_time or now_ph()
+    grace = int(getattr(settings, 'SESSION_QR_ROTATION_GRACE_WINDOWS', 1))
+    age = current_rotation_window(current_time) - window
+    if token_date != current_time.date() or age < -1 or age > grace:
+        logger.info(f"[SESSION-QR] Rejected expired signed token: {body} (age={age} windows)")
+        return None
+
+    return SignedSessionToken(course_id, schedule_id, token_date, window)
+
+
+def _active_course_filter(prefix=''):
+    """Filter kwargs matching the courses a student is allowed to scan into"""
+    return {
+        f'{prefix}instructor__is_teacher': True,
+        f'{prefix}is_active': True,
+        f'{prefix}deleted_at__isnull': True,
+        f'{prefix}is_archived': False,
+    }
+
+
+def _index_version():
+    from .fingerprint_index import read_version
+    return read_version(SESSION_QR_VERSION_KEY)
+
+
+def build_session_qr_index(on_date, version=None):
+    """
+    Precompute derived session codes for every schedule running on `on_date`.
+    One query over today's schedules; each token is stored under its own cache key.
+
+    Returns:
+        int: Number of tokens indexed
+    """
+    from dashboard.models import CourseSchedule
+
+    date_str = on_date.strftime('%Y%m%d')
+    version = _index_version() if version is None else version
+    day_short = WEEKDAY_SHORT[on_date.weekday()]
+
+    rows = CourseSchedule.objects.filter(
+        day=day_short,
+        **_active_course_filter('course__')
+    ).values_list('id', 'day', 'course_id', 'course__code', 'course__section')
+
+    entries = {}
+    for schedule_id, day, course_id, course_code, course_section in rows.iterator():
+        token = derive_session_qr_code(course_id, course_code, course_section, day, on_date)
+        entries[SESSION_QR_TOKEN_KEY.format(date=date_str, version=version, token=token)] = (course_id, schedule_id)
+
+    if entries:
+        cache.set_many(entries, SESSION_QR_INDEX_TIMEOUT)
+    cache.set(SESSION_QR_INDEX_BUILT_KEY.format(date=date_str, version=version), len(entries), SESSION_QR_INDEX_TIMEOUT)
+    logger.info(f"[SESSION-QR] Indexed {len(entries)} derived session codes for {date_str}")
+    return len(entries)
+
+
+def invalidate_session_qr_index():
+    """Make every process rebuild the derived-token index on its next lookup"""
+    from .fingerprint_index import bump_version
+    try:
+        bump_version(SESSION_QR_VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"[SESSION-QR] Could not invalidate the derived code index: {e}")
+
+
+def _lookup_derived(token, on_date):
+    date_str = on_date.strftime('%Y%m%d')
+    version = _index_version()
+    if cache.get(SESSION_QR_INDEX_BUILT_KEY.format(date=date_str, version=version)) is None:
+        build_session_qr_index(on_date, version)
+    return cache.get(SESSION_QR_TOKEN_KEY.format(date=date_str, version=version, token=token))
+
+
+def resolve_session_qr(scanned_code, current_time=None):
+    """
+    Resolve a scanned session QR code to the course/schedule it opens today.
+
+    Args:
+        scanned_code (str): Code read from the instructor's QR (case-insensitive)
+        current_time (datetime): Override for "now" (defaults to PH time)
+
+    Returns:
+        SessionQRMatch or None: (course, schedule or None, date) when the code is valid today
+    """
+    from dashboard.models import Course, CourseSchedule
+
+    token = (scanned_code or '').strip().upper()
+    if not token:
+        return None
+
+    current_time = current_time or now_ph()
+
+    # Signed rotating token: signature/date/window checked before any DB read
+    if is_signed_session_token(token):
+        signed = verify_signed_session_token(token, current_time)
+        if not signed:
+            return None
+        if signed.schedule_id:
+            schedule = CourseSchedule.objects.select_related('course', 'course__instructor').filter(
+                id=signed.schedule_id,
+                course_id=signed.course_id,
+                **_active_course_filter('course__')
+            ).first()
+            return SessionQRMatch(schedule.course, schedule, signed.date) if schedule else None
+        course = Course.objects.select_related('instructor').filter(
+            id=signed.course_id,
+            **_active_course_filter()
+        ).first()
+        return SessionQRMatch(course, None, signed.date) if course else None
+
+    today_date = current_time.date()
+    today_weekday = today_date.weekday()
+    today_day_short = WEEKDAY_SHORT[today_weekday]
+
+    # 1) Stored day-schedule code (unique index on CourseSchedule.qr_code)
+    schedule = CourseSchedule.objects.select_related('course', 'course__instructor').filter(
+        qr_code=token,
+        day=today_day_short,
+        **_active_course_filter('course__')
+    ).first()
+    if schedule:
+        return SessionQRMatch(schedule.course, schedule, today_date)
+
+    # 2) Derived code for one of today's schedules (precomputed cache index)
+    derived = _lookup_derived(token, today_date)
+    if derived:
+        course_id, schedule_id = derived
+        schedule = CourseSchedule.objects.select_related('course', 'course__instructor').filter(
+            id=schedule_id,
+            course_id=course_id,
+            **_active_course_filter('course__')
+        ).first()
+        if schedule:
+            return SessionQRMatch(schedule.course, schedule, today_date)
+
+    # 3) Course-level code for synchronized courses without a schedule today
+    course = Course.objects.select_related('instructor').filter(
+        qr_code=token,
+        **_active_course_filter()
+    ).first()
+    if course and course.days:
+        days_list = [d.strip() for d in course.days.split(',') if d.strip()]
+        if WEEKDAY_NAMES[today_weekday] in days_list or today_day_short in days_list:
+            if not course.course_schedules.filter(day=today_day_short).exists():
+                return SessionQRMatch(course, None, today_date)
+
+    return None
+
+
+# ======================== SIGNALS ========================
+
+COURSE_INDEX_FIELDS = ('code', 'section', 'instructor_id', 'is_active', 'deleted_at', 'is_archived')
+SCHEDULE_INDEX_FIELDS = ('day', 'course_id')
+
+
+def _index_fields_changing(sender, instance, fields):
+    # Courses and schedules are saved on every attendance open/close; only index inputs matter
+    if instance.pk is None:
+        return True
+    previous = sender.objects.filter(pk=instance.pk).only(*fields).first()
+    return previous is None or any(getattr(previous, field) != getattr(instance, field) for field in fields)
+
+
+def _course_saving(sender, instance, **kwargs):
+    instance._session_qr_index_stale = _index_fields_changing(sender, instance, COURSE_INDEX_FIELDS)
+
+
+def _schedule_saving(sender, instance, **kwargs):
+    instance._session_qr_index_stale = _index_fields_changing(sender, instance, SCHEDULE_INDEX_FIELDS)
+
+
+def _saved(sender, instance, **kwargs):
+    if getattr(instance, '_session_qr_index_stale', True):
+        invalidate_session_qr_index()
+    instance._session_qr_index_stale = False
+
+
+def _deleted(sender, instance, **kwargs):
+    invalidate_session_qr_index()
+
+
+def connect_signals():
+    """Invalidate the derived-token index when its inputs change (called from DashboardConfig.ready)"""
+    from django.db.models.signals import post_delete, post_save, pre_save
+    from dashboard.models import Course, CourseSchedule
+
+    pre_save.connect(_course_saving, sender=Course, dispatch_uid='session_qr_course_pre_save')
+    pre_save.connect(_schedule_saving, sender=CourseSchedule, dispatch_uid='session_qr_schedule_pre_save')
+    for model in (Course, CourseSchedule):
+        post_save.connect(_saved, sender=model, dispatch_uid=f'session_qr_{model.__name__}_save')
+        post_delete.connect(_deleted, sender=model, dispatch_uid=f'session_qr_{model.__name__}_delete')
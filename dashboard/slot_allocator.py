@@ -0,0 +1,358 @@
+"""
+Fingerprint slot allocator.
+Enrollment APIs used to pick the next slot as max(fingerprint_id) + 1, so slots of
+dropped students were never reused, the sensor's capacity was never checked and two
+requests racing on the same max collided.
+
+Each sensor's template table is now a bitmap in SensorSlotMap (bit n = slot n in use).
+A detection's fingerprint_id resolves to a student whichever sensor reported it, so slot
+numbers stay unique across sensors: a new slot is the lowest bit free in the union of
+all sensors' maps, in BIOMETRIC_SLOT_MIN..capacity. Allocation and release are a few
+integer bit operations on one locked row (one row per sensor is read for the union).
+
+Enrollments that do not go through the enrollment queue (the direct enrollment APIs)
+allocate with a reference (e.g. student_<id>): the slot is recorded as a SlotReservation
+for BIOMETRIC_SLOT_RESERVATION_SECONDS, so it counts as in use until its registration
+exists, a retry with the same reference gets the same slot back, and release_reservation()
+frees it when the enrollment could not start.
+
+Slots are freed when an enrollment fails or is cancelled before its registration exists
+(release_if_unregistered), and by collect_garbage() when every BiometricRegistration holding the
+slot has been deactivated or its reservation expired unused; freed slots are also deleted
+from the sensor. The
+reconcile_fingerprint_slots command compares a sensor's actual template table with the
+map (reconcile_sensor).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .biometric_devices import BIOMETRIC_DEFAULT_DEVICE_ID, device_topic
+
+logger = logging.getLogger(__name__)
+
+BIOMETRIC_SLOT_MIN = getattr(settings, 'BIOMETRIC_SLOT_MIN', 100)  # Lower ids belong to legacy registrations
+BIOMETRIC_SLOT_CAPACITY = getattr(settings, 'BIOMETRIC_SLOT_CAPACITY', 300)  # R307 template capacity
+BIOMETRIC_SLOT_RESERVATION_SECONDS = getattr(settings, 'BIOMETRIC_SLOT_RESERVATION_SECONDS', 10 * 60)
+
+
+class SlotsExhausted(Exception):
+    """No free fingerprint slot left on the sensor"""
+
+
+def bits_of(bitmap):
+    """Bitmap bytes (SensorSlotMap.bitmap or a sensor report) as an int, bit n = slot n"""
+    return int.from_bytes(bytes(bitmap or b''), 'little')
+
+
+def bitmap_of(bits, capacity):
+    """Bytes for slots 0..capacity (longer if a legacy slot lies beyond capacity)"""
+    return bits.to_bytes(max(capacity, bits.bit_length()) // 8 + 1, 'little')
+
+
+def _window(capacity):
+    """Bits of the allocatable slots BIOMETRIC_SLOT_MIN..capacity"""
+    return ((1 << (capacity + 1)) - 1) & ~((1 << BIOMETRIC_SLOT_MIN) - 1)
+
+
+def slots_of(bits):
+    """Slot numbers of the set bits, ascending"""
+    slots = []
+    while bits:
+        low = bits & -bits
+        slots.append(low.bit_length() - 1)
+        bits ^= low
+    return slots
+
+
+def _mask(slots):
+    bits = 0
+    for slot in slots:
+        if slot is not None and slot >= 0:
+            bits |= 1 << slot
+    return bits
+
+
+def _reserved_bits():
+    """Slots of unexpired reservations"""
+    from dashboard.models import SlotReservation
+
+    return _mask(SlotReservation.objects.filter(expires_at__gt=timezone.now()).values_list('slot', flat=True))
+
+
+def _in_use_bits(reserved=True):
+    """Slots held by an active registration or a running enrollment (and, unless reserved=False, a reservation)"""
+    from dashboard.models import BiometricRegistration, EnrollmentQueueEntry
+
+    registered = BiometricRegistration.objects.filter(
+        is_active=True, fingerprint_id__isnull=False,
+    ).values_list('fingerprint_id', flat=True).distinct()
+    enrolling = EnrollmentQueueEntry.objects.filter(status='active', slot__isnull=False).values_list('slot', flat=True)
+    bits = _mask(registered) | _mask(enrolling)
+    return bits | _reserved_bits() if reserved else bits
+
+
+def _ensure_map(device_id):
+    """
+    The sensor's map, created on first use. Registrations made before the allocator do
+    not record their sensor; they were all enrolled on the default sensor, so its map
+    starts from every slot in use.
+    """
+    from dashboard.models import SensorSlotMap
+
+    slot_map = SensorSlotMap.objects.filter(pk=device_id).first()
+    if slot_map is None:
+        bits = _in_use_bits() if device_id == BIOMETRIC_DEFAULT_DEVICE_ID else 0
+        slot_map, _ = SensorSlotMap.objects.get_or_create(
+            pk=device_id,
+            defaults={'capacity': BIOMETRIC_SLOT_CAPACITY, 'bitmap': bitmap_of(bits, BIOMETRIC_SLOT_CAPACITY)},
+        )
+    return slot_map
+
+
+def _locked_maps(device_id):
+    """All maps, locked in device_id order (same order everywhere, so no deadlocks); must run in a transaction"""
+    from dashboard.models import SensorSlotMap
+
+    _ensure_map(device_id)
+    return {m.device_id: m for m in SensorSlotMap.objects.select_for_update().order_by('device_id')}
+
+
+def _save_bits(slot_map, bits, **fields):
+    from dashboard.models import SensorSlotMap
+
+    SensorSlotMap.objects.filter(pk=slot_map.pk).update(
+        bitmap=bitmap_of(bits, slot_map.capacity), updated_at=timezone.now(), **fields,
+    )
+
+
+def _allocate(device_id):
+    from dashboard.models import BiometricRegistration
+
+    with transaction.atomic():
+        maps = _locked_maps(device_id)
+        own = maps[device_id]
+        taken = 0
+        for slot_map in maps.values():
+            taken |= bits_of(slot_map.bitmap)
+        free = _window(own.capacity) & ~taken
+        if not free:
+            return None
+        slot = (free & -free).bit_length() - 1
+        _save_bits(own, bits_of(own.bitmap) | (1 << slot))
+        # Deactivated registrations no longer own the slot; otherwise collect_garbage()
+        # would take it back from the student it was just given to
+        BiometricRegistration.objects.filter(fingerprint_id=slot, is_active=False).update(fingerprint_id=None)
+    return slot
+
+
+def allocate_slot(device_id=None, reference=None):
+    """
+    Reserve the lowest free slot on `device_id` (default sensor if None). When the sensor
+    is full, slots of deactivated registrations and expired reservations are collected
+    once before giving up.
+
+    With a `reference` the slot is recorded as a SlotReservation; while it is live, the
+    same reference gets the same slot back (the student retried).
+
+    Returns:
+        int: The slot
+
+    Raises:
+        SlotsExhausted: Every slot of the sensor is in use
+    """
+    from dashboard.models import SlotReservation
+
+    device_id = device_id or BIOMETRIC_DEFAULT_DEVICE_ID
+    expires_at = timezone.now() + timedelta(seconds=BIOMETRIC_SLOT_RESERVATION_SECONDS)
+    previous = SlotReservation.objects.filter(reference=reference).first() if reference else None
+    if previous and previous.device_id == device_id and previous.expires_at > timezone.now():
+        SlotReservation.objects.filter(pk=previous.pk).update(expires_at=expires_at)
+        logger.info(f"[SLOTS] Reusing slot {previous.slot} on {device_id} reserved for {reference}")
+        return previous.slot
+
+    slot = _allocate(device_id)
+    if slot is None and collect_garbage(device_id):
+        slot = _allocate(device_id)
+    if slot is None:
+        raise SlotsExhausted(f"No free fingerprint slot on {device_id}")
+    if reference:
+        SlotReservation.objects.update_or_create(
+            reference=reference, defaults={'device_id': device_id, 'slot': slot, 'expires_at': expires_at},
+        )
+        if previous:
+            # Expired or on another sensor: no longer held by this reference
+            release_if_unregistered(previous.device_id, previous.slot)
+    logger.info(f"[SLOTS] Allocated slot {slot} on {device_id}" + (f" for {reference}" if reference else ''))
+    return slot
+
+
+def release_reservation(reference):
+    """
+    Drop the reservation of `reference`; its slot is freed unless a registration holds it
+    by now (call when the enrollment could not start, or once it is registered).
+    """
+    from dashboard.models import SlotReservation
+
+    reservation = SlotReservation.objects.filter(reference=reference).first()
+    if reservation is None:
+        return False
+    reservation.delete()
+    release_if_unregistered(reservation.device_id, reservation.slot)
+    return True
+
+
+def mark_slot(device_id, slot):
+    """Record that `slot` holds a template on `device_id` (slot reused for a re-enrollment)"""
+    device_id = device_id or BIOMETRIC_DEFAULT_DEVICE_ID
+    with transaction.atomic():
+        own = _locked_maps(device_id)[device_id]
+        bits = bits_of(own.bitmap)
+        if not bits >> slot & 1:
+            _save_bits(own, bits | (1 << slot))
+
+
+def release_slot(device_id, slot):
+    """Free `slot` on `device_id` (no-op if it was free)"""
+    device_id = device_id or BIOMETRIC_DEFAULT_DEVICE_ID
+    with transaction.atomic():
+        own = _locked_maps(device_id)[device_id]
+        bits = bits_of(own.bitmap)
+        if not bits >> slot & 1:
+            return False
+        _save_bits(own, bits & ~(1 << slot))
+    logger.info(f"[SLOTS] Released slot {slot} on {device_id}")
+    return True
+
+
+def release_if_unregistered(device_id, slot):
+    """Free the slot of an enrollment that ended without a registration (failed, cancelled, timed out)"""
+    from dashboard.models import BiometricRegistration
+
+    if slot is None or BiometricRegistration.objects.filter(fingerprint_id=slot, is_active=True).exists():
+        return False
+    return release_slot(device_id, slot)
+
+
+def delete_templates_command(slots):
+    """biometric/<device_id>/command payload deleting the templates in `slots` in one go"""
+    return {'command': 'delete_templates', 'bitmap': bitmap_of(_mask(slots), max(slots)).hex()}
+
+
+def delete_from_sensor(device_id, slots):
+    """Ask the sensor to delete the templates in `slots` (through the app's MQTT client)"""
+    if not slots:
+        return False
+    from .mqtt_client import get_mqtt_client
+    mqtt_client = get_mqtt_client()
+    if not mqtt_client:
+        return False
+    return bool(mqtt_client.publish(device_topic(device_id, 'command'), delete_templates_command(slots), qos=1))
+
+
+def collect_garbage(device_id=None, delete=True):
+    """
+    Free slots whose registrations have all been deactivated (dropped students,
+    replaced fingerprints) or whose reservation expired without a registration, on one
+    sensor or on every sensor, and delete their templates.
+
+    Returns:
+        int: Slots freed
+    """
+    from dashboard.models import BiometricRegistration, SensorSlotMap, SlotReservation
+
+    now = timezone.now()
+    expired = list(SlotReservation.objects.filter(expires_at__lte=now).values_list('pk', 'slot'))
+    in_use = _in_use_bits()
+    deactivated = (_mask(
+        BiometricRegistration.objects.filter(is_active=False, fingerprint_id__isnull=False)
+        .values_list('fingerprint_id', flat=True).distinct()
+    ) | _mask(slot for _, slot in expired)) & ~in_use
+    if expired:
+        SlotReservation.objects.filter(pk__in=[pk for pk, _ in expired], expires_at__lte=now).delete()
+    if not deactivated:
+        return 0
+
+    freed = {}
+    with transaction.atomic():
+        maps = SensorSlotMap.objects.select_for_update().order_by('device_id')
+        if device_id:
+            maps = maps.filter(pk=device_id)
+        for slot_map in maps:
+            bits = bits_of(slot_map.bitmap)
+            garbage = bits & deactivated
+            if garbage:
+                _save_bits(slot_map, bits & ~garbage)
+                freed[slot_map.device_id] = slots_of(garbage)
+
+    for freed_device, slots in freed.items():
+        logger.info(f"[SLOTS] Collected {len(slots)} slot(s) of deactivated registrations on {freed_device}: {slots}")
+        if delete:
+            try:
+                delete_from_sensor(freed_device, slots)
+            except Exception as e:
+                logger.warning(f"[SLOTS] Could not delete collected templates on {freed_device}: {e}")
+    return sum(len(slots) for slots in freed.values())
+
+
+def reconcile_sensor(device_id, sensor_bitmap, capacity=None, apply=False):
+    """
+    Compare the template table a sensor reported (bitmap, bit n = template in slot n)
+    with its map.
+
+    - orphaned: templates on the sensor that no active registration, enrollment or reservation holds
+    - missing:  slots of active registrations mapped to this sensor whose template is gone
+                (the student has to enroll again)
+    - unmapped: templates held by a registration but missing from the map
+
+    With apply=True the map becomes (sensor | map) restricted to slots in use; missing
+    slots stay reserved so they are not handed to another student. Deleting the orphaned
+    templates from the sensor is left to the caller (delete_templates_command).
+
+    Returns:
+        dict: Slot lists per category plus counts
+    """
+    from dashboard.models import SensorSlotMap
+
+    in_use = _in_use_bits()
+    registered = _in_use_bits(reserved=False)  # Reserved slots may not be enrolled yet: never 'missing'
+    sensor_bits = bits_of(sensor_bitmap)
+    with transaction.atomic():
+        own = _locked_maps(device_id)[device_id]
+        map_bits = bits_of(own.bitmap)
+        orphaned = sensor_bits & ~in_use
+        report = {
+            'device_id': device_id,
+            'capacity': capacity or own.capacity,
+            'sensor_templates': bin(sensor_bits).count('1'),
+            'mapped_slots': bin(map_bits).count('1'),
+            'orphaned': slots_of(orphaned),
+            'missing': slots_of(map_bits & registered & ~sensor_bits),
+            'unmapped': slots_of(sensor_bits & in_use & ~map_bits),
+            'applied': apply,
+        }
+        if apply:
+            if capacity:
+                own.capacity = capacity
+            _save_bits(own, (sensor_bits | map_bits) & in_use, capacity=own.capacity, reconciled_at=timezone.now())
+    return report
+
+
+def slot_stats():
+    """Used/free slots per sensor map (for the device health endpoint)"""
+    from dashboard.models import SensorSlotMap
+
+    stats = {}
+    for slot_map in SensorSlotMap.objects.order_by('device_id'):
+        bits = bits_of(slot_map.bitmap)
+        stats[slot_map.device_id] = {
+            'capacity': slot_map.capacity,
+            'used': bin(bits).count('1'),
+            'free': bin(_window(slot_map.capacity) & ~bits).count('1'),
+            'reconciled_at': slot_map.reconciled_at.isoformat() if slot_map.reconciled_at else None,
+        }
+    return stats
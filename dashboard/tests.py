@@ -0,0 +1,901 @@
+import threading
+from datetime import datetime, time, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import CustomUser
+
+from . import attendance_finalizer, device_telemetry, mqtt_codec, mqtt_ingest, session_qr, slot_allocator
+from .attendance_batch import MAX_BATCH_SIZE, BatchValidationError, ingest_offline_scans
+from .biometric_utils import biometric_digest, check_fingerprint_uniqueness, encrypt_biometric_data
+from .detection_log import DETECTION_LOG_SETTLE_SECONDS, CacheDetectionLog, DatabaseDetectionLog
+from .models import (
+    AttendanceFinalization, AttendanceRecord, BiometricRegistration, Course, CourseEnrollment, CourseSchedule, DeviceTelemetry,
+    MQTTOutboxMessage, QRCodeRegistration, SensorSlotMap, ServiceLease, SlotReservation,
+)
+from .mqtt_client import PublishHandle
+from .mqtt_dedup import DedupWindow
+from .mqtt_workers import MessageWorkerPool
+
+
+def _detection(fingerprint_id, age_seconds=0):
+    timestamp = timezone.now() - timedelta(seconds=age_seconds)
+    return {'fingerprint_id': fingerprint_id, 'timestamp': timestamp.isoformat()}
+
+
+class CacheDetectionLogTests(SimpleTestCase):
+    """Cursor handling of the cache detection log (in-flight appends, limits, resets)"""
+
+    def setUp(self):
+        cache.clear()
+        self.log = CacheDetectionLog()
+        self.start = self.log.head('attendance')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_read_returns_entries_after_cursor(self):
+        seqs = [self.log.append('attendance', _detection(i)) for i in (1, 2, 3)]
+        entries, cursor = self.log.read('attendance', seqs[0], 50)
+        self.assertEqual([e['fingerprint_id'] for e in entries], [2, 3])
+        self.assertEqual(cursor, seqs[-1])
+
+    def test_limit_moves_cursor_only_past_returned_entries(self):
+        seqs = [self.log.append('attendance', _detection(i)) for i in (1, 2, 3)]
+        entries, cursor = self.log.read('attendance', seqs[0] - 1, 2)
+        self.assertEqual([e['fingerprint_id'] for e in entries], [1, 2])
+        self.assertEqual(cursor, seqs[1])
+        entries, cursor = self.log.read('attendance', cursor, 2)
+        self.assertEqual([e['fingerprint_id'] for e in entries], [3])
+        self.assertEqual(cursor, seqs[2])
+
+    def test_read_stops_before_append_in_flight(self):
+        first = self.log.append('attendance', _detection(1))
+        in_flight = self.log._next_seq('attendance')  # incr() done, set() not yet
+        self.log.append('attendance', _detection(3))
+        entries, cursor = self.log.read('attendance', first - 1, 50)
+        self.assertEqual([e['fingerprint_id'] for e in entries], [1])
+        self.assertEqual(cursor, first)
+
+        cache.set(CacheDetectionLog.ENTRY_KEY.format('attendance', in_flight), {**_detection(2), 'seq': in_flight})
+        entries, cursor = self.log.read('attendance', cursor, 50)
+        self.assertEqual([e['fingerprint_id'] for e in entries], [2, 3])
+
+    def test_read_skips_gap_older_than_grace(self):
+        first = self.log.append('attendance', _detection(1, age_seconds=30))
+        self.log._next_seq('attendance')  # Lost append
+        last = self.log.append('attendance', _detection(3, age_seconds=DETECTION_LOG_SETTLE_SECONDS + 5))
+        entries, cursor = self.log.read('attendance', first - 1, 50)
+        self.assertEqual([e['fingerprint_id'] for e in entries], [1, 3])
+        self.assertEqual(cursor, last)
+
+    def test_cursor_ahead_of_head_resyncs(self):
+        head = self.log.append('attendance', _detection(1))
+        self.assertEqual(self.log.read('attendance', head + 100, 50), ([], head))
+        self.assertEqual(self.log.read('attendance', head, 50), ([], head))
+
+    def test_lagging_consumer_pages_through_backlog(self):
+        seqs = [self.log.append('attendance', _detection(i)) for i in range(120)]
+        cursor, seen = seqs[0] - 1, []
+        for _ in range(3):
+            entries, cursor = self.log.read('attendance', cursor, 50)
+            seen += [e['fingerprint_id'] for e in entries]
+        self.assertEqual(seen, list(range(120)))
+        self.assertEqual(cursor, seqs[-1])
+
+    def test_modes_are_separate(self):
+        self.log.append('registration', _detection(1))
+        self.assertEqual(self.log.read('attendance', self.start, 50)[0], [])
+
+
+class DatabaseDetectionLogTests(TestCase):
+    """Cursor handling of the database detection log"""
+
+    def setUp(self):
+        self.log = DatabaseDetectionLog()
+
+    def test_limit_moves_cursor_only_past_returned_entries(self):
+        seqs = [self.log.append('attendance', _detection(i)) for i in (1, 2, 3)]
+        entries, cursor = self.log.read('attendance', 0, 2)
+        self.assertEqual([e['fingerprint_id'] for e in entries], [1, 2])
+        self.assertEqual(cursor, seqs[1])
+        entries, cursor = self.log.read('attendance', cursor, 2)
+        self.assertEqual([e['seq'] for e in entries], [seqs[2]])
+        self.assertEqual(cursor, seqs[2])
+
+    def test_nothing_new_keeps_cursor(self):
+        seq = self.log.append('attendance', _detection(1))
+        self.assertEqual(self.log.read('attendance', seq, 50), ([], seq))
+        other = self.log.append('registration', _detection(2))
+        self.assertEqual(self.log.read('attendance', seq, 50), ([], other))
+        self.assertEqual(self.log.read('attendance', other, 50), ([], other))
+
+    def test_cursor_ahead_of_head_resyncs(self):
+        seq = self.log.append('attendance', _detection(1))
+        self.assertEqual(self.log.read('attendance', seq + 100, 50), ([], seq))
+
+    def test_other_mode_rows_do_not_hold_the_cursor(self):
+        first = self.log.append('attendance', _detection(1))
+        other = self.log.append('registration', _detection(2))
+        last = self.log.append('attendance', _detection(3))
+        entries, cursor = self.log.read('attendance', first, 50)
+        self.assertEqual([e['seq'] for e in entries], [last])
+        self.assertEqual(self.log.read('attendance', cursor, 50), ([], last))
+        self.assertLess(other, last)
+
+    def test_read_stops_before_uncommitted_id(self):
+        from dashboard.models import FingerprintDetection
+
+        first = self.log.append('attendance', _detection(1))
+        in_flight = self.log.append('attendance', _detection(2))
+        last = self.log.append('attendance', _detection(3))
+        FingerprintDetection.objects.filter(id=in_flight).delete()  # Not visible yet
+        entries, cursor = self.log.read('attendance', first - 1, 50)
+        self.assertEqual([e['seq'] for e in entries], [first])
+        self.assertEqual(cursor, first)
+
+        # Once the row after it has settled, the missing id was rolled back
+        FingerprintDetection.objects.filter(id=last).update(
+            created_at=timezone.now() - timedelta(seconds=DETECTION_LOG_SETTLE_SECONDS + 1),
+        )
+        entries, cursor = self.log.read('attendance', cursor, 50)
+        self.assertEqual([e['seq'] for e in entries], [last])
+        self.assertEqual(cursor, last)
+
+
+class MQTTCodecTests(SimpleTestCase):
+    """Compact v1 frames round-trip through decode_payload; malformed ones decode to None"""
+
+    def test_detection_round_trip(self):
+        frame = mqtt_codec.encode_detection(
+            142, confidence=87, timestamp=1700000000, mode='registration', match_type='hardware',
+            reason='matched', msg_id='a1b2c3d4-17',
+        )
+        self.assertEqual(frame[0], mqtt_codec.MAGIC_V1)
+        self.assertEqual(mqtt_codec.decode_payload(frame), ({
+            'fingerprint_id': 142, 'confidence': 87, 'timestamp': 1700000000, 'mode': 'registration',
+            'match_type': 'hardware', 'reason': 'matched', 'msg_id': 'a1b2c3d4-17',
+        }, mqtt_codec.CODEC_COMPACT_V1))
+
+    def test_no_match_detection_round_trip(self):
+        message, _ = mqtt_codec.decode_payload(mqtt_codec.encode_detection(-1))
+        self.assertEqual(message['fingerprint_id'], -1)
+        self.assertEqual(message['mode'], 'attendance')
+        self.assertIsNone(message['match_type'])
+        self.assertIsNone(message['reason'])
+        self.assertIsNone(message['msg_id'])
+
+    def test_enroll_response_round_trip(self):
+        payload = {
+            'status': 'success', 'step': 3, 'slot': 105, 'success': True, 'quality': 91,
+            'template_id': 'tpl-105', 'message': 'Enrolled', 'msg_id': 'ff-2',
+        }
+        frame = mqtt_codec.encode_payload(payload, mqtt_codec.CODEC_COMPACT_V1)
+        self.assertEqual(mqtt_codec.decode_payload(frame), (payload, mqtt_codec.CODEC_COMPACT_V1))
+
+    def test_enroll_response_without_slot_or_quality(self):
+        frame = mqtt_codec.encode_enroll_response('capture_failed', step=1, success=False)
+        message, _ = mqtt_codec.decode_payload(frame)
+        self.assertEqual(message['status'], 'capture_failed')
+        self.assertIsNone(message['slot'])
+        self.assertIsNone(message['quality'])
+        self.assertFalse(message['success'])
+
+    def test_json_is_still_accepted(self):
+        payload = {'fingerprint_id': 7, 'confidence': 50}
+        self.assertEqual(mqtt_codec.encode_payload(payload), '{"fingerprint_id": 7, "confidence": 50}')
+        self.assertEqual(mqtt_codec.decode_payload(mqtt_codec.encode_payload(payload)), (payload, mqtt_codec.CODEC_JSON))
+
+    def test_truncated_frames_decode_to_none(self):
+        detection = mqtt_codec.encode_detection(142, reason='matched')
+        enroll = mqtt_codec.encode_enroll_response('success', slot=105, template_id='tpl', message='ok')
+        for frame in (detection[:1], detection[:5], detection[:-3], enroll[:6], enroll[:-1]):
+            with self.subTest(length=len(frame)):
+                self.assertEqual(mqtt_codec.decode_payload(frame), (None, mqtt_codec.CODEC_COMPACT_V1))
+
+    def test_partial_msg_id_trailer_is_ignored(self):
+        frame = mqtt_codec.encode_detection(142, msg_id='a1-5')
+        message, _ = mqtt_codec.decode_payload(frame[:-4])
+        self.assertEqual(message['fingerprint_id'], 142)
+        self.assertIsNone(message['msg_id'])
+
+    def test_unknown_frame_type_decodes_to_none(self):
+        self.assertEqual(mqtt_codec.decode_payload(bytes([mqtt_codec.MAGIC_V1, 0x7F, 0, 0])), (None, mqtt_codec.CODEC_COMPACT_V1))
+
+
+class SlotBitmapTests(SimpleTestCase):
+    """Bitmap helpers of the fingerprint slot allocator"""
+
+    def test_bitmap_round_trip(self):
+        bits = slot_allocator._mask([0, 100, 299, 300])
+        self.assertEqual(slot_allocator.bits_of(slot_allocator.bitmap_of(bits, 300)), bits)
+        self.assertEqual(slot_allocator.slots_of(bits), [0, 100, 299, 300])
+
+    def test_bitmap_keeps_legacy_slot_beyond_capacity(self):
+        bits = slot_allocator._mask([500])
+        self.assertEqual(slot_allocator.slots_of(slot_allocator.bits_of(slot_allocator.bitmap_of(bits, 300))), [500])
+
+    def test_window_is_min_to_capacity(self):
+        window = slot_allocator.slots_of(slot_allocator._window(110))
+        self.assertEqual(window, list(range(slot_allocator.BIOMETRIC_SLOT_MIN, 111)))
+
+
+class SlotAllocatorTests(TestCase):
+    """Allocation, release, reservations, garbage collection and reconciliation of sensor slots"""
+
+    def setUp(self):
+        self.instructor = CustomUser.objects.create(username='instructor', email='instructor@example.com', is_teacher=True)
+        self.course = Course.objects.create(
+            code='MSS101', name='Mixed Signals', year_level=1, section='A', days='Mon',
+            start_time=time(8), end_time=time(9), instructor=self.instructor,
+        )
+
+    def _register(self, slot, is_active=True):
+        student = CustomUser.objects.create(username=f'student{slot}', email=f'student{slot}@example.com', is_student=True)
+        return BiometricRegistration.objects.create(
+            student=student, course=self.course, biometric_data='template', fingerprint_id=slot, is_active=is_active,
+        )
+
+    def _mapped(self, device_id=slot_allocator.BIOMETRIC_DEFAULT_DEVICE_ID):
+        return slot_allocator.slots_of(slot_allocator.bits_of(SensorSlotMap.objects.get(pk=device_id).bitmap))
+
+    def test_allocates_lowest_free_slot_and_reuses_released_ones(self):
+        self.assertEqual(slot_allocator.allocate_slot(), 100)
+        self.assertEqual(slot_allocator.allocate_slot(), 101)
+        self.assertTrue(slot_allocator.release_slot(None, 100))
+        self.assertFalse(slot_allocator.release_slot(None, 100))
+        self.assertEqual(slot_allocator.allocate_slot(), 100)
+
+    def test_default_map_starts_from_registered_slots(self):
+        self._register(100)
+        self.assertEqual(slot_allocator.allocate_slot(), 101)
+        self.assertEqual(self._mapped(), [100, 101])
+
+    def test_slots_are_unique_across_sensors(self):
+        self.assertEqual(slot_allocator.allocate_slot('esp32'), 100)
+        self.assertEqual(slot_allocator.allocate_slot('esp32-lab2'), 101)
+        self.assertEqual(self._mapped('esp32-lab2'), [101])
+
+    def test_full_sensor_raises(self):
+        SensorSlotMap.objects.create(pk='tiny', capacity=101, bitmap=b'')
+        self.assertEqual(slot_allocator.allocate_slot('tiny'), 100)
+        self.assertEqual(slot_allocator.allocate_slot('tiny'), 101)
+        with self.assertRaises(slot_allocator.SlotsExhausted):
+            slot_allocator.allocate_slot('tiny')
+
+    def test_full_sensor_collects_deactivated_slots(self):
+        SensorSlotMap.objects.create(pk='tiny', capacity=100, bitmap=b'')
+        self.assertEqual(slot_allocator.allocate_slot('tiny'), 100)
+        dropped = self._register(100, is_active=False)
+        self.assertEqual(slot_allocator.allocate_slot('tiny'), 100)
+        dropped.refresh_from_db()
+        self.assertIsNone(dropped.fingerprint_id)  # No longer owns the slot given to someone else
+
+    def test_collect_garbage_frees_only_deactivated_slots(self):
+        kept, dropped = self._register(100), self._register(101)
+        slot_allocator.allocate_slot()
+        dropped.is_active = False
+        dropped.save()
+        self.assertEqual(slot_allocator.collect_garbage(delete=False), 1)
+        self.assertEqual(self._mapped(), [kept.fingerprint_id, 102])
+        self.assertEqual(slot_allocator.collect_garbage(delete=False), 0)
+
+    def test_reservation_is_reused_then_released(self):
+        slot = slot_allocator.allocate_slot(reference='student_1')
+        self.assertEqual(slot_allocator.allocate_slot(reference='student_1'), slot)
+        self.assertEqual(slot_allocator.allocate_slot(), slot + 1)
+        self.assertTrue(slot_allocator.release_reservation('student_1'))
+        self.assertFalse(slot_allocator.release_reservation('student_1'))
+        self.assertEqual(self._mapped(), [slot + 1])
+
+    def test_release_reservation_keeps_registered_slot(self):
+        slot = slot_allocator.allocate_slot(reference='student_1')
+        self._register(slot)
+        slot_allocator.release_reservation('student_1')
+        self.assertEqual(self._mapped(), [slot])
+
+    def test_expired_reservation_is_collected(self):
+        slot = slot_allocator.allocate_slot(reference='student_1')
+        SlotReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(slot_allocator.collect_garbage(delete=False), 1)
+        self.assertFalse(SlotReservation.objects.exists())
+        self.assertEqual(self._mapped(), [])
+        self.assertEqual(slot_allocator.allocate_slot(), slot)
+
+    def test_reconcile_categories(self):
+        self._register(100)
+        self._register(101)
+        self.assertEqual(slot_allocator.allocate_slot(reference='student_a'), 102)
+        self.assertEqual(slot_allocator.allocate_slot(reference='student_b'), 103)  # Not enrolled yet
+        self._register(104)  # Registered but never mapped
+        sensor = slot_allocator.bitmap_of(slot_allocator._mask([100, 102, 104, 150]), 300)
+
+        report = slot_allocator.reconcile_sensor('esp32', sensor)
+        self.assertEqual(report['orphaned'], [150])
+        self.assertEqual(report['missing'], [101])
+        self.assertEqual(report['unmapped'], [104])
+        self.assertEqual(self._mapped(), [100, 101, 102, 103])
+
+        slot_allocator.reconcile_sensor('esp32', sensor, apply=True)
+        self.assertEqual(self._mapped(), [100, 101, 102, 103, 104])
+
+
+class MQTTIngestLeaseTests(TestCase):
+    """Only one process holds the ingest lease until it releases it or lets it expire"""
+
+    def setUp(self):
+        mqtt_ingest._status.update(read_at=None, value=None)
+
+    def test_second_holder_is_refused_until_release(self):
+        self.assertTrue(mqtt_ingest.acquire_lease('web-1:100'))
+        self.assertFalse(mqtt_ingest.acquire_lease('web-2:200'))
+        self.assertTrue(mqtt_ingest.acquire_lease('web-1:100'))  # Renewal
+        mqtt_ingest.release_lease('web-1:100')
+        self.assertTrue(mqtt_ingest.acquire_lease('web-2:200'))
+        self.assertEqual(ServiceLease.objects.get().holder, 'web-2:200')
+
+    def test_expired_lease_is_taken_over(self):
+        mqtt_ingest.acquire_lease('web-1:100')
+        ServiceLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(mqtt_ingest.acquire_lease('web-2:200'))
+        self.assertFalse(mqtt_ingest.acquire_lease('web-1:100'))
+
+    def test_ingest_status_reports_live_holder(self):
+        self.assertIsNone(mqtt_ingest.ingest_status())
+        mqtt_ingest.acquire_lease('web-1:100', {'connected': True})
+        mqtt_ingest._status.update(read_at=None)
+        status = mqtt_ingest.ingest_status()
+        self.assertEqual(status['holder'], 'web-1:100')
+        self.assertTrue(status['connected'])
+        mqtt_ingest.release_lease('web-1:100')
+        mqtt_ingest._status.update(read_at=None)
+        self.assertIsNone(mqtt_ingest.ingest_status())
+
+
+class _FakeBroker:
+    """Broker client stand-in: keeps every publish handle, optionally failing them at once"""
+
+    def __init__(self, fail_topics=()):
+        self.is_connected = True
+        self.fail_topics = set(fail_topics)
+        self.handles = []
+
+    def publish_async(self, topic, payload, qos=1, retain=False):
+        handle = PublishHandle(topic, payload, qos, retain)
+        if topic in self.fail_topics:
+            handle.resolve(False)
+        self.handles.append(handle)
+        return handle
+
+
+class MQTTOutboxTests(TestCase):
+    """Outbox rows are published once, in order, and publish_async handles follow their delivery"""
+
+    def setUp(self):
+        mqtt_ingest.forget_outbox_handles()
+        mqtt_ingest._status.update(read_at=None, value=None)
+
+    def tearDown(self):
+        mqtt_ingest.forget_outbox_handles()
+        mqtt_ingest._status.update(read_at=None, value=None)
+
+    def _queue(self, *topics):
+        return [MQTTOutboxMessage.objects.create(topic=topic, payload='{}') for topic in topics]
+
+    def _resolve(self, rows):
+        watcher = mqtt_ingest._OutboxWatcher()
+        handles = {row.id: PublishHandle(row.topic, row.payload, row.qos, row.retain) for row in rows}
+        watcher._handles.update(handles)
+        watcher._check(list(handles))
+        return handles
+
+    def test_rows_are_sent_once_in_order(self):
+        rows = self._queue('a', 'b', 'c')
+        broker = _FakeBroker()
+        self.assertEqual(mqtt_ingest.drain_outbox(broker), 3)
+        self.assertEqual([h.topic for h in broker.handles], ['a', 'b', 'c'])
+        self.assertEqual(mqtt_ingest.drain_outbox(broker), 0)
+        self.assertEqual(len(broker.handles), 3)
+        self.assertEqual(mqtt_ingest.outbox_depth(), 0)
+        self.assertFalse(MQTTOutboxMessage.objects.filter(id__in=[r.id for r in rows], sent_at__isnull=True).exists())
+
+    def test_handle_waits_for_broker_ack(self):
+        row, = self._queue('a')
+        broker = _FakeBroker()
+        mqtt_ingest.drain_outbox(broker)
+        self.assertFalse(self._resolve([row])[row.id].done())  # Sent, not acknowledged yet
+
+        broker.handles[0].resolve(True)
+        mqtt_ingest.drain_outbox(broker)
+        row.refresh_from_db()
+        self.assertIsNotNone(row.delivered_at)
+        self.assertIs(self._resolve([row])[row.id].result(timeout=0), True)
+
+    def test_failed_publish_resolves_false(self):
+        ok, bad = self._queue('ok', 'bad')
+        broker = _FakeBroker(fail_topics={'bad'})
+        mqtt_ingest.drain_outbox(broker)
+        broker.handles[0].resolve(True)
+        mqtt_ingest.drain_outbox(broker)
+        handles = self._resolve([ok, bad])
+        self.assertIs(handles[ok.id].result(timeout=0), True)
+        self.assertIs(handles[bad.id].result(timeout=0), False)
+
+    def test_undelivered_rows_expire_and_purged_rows_fail(self):
+        stale, = self._queue('a')
+        broker = _FakeBroker()
+        mqtt_ingest.drain_outbox(broker)
+        MQTTOutboxMessage.objects.filter(id=stale.id).update(
+            created_at=timezone.now() - timedelta(seconds=mqtt_ingest.MQTT_OUTBOX_TTL + 1),
+        )
+        mqtt_ingest.drain_outbox(broker)
+        stale.refresh_from_db()
+        self.assertTrue(stale.failed)
+        self.assertNotIn(stale.id, mqtt_ingest._awaiting)
+
+        MQTTOutboxMessage.objects.filter(id=stale.id).delete()
+        self.assertIs(self._resolve([stale])[stale.id].result(timeout=0), False)
+
+    def test_publish_async_without_ingest_fails_at_once(self):
+        handle = mqtt_ingest.get_outbox_publisher().publish_async('a', {'x': 1})
+        self.assertIs(handle.result(timeout=0), False)
+        self.assertFalse(MQTTOutboxMessage.objects.exists())
+
+
+class MessageWorkerPoolTests(SimpleTestCase):
+    """Messages with one key run in arrival order; full lanes apply the overflow policy"""
+
+    def _finish(self, pool):
+        pool.stop()
+        for lane in pool._lanes:
+            if lane.thread:
+                lane.thread.join(timeout=5)
+
+    def _busy_pool(self, overflow, dropped):
+        """One-lane pool whose worker is parked in a handler until the returned event is set"""
+        pool = MessageWorkerPool(threads=1, queue_size=1, overflow=overflow, on_drop=lambda key, *_: dropped.append(key))
+        started, release = threading.Event(), threading.Event()
+        pool.submit('busy', lambda: (started.set(), release.wait(5)))
+        self.assertTrue(started.wait(5))
+        return pool, release
+
+    def test_same_key_keeps_arrival_order(self):
+        pool = MessageWorkerPool(threads=4, queue_size=100)
+        handled = {'a': [], 'b': [], 'c': []}
+        for n in range(30):
+            for key in handled:
+                self.assertTrue(pool.submit(key, handled[key].append, n))
+        self._finish(pool)
+        for key, values in handled.items():
+            self.assertEqual(values, list(range(30)), key)
+        self.assertEqual(pool.stats()['handled'], 90)
+
+    def test_drop_newest_rejects_the_new_message(self):
+        dropped = []
+        pool, release = self._busy_pool('drop_newest', dropped)
+        self.assertTrue(pool.submit('queued', lambda: None))
+        self.assertFalse(pool.submit('late', lambda: None))
+        release.set()
+        self._finish(pool)
+        self.assertEqual(dropped, ['late'])
+        self.assertEqual(pool.stats()['dropped'], 1)
+
+    def test_drop_oldest_makes_room(self):
+        dropped, handled = [], []
+        pool, release = self._busy_pool('drop_oldest', dropped)
+        self.assertTrue(pool.submit('queued', handled.append, 'queued'))
+        self.assertTrue(pool.submit('late', handled.append, 'late'))
+        release.set()
+        self._finish(pool)
+        self.assertEqual(dropped, ['queued'])
+        self.assertEqual(handled, ['late'])
+
+    def test_block_waits_for_room(self):
+        dropped, handled = [], []
+        pool, release = self._busy_pool('block', dropped)
+        self.assertTrue(pool.submit('queued', handled.append, 'queued'))
+        threading.Timer(0.1, release.set).start()
+        self.assertTrue(pool.submit('late', handled.append, 'late'))
+        self._finish(pool)
+        self.assertEqual(dropped, [])
+        self.assertEqual(handled, ['queued', 'late'])
+
+    def test_failing_handler_does_not_stop_the_lane(self):
+        pool = MessageWorkerPool(threads=1, queue_size=10)
+        handled = []
+        pool.submit('k', lambda: 1 / 0)
+        pool.submit('k', handled.append, 'after')
+        self._finish(pool)
+        self.assertEqual(handled, ['after'])
+        self.assertEqual(pool.stats()['errors'], 1)
+
+    def test_unknown_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            MessageWorkerPool(overflow='spill')
+
+
+class DedupWindowTests(SimpleTestCase):
+    """Replays of (device, msg_id) inside the window are dropped; the window is bounded in size and time"""
+
+    def test_replay_is_duplicate_per_device(self):
+        window = DedupWindow(size=10, ttl=60)
+        self.assertFalse(window.is_duplicate('esp32', 'boot1-1'))
+        self.assertTrue(window.is_duplicate('esp32', 'boot1-1'))
+        self.assertFalse(window.is_duplicate('esp32-lab2', 'boot1-1'))
+        self.assertFalse(window.is_duplicate('esp32', 'boot2-1'))  # Same sequence after a reboot
+        self.assertEqual(window.stats()['duplicates'], 1)
+
+    def test_messages_without_id_pass(self):
+        window = DedupWindow(size=10, ttl=60)
+        for _ in range(2):
+            self.assertFalse(window.is_duplicate('esp32', None))
+            self.assertFalse(window.is_duplicate('esp32', ''))
+        self.assertEqual(window.stats()['size'], 0)
+
+    def test_ids_expire_after_ttl_since_last_seen(self):
+        window = DedupWindow(size=10, ttl=60)
+        with mock.patch('dashboard.mqtt_dedup.time.monotonic') as clock:
+            clock.return_value = 1000
+            window.is_duplicate('esp32', 'a-1')
+            clock.return_value = 1050
+            self.assertTrue(window.is_duplicate('esp32', 'a-1'))  # Refreshes last seen
+            clock.return_value = 1100
+            self.assertTrue(window.is_duplicate('esp32', 'a-1'))
+            clock.return_value = 1161
+            self.assertFalse(window.is_duplicate('esp32', 'a-1'))
+        self.assertEqual(window.stats()['expired'], 1)
+
+    def test_oldest_id_is_evicted_when_full(self):
+        window = DedupWindow(size=2, ttl=60)
+        for msg_id in ('a-1', 'a-2', 'a-3'):
+            window.is_duplicate('esp32', msg_id)
+        self.assertTrue(window.is_duplicate('esp32', 'a-3'))
+        self.assertFalse(window.is_duplicate('esp32', 'a-1'))
+        self.assertEqual(window.stats()['evicted'], 2)
+
+    def test_forgotten_id_is_handled_again(self):
+        window = DedupWindow(size=10, ttl=60)
+        window.is_duplicate('esp32', 'a-1')
+        window.forget('esp32', 'a-1')
+        self.assertFalse(window.is_duplicate('esp32', 'a-1'))
+        self.assertEqual(window.stats()['forgotten'], 1)
+
+
+class DeviceTelemetryTests(TestCase):
+    """Samples are counted per bucket, flushed once finished and aggregated with sample-weighted RSSI"""
+
+    def setUp(self):
+        self._reset()
+        seconds = device_telemetry.DEVICE_TELEMETRY_BUCKET_SECONDS
+        self.previous = device_telemetry._bucket_start(timezone.now().timestamp()) - seconds
+        self.current = self.previous + seconds
+
+    def tearDown(self):
+        self._reset()
+
+    def _reset(self):
+        with device_telemetry._lock:
+            device_telemetry._rings.clear()
+            device_telemetry._next_flush = None
+
+    def test_reconnects_from_reboot_and_heartbeat_gap(self):
+        gap = device_telemetry.DEVICE_HEARTBEAT_GAP_SECONDS
+        device_telemetry.record('esp32', 'status', uptime_seconds=500, now=self.current)
+        device_telemetry.record('esp32', 'status', uptime_seconds=20, now=self.current + 1)  # Rebooted
+        device_telemetry.record('esp32', 'status', uptime_seconds=30, now=self.current + 2)
+        device_telemetry.record('esp32', 'status', uptime_seconds=31, now=self.current + gap + 3)  # Came back
+        device_telemetry.flush(now=self.current + gap + device_telemetry.DEVICE_TELEMETRY_BUCKET_SECONDS)
+        self.assertEqual([r.reconnects for r in DeviceTelemetry.objects.order_by('bucket_start')], [1, 1])
+        self.assertEqual(sum(r.heartbeats for r in DeviceTelemetry.objects.all()), 4)
+
+    def test_bucket_is_written_once_finished(self):
+        device_telemetry.record('esp32', 'detection', rssi=-60, now=self.previous + 1)
+        self.assertFalse(DeviceTelemetry.objects.exists())
+        device_telemetry.record('esp32', 'detection', rssi=-70, now=self.current + 1)  # Rollover flushes
+        row = DeviceTelemetry.objects.get()
+        self.assertEqual((row.detections, row.rssi_sum, row.rssi_count), (1, -60, 1))
+        self.assertEqual(list(device_telemetry._rings['esp32'].buckets), [self.current])
+        self.assertEqual(device_telemetry.flush(now=self.current + 2), 0)
+
+    def test_health_weights_rssi_by_samples_and_merges_live_bucket(self):
+        for offset in range(3):
+            device_telemetry.record('esp32', 'detection', rssi=-60, now=self.previous + offset)
+        device_telemetry.record('esp32', 'status', rssi=-90, uptime_seconds=120, now=self.current)
+        device_telemetry.flush(now=self.current)
+
+        health, = device_telemetry.device_health(hours=1)
+        self.assertEqual(health['device_id'], 'esp32')
+        self.assertEqual(health['rssi'], {'min': -90, 'avg': -67.5, 'max': -60})  # Not (-60 + -90) / 2
+        self.assertEqual(health['heartbeats'], 1)
+        self.assertEqual(health['uptime_seconds'], 120)
+        self.assertEqual(health['detections_per_minute'], round(3 / 60, 2))
+
+
+class BiometricDigestTests(TestCase):
+    """Fingerprint duplicates are found through the stored digest, per course"""
+
+    def setUp(self):
+        instructor = CustomUser.objects.create(username='instructor', email='instructor@example.com', is_teacher=True)
+        self.course, self.other_course = [
+            Course.objects.create(
+                code='BIO101', name='Biometrics', year_level=1, section=section, days='Mon',
+                start_time=time(8), end_time=time(9), instructor=instructor,
+            )
+            for section in ('A', 'B')
+        ]
+        self.owner = CustomUser.objects.create(username='owner', email='owner@example.com', is_student=True)
+        self.other = CustomUser.objects.create(username='other', email='other@example.com', is_student=True)
+        self.registration = BiometricRegistration.objects.create(
+            student=self.owner, course=self.course, biometric_data=encrypt_biometric_data('template-1'), fingerprint_id=100,
+        )
+
+    def test_save_keeps_digest_in_sync(self):
+        self.assertEqual(self.registration.biometric_digest, biometric_digest('template-1'))
+        self.registration.biometric_data = encrypt_biometric_data('template-2')
+        self.registration.save(update_fields=['biometric_data'])
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.biometric_digest, biometric_digest('template-2'))
+
+    def test_duplicate_within_course(self):
+        result = check_fingerprint_uniqueness('template-1', self.course.id, exclude_student_id=self.other.id)
+        self.assertFalse(result['is_unique'])
+        self.assertEqual(result['duplicate_student_id'], self.owner.id)
+
+    def test_own_fingerprint_other_course_and_inactive_are_unique(self):
+        self.assertTrue(check_fingerprint_uniqueness('template-1', self.course.id, exclude_student_id=self.owner.id)['is_unique'])
+        self.assertTrue(check_fingerprint_uniqueness('template-1', self.other_course.id)['is_unique'])
+        self.assertTrue(check_fingerprint_uniqueness('template-9', self.course.id)['is_unique'])
+        self.registration.is_active = False
+        self.registration.save()
+        self.assertTrue(check_fingerprint_uniqueness('template-1', self.course.id)['is_unique'])
+
+
+class AttendanceFinalizerTests(TestCase):
+    """Each ended session is claimed and finalized exactly once; skipped sessions are retried"""
+
+    def setUp(self):
+        self.session_date = (timezone.now() - timedelta(days=2)).astimezone(attendance_finalizer.PH_TZ).date()
+        weekday = attendance_finalizer._WEEKDAYS[self.session_date.weekday()]
+        instructor = CustomUser.objects.create(username='instructor', email='instructor@example.com', is_teacher=True)
+        self.course = Course.objects.create(
+            code='FIN101', name='Finalization', year_level=1, section='A', days=weekday,
+            start_time=time(8), end_time=time(9), instructor=instructor,
+        )
+        student = CustomUser.objects.create(username='student', email='student@example.com', is_student=True)
+        enrollment = CourseEnrollment.objects.create(
+            course=self.course, student=student, full_name='Student One', year_level=1, section='A',
+            email='student@example.com', student_id_number='2024-0001',
+        )
+        CourseEnrollment.objects.filter(pk=enrollment.pk).update(enrolled_at=timezone.now() - timedelta(days=7))
+        self.ends_at = attendance_finalizer.session_end(self.course, self.session_date)
+        self.after_grace = self.ends_at + timedelta(seconds=attendance_finalizer.ATTENDANCE_FINALIZE_GRACE_SECONDS + 60)
+
+    def test_session_end_uses_schedules_before_course_days(self):
+        self.assertEqual(self.ends_at.astimezone(attendance_finalizer.PH_TZ).time(), time(9))
+        CourseSchedule.objects.create(
+            course=self.course, day=self.course.days, start_time=time(13), end_time=time(15),
+        )
+        course = Course.objects.prefetch_related('course_schedules').get(pk=self.course.pk)
+        self.assertEqual(attendance_finalizer.session_end(course, self.session_date).astimezone(attendance_finalizer.PH_TZ).time(), time(15))
+        self.assertIsNone(attendance_finalizer.session_end(course, self.session_date + timedelta(days=1)))
+
+    def test_session_is_due_only_after_grace(self):
+        self.assertEqual(attendance_finalizer.due_sessions(now=self.ends_at + timedelta(seconds=1)), [])
+        due = attendance_finalizer.due_sessions(now=self.after_grace)
+        self.assertEqual([(c.id, d) for c, d, _ in due], [(self.course.id, self.session_date)])
+
+    def test_session_is_finalized_once(self):
+        result = attendance_finalizer.finalize_due(now=self.after_grace)
+        self.assertEqual((result['finalized'], result['records']), (1, 1))
+        self.assertEqual(AttendanceRecord.objects.get(course=self.course).status, 'absent')
+        self.assertEqual(AttendanceFinalization.objects.get().created_records, 1)
+
+        self.assertEqual(attendance_finalizer.due_sessions(now=self.after_grace), [])
+        self.assertIsNone(attendance_finalizer.finalize_session(self.course, self.session_date, self.ends_at))  # Lost the claim
+        self.assertEqual(AttendanceRecord.objects.filter(course=self.course).count(), 1)
+
+    def test_skipped_or_failed_session_releases_its_claim(self):
+        with mock.patch('dashboard.views.finalize_all_course_attendance', return_value=False):
+            self.assertEqual(attendance_finalizer.finalize_due(now=self.after_grace)['deferred'], 1)
+        self.assertFalse(AttendanceFinalization.objects.exists())
+
+        with mock.patch('dashboard.views.finalize_all_course_attendance', side_effect=RuntimeError('db down')):
+            self.assertEqual(attendance_finalizer.finalize_due(now=self.after_grace)['failed'], 1)
+        self.assertFalse(AttendanceFinalization.objects.exists())
+
+        self.assertEqual(attendance_finalizer.finalize_due(now=self.after_grace)['finalized'], 1)
+
+
+@override_settings(SESSION_QR_ROTATION_SECONDS=30, SESSION_QR_ROTATION_GRACE_WINDOWS=1)
+class SignedSessionTokenTests(SimpleTestCase):
+    """Signed session tokens are accepted only on their date and inside the rotation grace"""
+
+    def setUp(self):
+        self.issued = datetime(2026, 10, 14, 12, 0, 5, tzinfo=session_qr.PH_TZ)
+        self.token = session_qr.make_signed_session_token(42, 7, current_time=self.issued)
+
+    def _verify(self, seconds_later, token=None):
+        return session_qr.verify_signed_session_token(token or self.token, self.issued + timedelta(seconds=seconds_later))
+
+    def test_round_trip(self):
+        signed = self._verify(0, self.token.lower())
+        self.assertEqual((signed.course_id, signed.schedule_id, signed.date), (42, 7, self.issued.date()))
+        self.assertIsNone(session_qr.verify_signed_session_token(
+            session_qr.make_signed_session_token(42, None, current_time=self.issued), self.issued,
+        ).schedule_id)
+
+    def test_grace_windows(self):
+        self.assertIsNotNone(self._verify(30))  # Previous window
+        self.assertIsNone(self._verify(60))  # Two windows old
+        self.assertIsNotNone(self._verify(-30))  # Scanner clock one window behind
+        self.assertIsNone(self._verify(-60))
+        with override_settings(SESSION_QR_ROTATION_GRACE_WINDOWS=3):
+            self.assertIsNotNone(self._verify(90))
+            self.assertIsNone(self._verify(120))
+
+    def test_other_day_is_rejected(self):
+        self.assertIsNone(self._verify(24 * 3600))
+
+    def test_tampered_token_is_rejected(self):
+        body, signature = self.token.rsplit('-', 1)
+        forged = body.replace('-16-', '-17-', 1)  # Another course id, base36
+        self.assertNotEqual(forged, body)
+        self.assertIsNone(self._verify(0, f'{forged}-{signature}'))
+        self.assertIsNone(self._verify(0, f'{body}-{"0" * len(signature)}'))
+        self.assertIsNone(self._verify(0, body))
+
+
+class ResolveSignedSessionTests(TestCase):
+    """A verified signed token resolves to its schedule only while the course is open to students"""
+
+    def setUp(self):
+        self.now = session_qr.now_ph()
+        instructor = CustomUser.objects.create(username='instructor', email='instructor@example.com', is_teacher=True)
+        self.course = Course.objects.create(
+            code='QR101', name='Signed Codes', year_level=1, section='A', days=session_qr.WEEKDAY_SHORT[self.now.weekday()],
+            start_time=time(8), end_time=time(9), instructor=instructor,
+        )
+        self.schedule = CourseSchedule.objects.create(
+            course=self.course, day=self.course.days, start_time=time(8), end_time=time(9),
+        )
+
+    def test_signed_token_resolves_schedule(self):
+        token = session_qr.make_signed_session_token(self.course.id, self.schedule.id, current_time=self.now)
+        match = session_qr.resolve_session_qr(token, self.now)
+        self.assertEqual((match.course, match.schedule, match.date), (self.course, self.schedule, self.now.date()))
+
+    def test_archived_course_does_not_resolve(self):
+        token = session_qr.make_signed_session_token(self.course.id, self.schedule.id, current_time=self.now)
+        Course.objects.filter(pk=self.course.pk).update(is_archived=True)
+        self.assertIsNone(session_qr.resolve_session_qr(token, self.now))
+
+
+class DerivedSessionCodeTests(TestCase):
+    """Derived session codes stop resolving as soon as the course or schedule they were built from changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.today = session_qr.now_ph().date()
+        self.day = session_qr.WEEKDAY_SHORT[self.today.weekday()]
+        instructor = CustomUser.objects.create(username='instructor', email='instructor@example.com', is_teacher=True)
+        self.course = Course.objects.create(
+            code='QR102', name='Derived Codes', year_level=1, section='A', days=self.day,
+            start_time=time(8), end_time=time(9), instructor=instructor,
+        )
+        self.schedule = CourseSchedule.objects.create(course=self.course, day=self.day, start_time=time(8), end_time=time(9))
+
+    def tearDown(self):
+        cache.clear()
+
+    def _code(self, section):
+        return session_qr.derive_session_qr_code(self.course.id, self.course.code, section, self.day, self.today)
+
+    def test_section_change_rebuilds_index(self):
+        self.assertEqual(session_qr._lookup_derived(self._code('A'), self.today), (self.course.id, self.schedule.id))
+        self.course.section = 'B'
+        self.course.save()
+        self.assertIsNone(session_qr._lookup_derived(self._code('A'), self.today))
+        self.assertEqual(session_qr._lookup_derived(self._code('B'), self.today), (self.course.id, self.schedule.id))
+
+    def test_unrelated_save_keeps_index(self):
+        session_qr._lookup_derived(self._code('A'), self.today)
+        version = session_qr._index_version()
+        self.course.name = 'Renamed'
+        self.course.save()
+        self.assertEqual(session_qr._index_version(), version)
+
+    def test_deleted_schedule_stops_resolving(self):
+        session_qr._lookup_derived(self._code('A'), self.today)
+        self.schedule.delete()
+        self.assertIsNone(session_qr._lookup_derived(self._code('A'), self.today))
+
+
+class OfflineScanBatchTests(TestCase):
+    """Offline scans are judged by their own time, deduplicated per student/day and rejected one by one"""
+
+    QR = '0123456789abcdef0123456789abcdef'
+
+    def setUp(self):
+        self.now = datetime(2026, 10, 14, 12, 0, tzinfo=session_qr.PH_TZ)  # Wednesday
+        self.instructor = CustomUser.objects.create(username='instructor', email='instructor@example.com', is_teacher=True)
+        self.course = Course.objects.create(
+            code='OFF101', name='Offline', year_level=1, section='A', days='Wed',
+            start_time=time(8), end_time=time(10), instructor=self.instructor, attendance_present_duration=15,
+        )
+        CourseSchedule.objects.create(course=self.course, day='Wed', start_time=time(8), end_time=time(10))
+        self.student = self._student('student', '2024000001', qr=self.QR)
+
+    def _student(self, username, school_id, qr=None, course=None):
+        course = course or self.course
+        student = CustomUser.objects.create(
+            username=username, email=f'{username}@example.com', school_id=school_id, full_name=username.title(), is_student=True,
+        )
+        CourseEnrollment.objects.create(
+            course=course, student=student, full_name=student.full_name, year_level=1, section='A',
+            email=student.email, student_id_number=school_id,
+        )
+        QRCodeRegistration.objects.create(student=student, course=course, qr_code=qr or school_id, registered_by=self.instructor)
+        return student
+
+    def _at(self, hour, minute, day=0):
+        return (self.now.replace(hour=hour, minute=minute) - timedelta(days=day)).isoformat()
+
+    def _ingest(self, scans, course=None):
+        return ingest_offline_scans(self.instructor, course or self.course, scans, current_time=self.now)
+
+    def test_status_follows_scan_time_and_earliest_scan_wins(self):
+        late = self._student('late', '2024000002')
+        results = self._ingest([
+            {'qr_code': self.QR.upper(), 'scanned_at': self._at(8, 20), 'client_id': 'a'},
+            {'qr_code': f'https://example.com/scan?qr_code={self.QR}', 'scanned_at': self._at(8, 5), 'client_id': 'b'},
+            {'school_id': 2024000002, 'scanned_at': self._at(8, 30), 'client_id': 'c'},
+        ])
+        self.assertTrue(all(r.success for r in results))
+        self.assertEqual([r.status for r in results], ['present', 'present', 'late'])
+        self.assertEqual(results[0].message, 'Duplicate scan in batch.')
+        records = {r.student_id: r for r in AttendanceRecord.objects.filter(course=self.course)}
+        self.assertEqual(len(records), 2)
+        self.assertEqual((records[self.student.id].status, records[self.student.id].attendance_time), ('present', time(8, 5)))
+        self.assertEqual(records[late.id].status, 'late')
+
+        again, = self._ingest([{'qr_code': self.QR, 'scanned_at': self._at(9, 0)}])
+        self.assertEqual((again.status, again.message), ('present', 'Already recorded.'))
+
+    def test_bad_items_are_rejected_one_by_one(self):
+        outsider = CustomUser.objects.create(username='outsider', email='outsider@example.com', school_id='2024000009', is_student=True)
+        results = self._ingest([
+            'not a scan',
+            {'qr_code': {'nested': True}, 'scanned_at': self._at(8, 0)},
+            {'qr_code': self.QR},
+            {'qr_code': self.QR, 'scanned_at': self._at(13, 0)},
+            {'qr_code': self.QR, 'scanned_at': self._at(8, 0, day=14)},
+            {'qr_code': 'ffffffffffffffffffffffffffffffff', 'scanned_at': self._at(8, 0)},
+            {'school_id': outsider.school_id, 'scanned_at': self._at(8, 0)},
+            {'qr_code': self.QR, 'scanned_at': self._at(8, 0, day=1)},  # Tuesday
+            {'qr_code': self.QR, 'scanned_at': self._at(8, 1), 'client_id': 'ok'},
+        ])
+        self.assertEqual([r.success for r in results], [False] * 8 + [True])
+        self.assertEqual(results[1].message, 'qr_code and school_id must be text.')
+        self.assertIn('not enrolled', results[6].message)
+        self.assertIn('No class scheduled', results[7].message)
+        self.assertEqual(results[8].client_id, 'ok')
+        self.assertEqual(AttendanceRecord.objects.get().student_id, self.student.id)
+
+    def test_course_level_schedule_without_course_schedules(self):
+        course = Course.objects.create(
+            code='OFF102', name='Offline Two', year_level=1, section='A', days='Wed,Sat',
+            start_time=time(8), end_time=time(10), instructor=self.instructor,
+        )
+        student = self._student('second', '2024000003', course=course)
+        result, = self._ingest([{'school_id': student.school_id, 'scanned_at': self._at(8, 10)}], course=course)
+        self.assertEqual(result.status, 'present')
+        self.assertEqual(AttendanceRecord.objects.get(course=course).schedule_day, 'Wed')
+
+    def test_batch_level_validation(self):
+        with self.assertRaises(BatchValidationError):
+            self._ingest({'qr_code': self.QR})
+        with self.assertRaises(BatchValidationError):
+            self._ingest([{}] * (MAX_BATCH_SIZE + 1))
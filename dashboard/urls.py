@@ -32,6 +32,7 @@ urlpatterns = [
     path('instructor/courses/<int:course_id>/', views.instructor_course_detail_view, name='instructor_course_detail'),
     path('instructor/courses/<int:course_id>/enrollments/', views.instructor_course_enrollments_view, name='instructor_course_enrollments'),
     path('instructor/courses/<int:course_id>/qr-code/', views.instructor_qr_code_view, name='instructor_qr_code'),
+    path('instructor/courses/<int:course_id>/qr-cards/', views.instructor_course_qr_cards_view, name='instructor_course_qr_cards'),
     path('student/qr-scanner/', views.student_qr_scanner_view, name='student_qr_scanner'),
     path('student/scan-qr-attendance/', views.student_scan_qr_attendance_view, name='student_scan_qr_attendance'),
     path('student/todays-status/', views.student_todays_status_view, name='student_todays_status'),
@@ -55,6 +56,7 @@ urlpatterns = [
     path('instructor/courses/<int:course_id>/update-enrollment-status/', views.instructor_update_enrollment_status_view, name='instructor_update_enrollment_status'),
     path('instructor/scan-student-school-id/', views.instructor_scan_student_school_id_view, name='instructor_scan_student_school_id'),
     path('instructor/scan-student-qr-code/', views.instructor_scan_student_qr_code_view, name='instructor_scan_student_qr_code'),
+    path('instructor/scan-bulk-upload/', views.instructor_bulk_scan_upload_view, name='instructor_scan_bulk_upload'),
     path('instructor/scanned-students/', views.instructor_get_scanned_students_view, name='instructor_get_scanned_students'),
     path('instructor/biometric-students/', views.instructor_get_biometric_students_view, name='instructor_get_biometric_students'),
     path('instructor/decode-image/', views.instructor_decode_image_view, name='instructor_decode_image'),
@@ -153,6 +155,7 @@ urlpatterns = [
     path('api/move-students-to-section/', views.move_students_to_section_view, name='api_move_students_to_section'),
     
     path('api/health-check/', views.api_health_check, name='api_health_check'),
+    path('api/device-health/', views.api_device_health, name='api_device_health'),
     
     # ESP32 Fingerprint Sensor Communication
     path('api/esp32/config/', views.api_esp32_config, name='api_esp32_config'),
@@ -179,9 +182,11 @@ urlpatterns = [
     path('api/get-enrolled-courses-status/', views.get_enrolled_courses_status_view, name='get_enrolled_courses_status'),
     # Instructor Biometric Scanning (Combined QR + Biometric Attendance)
     path('instructor/biometric-pending/', views.instructor_get_biometric_pending_view, name='instructor_get_biometric_pending'),
+    path('instructor/biometric-stream/', views.instructor_biometric_stream_view, name='instructor_biometric_stream'),
     path('api/instructor/attendance/start/', views.instructor_start_biometric_detection_view, name='instructor_start_biometric_detection'),
     path('api/instructor/attendance/stop/', views.instructor_stop_biometric_detection_view, name='instructor_stop_biometric_detection'),
     path('instructor/biometric-scan-attendance/', views.instructor_biometric_scan_attendance_view, name='instructor_biometric_scan_attendance'),
+    path('instructor/biometric-auto-record/', views.instructor_biometric_auto_record_view, name='instructor_biometric_auto_record'),
     path('get-course-attendance-count/', views.get_course_attendance_count, name='get_course_attendance_count'),
     # Student Biometric Registration (separate from attendance)
     path('student/fingerprint-pending/', views.student_fingerprint_pending_view, name='student_fingerprint_pending'),
@@ -32,27 +32,8 @@ logger = logging.getLogger(__name__)
 
 
 def _normalize_registered_qr(raw_value: str) -> str:
-    raw = (raw_value or '').strip()
-    if not raw:
-        return ''
-
-    candidate = None
-    try:
-        if raw.startswith('http://') or raw.startswith('https://'):
-            from urllib.parse import urlparse, parse_qs
-            parsed = urlparse(raw)
-            q = parse_qs(parsed.query or '')
-            candidate = (q.get('qr_code') or q.get('qr') or [None])[0]
-            if not candidate:
-                m = re.search(r'([a-f0-9]{32})', raw, flags=re.IGNORECASE)
-                candidate = m.group(1) if m else None
-        else:
-            m = re.search(r'([a-f0-9]{32})', raw, flags=re.IGNORECASE)
-            candidate = m.group(1) if m else None
-    except Exception:
-        candidate = None
-
-    return (candidate or raw).strip().lower()
+    from .qr_registry import normalize_qr_key
+    return normalize_qr_key(raw_value)
 
 try:
     from PIL import Image
@@ -631,25 +612,7 @@ def student_dashboard_view(request):
         'upcoming_classes': upcoming_classes,
         'total_enrolled': enrollments.count(),
     }
-    # Ensure today's attendance is finalized for enrolled courses so counts match the Attendance Log page
-    try:
-        # Finalize attendance for each enrolled course (idempotent)
-        processed_courses = set()
-        for enrollment in enrollments:
-            course_obj = getattr(enrollment, 'course', None)
-            if not course_obj or course_obj.id in processed_courses:
-                continue
-            processed_courses.add(course_obj.id)
-            try:
-                finalize_all_course_attendance(course_obj, getattr(course_obj, 'instructor', None), force=False)
-            except Exception:
-                # Ignore finalization errors; proceed to counting
-                logger.exception('Error finalizing attendance for course %s', getattr(course_obj, 'id', None))
-    except Exception:
-        # If anything unexpected happens, continue without finalization
-        logger.exception('Error during attendance finalization loop for student dashboard')
-
-    # Compute student's attendance log count (after finalization)
+    # Compute student's attendance log count (absent/postponed records of ended sessions come from the finalize_attendance scheduler)
     try:
         attendance_log_count = AttendanceRecord.objects.filter(student=user, course__is_active=True, course__deleted_at__isnull=True, course__is_archived=False).count()
     except Exception:
@@ -1278,18 +1241,8 @@ def student_attendance_log_view(request):
                 today = now_ph.date()
                 current_time = now_ph.time()
                 
-                # Get attendance records for selected course
-                # Ensure any missing absent records are finalized for today's schedules
-                try:
-                    # finalize_all_course_attendance is idempotent with force=False (time-aware)
-                    # Only creates ABSENT records if ALL class schedules for today have ended
-                    finalize_all_course_attendance(selected_course, getattr(selected_course, 'instructor', None), force=False)
-                except Exception:
-                    # If finalization fails, continue and allow manual inspection
-                    logger.exception('finalize_all_course_attendance failed')
-
-                # Get all existing attendance records AFTER finalization
-                # This ensures we include records created by finalize_all_course_attendance
+                # Get attendance records for selected course (absent/postponed records of ended
+                # sessions are created by the finalize_attendance scheduler)
                 records_qs = AttendanceRecord.objects.filter(
                     student=user,
                     course=selected_course
@@ -2254,6 +2207,7 @@ def instructor_my_classes_view(request):
         'course_finished': course_finished,  # Flag to show reminder when course ends
         'instructor_present_expiry_ms': instructor_present_expiry_ms,  # Server-side timer expiry for persistence
         'esp32_ip': settings.ESP32_IP,  # ESP32 fingerprint sensor IP address for biometric scanning
+        'session_qr_rotation_seconds': settings.SESSION_QR_ROTATION_SECONDS if settings.SESSION_QR_SIGNED_TOKENS else 0,  # Refresh interval for signed rotating QR codes
     }
     return render(request, 'dashboard/instructor/my_classes.html', context)
 
@@ -2364,9 +2318,9 @@ def finalize_attendance_records(course, schedule, instructor):
                 logger.error(f"Error creating {record_status} notification: {str(e)}")
 
 
-def finalize_all_course_attendance(course, instructor, force=False):
+def finalize_all_course_attendance(course, instructor, force=False, session_date=None):
     """
-    Finalize attendance for all schedules of a course for today.
+    Finalize attendance for all schedules of a course for today (or session_date).
     Create absent records for enrolled students who didn't scan any session.
     If schedule is postponed, create postponed records instead of absent records.
     
@@ -2375,6 +2329,11 @@ def finalize_all_course_attendance(course, instructor, force=False):
         instructor: The instructor of the course (used for notifications)
         force: If True, force finalization regardless of class time. If False (default),
                only finalize if class has ended or if explicitly closing attendance
+        session_date: Date of the session to finalize (default today in Asia/Manila); used by
+               the finalize_attendance scheduler for sessions that ended before midnight
+
+    Returns:
+        bool: False if finalization was skipped (class not ended or no end time found)
     """
     from django.utils import timezone
     from zoneinfo import ZoneInfo
@@ -2387,7 +2346,7 @@ def finalize_all_course_attendance(course, instructor, force=False):
         ph_tz = pytz.timezone('Asia/Manila')
     
     now_ph = timezone.now().astimezone(ph_tz)
-    today = now_ph.date()
+    today = session_date or now_ph.date()
     today_day = today.strftime('%A')  # e.g., 'Monday'
     
     # Get all day-of-week strings for today's schedule
@@ -2414,8 +2373,7 @@ def finalize_all_course_attendance(course, instructor, force=False):
         today_day_tokens = {today_day, today_day_abbrev}
 
     today_schedules = CourseSchedule.objects.filter(
-        course=course,
-        is_deleted=False
+        course=course
     ).filter(
         Q(day__in=list(today_day_tokens))
     )
@@ -2462,11 +2420,11 @@ def finalize_all_course_attendance(course, instructor, force=False):
 
         if not effective_end_dt:
             logger.info(f"[FINALIZE] No reliable end time found for course={course.id} today. Skipping finalization.")
-            return
+            return False
 
         if now_ph < effective_end_dt:
             logger.info(f"[FINALIZE] Class hasn't ended yet for course={course.id}. End time: {effective_end_dt}. Skipping finalization.")
-            return
+            return False
     
     # Check if TODAY is marked as postponed for ANY of the schedules
     # If so, create postponed records instead of absent records
@@ -2622,6 +2580,7 @@ def finalize_all_course_attendance(course, instructor, force=False):
                     )
                 except Exception as e:
                     logger.error(f"Error creating absent notification: {str(e)}")
+    return True
 
 @login_required
 @require_http_methods(["POST"])
@@ -2680,6 +2639,11 @@ def instructor_update_attendance_status_view(request, course_id):
         
         course = Course.objects.get(id=course_id, instructor=user)
         
+        if status not in ['open', 'automatic']:
+            # Closing the session also ends server-side biometric recording for it
+            from .biometric_autorecord import disarm_auto_record
+            disarm_auto_record(course)
+        
         # If day or schedule_id is provided, update day-specific schedule
         if day or schedule_id:
             day_schedule = None
@@ -5227,6 +5191,8 @@ def instructor_delete_course_view(request, course_id):
                     deleted_at=timezone.now(),
                     is_active=False
                 )
+                from .fingerprint_index import invalidate_course_group
+                invalidate_course_group(course)
                 
                 # Clean up QR and biometric registrations before deleting enrollments
                 enrollments_to_delete = CourseEnrollment.objects.filter(
@@ -5301,6 +5267,8 @@ def instructor_delete_course_view(request, course_id):
                 
                 if updated_count == 0:
                     return JsonResponse({'success': False, 'message': 'Course not found or already deleted.'})
+                from .fingerprint_index import invalidate_course_group
+                invalidate_course_group(course)
                 
                 if updated_count > 1:
                     logger.error(f"CRITICAL ERROR: Update affected {updated_count} courses instead of 1! Course ID: {course_id}")
@@ -6462,45 +6430,23 @@ def get_custom_password_view(request):
 @require_http_methods(["GET"])
 def instructor_qr_code_view(request, course_id):
     """Generate and return QR code image for a course - Always returns a valid PNG image"""
-    from django.http import HttpResponse
-    from io import BytesIO
+    from django.http import HttpResponse, HttpResponseNotModified
+    from .qr_image_cache import placeholder_png
     
     user = request.user
     if not user.is_teacher:
-        # Return a placeholder image instead of error
-        try:
-            from PIL import Image, ImageDraw
-            img = Image.new('RGB', (200, 200), color='white')
-            draw = ImageDraw.Draw(img)
-            draw.text((60, 90), 'Unauthorized', fill='black')
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            response = HttpResponse(buffer.read(), content_type='image/png')
-            response['Cache-Control'] = 'no-cache'
-            return response
-        except Exception:
-            pass
-        return HttpResponse('Unauthorized', status=403)
+        # Return a placeholder image instead of error (rendered once per process)
+        response = HttpResponse(placeholder_png('Unauthorized'), content_type='image/png')
+        response['Cache-Control'] = 'no-cache'
+        return response
     
     try:
         course = Course.objects.get(id=course_id, instructor=user)
     except Course.DoesNotExist:
         # Return a placeholder image instead of 404
-        try:
-            from PIL import Image, ImageDraw
-            img = Image.new('RGB', (200, 200), color='white')
-            draw = ImageDraw.Draw(img)
-            draw.text((70, 90), 'Not Found', fill='black')
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            response = HttpResponse(buffer.read(), content_type='image/png')
-            response['Cache-Control'] = 'no-cache'
-            return response
-        except Exception:
-            pass
-        return HttpResponse('Not Found', status=404)
+        response = HttpResponse(placeholder_png('Not Found'), content_type='image/png')
+        response['Cache-Control'] = 'no-cache'
+        return response
     
     # Generate SESSION-BASED QR code that changes per day/session
     # This prevents students from scanning old QR codes when not in class
@@ -6728,141 +6674,20 @@ def instructor_qr_code_view(request, course_id):
         qr_code_data = hashlib.sha256(session_data.encode()).hexdigest()[:32].upper()
         logger.info(f"Generated session-based QR code for course {course.id} ({course.code}) on {date_str} (day {today_day_short}): {qr_code_data[:8]}...")
     
-    # Generate QR code image - ensure it always works
-    # Always try to import qrcode here (even if module-level import failed)
-    qrcode_module = None
-    try:
-        if QRCODE_AVAILABLE:
-            # Use module-level import if available
-            import qrcode
-            qrcode_module = qrcode
-            logger.info("Using module-level qrcode import")
-        else:
-            # Try function-level import as fallback
-            import qrcode
-            qrcode_module = qrcode
-            logger.info("Using function-level qrcode import (fallback)")
-    except ImportError as import_err:
-        logger.error(f"qrcode library not available: {str(import_err)}")
-        # Return a proper error image instead of text
-        try:
-            from PIL import Image, ImageDraw
-            img = Image.new('RGB', (250, 250), color='white')
-            draw = ImageDraw.Draw(img)
-            # Draw error message as image
-            try:
-                from PIL import ImageFont
-                font = ImageFont.load_default()
-            except:
-                font = None
-            text = "QR Code\nError\nInstall qrcode"
-            draw.text((125, 125), text, fill='red', anchor='mm', font=font)
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            response = HttpResponse(buffer.read(), content_type='image/png')
-            response['Cache-Control'] = 'no-cache'
-            response['Content-Length'] = str(len(buffer.getvalue()))
-            return response
-        except Exception as e:
-            logger.error(f"Error creating QR code error image: {str(e)}")
-            # Return minimal valid PNG
-            fallback_png = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00\x00\tpHYs\x00\x00\x0b\x13\x00\x00\x0b\x13\x01\x00\x9a\x9c\x18\x00\x00\x00\nIDATx\x9cc\xf8\x00\x00\x00\x01\x00\x01\x00\x00\x00\x00IEND\xaeB`\x82'
-            response = HttpResponse(fallback_png, content_type='image/png')
-            response['Cache-Control'] = 'no-cache'
-            return response
-    
-    # Generate QR code using the imported qrcode module
-    try:
-        qr = qrcode_module.QRCode(
-            version=None,  # Auto-determine version based on data
-            error_correction=qrcode.constants.ERROR_CORRECT_M,  # Medium error correction
-            box_size=10,
-            border=4,
-        )
-        
-        # Store the session-based QR code string (32-char hex)
-        qr.add_data(qr_code_data.strip())
-        qr.make(fit=True)
-        
-        # Create QR code image using PIL factory - ensure we get a proper image
-        try:
-            img = qr.make_image(fill_color="black", back_color="white")
-            logger.info(f"QR code image created successfully for course {course.id}: {img.size}, type: {type(img)}")
-        except Exception as img_error:
-            logger.warning(f"Error creating QR code image with colors: {str(img_error)}, trying default")
-            # Try with default factory
-            try:
-                img = qr.make_image()
-                logger.info(f"QR code image created with default factory for course {course.id}: {img.size}")
-            except Exception as default_error:
-                logger.error(f"Error creating QR code image with default factory: {str(default_error)}")
-                raise
-        
-        # Ensure the image is properly sized (at least 250x250 for excellent visibility and scanning)
-        current_size = img.size
-        target_size = 250  # Larger size for better visibility and scanning
-        if current_size[0] < target_size or current_size[1] < target_size:
-            # Scale up to ensure visibility
-            scale_factor = max(target_size / current_size[0], target_size / current_size[1])
-            new_size = (int(current_size[0] * scale_factor), int(current_size[1] * scale_factor))
-            # Use high-quality resampling
-            img = img.resize(new_size, Image.LANCZOS)
-        elif current_size[0] > target_size * 1.5 or current_size[1] > target_size * 1.5:
-            # If too large, scale down for better performance while maintaining quality
-            scale_factor = min(target_size * 1.5 / current_size[0], target_size * 1.5 / current_size[1])
-            new_size = (int(current_size[0] * scale_factor), int(current_size[1] * scale_factor))
-            img = img.resize(new_size, Image.LANCZOS)
-        
-        # Convert to RGB if necessary (some PIL modes don't support PNG properly)
-        if img.mode not in ('RGB', 'RGBA'):
-            if img.mode == 'L':  # Grayscale
-                rgb_img = Image.new('RGB', img.size, color='white')
-                rgb_img.paste(img, (0, 0))
-                img = rgb_img
-            else:
-                img = img.convert('RGB')
-        
-        # Save to BytesIO - ensure proper PNG format with maximum quality
-        buffer = BytesIO()
-        try:
-            # Save with maximum quality settings
-            img.save(buffer, format='PNG', optimize=True, compress_level=6)
-        except Exception as save_error:
-            logger.error(f"Error saving QR code image: {str(save_error)}")
-            # Try saving without optimization
-            buffer = BytesIO()
-            try:
-                img.save(buffer, format='PNG', optimize=False)
-            except Exception as save_error2:
-                logger.error(f"Error saving QR code image without optimization: {str(save_error2)}")
-                # Last resort - convert to PNG format explicitly
-                buffer = BytesIO()
-                img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        image_data = buffer.read()
-        
-        # Verify we have actual image data
-        if len(image_data) < 100:  # PNG files should be at least 100 bytes
-            logger.error(f"Generated QR code image data is too small: {len(image_data)} bytes")
-            raise Exception(f"Generated image data is too small: {len(image_data)} bytes")
-        
-        logger.info(f"QR code image generated successfully for course {course.id}: {len(image_data)} bytes")
-        
-        response = HttpResponse(image_data, content_type='image/png')
-        # Cache headers - cache until course end time (or end of day)
-        # QR code is valid for the entire day, so cache it until end of day
-        # hashlib is already imported at module level
-        # ETag based on session (date + day) so it changes daily
-        etag_data = f"{course.id}_{date_str}_{day_str}_{qr_code_data[:8]}"
-        etag = hashlib.md5(etag_data.encode()).hexdigest()
-        response['ETag'] = f'"{etag}"'
-        
-        # Calculate cache duration - cache until end of day or course end time, whichever is later
+    # Signed rotating token replaces the static code when enabled (legacy codes still validate on scan)
+    from .session_qr import signed_tokens_enabled, make_signed_session_token, rotation_seconds
+    from .qr_image_cache import get_qr_image_cache, etag_matches, render_qr_png
+    signed_rotation = signed_tokens_enabled()
+    if signed_rotation:
+        qr_code_data = make_signed_session_token(course.id, day_schedule.id if day_schedule else None, now_ph)
+    
+    # Cache headers - computed up front so 304 responses carry them as well
+    if signed_rotation:
+        # Rotating token - the image is only valid for the current rotation window
+        cache_control = f'private, max-age={rotation_seconds()}'
+    else:
+        # QR code is valid for the entire day, cache until course end (+1h) or end of day
         seconds_until_midnight = (24 * 3600) - ((now_ph.hour * 3600) + (now_ph.minute * 60) + now_ph.second)
-        
-        # If course has end time today, cache until then (with some buffer)
         cache_until_end = seconds_until_midnight
         if attendance_end:
             end_time_today = datetime.combine(today_date, attendance_end)
@@ -6871,141 +6696,50 @@ def instructor_qr_code_view(request, course_id):
                     end_time_today = PH_TZ.localize(end_time_today)
                 else:
                     end_time_today = end_time_today.replace(tzinfo=PH_TZ)
-            elif not PH_TZ:
-                pass  # Keep naive
-            
             if end_time_today > now_ph:
                 seconds_until_end = (end_time_today - now_ph).total_seconds()
-                # Cache until course end + 1 hour buffer, but not more than until midnight
                 cache_until_end = min(seconds_until_end + 3600, seconds_until_midnight)
-        
         # Cache for the calculated duration (at least 1 hour, max until end of day)
         max_age = max(3600, min(int(cache_until_end), 86400))
-        response['Cache-Control'] = f'public, max-age={max_age}, immutable'  # Cache until course end or end of day
-        response['Content-Disposition'] = f'inline; filename="qr_code_{course.id}_{date_str}.png"'
-        response['Content-Length'] = str(len(image_data))
-        response['X-Content-Type-Options'] = 'nosniff'
-        # Add timestamp header for debugging
-        response['X-QR-Code-Date'] = date_str
-        response['X-QR-Code-Day'] = day_str
-        return response
-    except ImportError as import_err:
-        # If qrcode library is not installed - try to import it again as fallback
-        logger.warning(f"qrcode import failed at module level, trying function-level import: {str(import_err)}")
+        cache_control = f'public, max-age={max_age}, immutable'
+    
+    # Rendered PNGs are cached per (course, schedule, date, token version);
+    # repeated fetches are a dictionary lookup and revalidations a 304
+    image_cache = get_qr_image_cache()
+    cache_key = (course.id, day_schedule.id if day_schedule else None, date_str, qr_code_data)
+    cached = image_cache.get(cache_key)
+    if cached is None:
         try:
-            import qrcode
-            from PIL import Image
-            # Retry QR code generation with function-level import
-            qr = qrcode.QRCode(
-                version=None,
-                error_correction=qrcode.constants.ERROR_CORRECT_M,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_code_data.strip())
-            qr.make(fit=True)
-            img = qr.make_image(fill_color="black", back_color="white")
-            # Resize and process image (same as above)
-            current_size = img.size
-            target_size = 250
-            if current_size[0] < target_size or current_size[1] < target_size:
-                scale_factor = max(target_size / current_size[0], target_size / current_size[1])
-                new_size = (int(current_size[0] * scale_factor), int(current_size[1] * scale_factor))
-                img = img.resize(new_size, Image.LANCZOS)
-            if img.mode not in ('RGB', 'RGBA'):
-                if img.mode == 'L':
-                    rgb_img = Image.new('RGB', img.size, color='white')
-                    rgb_img.paste(img, (0, 0))
-                    img = rgb_img
-                else:
-                    img = img.convert('RGB')
-            buffer = BytesIO()
-            img.save(buffer, format='PNG', optimize=True, compress_level=6)
-            buffer.seek(0)
-            image_data = buffer.read()
-            logger.info(f"QR code generated successfully using function-level import for course {course.id}: {len(image_data)} bytes")
-            response = HttpResponse(image_data, content_type='image/png')
-            etag_data = f"{course.id}_{date_str}_{day_str}_{qr_code_data[:8]}"
-            etag = hashlib.md5(etag_data.encode()).hexdigest()
-            response['ETag'] = f'"{etag}"'
-            seconds_until_midnight = (24 * 3600) - ((now_ph.hour * 3600) + (now_ph.minute * 60) + now_ph.second)
-            cache_until_end = seconds_until_midnight
-            if attendance_end:
-                end_time_today = datetime.combine(today_date, attendance_end)
-                if PH_TZ and end_time_today.tzinfo is None:
-                    if hasattr(PH_TZ, 'localize'):
-                        end_time_today = PH_TZ.localize(end_time_today)
-                    else:
-                        end_time_today = end_time_today.replace(tzinfo=PH_TZ)
-                if end_time_today > now_ph:
-                    seconds_until_end = (end_time_today - now_ph).total_seconds()
-                    cache_until_end = min(seconds_until_end + 3600, seconds_until_midnight)
-            max_age = max(3600, min(int(cache_until_end), 86400))
-            response['Cache-Control'] = f'public, max-age={max_age}, immutable'
-            response['Content-Disposition'] = f'inline; filename="qr_code_{course.id}_{date_str}.png"'
-            response['Content-Length'] = str(len(image_data))
-            response['X-Content-Type-Options'] = 'nosniff'
-            response['X-QR-Code-Date'] = date_str
-            response['X-QR-Code-Day'] = day_str
-            return response
-        except ImportError as import_err2:
-            logger.error(f"qrcode library not available even with function-level import: {str(import_err2)}")
-            # Try to generate a basic QR code using PIL directly as fallback
-            try:
-                from PIL import Image, ImageDraw
-                # Generate a simple placeholder that looks like a QR code
-                size = 200
-                img = Image.new('RGB', (size, size), color='white')
-                draw = ImageDraw.Draw(img)
-                # Draw a simple grid pattern that resembles a QR code
-                block_size = 20
-                for i in range(0, size, block_size):
-                    for j in range(0, size, block_size):
-                        if (i // block_size + j // block_size) % 3 == 0:
-                            draw.rectangle([i, j, i+block_size-2, j+block_size-2], fill='black')
-                buffer = BytesIO()
-                img.save(buffer, format='PNG')
-                buffer.seek(0)
-                image_data = buffer.read()
-                response = HttpResponse(image_data, content_type='image/png')
-                response['Cache-Control'] = 'no-cache'
-                response['Content-Disposition'] = f'inline; filename="qr_code_{course.id}.png"'
-                response['Content-Length'] = len(image_data)
-                return response
-            except Exception as e:
-                logger.error(f"Error creating fallback QR code: {str(e)}")
-                pass
-            # Final fallback - minimal PNG
-            fallback_png = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00\x00\tpHYs\x00\x00\x0b\x13\x00\x00\x0b\x13\x01\x00\x9a\x9c\x18\x00\x00\x00\nIDATx\x9cc\xf8\x00\x00\x00\x01\x00\x01\x00\x00\x00\x00IEND\xaeB`\x82'
-            response = HttpResponse(fallback_png, content_type='image/png')
+            cached = image_cache.put(cache_key, render_qr_png(qr_code_data))
+            logger.info(f"QR code image generated successfully for course {course.id}: {len(cached[0])} bytes")
+        except ImportError as import_err:
+            logger.error(f"qrcode library not available: {str(import_err)}")
+            response = HttpResponse(placeholder_png('QR Code Error - Install qrcode', 'red', 250), content_type='image/png')
             response['Cache-Control'] = 'no-cache'
-            response['Content-Disposition'] = f'inline; filename="qr_code_{course.id}.png"'
             return response
-    except Exception as e:
-        logger.error(f"Error generating QR code for course {course.id}: {str(e)}", exc_info=True)
-        # Try to return a proper error image
-        try:
-            from PIL import Image, ImageDraw
-            img = Image.new('RGB', (200, 200), color='white')
-            draw = ImageDraw.Draw(img)
-            draw.text((70, 90), 'Error', fill='red')
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            image_data = buffer.read()
-            response = HttpResponse(image_data, content_type='image/png')
+        except Exception as e:
+            logger.error(f"Error generating QR code for course {course.id}: {str(e)}", exc_info=True)
+            response = HttpResponse(placeholder_png('Error', 'red'), content_type='image/png')
             response['Cache-Control'] = 'no-cache'
             response['Content-Disposition'] = f'inline; filename="qr_code_{course.id}.png"'
-            response['Content-Length'] = len(image_data)
             return response
-        except Exception:
-            pass
-        # Final fallback
-        fallback_png = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00\x00\tpHYs\x00\x00\x0b\x13\x00\x00\x0b\x13\x01\x00\x9a\x9c\x18\x00\x00\x00\nIDATx\x9cc\xf8\x00\x00\x00\x01\x00\x01\x00\x00\x00\x00IEND\xaeB`\x82'
-        response = HttpResponse(fallback_png, content_type='image/png')
-        response['Cache-Control'] = 'no-cache'
-        response['Content-Disposition'] = f'inline; filename="qr_code_{course.id}.png"'
-        return response
+    image_data, etag = cached
+    
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(image_data, content_type='image/png')
+        response['Content-Disposition'] = f'inline; filename="qr_code_{course.id}_{date_str}.png"'
+        response['Content-Length'] = str(len(image_data))
+        response['X-Content-Type-Options'] = 'nosniff'
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    if signed_rotation:
+        response['X-QR-Rotation-Seconds'] = str(rotation_seconds())
+    # Add timestamp header for debugging
+    response['X-QR-Code-Date'] = date_str
+    response['X-QR-Code-Day'] = day_str
+    return response
 
 @login_required
 def student_qr_scanner_view(request):
@@ -7101,84 +6835,19 @@ def student_scan_qr_attendance_view(request):
         date_str = today_date.strftime('%Y%m%d')
         day_str = str(today_weekday)
         
-        # Try to find course by matching today's session QR code
-        # We'll check all courses and generate their expected QR codes for today
-        all_courses = Course.objects.filter(
-            instructor__is_teacher=True,
-            is_active=True,
-            deleted_at__isnull=True,
-            is_archived=False
-        ).select_related('instructor').prefetch_related('course_schedules')
-        
+        # Resolve the scanned code to today's course/schedule in constant time
+        # (indexed lookup on stored codes + precomputed index of derived codes)
+        from .session_qr import resolve_session_qr
         course = None
         matched_qr_code = None
         matched_schedule = None
         
-        for c in all_courses:
-            # Check day-specific schedules first (asynchronous)
-            day_schedules = c.course_schedules.filter(day__iexact=today_day_short).all()
-            if day_schedules.exists():
-                # Check each day schedule's QR code directly from database
-                for schedule in day_schedules:
-                    # Check if the scanned QR code matches the schedule's stored QR code
-                    if schedule.qr_code and scanned_qr_code == schedule.qr_code.upper():
-                        course = c
-                        matched_schedule = schedule
-                        matched_qr_code = schedule.qr_code
-                        logger.info(f"Student {user.username} scanned valid QR code for course {c.id} ({c.code}) on {date_str} (day {today_day_short})")
-                        break
-                    
-                    # Also try generating expected QR code (for backward compatibility)
-                    # Format: course_id_code_section_day_YYYYMMDD
-                    qr_data = f"{c.id}_{c.code}_{c.section or ''}_{schedule.day}_{date_str}"
-                    expected_qr_code = hashlib.sha256(qr_data.encode()).hexdigest()[:16].upper()
-                    
-                    if scanned_qr_code == expected_qr_code:
-                        course = c
-                        matched_schedule = schedule
-                        matched_qr_code = expected_qr_code
-                        logger.info(f"Student {user.username} scanned valid generated QR code for course {c.id} ({c.code}) on {date_str} (day {today_day_short})")
-                        break
-                    
-                    # Try with random suffix (in case of collisions)
-                    for attempt in range(10):
-                        qr_data_with_suffix = f"{c.id}_{c.code}_{c.section or ''}_{schedule.day}_{date_str}_{random.randint(1000, 9999)}"
-                        expected_qr_code = hashlib.sha256(qr_data_with_suffix.encode()).hexdigest()[:16].upper()
-                        if scanned_qr_code == expected_qr_code:
-                            course = c
-                            matched_schedule = schedule
-                            matched_qr_code = expected_qr_code
-                            logger.info(f"Student {user.username} scanned valid QR code (with suffix) for course {c.id} ({c.code}) on {date_str} (day {today_day_short})")
-                            break
-                    
-                    if course:
-                        break
-                
-                if course:
-                    break
-            elif c.days:
-                # Check synchronized schedule - need to find the day schedule or use course-level QR
-                days_list = [d.strip() for d in c.days.split(',') if d.strip()]
-                if today_day_name in days_list or today_day_short in days_list:
-                    # For synchronized schedules, check if there's a day schedule for today
-                    # If not, use course-level QR code (backward compatibility)
-                    day_schedule = c.course_schedules.filter(day__iexact=today_day_short).first()
-                    if day_schedule and day_schedule.qr_code:
-                        # Use the day schedule's QR code
-                        if scanned_qr_code == day_schedule.qr_code:
-                            course = c
-                            matched_schedule = day_schedule
-                            matched_qr_code = day_schedule.qr_code
-                            logger.info(f"Student {user.username} scanned valid day schedule QR code for course {c.id} ({c.code}) on {date_str}")
-                            break
-                    elif c.qr_code:
-                        # Fallback to course-level QR code (for backward compatibility)
-                        if scanned_qr_code == c.qr_code:
-                            course = c
-                            matched_schedule = None
-                            matched_qr_code = c.qr_code
-                            logger.info(f"Student {user.username} scanned valid course-level QR code for course {c.id} ({c.code}) on {date_str}")
-                            break
+        session_match = resolve_session_qr(scanned_qr_code, now_ph)
+        if session_match:
+            course = session_match.course
+            matched_schedule = session_match.schedule
+            matched_qr_code = scanned_qr_code
+            logger.info(f"Student {user.username} scanned valid QR code for course {course.id} ({course.code}) on {date_str} (day {today_day_short})")
         
         if not course:
             # Log for debugging
@@ -10618,78 +10287,15 @@ def instructor_scan_student_qr_code_view(request):
         if not qr_code_raw or not course_id:
             return JsonResponse({'success': False, 'message': 'Missing required fields.'})
         
-        # Normalize QR code:
-        # - Extract 32-hex id from URL/text if present
-        # - Lowercase to avoid case-sensitivity issues
-        qr_code_norm = qr_code_raw
-        try:
-            if qr_code_raw.startswith('http://') or qr_code_raw.startswith('https://'):
-                from urllib.parse import urlparse, parse_qs
-                parsed = urlparse(qr_code_raw)
-                q = parse_qs(parsed.query or '')
-                candidate = (q.get('qr_code') or q.get('qr') or [None])[0]
-                if not candidate:
-                    import re
-                    m = re.search(r'([a-f0-9]{32})', qr_code_raw, flags=re.IGNORECASE)
-                    candidate = m.group(1) if m else None
-                if candidate:
-                    qr_code_norm = candidate
-            else:
-                import re
-                m = re.search(r'([a-f0-9]{32})', qr_code_raw, flags=re.IGNORECASE)
-                if m:
-                    qr_code_norm = m.group(1)
-        except Exception:
-            qr_code_norm = qr_code_raw
-
-        qr_code_norm = (qr_code_norm or '').strip().lower()
-
         # Get the course
         course = get_object_or_404(Course, id=course_id, instructor=request.user)
-        
-        sibling_courses = Course.objects.filter(
-            instructor=request.user,
-            code=course.code,
-            name=course.name,
-            semester=course.semester,
-            school_year=course.school_year,
-            is_active=True,
-            deleted_at__isnull=True,
-            is_archived=False
-        )
 
-        # Look up the QR code in QRCodeRegistration.
+        # Look up the QR code by its normalized key (indexed: qr_key, course, is_active).
         # Prefer this course, but allow sibling sections so scans don't fail due to section mismatch.
-        qr_registration = QRCodeRegistration.objects.filter(
-            qr_code__iexact=qr_code_norm,
-            course=course,
-            is_active=True
-        ).select_related('student').first()
+        # Legacy rows that stored a full URL/text are covered because qr_key holds the extracted 32-hex id.
+        from .qr_registry import resolve_registered_qr
+        qr_registration = resolve_registered_qr(qr_code_raw, course, request.user)
 
-        if not qr_registration:
-            qr_registration = QRCodeRegistration.objects.filter(
-                qr_code__iexact=qr_code_norm,
-                course__in=sibling_courses,
-                is_active=True
-            ).select_related('student', 'course').first()
-
-        # Legacy fallback: older registrations may have stored the *full URL* or other text
-        # that contains the 32-hex QR id. If so, match by substring (safe because the 32-hex
-        # id should be unique).
-        if not qr_registration and qr_code_norm:
-            qr_registration = QRCodeRegistration.objects.filter(
-                qr_code__icontains=qr_code_norm,
-                course=course,
-                is_active=True
-            ).select_related('student').first()
-
-        if not qr_registration and qr_code_norm:
-            qr_registration = QRCodeRegistration.objects.filter(
-                qr_code__icontains=qr_code_norm,
-                course__in=sibling_courses,
-                is_active=True
-            ).select_related('student', 'course').first()
-        
         if not qr_registration:
             return JsonResponse({
                 'success': False, 
@@ -10733,10 +10339,10 @@ def instructor_scan_student_qr_code_view(request):
         
         # Find ONLY schedules for this course on this specific day
         # Attendance should only record for the actual class on that day
+        # (CourseSchedule has no `is_deleted` field)
         active_schedules = CourseSchedule.objects.filter(
             course=course,
-            day=today_day_short,
-            is_deleted=False
+            day=today_day_short
         ).order_by('start_time')
         
         if not active_schedules.exists():
@@ -11175,6 +10781,66 @@ def instructor_scan_student_school_id_view(request):
         return JsonResponse({'success': False, 'message': f'Error: {str(e)}'})
 
 
+@login_required
+@require_http_methods(["POST"])
+def instructor_bulk_scan_upload_view(request):
+    """
+    Upload scans collected while the instructor device was offline.
+    Body: {"course_id": 12, "scans": [{"qr_code": "...", "scanned_at": "2025-01-14T08:05:12+08:00", "client_id": "a1"},
+                                     {"school_id": "166701002", "scanned_at": 1736813112000}]}
+    Every scan is judged present/late by its own scanned_at and the whole batch is
+    written in one transaction. Returns one result per scan, in input order.
+    """
+    try:
+        if not request.user.is_teacher:
+            return JsonResponse({'success': False, 'message': 'Only instructors can upload scans.'})
+
+        from .attendance_batch import BatchValidationError, ingest_offline_scans
+
+        data = json.loads(request.body)
+        course_id = data.get('course_id')
+        scans = data.get('scans')
+
+        # Same composite key handling as the single-scan views ("73_F_20251212")
+        try:
+            course_id = int(str(course_id).split('_')[0])
+        except (ValueError, TypeError):
+            return JsonResponse({'success': False, 'message': f'Invalid course ID format: {course_id}'})
+
+        course = get_object_or_404(Course, id=course_id, instructor=request.user)
+
+        try:
+            results = ingest_offline_scans(request.user, course, scans)
+        except BatchValidationError as e:
+            return JsonResponse({'success': False, 'message': str(e)})
+
+        recorded = sum(1 for r in results if r.success)
+        if recorded:
+            create_notification(
+                request.user,
+                'attendance_scanned',
+                'Offline Scans Uploaded',
+                f'{recorded} of {len(results)} offline scans recorded for {course.code}',
+                category='attendance',
+                related_course=course
+            )
+
+        return JsonResponse({
+            'success': True,
+            'message': f'{recorded} of {len(results)} scans recorded.',
+            'course_code': course.code,
+            'recorded': recorded,
+            'failed': len(results) - recorded,
+            'results': [r._asdict() for r in results],
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON data.'})
+    except Exception as e:
+        logger.error(f"Error uploading offline scans: {str(e)}")
+        return JsonResponse({'success': False, 'message': f'Error: {str(e)}'})
+
+
 @login_required
 def instructor_get_scanned_students_view(request):
     """
@@ -11487,8 +11153,12 @@ def instructor_register_student_qr_code_view(request):
 @require_http_methods(["POST"])
 def instructor_decode_image_view(request):
     """
-    Server-side decode endpoint: accepts JSON with `image` being a data URL (PNG/JPEG),
-    decodes any QR codes using pyzbar and returns decoded text(s).
+    Server-side decode endpoint for camera-assist scanning. Accepts up to
+    QR_DECODE_MAX_FRAMES frames per request, in any of these forms:
+    - multipart/form-data with one or more `frames` (or `image`) files (preferred)
+    - a raw image body (Content-Type: image/jpeg, image/png, image/webp)
+    - legacy JSON with `image` (data URL) or `images` (list of data URLs)
+    Frames are downscaled + grayscaled and decoded with pyzbar in the decode pool.
     """
     try:
         if not request.user.is_teacher:
@@ -11497,33 +11167,52 @@ def instructor_decode_image_view(request):
         if not SERVER_DECODE_AVAILABLE:
             return JsonResponse({'success': False, 'message': 'Server decode libraries not available. Install pyzbar and Pillow.'})
 
-        data = json.loads(request.body)
-        data_url = data.get('image')
-        if not data_url:
-            return JsonResponse({'success': False, 'message': 'No image provided.'})
-
-        # Strip off data URL prefix
-        if data_url.startswith('data:'):
-            header, encoded = data_url.split(',', 1)
+        from concurrent.futures import TimeoutError as FutureTimeoutError
+        from .qr_decode import DecodePoolBusy, QR_DECODE_MAX_FRAME_BYTES, QR_DECODE_MAX_FRAMES, get_decode_pool
+
+        content_type = (request.content_type or '').lower()
+        frames = []
+        if content_type.startswith('multipart/'):
+            uploads = request.FILES.getlist('frames') or request.FILES.getlist('image')
+            if len(uploads) > QR_DECODE_MAX_FRAMES:
+                return JsonResponse({'success': False, 'message': f'Too many frames (max {QR_DECODE_MAX_FRAMES}).'})
+            for upload in uploads:
+                if upload.size > QR_DECODE_MAX_FRAME_BYTES:
+                    return JsonResponse({'success': False, 'message': 'Frame too large.'})
+                frames.append(upload.read())
+        elif content_type.startswith('image/') or content_type == 'application/octet-stream':
+            frames.append(request.body)
         else:
-            encoded = data_url
-
-        image_bytes = base64.b64decode(encoded)
-        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+            data = json.loads(request.body)
+            data_urls = data.get('images') or ([data['image']] if data.get('image') else [])
+            if len(data_urls) > QR_DECODE_MAX_FRAMES:
+                return JsonResponse({'success': False, 'message': f'Too many frames (max {QR_DECODE_MAX_FRAMES}).'})
+            for data_url in data_urls:
+                # Strip off data URL prefix
+                encoded = data_url.split(',', 1)[1] if data_url.startswith('data:') else data_url
+                frames.append(base64.b64decode(encoded))
+
+        frames = [frame for frame in frames if frame]
+        if not frames:
+            return JsonResponse({'success': False, 'message': 'No image provided.'})
+        if any(len(frame) > QR_DECODE_MAX_FRAME_BYTES for frame in frames):
+            return JsonResponse({'success': False, 'message': 'Frame too large.'})
 
-        results = pyzbar_decode(img)
-        decoded = []
-        for r in results:
-            try:
-                text = r.data.decode('utf-8')
-            except Exception:
-                text = str(r.data)
-            decoded.append(text)
+        try:
+            per_frame = get_decode_pool().decode_frames(frames)
+        except DecodePoolBusy:
+            response = JsonResponse({'success': False, 'message': 'Server decoder is busy, try again shortly.', 'busy': True}, status=503)
+            response['Retry-After'] = '1'
+            return response
+        except FutureTimeoutError:
+            return JsonResponse({'success': False, 'message': 'Server decode timed out.'}, status=503)
 
+        # Unique decoded texts across frames, first-seen order
+        decoded = list(dict.fromkeys(text for texts in per_frame for text in texts))
         if decoded:
-            return JsonResponse({'success': True, 'decoded': decoded})
+            return JsonResponse({'success': True, 'decoded': decoded, 'frames': per_frame})
         else:
-            return JsonResponse({'success': False, 'message': 'No QR detected by server decoder.'})
+            return JsonResponse({'success': False, 'message': 'No QR detected by server decoder.', 'frames': per_frame})
 
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'message': 'Invalid JSON.'})
@@ -11532,6 +11221,70 @@ def instructor_decode_image_view(request):
         return JsonResponse({'success': False, 'message': 'Server decode error: ' + str(e)})
 
 
+@login_required
+@require_http_methods(["GET"])
+def instructor_course_qr_cards_view(request, course_id):
+    """
+    Download printable QR cards for every enrolled student of a course.
+    Query params:
+    - format: 'zip' (one PNG per student, default) or 'pdf' (A4 sheets)
+    - scope: 'course' (default) or 'program' (all of this instructor's active courses in the same program)
+    The file is rendered in the shared card pool and streamed as it is produced;
+    returns 503 while QR_CARD_MAX_EXPORTS other exports are streaming.
+    """
+    from django.http import StreamingHttpResponse
+    from .qr_cards import CardExportBusy, collect_qr_cards, get_card_pool, stream_qr_cards_pdf, stream_qr_cards_zip
+
+    if not request.user.is_teacher:
+        return JsonResponse({'success': False, 'message': 'Only instructors can generate QR cards.'}, status=403)
+
+    course = get_object_or_404(Course, id=course_id, instructor=request.user)
+    output_format = request.GET.get('format', 'zip').lower()
+    scope = request.GET.get('scope', 'course').lower()
+    if output_format not in ('zip', 'pdf'):
+        return JsonResponse({'success': False, 'message': 'format must be zip or pdf.'}, status=400)
+
+    if scope == 'program' and course.program_id:
+        courses = Course.objects.filter(
+            instructor=request.user,
+            program_id=course.program_id,
+            is_active=True,
+            deleted_at__isnull=True,
+            is_archived=False
+        )
+        label = re.sub(r'[^A-Za-z0-9]+', '_', course.program.code)
+    else:
+        courses = Course.objects.filter(id=course.id)
+        label = re.sub(r'[^A-Za-z0-9]+', '_', f'{course.code}_{course.section}')
+
+    try:
+        cards, missing = collect_qr_cards(courses)
+    except Exception as e:
+        logger.error(f"Error collecting QR cards for course {course_id}: {str(e)}")
+        return JsonResponse({'success': False, 'message': f'Error: {str(e)}'}, status=500)
+
+    if not cards:
+        return JsonResponse({'success': False, 'message': 'No enrolled students with a registered QR code.', 'missing': missing}, status=404)
+
+    try:
+        if output_format == 'pdf':
+            stream = get_card_pool().export(stream_qr_cards_pdf(cards))
+        else:
+            stream = get_card_pool().export(stream_qr_cards_zip(cards, missing))
+    except CardExportBusy:
+        response = JsonResponse({'success': False, 'message': 'Other QR card exports are running, try again shortly.', 'busy': True}, status=503)
+        response['Retry-After'] = '5'
+        return response
+
+    logger.info(f"[QR-CARDS] Streaming {len(cards)} {output_format} cards for {label} ({len(missing)} without QR)")
+    content_type = 'application/pdf' if output_format == 'pdf' else 'application/zip'
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="qr_cards_{label}.{output_format}"'
+    response['X-QR-Cards'] = str(len(cards))
+    response['X-QR-Cards-Missing'] = str(len(missing))
+    return response
+
+
 @login_required
 @require_http_methods(["GET"])
 def check_course_registration_status(request):
@@ -12460,8 +12213,8 @@ def api_biometric_enroll_view(request):
             # Handle case where old records have None fingerprint_id (shouldn't happen, but safety check)
             if old_fingerprint_id is None:
                 print(f"\n[WARNING] Existing registration has None fingerprint_id! Assigning new ID...")
-                max_fingerprint_id = BiometricRegistration.objects.aggregate(max_id=Max('fingerprint_id'))['max_id'] or 99
-                fingerprint_id = max(100, max_fingerprint_id + 1)
+                from .slot_allocator import allocate_slot
+                fingerprint_id = allocate_slot(data.get('device_id'), reference=f'student_{target_student.id}')
                 is_replacement = False  # Treat as new enrollment since old ID was invalid
                 is_new_fingerprint = True
             else:
@@ -12483,8 +12236,8 @@ def api_biometric_enroll_view(request):
             # Handle case where existing records have None fingerprint_id
             if biometric_fingerprint_id is None:
                 print(f"\n[WARNING] Existing biometric match has None fingerprint_id! Assigning new ID...")
-                max_fingerprint_id = BiometricRegistration.objects.aggregate(max_id=Max('fingerprint_id'))['max_id'] or 99
-                fingerprint_id = max(100, max_fingerprint_id + 1)
+                from .slot_allocator import allocate_slot
+                fingerprint_id = allocate_slot(data.get('device_id'), reference=f'student_{target_student.id}')
                 is_new_fingerprint = True
                 is_replacement = False
             else:
@@ -12505,15 +12258,14 @@ def api_biometric_enroll_view(request):
             print(f"   (Storage optimized - same biometric across instructors!)")
         else:
             # NEW fingerprint for this student (different finger than any previous)
-            # Use high ID numbers (starting from 100) to avoid conflicts with course_ids (1-99)
-            max_fingerprint_id = BiometricRegistration.objects.aggregate(max_id=Max('fingerprint_id'))['max_id'] or 99
-            fingerprint_id = max(100, max_fingerprint_id + 1)
+            # Free slot from the sensor's slot map (reserved range starts at 100, below are legacy ids)
+            from .slot_allocator import allocate_slot
+            fingerprint_id = allocate_slot(data.get('device_id'), reference=f'student_{target_student.id}')
             is_new_fingerprint = True
             is_replacement = False
             print(f"\nNEW FINGERPRINT (Different finger than any previous):")
             print(f"   Student: {target_student.full_name or target_student.username}")
             print(f"   Instructor: {instructor.full_name or instructor.username}")
-            print(f"   [DEBUG] Max existing fingerprint_id globally: {max_fingerprint_id}")
             print(f"   [DEBUG] New fingerprint_id assigned: {fingerprint_id}")
             print(f"   Courses: {[c.code for c in courses]}")
             print(f"   (Different finger = different ID from previous registrations)")
@@ -12541,7 +12293,10 @@ def api_biometric_enroll_view(request):
             print(f"\n[CLEANUP] Deactivating {old_registrations.count()} old registrations with fingerprint_id {fingerprint_id}")
             for old_reg in old_registrations:
                 print(f"   - Deactivating: {old_reg.course.code}")
+            from .fingerprint_index import invalidate_courses
+            stale_course_ids = list(old_registrations.values_list('course_id', flat=True))
             old_registrations.update(is_active=False)
+            invalidate_courses(stale_course_ids)
             print(f"[CLEANUP] All old registrations deactivated")
         
         # CLEANUP: Fix any existing records with None fingerprint_id for this student
@@ -12554,7 +12309,10 @@ def api_biometric_enroll_view(request):
         if none_registrations.exists():
             print(f"\n[CLEANUP] Found {none_registrations.count()} registrations with None fingerprint_id")
             # Update them to use the current fingerprint_id being assigned
+            from .fingerprint_index import invalidate_courses
+            stale_course_ids = list(none_registrations.values_list('course_id', flat=True))
             none_registrations.update(fingerprint_id=fingerprint_id)
+            invalidate_courses(stale_course_ids)
             print(f"[CLEANUP] Updated them to fingerprint_id: {fingerprint_id}")
         
         # Safety check: ensure fingerprint_id is valid
@@ -12589,7 +12347,8 @@ def api_biometric_enroll_view(request):
                     'student_name': target_student.full_name or target_student.username
                 }
                 
-                success = mqtt_client.publish('biometric/esp32/enroll/request', enrollment_message)
+                from dashboard.biometric_devices import device_topic
+                success = mqtt_client.publish(device_topic(data.get('device_id'), 'enroll/request'), enrollment_message)
                 if success:
                     logger.info(f"[MQTT ENROLLMENT] Enrollment request published to ESP32")
                     logger.info(f"[MQTT ENROLLMENT] Slot {fingerprint_id} is now waiting for 3 finger scans")
@@ -12655,6 +12414,10 @@ def api_biometric_enroll_view(request):
         
         # ALL COURSES REGISTERED SUCCESSFULLY
         logger.info(f"Biometric registration COMPLETED for student {target_student.id} in {len(registered_courses)} course(s): {[c.code for c in registered_courses]}")
+        if is_new_fingerprint:
+            # The registrations hold the slot now
+            from .slot_allocator import release_reservation
+            release_reservation(f'student_{target_student.id}')
         
         course_names = ', '.join([f'{c.code} - {c.name}' for c in registered_courses])
         
@@ -12681,7 +12444,6 @@ def api_biometric_enroll_view(request):
         mqtt_sent = False
         try:
             from dashboard.mqtt_client import get_mqtt_client
-            import time
             
             mqtt_client = get_mqtt_client()
             
@@ -12700,45 +12462,25 @@ def api_biometric_enroll_view(request):
                 logger.info(f"[MQTT] Template ID: {biometric_template_id}")
                 logger.info(f"[MQTT] Message: {json.dumps(completion_msg)}")
                 
-                # CRITICAL: Publish with QoS=1 (at least once delivery) with automatic retries
+                # CRITICAL: Publish with QoS=1 (at least once delivery)
                 # Publish to BOTH topics for maximum reliability
-                # Retry up to 3 times if initial publish fails
-                max_retries = 3
-                for attempt in range(1, max_retries + 1):
-                    try:
-                        result1 = mqtt_client.publish('biometric/esp32/enroll/response', completion_msg, qos=1)
-                        result2 = mqtt_client.publish('biometric/esp32/enroll/completion', completion_msg, qos=1)
-                        
-                        logger.info(f"[MQTT] Attempt {attempt}/{max_retries}:")
-                        logger.info(f"[MQTT]   - Published to biometric/esp32/enroll/response")
-                        logger.info(f"[MQTT]   - Published to biometric/esp32/enroll/completion")
-                        
-                        # Both publishes should succeed
-                        if result1 and result2:
-                            logger.info(f"[MQTT] Success on attempt {attempt}")
-                            mqtt_sent = True
-                            break
-                        else:
-                            logger.warning(f"[MQTT] Publish failed, retrying...")
-                            time.sleep(0.3)  # Wait before retry
-                            
-                    except Exception as publish_error:
-                        logger.error(f"[MQTT] Attempt {attempt} failed: {str(publish_error)}")
-                        if attempt < max_retries:
-                            time.sleep(0.3)
-                            continue
-                        else:
-                            raise
-                
-                # Wait a moment for MQTT to process
-                time.sleep(0.5)
+                # The client queues both across broker blips and resends on reconnect, so no retry loop here
+                # The sensor that ran this enrollment (biometric_data carries its template id)
+                from dashboard.biometric_devices import device_topic
+                from dashboard.enrollment_scheduler import device_for_template
+                device_id = device_for_template(biometric_data)
+                result1 = mqtt_client.publish(device_topic(device_id, 'enroll/response'), completion_msg, qos=1)
+                result2 = mqtt_client.publish(device_topic(device_id, 'enroll/completion'), completion_msg, qos=1)
+                logger.info(f"[MQTT]   - Published to {device_topic(device_id, 'enroll/response')}")
+                logger.info(f"[MQTT]   - Published to {device_topic(device_id, 'enroll/completion')}")
+                mqtt_sent = bool(result1 and result2)
                 
                 if mqtt_sent:
                     logger.info(f"[MQTT] CRITICAL: ESP32 should now receive enrollment_saved and reset enrollmentInProgress = false")
                     logger.info(f"[MQTT] Next student can immediately start enrollment!")
                     logger.info(f"[MQTT] Enrollment completion sent to ESP32 for fingerprint {fingerprint_id} (QoS=1, delivered)")
                 else:
-                    logger.warning(f"[MQTT] WARNING: Could not send enrollment_saved to ESP32 after {max_retries} attempts")
+                    logger.warning(f"[MQTT] WARNING: Could not send enrollment_saved to ESP32")
             else:
                 logger.warning(f"[MQTT] MQTT client not connected - enrollment saved but ESP32 not notified")
             
@@ -12790,18 +12532,22 @@ def api_biometric_enroll_view(request):
 def api_check_biometric_view(request):
     """
     API endpoint to check if a student has existing biometric registered for given courses.
-    Returns whether student already has a fingerprint registered.
+    Returns whether student already has a fingerprint registered and, when biometric_data
+    is sent, whether another student registered the same fingerprint in those courses
+    (indexed digest lookup).
     
     Expected POST data:
     {
         'student_id': '<string>',  # School ID
-        'course_ids': [<int>, <int>, ...]  # List of course IDs
+        'course_ids': [<int>, <int>, ...],  # List of course IDs
+        'biometric_data': '<string>'  # Optional: fingerprint template to check for duplicates
     }
     """
     try:
         data = json.loads(request.body)
         student_school_id = data.get('student_id', '').strip()
         course_ids = data.get('course_ids', [])
+        biometric_data = (data.get('biometric_data') or '').strip()
         
         if not student_school_id or not course_ids:
             return JsonResponse({
@@ -12839,9 +12585,20 @@ def api_check_biometric_view(request):
             if existing_reg and existing_reg.course:
                 instructor_name = existing_reg.course.instructor.get_full_name() or existing_reg.course.instructor.username
         
+        # Same fingerprint already registered by another student in one of these courses
+        is_duplicate = False
+        if biometric_data:
+            from .biometric_utils import biometric_digest
+            is_duplicate = BiometricRegistration.objects.filter(
+                biometric_digest=biometric_digest(biometric_data),
+                course_id__in=course_ids,
+                is_active=True
+            ).exclude(student=student).exists()
+        
         return JsonResponse({
             'success': True,
             'has_existing_biometric': has_existing,
+            'is_duplicate': is_duplicate,
             'instructor_name': instructor_name,
             'message': 'Check completed successfully'
         })
@@ -12893,19 +12650,18 @@ def api_biometric_verify_view(request):
                 'matched_student': None
             }, status=404)
         
-        # Find matching biometric registration for this course
-        from .biometric_utils import verify_biometric_match
-        biometric_registrations = BiometricRegistration.objects.filter(
+        # Find matching biometric registration for this course (indexed digest lookup)
+        from .biometric_utils import biometric_digest
+        bio_reg = BiometricRegistration.objects.filter(
+            biometric_digest=biometric_digest(biometric_data),
             course=course,
             is_active=True
-        ).select_related('student')
+        ).select_related('student').first()
         
         matched_student = None
-        for bio_reg in biometric_registrations:
-            if verify_biometric_match(bio_reg.biometric_data, biometric_data):
-                matched_student = bio_reg.student
-                logger.info(f"Biometric match found for student {matched_student.id} in course {course.id}")
-                break
+        if bio_reg:
+            matched_student = bio_reg.student
+            logger.info(f"Biometric match found for student {matched_student.id} in course {course.id}")
         
         if matched_student:
             return JsonResponse({
@@ -13610,10 +13366,45 @@ def api_health_check(request):
     GET /dashboard/api/health-check/
     Returns JSON with server status.
     """
+    from .fingerprint_index import fingerprint_index_stats
+    from .mqtt_ingest import mqtt_ingest_stats
     return JsonResponse({
         'status': 'ok',
         'message': 'Django server is reachable',
-        'timestamp': timezone.now().isoformat()
+        'timestamp': timezone.now().isoformat(),
+        'fingerprint_index': fingerprint_index_stats(),
+        'mqtt_ingest': mqtt_ingest_stats(),
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_device_health(request):
+    """
+    Sensor health for instructors and admins.
+    GET /dashboard/api/device-health/?hours=1
+    Returns per-sensor message/detection rates, last seen, uptime, reconnects and RSSI
+    over the last `hours` (1-168), plus the recent RSSI trend when served by the ingest process,
+    and used/free fingerprint slots per sensor.
+    """
+    from .device_telemetry import device_health, recent_rssi
+    user = request.user
+    if not (user.is_teacher or user.is_admin or user.is_superuser):
+        return JsonResponse({'success': False, 'message': 'You are not authorized to view sensor health.'}, status=403)
+    try:
+        hours = max(1, min(int(request.GET.get('hours', 1)), 168))
+    except (TypeError, ValueError):
+        hours = 1
+    from .slot_allocator import slot_stats
+    devices = device_health(hours)
+    for device in devices:
+        device['rssi_trend'] = recent_rssi(device['device_id'])
+    return JsonResponse({
+        'success': True,
+        'hours': hours,
+        'timestamp': timezone.now().isoformat(),
+        'devices': devices,
+        'slots': slot_stats(),
     })
 
 
@@ -14111,8 +13902,8 @@ def api_esp32_config(request):
 
 # ==================== BIOMETRIC ENROLLMENT MANAGEMENT APIs ====================
 
-# In-memory store for current enrollment states
-_enrollment_states = {}
+# Shared enrollment state store (visible to every worker process)
+from .enrollment_state import _enrollment_states
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -14302,9 +14093,9 @@ def api_save_enrollment(request):
 
 
 
-# In-memory store for current enrollment states (in production, use Redis or database)
+# Shared enrollment state store (see enrollment_state.py)
 
-_enrollment_states = {}
+from .enrollment_state import _enrollment_states
 
 
 
@@ -14436,13 +14227,16 @@ def api_start_enrollment(request):
             existing_slot = None
 
         # Prevent legacy/unsafe slot reuse (e.g., slot 1) by forcing our reserved range >= 100.
+        reserved_slot = False
         if existing_slot is not None and existing_slot >= 100:
             fingerprint_slot = existing_slot
             print(f"✓ REUSING fingerprint_id: {fingerprint_slot} (student already has fingerprint registered)")
             logger.info(f"[ENROLLMENT] REUSING fingerprint_id: {fingerprint_slot} for student {user.full_name}")
         else:
-            max_existing_slot = BiometricRegistration.objects.aggregate(max_id=Max('fingerprint_id'))['max_id'] or 99
-            fingerprint_slot = max(100, int(max_existing_slot) + 1)
+            from .slot_allocator import allocate_slot
+            # Recorded as a reservation: a retry gets the same slot, and it is collected if never registered
+            fingerprint_slot = allocate_slot(data.get('device_id'), reference=f'student_{user.id}')
+            reserved_slot = True
             print(f"✓ ALLOCATING NEW fingerprint_id: {fingerprint_slot} for student {user.full_name}")
             logger.info(f"[ENROLLMENT] ALLOCATING NEW fingerprint_id: {fingerprint_slot} for student {user.full_name}")
         
@@ -14523,6 +14317,10 @@ def api_start_enrollment(request):
             print(f"✗ ERROR: Could not reach any ESP32 address. Last error: {last_error}")
             logger.error(f"[ENROLLMENT] Could not reach ESP32 at any address. Last error: {last_error}")
             _enrollment_states[enrollment_id]['message'] = f'Sensor offline - tried multiple addresses. Last error: {last_error}'
+            if reserved_slot:
+                # Nothing will be enrolled into the slot; the retry allocates again
+                from .slot_allocator import release_reservation
+                release_reservation(f'student_{user.id}')
         
         response_data = {
             'success': True,
@@ -14576,7 +14374,7 @@ def api_enrollment_status(request, enrollment_id):
 
             state = _enrollment_states[enrollment_id]
 
-            return JsonResponse({
+            response = {
 
                 'status': state['status'],
 
@@ -14588,7 +14386,19 @@ def api_enrollment_status(request, enrollment_id):
 
                 'error': state.get('error', None)
 
-            })
+            }
+
+            # Queue position / ETA while waiting for a sensor, and the sensor once assigned
+
+            from .enrollment_scheduler import queue_status
+
+            queue = queue_status(enrollment_id)
+
+            if queue:
+
+                response.update(queue)
+
+            return JsonResponse(response)
 
         else:
 
@@ -14644,7 +14454,11 @@ def api_enrollment_updates(request, enrollment_id):
 
         
 
-        state = _enrollment_states[enrollment_id]
+        state = dict(_enrollment_states[enrollment_id])
+
+        from .enrollment_scheduler import queue_status
+
+        state.update(queue_status(enrollment_id) or {})
 
         
 
@@ -15027,7 +14841,10 @@ def api_biometric_confirm_fingerprint_view(request):
             if none_registrations.exists():
                 print(f"\n[CLEANUP] Found {none_registrations.count()} registrations with None fingerprint_id")
                 # Update them to use the fingerprint_id being confirmed
+                from .fingerprint_index import invalidate_courses
+                stale_course_ids = list(none_registrations.values_list('course_id', flat=True))
                 none_registrations.update(fingerprint_id=fingerprint_id)
+                invalidate_courses(stale_course_ids)
                 print(f"[CLEANUP] Updated them to fingerprint_id: {fingerprint_id}")
             
             # Debug: Show all fingerprint registrations for this student
@@ -15384,337 +15201,28 @@ def instructor_get_biometric_pending_view(request):
             print(f"[BIOMETRIC POLL] ✗ Course not found: {course_id}")
             return JsonResponse({'pending': []})
         
-        # Get all biometric registrations for this course that are active.
-        # Also include sibling sections of the same course so fingerprint slots resolve correctly
-        # even if the student registered under a different section.
-        sibling_courses = Course.objects.filter(
-            instructor=course.instructor,
-            code=course.code,
-            name=course.name,
-            semester=course.semester,
-            school_year=course.school_year,
-            is_active=True,
-            deleted_at__isnull=True,
-            is_archived=False
-        )
-
-        registrations = BiometricRegistration.objects.filter(
-            course__in=sibling_courses,
-            is_active=True
-        ).select_related('student', 'course')
-        
-        print(f"[BIOMETRIC POLL] ===== BIOMETRIC REGISTRATIONS FOR COURSE {course.code} =====")
-        print(f"[BIOMETRIC POLL] Total registrations in database for this course: {registrations.count()}")
-        for reg in registrations:
-            print(f"[BIOMETRIC POLL]   - {reg.student.full_name}: Fingerprint ID={reg.fingerprint_id}, Active={reg.is_active}")
-        print(f"[BIOMETRIC POLL] =====")
-        
-        # Create a mapping of fingerprint_id(int) -> (student, registration)
-        fingerprint_map = {}
-        for reg in registrations:
-            if reg.fingerprint_id is None:
-                continue
-
-            try:
-                fp_key = int(reg.fingerprint_id)
-            except Exception:
-                continue
-
-            # Prefer the registration for the actively scanned course if duplicates exist.
-            if fp_key in fingerprint_map:
-                try:
-                    existing_reg = fingerprint_map[fp_key].get('registration')
-                    if existing_reg and getattr(existing_reg, 'course_id', None) == course.id:
-                        continue
-                except Exception:
-                    pass
-
-            fingerprint_map[fp_key] = {
-                'student': reg.student,
-                'registration': reg,
-                'fingerprint_id': reg.fingerprint_id
-            }
-            print(f"[BIOMETRIC POLL]   - Student: {reg.student.full_name}, Fingerprint ID: {reg.fingerprint_id}")
+        # Fingerprint slot -> student for the whole course group (sibling sections included)
+        from .biometric_stream import build_fingerprint_map, resolve_detection
+        fingerprint_map = build_fingerprint_map(course)
         
         logger.info(f"[PENDING] Course {course.code} has {len(fingerprint_map)} registered fingerprints: {list(fingerprint_map.keys())}")
-        print(f"[BIOMETRIC POLL] Fingerprint map: {fingerprint_map}")
-        
-        # Get pending detections from cache - USE ATTENDANCE QUEUE
-        detections_queue_key = "fingerprint_detections_queue_attendance"
-        queue = cache.get(detections_queue_key, [])
         
-        print(f"[BIOMETRIC POLL] Cache queue size: {len(queue)}")
-        print(f"[BIOMETRIC POLL] Queue contents: {queue}")
+        # New detections from the append-only log, read with this scanner's own cursor.
+        # The page sends ?after=<cursor>; older pages fall back to a cursor kept per session.
+        from .detection_log import parse_cursor, read_detections
+        cursor_cache_key = f"fp_detection_cursor:{request.session.session_key}:{course.id}"
+        after = parse_cursor(request.GET.get('after'))
+        if after is None:
+            after = parse_cursor(cache.get(cursor_cache_key))
+        queue, next_cursor = read_detections('attendance', after)
+        cache.set(cursor_cache_key, next_cursor, 3600)
         
-        pending_list = []
-        processed_keys = []
+        print(f"[BIOMETRIC POLL] Detections after cursor {after}: {len(queue)}")
         
-        print(f"[BIOMETRIC POLL] ===== PROCESSING DETECTIONS =====")
-        print(f"[BIOMETRIC POLL] Total detections to process: {len(queue)}")
-        
-        # Process each detection
-        for idx, detection in enumerate(queue):
-            # Some devices send retry/hint events using fingerprint_id=-2.
-            # Always treat this as a retry (never as not-registered), even if match_type is missing.
-            fingerprint_slot_raw = detection.get('fingerprint_id')
-            try:
-                fingerprint_slot_int = int(fingerprint_slot_raw)
-            except Exception:
-                fingerprint_slot_int = None
-
-            if fingerprint_slot_int == -2:
-                pending_list.append({
-                    'fingerprint_id': -2,
-                    'student_id': None,
-                    'student_name': 'Place finger again',
-                    'error': 'retry',
-                    'reason': detection.get('reason'),
-                    'confidence': detection.get('confidence', 0),
-                    'timestamp': detection.get('timestamp')
-                })
-                processed_keys.append(detection.get('key'))
-                continue
-
-            if detection.get('match_type') == 'hint':
-                fingerprint_slot_raw = detection.get('fingerprint_id')
-                try:
-                    fingerprint_slot = int(fingerprint_slot_raw)
-                except Exception:
-                    fingerprint_slot = fingerprint_slot_raw
-
-                if fingerprint_slot == -2:
-                    pending_list.append({
-                        'fingerprint_id': -2,
-                        'student_id': None,
-                        'student_name': 'Place finger again',
-                        'error': 'retry',
-                        'reason': detection.get('reason'),
-                        'confidence': detection.get('confidence', 0),
-                        'timestamp': detection.get('timestamp')
-                    })
-                    processed_keys.append(detection.get('key'))
-                    continue
-
-            # Check if this is a hardware-matched fingerprint (ACCURATE)
-            if detection.get('match_type') == 'hardware':
-                fingerprint_slot_raw = detection.get('fingerprint_id')
-                try:
-                    fingerprint_slot = int(fingerprint_slot_raw)
-                except Exception:
-                    fingerprint_slot = fingerprint_slot_raw
-                confidence = detection.get('confidence', 0)
-                timestamp = detection.get('timestamp')
-                detection_key = detection.get('key')
-
-                # Sentinel for "unregistered" published by ESP32
-                if fingerprint_slot == -1:
-                    logger.warning(f"[PENDING] ⚠ UNREGISTERED (hardware) - Fingerprint not found in sensor database")
-                    pending_list.append({
-                        'fingerprint_id': -1,
-                        'student_id': None,
-                        'student_name': 'Unregistered',
-                        'error': 'unregistered_fingerprint',
-                        'confidence': confidence,
-                        'timestamp': timestamp
-                    })
-                    processed_keys.append(detection_key)
-                    continue
-                
-                print(f"[BIOMETRIC POLL] [{idx}] ✓ HARDWARE MATCH - Fingerprint ID: {fingerprint_slot}, Confidence: {confidence}")
-                logger.info(f"[PENDING] Hardware-matched fingerprint: ID={fingerprint_slot}, confidence={confidence}")
-                
-                # Look up student by fingerprint_id (100% accurate - from hardware sensor)
-                if fingerprint_slot in fingerprint_map:
-                    student_info = fingerprint_map[fingerprint_slot]
-                    student = student_info['student']
-                    
-                    print(f"[BIOMETRIC POLL] ✓ MATCHED! Fingerprint {fingerprint_slot} = Student {student.full_name}")
-                    
-                    pending_list.append({
-                        'fingerprint_id': fingerprint_slot,
-                        'fingerprint_template_id': student_info.get('fingerprint_id', ''),
-                        'student_id': student.id,
-                        'student_name': student.full_name or student.username,
-                        'student_email': student.email,
-                        'confidence': confidence,
-                        'timestamp': timestamp
-                    })
-                    
-                    logger.info(f"[PENDING] ✓ ACCURATE MATCH - Fingerprint {fingerprint_slot} belongs to Student: {student.full_name}")
-                    processed_keys.append(detection_key)
-                else:
-                    # Fingerprint slot not found in this course
-                    print(f"[BIOMETRIC POLL] ✗ Fingerprint ID {fingerprint_slot} not enrolled in this course")
-                    owner_reg = BiometricRegistration.objects.filter(
-                        fingerprint_id=fingerprint_slot,
-                        is_active=True
-                    ).select_related('student', 'course').first()
-
-                    if owner_reg:
-                        pending_list.append({
-                            'fingerprint_id': fingerprint_slot,
-                            'student_id': owner_reg.student.id,
-                            'student_name': owner_reg.student.full_name or owner_reg.student.username,
-                            'student_email': getattr(owner_reg.student, 'email', ''),
-                            'confidence': confidence,
-                            'timestamp': timestamp,
-                            'error': 'not_registered_for_course'
-                        })
-                    else:
-                        pending_list.append({
-                            'fingerprint_id': fingerprint_slot,
-                            'student_id': None,
-                            'student_name': f'Fingerprint ID {fingerprint_slot} not enrolled',
-                            'confidence': confidence,
-                            'timestamp': timestamp,
-                            'error': 'not_registered_for_course'
-                        })
-                    processed_keys.append(detection_key)
-                continue
-            
-            # Handle legacy raw fingerprint detections
-            if detection.get('needs_matching'):
-                print(f"[BIOMETRIC POLL] [{idx}] Raw fingerprint detection - needs software matching")
-                print(f"[BIOMETRIC POLL]     Quality: {detection.get('quality')}")
-                
-                # Raw fingerprint from ESP32 - try to identify which student it belongs to
-                # Strategy: If only ONE student in this course has biometric enrollment,
-                # it's likely that student who placed their finger
-                
-                students_with_biometric = list(fingerprint_map.values())
-                
-                if len(students_with_biometric) == 1:
-                    # Only one student has biometric enrollment - must be them!
-                    student_info = students_with_biometric[0]
-                    student = student_info['student']
-                    
-                    print(f"[BIOMETRIC POLL] ✓ MATCHED! Only 1 student enrolled - must be {student.full_name}")
-                    
-                    pending_list.append({
-                        'fingerprint_id': student_info['fingerprint_id'],
-                        'fingerprint_template_id': student_info.get('fingerprint_id', ''),
-                        'student_id': student.id,
-                        'student_name': student.full_name or student.username,
-                        'student_email': student.email,
-                        'confidence': detection.get('quality', 0),
-                        'timestamp': detection.get('timestamp')
-                    })
-                    
-                elif len(students_with_biometric) > 1:
-                    # Multiple students with biometric - we need more info to match
-                    # For now, show the student who most recently had their fingerprint enrolled
-                    # (most recent = highest fingerprint_id)
-                    most_recent = max(students_with_biometric, 
-                                     key=lambda x: x.get('fingerprint_id', 0))
-                    student = most_recent['student']
-                    
-                    print(f"[BIOMETRIC POLL] ⚠ Multiple students enrolled - guessing {student.full_name} (most recent)")
-                    
-                    pending_list.append({
-                        'fingerprint_id': most_recent['fingerprint_id'],
-                        'fingerprint_template_id': most_recent.get('fingerprint_id', ''),
-                        'student_id': student.id,
-                        'student_name': student.full_name or student.username,
-                        'student_email': student.email,
-                        'confidence': detection.get('quality', 0),
-                        'timestamp': detection.get('timestamp')
-                    })
-                else:
-                    # No students with biometric enrollment in this course
-                    print(f"[BIOMETRIC POLL] ✗ No students with biometric enrollment in this course")
-                    pending_list.append({
-                        'fingerprint_id': -1,
-                        'student_id': None,
-                        'student_name': 'No biometric students enrolled',
-                        'confidence': 0,
-                        'timestamp': detection.get('timestamp'),
-                        'error': 'unregistered_fingerprint'
-                    })
-                
-                processed_keys.append(detection.get('key'))
-                continue
-            
-            # Original detection processing for already-matched fingerprints
-            fingerprint_slot = detection.get('fingerprint_id')
-            confidence = detection.get('confidence', 0)
-            timestamp = detection.get('timestamp')
-            detection_key = detection.get('key')
-            
-            print(f"[BIOMETRIC POLL] [{idx}] Fingerprint ID: {fingerprint_slot}, Confidence: {confidence}")
-            logger.info(f"[PENDING] Checking detection - Fingerprint ID: {fingerprint_slot}, Confidence: {confidence}")
-            
-            # Check if this fingerprint is registered for this course
-            if fingerprint_slot in fingerprint_map:
-                student_info = fingerprint_map[fingerprint_slot]
-                student = student_info['student']
-                
-                print(f"[BIOMETRIC POLL] ✓ MATCH! Fingerprint {fingerprint_slot} = Student {student.full_name}")
-                
-                pending_list.append({
-                    'fingerprint_id': fingerprint_slot,
-                    'fingerprint_template_id': student_info.get('fingerprint_id', ''),
-                    'student_id': student.id,
-                    'student_name': student.full_name or student.username,
-                    'student_email': student.email,
-                    'confidence': confidence,
-                    'timestamp': timestamp
-                })
-                
-                logger.info(f"[PENDING] ✓ MATCH FOUND - Fingerprint ID {fingerprint_slot} belongs to Student: {student.full_name}")
-                processed_keys.append(detection_key)
-                
-            elif fingerprint_slot == -1:
-                # Unregistered fingerprint (sensor couldn't match to any enrolled fingerprint)
-                logger.warning(f"[PENDING] ⚠ UNREGISTERED - Fingerprint not found in sensor database")
-                pending_list.append({
-                    'fingerprint_id': -1,
-                    'student_id': None,
-                    'student_name': 'Unregistered',
-                    'error': 'unregistered_fingerprint',
-                    'confidence': confidence,
-                    'timestamp': timestamp
-                })
-                processed_keys.append(detection_key)
-            else:
-                # Fingerprint detected but NOT registered for THIS COURSE
-                # Check if it's registered for another course
-                other_registrations = BiometricRegistration.objects.filter(
-                    fingerprint_id=fingerprint_slot,
-                    is_active=True
-                ).select_related('student', 'course')
-                
-                if other_registrations.exists():
-                    reg = other_registrations.first()
-                    logger.warning(f"[PENDING] ⚠ NOT THIS COURSE - Fingerprint ID {fingerprint_slot} registered for {reg.course.code}, not {course.code}")
-                    # Return owner info but mark as not registered for this course (frontend will not record attendance)
-                    pending_list.append({
-                        'fingerprint_id': fingerprint_slot,
-                        'student_id': reg.student.id,
-                        'student_name': reg.student.full_name or reg.student.username,
-                        'student_email': getattr(reg.student, 'email', ''),
-                        'confidence': confidence,
-                        'timestamp': timestamp,
-                        'error': 'not_registered_for_course'
-                    })
-                else:
-                    logger.warning(f"[PENDING] ⚠ NOT REGISTERED - Fingerprint ID {fingerprint_slot} not found in any registration")
-                    # Treat as unregistered for this course
-                    pending_list.append({
-                        'fingerprint_id': fingerprint_slot,
-                        'student_id': None,
-                        'student_name': 'Not registered for this course',
-                        'error': 'not_registered_for_course',
-                        'confidence': confidence,
-                        'timestamp': timestamp
-                    })
-                
-                processed_keys.append(detection_key)
-        
-        # Remove processed detections from queue (clean up)
-        if processed_keys:
-            queue = [d for d in queue if d.get('key') not in processed_keys]
-            cache.set("fingerprint_detections_queue_attendance", queue, 60)
-            logger.info(f"[PENDING] Removed {len(processed_keys)} processed detections, {len(queue)} remaining in queue")
+        # Nothing is removed from the log: the cursor moves past what this scanner has seen
+        pending_list = [resolve_detection(detection, course, fingerprint_map) for detection in queue]
+        if pending_list:
+            logger.info(f"[PENDING] Delivered {len(pending_list)} detections, cursor now {next_cursor}")
         
         logger.info(f"[PENDING] ✓ RETURNING {len(pending_list)} pending detections for course {course.code} ({course_id})")
         for item in pending_list:
@@ -15733,16 +15241,67 @@ def instructor_get_biometric_pending_view(request):
         print(f"Pending items: {len(pending_list)}")
         for item in pending_list:
             print(f"  - {item.get('student_name')} (Fingerprint {item.get('fingerprint_id')})")
-        print(f"Cache queue size: {len(queue)}")
+        print(f"Detections read: {len(queue)}, cursor: {next_cursor}")
         print(f"===\n")
         
-        return JsonResponse({'pending': pending_list})
+        return JsonResponse({'pending': pending_list, 'cursor': next_cursor})
         
     except Exception as e:
         logger.error(f"Error getting pending biometric scans: {str(e)}", exc_info=True)
         return JsonResponse({'pending': []})
 
 
+@login_required
+@require_http_methods(["GET"])
+def instructor_biometric_stream_view(request):
+    """
+    Long-poll push channel for the instructor biometric scanner (replaces polling
+    biometric-pending every 2 s and the student lists every 3 s).
+    Held open until there are new fingerprint detections or scanned-student changes
+    for the course group, or BIOMETRIC_STREAM_TIMEOUT seconds pass.
+    
+    Query parameters:
+    - course_id: int (required)
+    - after: detection cursor from the previous response (optional)
+    - since: scanned-student cursor from the previous response (optional; omit for a full snapshot)
+    - device_id: sensor the scanner uses (optional; default: the course group's armed session's sensor)
+    
+    Returns:
+    {
+        'success': True,
+        'pending': [...],   # Same items as instructor_get_biometric_pending_view
+        'students': [...],  # Changed rows of instructor_get_biometric_students_view, keyed by student_id
+        'cursor': int,
+        'since': str,
+        'auto_record': bool  # Server records matches itself; the page only displays them
+    }
+    """
+    try:
+        if not request.user.is_teacher:
+            return JsonResponse({'success': False, 'message': 'Only instructors can access this'}, status=403)
+        
+        try:
+            course = Course.objects.get(id=int(request.GET.get('course_id')), instructor=request.user)
+        except (Course.DoesNotExist, TypeError, ValueError):
+            return JsonResponse({'success': False, 'message': 'Course not found'}, status=404)
+        
+        from .biometric_autorecord import auto_record_armed
+        from .biometric_stream import parse_since, wait_for_scanner_updates
+        from .detection_log import parse_cursor
+        
+        updates = wait_for_scanner_updates(
+            course,
+            after=parse_cursor(request.GET.get('after')),
+            since=parse_since(request.GET.get('since')),
+            device_id=request.GET.get('device_id') or None,
+        )
+        return JsonResponse({'success': True, **updates, 'auto_record': auto_record_armed(course)})
+    
+    except Exception as e:
+        logger.error(f"[BIOMETRIC-STREAM] Error: {str(e)}", exc_info=True)
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)
+
+
 @login_required
 @require_http_methods(["POST"])
 def instructor_biometric_scan_attendance_view(request):
@@ -15791,33 +15350,13 @@ def instructor_biometric_scan_attendance_view(request):
                 'message': 'Course not found'
             }, status=404)
         
-        # Find student with matching fingerprint registration.
+        # Find student with matching fingerprint registration (cached slot index).
         # Prefer this specific course, but allow sibling sections so a student doesn't
         # get falsely flagged as "not registered" due to section mismatch.
-        biometric_reg = BiometricRegistration.objects.filter(
-            course=course,
-            fingerprint_id=fingerprint_id,
-            is_active=True
-        ).select_related('student', 'course').first()
-
-        if not biometric_reg:
-            sibling_courses = Course.objects.filter(
-                instructor=course.instructor,
-                code=course.code,
-                name=course.name,
-                semester=course.semester,
-                school_year=course.school_year,
-                is_active=True,
-                deleted_at__isnull=True,
-                is_archived=False
-            )
-            biometric_reg = BiometricRegistration.objects.filter(
-                course__in=sibling_courses,
-                fingerprint_id=fingerprint_id,
-                is_active=True
-            ).select_related('student', 'course').first()
+        from .fingerprint_index import lookup_fingerprint
+        fingerprint_info = lookup_fingerprint(course, fingerprint_id)
         
-        if not biometric_reg:
+        if not fingerprint_info:
             # SECURITY: Check if this fingerprint_id exists but for a DIFFERENT student
             # (should never happen due to unique_student_fingerprint_id constraint, but validate anyway)
             other_student_reg = BiometricRegistration.objects.filter(
@@ -15839,12 +15378,16 @@ def instructor_biometric_scan_attendance_view(request):
             }, status=403)
         
         # Hardware matching is performed on the ESP32/sensor; for attendance we rely on
-        # fingerprint_id -> student mapping. biometric_data may be empty for some legacy
-        # registrations and should not block attendance.
-        if not biometric_reg.biometric_data:
-            logger.warning(f"[BIOMETRIC WARNING] Registration {biometric_reg.id} has no biometric_data stored; proceeding with hardware-matched fingerprint_id={fingerprint_id}")
-
-        student = biometric_reg.student
+        # fingerprint_id -> student mapping, so biometric_data (empty for some legacy
+        # registrations) is not loaded here.
+        try:
+            student = CustomUser.objects.get(id=fingerprint_info['student_id'])
+        except CustomUser.DoesNotExist:
+            logger.warning(f"[BIOMETRIC] Registration {fingerprint_info['registration_id']} points to a missing student")
+            return JsonResponse({
+                'success': False,
+                'message': 'Fingerprint not registered for this course'
+            }, status=403)
         
         # SECURITY: Verify student is actually enrolled in this course
         try:
@@ -16148,45 +15691,20 @@ def fingerprint_detection_view(request):
         
         logger.info(f"[DETECTION] Fingerprint detected - ID: {fingerprint_id}, Confidence: {confidence}, Mode: {detection_mode}")
         
-        # Use different cache keys for different modes
-        if detection_mode == 'registration':
-            detections_queue_key = "fingerprint_detections_queue_registration"
-        else:  # attendance
-            detections_queue_key = "fingerprint_detections_queue_attendance"
-        
-        print(f"[DETECTION] Using queue key: {detections_queue_key}")
-        
-        # Create a unique key for this detection
-        detection_key = f"fingerprint_detection_{detection_mode}_{fingerprint_id}_{int(timezone.now().timestamp() * 1000)}"
-        
-        # Store detection data with 30-second expiry
-        detection_data = {
-            'fingerprint_id': fingerprint_id,
-            'confidence': confidence,
-            'timestamp': timezone.now().isoformat(),
-            'match_type': match_type,
-            'reason': reason
-        }
-        cache.set(detection_key, detection_data, 30)
-        
-        # Maintain a queue of recent detections for this mode
-        queue = cache.get(detections_queue_key, [])
-        queue.append({
-            'fingerprint_id': fingerprint_id,
-            'confidence': confidence,
-            'timestamp': timezone.now().isoformat(),
-            'key': detection_key,
-            'match_type': match_type,
-            'reason': reason
-        })
-        
-        # Keep only last 50 detections
-        queue = queue[-50:]
-        cache.set(detections_queue_key, queue, 60)  # Cache for 1 minute
-        
-        logger.info(f"[DETECTION] Stored {detection_mode} detection - Queue size: {len(queue)}")
-        print(f"[DETECTION] Stored in cache! Queue now has {len(queue)} items")
-        print(f"[DETECTION] Queue contents: {queue}\n")
+        # Append-only log; pollers read it with their own cursor (see detection_log.py)
+        from .biometric_devices import BIOMETRIC_DEFAULT_DEVICE_ID
+        from .detection_log import append_detection
+        entry = append_detection(
+            detection_mode, fingerprint_id, confidence, match_type=match_type, reason=reason,
+            device_id=data.get('device_id') or BIOMETRIC_DEFAULT_DEVICE_ID,
+        )
+
+        logger.info(f"[DETECTION] Logged {detection_mode} detection seq={entry['seq']}")
+        print(f"[DETECTION] Logged {detection_mode} detection seq={entry['seq']}\n")
+
+        if detection_mode == 'attendance' and fingerprint_id >= 0:
+            from .biometric_autorecord import submit_detection
+            submit_detection(entry)
         
         return JsonResponse({
             'success': True,
@@ -16222,27 +15740,30 @@ def student_fingerprint_pending_view(request):
         }, status=405)
     
     try:
-        # Get the registration queue
-        detections_queue_key = "fingerprint_detections_queue_registration"
-        queue = cache.get(detections_queue_key, [])
-        
-        # Get detections that haven't been processed yet
+        from .detection_log import parse_cursor, read_detections, recent_detections
+
+        # Preferred: ?after=<cursor> from the previous response
+        after = parse_cursor(request.GET.get('after'))
         last_check = request.GET.get('last_check')
         
-        pending_detections = []
-        if last_check:
-            try:
-                last_check_time = float(last_check)
-                for detection in queue:
-                    detection_time = datetime.datetime.fromisoformat(detection['timestamp']).timestamp()
-                    if detection_time > last_check_time:
-                        pending_detections.append(detection)
-            except (ValueError, KeyError):
-                # If parsing fails, return all detections
-                pending_detections = queue[-10:]  # Last 10 detections
+        if after is not None:
+            pending_detections, cursor = read_detections('registration', after)
         else:
-            # First check - return last 5 detections
-            pending_detections = queue[-5:]
+            queue, cursor = recent_detections('registration')
+            pending_detections = []
+            if last_check:
+                try:
+                    last_check_time = float(last_check)
+                    for detection in queue:
+                        detection_time = datetime.fromisoformat(detection['timestamp']).timestamp()
+                        if detection_time > last_check_time:
+                            pending_detections.append(detection)
+                except (ValueError, KeyError):
+                    # If parsing fails, return all detections
+                    pending_detections = queue[-10:]  # Last 10 detections
+            else:
+                # First check - return last 5 detections
+                pending_detections = queue[-5:]
         
         logger.info(f"[STUDENT] Fingerprint pending check - {len(pending_detections)} detections found")
         
@@ -16250,6 +15771,7 @@ def student_fingerprint_pending_view(request):
             'success': True,
             'detections': pending_detections,
             'count': len(pending_detections),
+            'cursor': cursor,
             'timestamp': timezone.now().isoformat()
         })
         
@@ -16328,14 +15850,16 @@ def instructor_start_biometric_detection_view(request):
     {
         'course_id': <int>,
         'schedule_id': <str> (optional),
-        'session_id': <str> (unique session identifier)
+        'session_id': <str> (unique session identifier),
+        'auto_record': <bool> (optional; record matches server-side, see biometric_autorecord.py)
     }
     
     Returns:
     {
         'success': True/False,
         'message': 'Detection started' or error message,
-        'session_id': session identifier
+        'session_id': session identifier,
+        'auto_record': whether server-side recording is armed
     }
     """
     try:
@@ -16372,6 +15896,7 @@ def instructor_start_biometric_detection_view(request):
         # Enable fingerprint detection on ESP32 via MQTT
         try:
             from dashboard.mqtt_client import get_mqtt_client
+            from dashboard.biometric_devices import device_topic
             mqtt_client = get_mqtt_client()
             
             if mqtt_client and mqtt_client.is_connected:
@@ -16382,13 +15907,21 @@ def instructor_start_biometric_detection_view(request):
                     'course_id': course.id,
                     'session_id': session_id
                 }
-                mqtt_client.publish('biometric/esp32/detect/request', detection_request, qos=1)
+                mqtt_client.publish(device_topic(data.get('device_id'), 'detect/request'), detection_request, qos=1)
                 logger.info(f"[API] ✓ Fingerprint detection enabled for attendance - Course: {course.code}, Session: {session_id}")
                 
+                from .biometric_autorecord import arm_auto_record, disarm_auto_record
+                auto_record = bool(data.get('auto_record'))
+                if auto_record:
+                    arm_auto_record(course, request.user, session_id, data.get('schedule_id'), device_id=data.get('device_id') or '')
+                else:
+                    disarm_auto_record(course)
+                
                 return JsonResponse({
                     'success': True,
                     'message': 'Fingerprint detection started',
-                    'session_id': session_id
+                    'session_id': session_id,
+                    'auto_record': auto_record
                 })
 
             else:
@@ -16469,6 +16002,7 @@ def instructor_stop_biometric_detection_view(request):
         # Disable fingerprint detection on ESP32 via MQTT
         try:
             from dashboard.mqtt_client import get_mqtt_client
+            from dashboard.biometric_devices import device_topic
             mqtt_client = get_mqtt_client()
             
             if mqtt_client and mqtt_client.is_connected:
@@ -16477,11 +16011,16 @@ def instructor_stop_biometric_detection_view(request):
                     'action': 'stop_detection',
                     'mode': 0  # MODE_IDLE
                 }
-                mqtt_client.publish('biometric/esp32/detect/request', detection_request, qos=1)
+                mqtt_client.publish(device_topic(data.get('device_id'), 'detect/request'), detection_request, qos=1)
                 logger.info(f"[API] ✓ Fingerprint detection disabled - Course: {course.code}")
         except Exception as bridge_error:
             logger.error(f"[API] Error with MQTT during stop: {bridge_error}")
         
+        # The scanner session is over, so is server-side recording for it
+        if course.instructor_id == request.user.id:
+            from .biometric_autorecord import disarm_auto_record
+            disarm_auto_record(course)
+        
         # Always return success (detection is off either way)
         return JsonResponse({
             'success': True,
@@ -16501,6 +16040,56 @@ def instructor_stop_biometric_detection_view(request):
         }, status=500)
 
 
+@login_required
+@require_http_methods(["POST"])
+def instructor_biometric_auto_record_view(request):
+    """
+    Turn server-side recording of fingerprint matches on or off for an open scanner session.
+    While on, matches arriving over MQTT are recorded even if the scanner page is asleep.
+    
+    POST /dashboard/instructor/biometric-auto-record/
+    {
+        'course_id': <int>,
+        'enabled': <bool>,
+        'session_id': <str> (optional),
+        'schedule_id': <str> (optional)
+    }
+    """
+    try:
+        if not request.user.is_teacher:
+            return JsonResponse({'success': False, 'message': 'Only instructors can change auto-record.'}, status=403)
+        
+        data = json.loads(request.body)
+        try:
+            course = Course.objects.get(id=int(data.get('course_id')), instructor=request.user)
+        except (Course.DoesNotExist, TypeError, ValueError):
+            return JsonResponse({'success': False, 'message': 'Course not found'}, status=404)
+        
+        from .biometric_autorecord import arm_auto_record, disarm_auto_record
+        enabled = bool(data.get('enabled'))
+        if enabled:
+            attendance_open = course.attendance_status in ['open', 'automatic'] or CourseSchedule.objects.filter(
+                course=course, attendance_status__in=['open', 'automatic']
+            ).exists()
+            if not attendance_open:
+                return JsonResponse({'success': False, 'message': 'Open attendance before enabling auto-record.'}, status=400)
+            arm_auto_record(course, request.user, data.get('session_id'), data.get('schedule_id'), device_id=data.get('device_id'))
+        else:
+            disarm_auto_record(course)
+        
+        return JsonResponse({
+            'success': True,
+            'auto_record': enabled,
+            'message': 'Auto-record enabled' if enabled else 'Auto-record disabled'
+        })
+    
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        logger.error(f"[AUTO-RECORD] Error toggling auto-record: {str(e)}", exc_info=True)
+        return JsonResponse({'success': False, 'message': f'Error: {str(e)}'}, status=500)
+
+
 # ============================================================================
 # MISSING API ENDPOINTS FOR STUDENT BIOMETRIC ENROLLMENT
 # ============================================================================
@@ -16518,6 +16107,8 @@ def api_student_enrollment_status(request):
                 'message': 'student_id required'
             }, status=400)
         
+        from .enrollment_scheduler import queue_status
+        
         # Check for any active enrollments for this student
         active_enrollments = []
         for enrollment_id, state in _enrollment_states.items():
@@ -16526,7 +16117,8 @@ def api_student_enrollment_status(request):
                     'enrollment_id': enrollment_id,
                     'status': state.get('status'),
                     'progress': state.get('progress'),
-                    'message': state.get('message')
+                    'message': state.get('message'),
+                    **(queue_status(enrollment_id) or {}),
                 })
         
         return JsonResponse({
@@ -16563,6 +16155,12 @@ def api_student_enroll_cancel(request):
             del _enrollment_states[enrollment_id]
             logger.info(f"[ENROLL CANCEL] Deleted enrollment state {enrollment_id}")
         
+        # Leave the enrollment queue / free the sensor held by this student
+        from .enrollment_scheduler import cancel_student_enrollment
+        student = CustomUser.objects.filter(id=student_id).first() if str(student_id).isdigit() else None
+        if student:
+            cancel_student_enrollment(student)
+        
         return JsonResponse({
             'success': True,
             'message': 'Enrollment cancelled',
@@ -16609,7 +16207,10 @@ def api_broadcast_enrollment(request):
         if slot_int is not None:
             payload['slot'] = slot_int
 
-        mqtt_ok = mqtt_client.publish('biometric/esp32/enroll/request', payload)
+        # Confirm goes to the sensor holding the scans for this template
+        from dashboard.biometric_devices import device_topic
+        from dashboard.enrollment_scheduler import device_for_template
+        mqtt_ok = mqtt_client.publish(device_topic(device_for_template(template_id), 'enroll/request'), payload)
         if not mqtt_ok:
             return JsonResponse({'success': False, 'message': 'Failed to publish MQTT message'}, status=502)
         
@@ -507,6 +507,7 @@ def instructor_start_biometric_detection_view(request):
         
         # Enable fingerprint detection on ESP32 via MQTT
         from dashboard.mqtt_client import get_mqtt_client
+        from dashboard.biometric_devices import device_topic
         mqtt_client = get_mqtt_client()
         
         if mqtt_client and mqtt_client.is_connected:
@@ -517,7 +518,7 @@ def instructor_start_biometric_detection_view(request):
                 'course_id': course.id,
                 'session_id': session_id
             }
-            mqtt_client.publish('biometric/esp32/detect/request', detection_request, qos=1)
+            mqtt_client.publish(device_topic(data.get('device_id'), 'detect/request'), detection_request, qos=1)
             logger.info(f"[API] ✓ Fingerprint detection enabled for attendance - Course: {course.code}, Session: {session_id}")
             
             return JsonResponse({
@@ -594,6 +595,7 @@ def instructor_stop_biometric_detection_view(request):
         
         # Disable fingerprint detection on ESP32 via MQTT
         from dashboard.mqtt_client import get_mqtt_client
+        from dashboard.biometric_devices import device_topic
         mqtt_client = get_mqtt_client()
         
         if mqtt_client and mqtt_client.is_connected:
@@ -602,7 +604,7 @@ def instructor_stop_biometric_detection_view(request):
                 'action': 'stop_detection',
                 'mode': 0  # MODE_IDLE
             }
-            mqtt_client.publish('biometric/esp32/detect/request', detection_request, qos=1)
+            mqtt_client.publish(device_topic(data.get('device_id'), 'detect/request'), detection_request, qos=1)
             logger.info(f"[API] ✓ Fingerprint detection disabled - Course: {course.code}")
             
             return JsonResponse({
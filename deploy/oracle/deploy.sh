@@ -46,6 +46,9 @@ sudo chown ubuntu:www-data /run
 sudo cp deploy/oracle/gunicorn.service /etc/systemd/system/gunicorn.service
 sudo systemctl daemon-reload
 sudo systemctl enable --now gunicorn
+sudo cp deploy/oracle/attendance-finalizer.service /etc/systemd/system/attendance-finalizer.service
+sudo systemctl daemon-reload
+sudo systemctl enable --now attendance-finalizer
 
 # Nginx
 sudo apt-get update
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 
 try:
     import dj_database_url
@@ -52,6 +53,107 @@ if os.environ.get('CSRF_TRUSTED_ORIGINS'):
 # Can be set via environment variable ESP32_IP, defaults to 192.168.1.9
 ESP32_IP = os.environ.get('ESP32_IP', '192.168.1.9')
 
+# Session QR codes shown by instructors
+# SESSION_QR_SIGNED_TOKENS: encode HMAC-signed rotating tokens instead of the legacy 16-hex codes
+# (legacy codes keep validating either way). Tokens rotate every SESSION_QR_ROTATION_SECONDS and
+# stay valid for SESSION_QR_ROTATION_GRACE_WINDOWS extra windows so screenshots expire quickly.
+SESSION_QR_SIGNED_TOKENS = os.environ.get('SESSION_QR_SIGNED_TOKENS', 'False') == 'True'
+SESSION_QR_ROTATION_SECONDS = int(os.environ.get('SESSION_QR_ROTATION_SECONDS', '30'))
+SESSION_QR_ROTATION_GRACE_WINDOWS = int(os.environ.get('SESSION_QR_ROTATION_GRACE_WINDOWS', '1'))
+
+# Server-side QR decode (camera-assist fallback) runs in a small process pool.
+# Requests beyond QR_DECODE_MAX_PENDING queued frames get a 503 instead of tying up web workers.
+QR_DECODE_MAX_WORKERS = int(os.environ.get('QR_DECODE_MAX_WORKERS', '2'))
+QR_DECODE_MAX_PENDING = int(os.environ.get('QR_DECODE_MAX_PENDING', '8'))
+QR_DECODE_MAX_DIMENSION = int(os.environ.get('QR_DECODE_MAX_DIMENSION', '1024'))
+
+# qr_integrity_check --incremental keeps its last-run watermark here; keep it outside the source tree.
+QR_INTEGRITY_STATE_FILE = os.environ.get('QR_INTEGRITY_STATE_FILE', os.path.join(tempfile.gettempdir(), 'qr_integrity_state.json'))
+
+# Printable QR card exports share one render pool per process; extra concurrent exports get a 503.
+QR_CARD_MAX_WORKERS = int(os.environ.get('QR_CARD_MAX_WORKERS', '2'))
+QR_CARD_MAX_EXPORTS = int(os.environ.get('QR_CARD_MAX_EXPORTS', '2'))
+
+# Fingerprint enrollment progress is shared by all worker processes.
+# ENROLLMENT_STATE_BACKEND: 'cache' (default cache, must be shared e.g. Redis), 'db', or
+# 'auto' (= 'db' while the default cache is process-local LocMem).
+ENROLLMENT_STATE_BACKEND = os.environ.get('ENROLLMENT_STATE_BACKEND', 'auto')
+ENROLLMENT_STATE_TTL = int(os.environ.get('ENROLLMENT_STATE_TTL', '900'))
+ENROLLMENT_STATE_LOCAL_TTL = float(os.environ.get('ENROLLMENT_STATE_LOCAL_TTL', '0.5'))
+
+# Fingerprint detections are an append-only log that pollers read with their own cursor.
+# DETECTION_LOG_BACKEND works like ENROLLMENT_STATE_BACKEND; entries live DETECTION_LOG_TTL seconds.
+DETECTION_LOG_BACKEND = os.environ.get('DETECTION_LOG_BACKEND', 'auto')
+DETECTION_LOG_TTL = int(os.environ.get('DETECTION_LOG_TTL', '60'))
+# Reads wait this long for an append that got its sequence number but is not visible yet
+DETECTION_LOG_SETTLE_SECONDS = int(os.environ.get('DETECTION_LOG_SETTLE_SECONDS', '2'))
+
+# The instructor scanner long-polls instructor/biometric-stream/; each request is held at most
+# BIOMETRIC_STREAM_TIMEOUT seconds. gunicorn runs gthread workers (Procfile, render.yaml, gunicorn.service);
+# at most BIOMETRIC_STREAM_MAX_HELD held requests per process, so keep it below the thread count.
+BIOMETRIC_STREAM_TIMEOUT = int(os.environ.get('BIOMETRIC_STREAM_TIMEOUT', '25'))
+BIOMETRIC_STREAM_MAX_HELD = int(os.environ.get('BIOMETRIC_STREAM_MAX_HELD', '4'))
+
+# The fingerprint slot -> student map is cached per course group in each process; a worker
+# re-checks the group's shared version at most every FINGERPRINT_INDEX_CHECK_INTERVAL seconds.
+FINGERPRINT_INDEX_CHECK_INTERVAL = float(os.environ.get('FINGERPRINT_INDEX_CHECK_INTERVAL', '1.0'))
+
+# Scanner sessions with auto-record on are recorded server-side from MQTT detections,
+# written in micro-batches every BIOMETRIC_AUTO_RECORD_FLUSH_INTERVAL seconds.
+BIOMETRIC_AUTO_RECORD_FLUSH_INTERVAL = float(os.environ.get('BIOMETRIC_AUTO_RECORD_FLUSH_INTERVAL', '0.2'))
+BIOMETRIC_AUTO_RECORD_SESSION_HOURS = int(os.environ.get('BIOMETRIC_AUTO_RECORD_SESSION_HOURS', '6'))
+
+# Fingerprint sensors are registered as BiometricDevice rows (topics biometric/<device_id>/...);
+# without any, the single legacy sensor BIOMETRIC_DEFAULT_DEVICE_ID is used. Enrollments queue
+# FIFO for a free sensor, which is reclaimed after BIOMETRIC_ENROLLMENT_LEASE_SECONDS.
+BIOMETRIC_DEFAULT_DEVICE_ID = os.environ.get('BIOMETRIC_DEFAULT_DEVICE_ID', 'esp32')
+BIOMETRIC_ENROLLMENT_LEASE_SECONDS = int(os.environ.get('BIOMETRIC_ENROLLMENT_LEASE_SECONDS', '300'))
+BIOMETRIC_ENROLLMENT_DEFAULT_SECONDS = int(os.environ.get('BIOMETRIC_ENROLLMENT_DEFAULT_SECONDS', '60'))
+
+# Fingerprint slots are allocated per sensor from BIOMETRIC_SLOT_MIN up to the sensor's capacity
+# (BIOMETRIC_SLOT_CAPACITY until reconcile_fingerprint_slots reads the real one).
+BIOMETRIC_SLOT_MIN = int(os.environ.get('BIOMETRIC_SLOT_MIN', '100'))
+BIOMETRIC_SLOT_CAPACITY = int(os.environ.get('BIOMETRIC_SLOT_CAPACITY', '300'))
+# Slots handed out by the direct enrollment APIs are reserved this long for their registration
+BIOMETRIC_SLOT_RESERVATION_SECONDS = int(os.environ.get('BIOMETRIC_SLOT_RESERVATION_SECONDS', '600'))
+
+# Broker the sensors and the MQTT ingest share (a local broker works for offline setups)
+MQTT_BROKER = os.environ.get('MQTT_BROKER', 'broker.hivemq.com')
+MQTT_PORT = int(os.environ.get('MQTT_PORT', '1883'))
+
+# Only one process holds the MQTT broker connection (the ingest lease, see dashboard/mqtt_ingest.py);
+# the others publish through the database outbox. 'auto': web workers elect the ingest among
+# themselves; 'web': they never connect and `manage.py mqtt_ingest` runs as its own process.
+MQTT_ROLE = os.environ.get('MQTT_ROLE', 'auto')
+MQTT_INGEST_LEASE_SECONDS = int(os.environ.get('MQTT_INGEST_LEASE_SECONDS', '15'))
+# Publishes made while the broker is unreachable are queued in memory (oldest dropped when full)
+# and sent on reconnect unless older than MQTT_PUBLISH_QUEUE_TTL seconds.
+MQTT_PUBLISH_QUEUE_SIZE = int(os.environ.get('MQTT_PUBLISH_QUEUE_SIZE', '200'))
+MQTT_PUBLISH_QUEUE_TTL = int(os.environ.get('MQTT_PUBLISH_QUEUE_TTL', '60'))
+# Inbound MQTT messages are handled by MQTT_WORKER_THREADS workers (ordered per enrollment/sensor),
+# each holding up to MQTT_WORKER_QUEUE_SIZE messages. Overflow: 'block', 'drop_oldest' or 'drop_newest'.
+MQTT_WORKER_THREADS = int(os.environ.get('MQTT_WORKER_THREADS', '4'))
+MQTT_WORKER_QUEUE_SIZE = int(os.environ.get('MQTT_WORKER_QUEUE_SIZE', '500'))
+MQTT_WORKER_OVERFLOW = os.environ.get('MQTT_WORKER_OVERFLOW', 'block')
+
+# Redelivered device messages are dropped by msg_id: the last MQTT_DEDUP_SIZE ids are remembered
+# for MQTT_DEDUP_TTL seconds.
+MQTT_DEDUP_SIZE = int(os.environ.get('MQTT_DEDUP_SIZE', '10000'))
+MQTT_DEDUP_TTL = int(os.environ.get('MQTT_DEDUP_TTL', '600'))
+
+# Sensor telemetry: the ingest keeps DEVICE_TELEMETRY_RING_SIZE recent samples per sensor in memory and
+# writes one DeviceTelemetry row per sensor per DEVICE_TELEMETRY_BUCKET_SECONDS, kept DEVICE_TELEMETRY_RETENTION_DAYS.
+DEVICE_TELEMETRY_RING_SIZE = int(os.environ.get('DEVICE_TELEMETRY_RING_SIZE', '512'))
+DEVICE_TELEMETRY_BUCKET_SECONDS = int(os.environ.get('DEVICE_TELEMETRY_BUCKET_SECONDS', '60'))
+DEVICE_TELEMETRY_RETENTION_DAYS = int(os.environ.get('DEVICE_TELEMETRY_RETENTION_DAYS', '30'))
+DEVICE_HEARTBEAT_GAP_SECONDS = int(os.environ.get('DEVICE_HEARTBEAT_GAP_SECONDS', '90'))
+
+# Attendance finalization (manage.py finalize_attendance): a session is finalized ATTENDANCE_FINALIZE_GRACE_SECONDS
+# after it ends; sessions that ended up to ATTENDANCE_FINALIZE_LOOKBACK_HOURS ago are caught up after downtime.
+ATTENDANCE_FINALIZE_GRACE_SECONDS = int(os.environ.get('ATTENDANCE_FINALIZE_GRACE_SECONDS', '300'))
+ATTENDANCE_FINALIZE_LOOKBACK_HOURS = int(os.environ.get('ATTENDANCE_FINALIZE_LOOKBACK_HOURS', '24'))
+ATTENDANCE_FINALIZE_MAX_SLEEP = int(os.environ.get('ATTENDANCE_FINALIZE_MAX_SLEEP', '60'))
+
 # Add Render and Cloudflare patterns if present
 CSRF_TRUSTED_ORIGINS.extend([
     "https://*.onrender.com",
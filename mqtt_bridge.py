@@ -7,8 +7,9 @@ import paho.mqtt.client as mqtt
 import json
 import logging
 from django.core.management.base import BaseCommand
-from accounts.models import BiometricData
 from django.utils import timezone
+from dashboard.mqtt_codec import decode_payload
+from dashboard.mqtt_dedup import DedupWindow
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +38,7 @@ class MQTTBridge:
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
         self.is_connected = False
+        self.dedup = DedupWindow()  # Broker redeliveries are dropped by msg_id
         
     def on_connect(self, client, userdata, flags, rc):
         """Callback when client connects to MQTT broker"""
@@ -64,22 +66,24 @@ class MQTTBridge:
     def on_message(self, client, userdata, msg):
         """Callback when message is received"""
         topic = msg.topic
-        payload = msg.payload.decode()
+        data, codec = decode_payload(msg.payload)
         
-        logger.info(f"Message received: {topic} -> {payload}")
+        if data is None:
+            logger.error(f"Invalid {codec} payload on {topic} ({len(msg.payload)} bytes)")
+            return
         
-        try:
-            data = json.loads(payload)
-            
-            if topic == TOPIC_ENROLL_RESPONSE:
-                self.handle_enrollment_response(data)
-            elif topic == TOPIC_FINGERPRINT_RESULT:
-                self.handle_fingerprint_detection(data)
-            elif topic == TOPIC_STATUS:
-                self.handle_device_status(data)
-                
-        except json.JSONDecodeError:
-            logger.error(f"Invalid JSON payload: {payload}")
+        logger.info(f"Message received: {topic} ({codec}) -> {data}")
+        
+        if isinstance(data, dict) and self.dedup.is_duplicate('esp32', data.get('msg_id')):
+            logger.info(f"Dropped replayed message {data.get('msg_id')} on {topic}")
+            return
+        
+        if topic == TOPIC_ENROLL_RESPONSE:
+            self.handle_enrollment_response(data)
+        elif topic == TOPIC_FINGERPRINT_RESULT:
+            self.handle_fingerprint_detection(data)
+        elif topic == TOPIC_STATUS:
+            self.handle_device_status(data)
     
     def connect(self):
         """Connect to MQTT broker"""
@@ -211,61 +215,74 @@ class MQTTBridge:
             state = _enrollment_states[enrollment_id]
             logger.info(f"[MQTT] ✓ Updating enrollment {enrollment_id}: status={status}, step={step}")
             
+            # Collect every change and write it with one update() call: one atomic store
+            # write per message, so no reader sees half of it (nested values such as the
+            # scans list are only written back when assigned, see EnrollmentState)
+            fields = {}
             if status == "progress":
                 # Update progress for current scan
                 logger.info(f"[MQTT] ✓ SCAN {step}/3 progress received")
-                state['status'] = 'processing'
-                state['current_scan'] = step
-                state['progress'] = (step / 3) * 100  # Calculate progress percentage
-                state['message'] = message
-                state['last_scan_quality'] = quality
-                state['success'] = success
-                state['fingerprint_slot'] = slot
-                state['template_id'] = template_id  # Always update with actual template_id from ESP32
+                fields = {
+                    'status': 'processing',
+                    'current_scan': step,
+                    'progress': (step / 3) * 100,  # Calculate progress percentage
+                    'message': message,
+                    'last_scan_quality': quality,
+                    'success': success,
+                    'fingerprint_slot': slot,
+                    'template_id': template_id,  # Always update with actual template_id from ESP32
+                }
                 
                 # Add to scans list if not already there
-                existing_scans = [s['step'] for s in state.get('scans', [])]
-                if step not in existing_scans:
-                    state['scans'].append({
+                scans = list(state.get('scans') or [])
+                if step not in [s['step'] for s in scans]:
+                    scans.append({
                         'step': step,
                         'message': message,
                         'quality': quality,
                         'timestamp': timezone.now().isoformat()
                     })
-                    logger.info(f"[MQTT] ✓ Added scan {step} to history. Total scans: {len(state['scans'])}")
+                    fields['scans'] = scans
+                    logger.info(f"[MQTT] ✓ Added scan {step} to history. Total scans: {len(scans)}")
                 else:
                     logger.info(f"[MQTT] ⓘ Scan {step} already recorded")
                 
             elif status == "ready_for_confirmation":
                 # All scans complete, waiting for user confirmation
                 logger.info(f"[MQTT] ✓ All scans ready - awaiting user confirmation")
-                state['status'] = 'ready_for_confirmation'
-                state['current_scan'] = 3
-                state['progress'] = 100
-                state['message'] = message
-                state['fingerprint_slot'] = slot
-                state['template_id'] = template_id
+                fields = {
+                    'status': 'ready_for_confirmation',
+                    'current_scan': 3,
+                    'progress': 100,
+                    'message': message,
+                    'fingerprint_slot': slot,
+                    'template_id': template_id,
+                }
                 
             elif status == "capture_failed":
                 # Low quality scan, user needs to retry
                 logger.warning(f"[MQTT] ⚠ Scan {step} REJECTED - quality too low")
-                state['status'] = 'processing'
-                state['message'] = f"Scan {step} rejected: {message}"
-                state['last_scan_quality'] = quality
-                state['capture_failed'] = True
-                state['current_scan'] = step - 1  # Go back to previous scan
-                state['progress'] = ((step - 1) / 3) * 100
+                fields = {
+                    'status': 'processing',
+                    'message': f"Scan {step} rejected: {message}",
+                    'last_scan_quality': quality,
+                    'capture_failed': True,
+                    'current_scan': step - 1,  # Go back to previous scan
+                    'progress': ((step - 1) / 3) * 100,
+                }
                 
             elif status == "success":
                 # Model successfully created and stored
                 logger.info(f"[MQTT] ✓ Fingerprint model stored in slot {slot}")
-                state['status'] = 'completed'
-                state['current_scan'] = 3
-                state['progress'] = 100
-                state['message'] = message
-                state['fingerprint_id'] = slot  # Store the slot number as fingerprint ID
-                state['fingerprint_slot'] = slot
-                state['template_id'] = template_id
+                fields = {
+                    'status': 'completed',
+                    'current_scan': 3,
+                    'progress': 100,
+                    'message': message,
+                    'fingerprint_id': slot,  # Store the slot number as fingerprint ID
+                    'fingerprint_slot': slot,
+                    'template_id': template_id,
+                }
                 
                 # Update database
                 try:
@@ -284,9 +301,10 @@ class MQTTBridge:
             elif status == "error":
                 # Enrollment failed
                 logger.error(f"[MQTT] ✗ Enrollment error: {message}")
-                state['status'] = 'failed'
-                state['message'] = message
-                state['error'] = message
+                fields = {'status': 'failed', 'message': message, 'error': message}
+            
+            if fields:
+                state.update(fields)
         else:
             logger.error(f"[MQTT] ✗ CRITICAL: No matching enrollment found!")
             logger.error(f"[MQTT] template_id={template_id}, enrollment_id={enrollment_id}")
@@ -312,6 +330,10 @@ class MQTTBridge:
         
         logger.info(f"Device status: {device_id} -> {status} "
                    f"(fingerprints: {fingerprints_stored})")
+        
+        # This bridge only listens on the default sensor's topics
+        from dashboard.device_telemetry import record_status
+        record_status('esp32', data)
 
 
 # Global MQTT bridge instance
@@ -14,7 +14,7 @@ String mqtt_client_id;
 
 // ==================== WIFI SETTINGS (CONFIGURABLE) ====================
 // IMPORTANT: WiFi credentials can be changed via MQTT command
-// Topics: biometric/esp32/command with {"command":"set_wifi","ssid":"...","password":"..."}
+// Topics: biometric/<DEVICE_ID>/command with {"command":"set_wifi","ssid":"...","password":"..."}
 // 
 // For cross-network support:
 // 1. Primary: Use below credentials for your main network
@@ -35,15 +35,25 @@ String current_password = "Blake_2018";  // Change this to your password
 // IPAddress subnet(255, 255, 255, 0);
 
 // ==================== MQTT TOPICS ====================
-// These topics allow communication from any device/network
-const char* topic_enroll_request = "biometric/esp32/enroll/request";     // Receive enrollment requests
-const char* topic_enroll_response = "biometric/esp32/enroll/response";   // Send enrollment status
-const char* topic_scan_ack = "biometric/esp32/scan/acknowledged";        // Receive scan acknowledgment from frontend
-const char* topic_detect_request = "biometric/esp32/detect/request";     // Enable/disable detection mode
-const char* topic_detect_response = "biometric/esp32/detect/response";   // Send detection results
-const char* topic_status = "biometric/esp32/status";                     // Device status
-const char* topic_command = "biometric/esp32/command";                   // General commands
-const char* topic_fingerprint_result = "biometric/esp32/fingerprint";    // Fingerprint data
+// These topics allow communication from any device/network.
+// Every sensor uses its own namespace biometric/<DEVICE_ID>/...; register the same id as a
+// Biometric Device in Django admin. Build extra sensors with e.g. -DDEVICE_ID=\"lab2\".
+#ifndef DEVICE_ID
+#define DEVICE_ID "esp32"
+#endif
+#define TOPIC_PREFIX "biometric/" DEVICE_ID
+
+const char* topic_enroll_request = TOPIC_PREFIX "/enroll/request";         // Receive enrollment requests
+const char* topic_enroll_response = TOPIC_PREFIX "/enroll/response";       // Send enrollment status
+const char* topic_enroll_completion = TOPIC_PREFIX "/enroll/completion";   // Receive enrollment_saved from Django
+const char* topic_scan_ack = TOPIC_PREFIX "/scan/acknowledged";            // Receive scan acknowledgment from frontend
+const char* topic_detect_request = TOPIC_PREFIX "/detect/request";         // Enable/disable detection mode
+const char* topic_detect_response = TOPIC_PREFIX "/detect/response";       // Send detection results
+const char* topic_status = TOPIC_PREFIX "/status";                         // Device status
+const char* topic_command = TOPIC_PREFIX "/command";                       // General commands
+const char* topic_fingerprint_result = TOPIC_PREFIX "/fingerprint";        // Fingerprint data
+const char* topic_config = TOPIC_PREFIX "/config";                         // Retained settings from Django (payload codec)
+const char* topic_templates = TOPIC_PREFIX "/templates";                   // Template table report (slot reconciliation)
 
 // ==================== FINGERPRINT SETUP ====================
 HardwareSerial fingerSerial(2);
@@ -60,6 +70,9 @@ bool enrollmentInProgress = false;
 bool enrollmentCancelled = false;
 bool enrollmentConfirmed = false;  // Flag for when user clicks "Confirm & Save"
 int detectionMode = 0;  // 0=disabled, 1=registration, 2=attendance
+bool compactPayloads = false;  // Detections as compact binary frames (dashboard/mqtt_codec.py) instead of JSON
+uint32_t bootId = 0;           // Random per power-up; msg_id = "<bootId hex>-<msgSeq>" (dashboard/mqtt_dedup.py)
+uint32_t msgSeq = 0;
 unsigned long lastStatusPublish = 0;
 const unsigned long STATUS_PUBLISH_INTERVAL = 30000;  // Publish status every 30 seconds
 
@@ -77,10 +90,14 @@ void handleCommand(JsonDocument& doc);
 void enrollFingerprint();
 void attendanceScanning();
 void publishFingerprintDetection(int fingerprintID, int confidence);
+void handleConfig(JsonDocument& doc);
+bool publishCompactDetection(int fingerprintID, int confidence, const char* mode, uint8_t matchType);
+bool publishMessage(const char* topic, const String& json);
 
 // ==================== SETUP ====================
 void setup() {
   Serial.begin(115200);
+  bootId = esp_random();
   delay(500);
   
   Serial.println("\n========== ESP32 Biometric System ==========");
@@ -100,6 +117,7 @@ void setup() {
   client.setCallback(callback);
   client.setKeepAlive(60);
   client.setSocketTimeout(15);
+  client.setBufferSize(512);  // Template bitmaps of a 1000-slot sensor are ~250 hex chars
   
   Serial.println("✓ Setup complete!\n");
 }
@@ -218,12 +236,14 @@ void reconnect() {
       bool s1 = client.subscribe(topic_enroll_request, 1);
       bool s2 = client.subscribe(topic_detect_request, 1);
       bool s3 = client.subscribe(topic_command, 1);
-      bool s4 = client.subscribe("biometric/esp32/enroll/completion", 1);
+      bool s4 = client.subscribe(topic_enroll_completion, 1);
+      bool s5 = client.subscribe(topic_config, 1);
 
       Serial.println(String("[MQTT] Subscribed enroll/request: ") + (s1 ? "OK" : "FAIL"));
       Serial.println(String("[MQTT] Subscribed detect/request: ") + (s2 ? "OK" : "FAIL"));
       Serial.println(String("[MQTT] Subscribed command: ") + (s3 ? "OK" : "FAIL"));
       Serial.println(String("[MQTT] Subscribed enroll/completion: ") + (s4 ? "OK" : "FAIL"));
+      Serial.println(String("[MQTT] Subscribed config: ") + (s5 ? "OK" : "FAIL"));
 
       // NOTE: Do not subscribe to topic_enroll_response; ESP32 publishes to it and would receive its own messages.
       return;
@@ -256,7 +276,7 @@ void callback(char* topic, byte* payload, unsigned int length) {
   Serial.println("Payload: " + message);
   
   // Parse JSON
-  StaticJsonDocument<256> doc;
+  StaticJsonDocument<512> doc;
   DeserializationError error = deserializeJson(doc, message);
   
   if (error) {
@@ -270,12 +290,14 @@ void callback(char* topic, byte* payload, unsigned int length) {
     handleEnrollmentRequest(doc);
   } else if (strcmp(topic, topic_enroll_response) == 0) {
     handleEnrollmentResponse(doc);  // Handle completion messages from Django
-  } else if (strcmp(topic, "biometric/esp32/enroll/completion") == 0) {
+  } else if (strcmp(topic, topic_enroll_completion) == 0) {
     handleEnrollmentCompletion(doc);  // Handle enrollment_saved from Django
   } else if (strcmp(topic, topic_detect_request) == 0) {
     handleDetectionRequest(doc);
   } else if (strcmp(topic, topic_command) == 0) {
     handleCommand(doc);
+  } else if (strcmp(topic, topic_config) == 0) {
+    handleConfig(doc);
   } else {
     Serial.print("[CALLBACK] Unknown topic: ");
     Serial.println(topic);
@@ -314,7 +336,7 @@ void handleEnrollmentRequest(JsonDocument& doc) {
       response["template_id"] = enrollmentTemplateID;
       String jsonStr;
       serializeJson(response, jsonStr);
-      client.publish(topic_enroll_response, jsonStr.c_str());
+      publishMessage(topic_enroll_response, jsonStr);
       client.loop();
       return;
     }
@@ -331,7 +353,7 @@ void handleEnrollmentRequest(JsonDocument& doc) {
       response["template_id"] = template_id;
       String jsonStr;
       serializeJson(response, jsonStr);
-      client.publish(topic_enroll_response, jsonStr.c_str());
+      publishMessage(topic_enroll_response, jsonStr);
       return;
     }
     
@@ -352,7 +374,7 @@ void handleEnrollmentRequest(JsonDocument& doc) {
     response["template_id"] = enrollmentTemplateID;
     String jsonStr;
     serializeJson(response, jsonStr);
-    client.publish(topic_enroll_response, jsonStr.c_str());
+    publishMessage(topic_enroll_response, jsonStr);
     client.loop();
     
     Serial.println("Enrollment started for slot " + String(enrollID));
@@ -375,7 +397,7 @@ void handleEnrollmentRequest(JsonDocument& doc) {
     response["template_id"] = enrollmentTemplateID;
     String jsonStr;
     serializeJson(response, jsonStr);
-    client.publish(topic_enroll_response, jsonStr.c_str());
+    publishMessage(topic_enroll_response, jsonStr);
     
     Serial.println("Enrollment cancelled!");
   }
@@ -561,7 +583,7 @@ void handleCommand(JsonDocument& doc) {
         response["ip"] = WiFi.localIP().toString();
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_status, jsonStr.c_str());
+        publishMessage(topic_status, jsonStr);
       } else {
         Serial.println("[WIFI] ✗ Failed to connect to new network");
         Serial.println("========================================\n");
@@ -573,7 +595,7 @@ void handleCommand(JsonDocument& doc) {
         response["ssid"] = newSSID;
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_status, jsonStr.c_str());
+        publishMessage(topic_status, jsonStr);
       }
     } else {
       Serial.println("[WIFI] ✗ SSID not provided");
@@ -586,7 +608,7 @@ void handleCommand(JsonDocument& doc) {
     response["stored"] = finger.templateCount;
     String jsonStr;
     serializeJson(response, jsonStr);
-    client.publish(topic_status, jsonStr.c_str());
+    publishMessage(topic_status, jsonStr);
   }
   else if (cmd == "test_sensor") {
     Serial.println("\n=== SENSOR TEST MODE ===");
@@ -621,7 +643,60 @@ void handleCommand(JsonDocument& doc) {
     response["test_complete"] = true;
     String jsonStr;
     serializeJson(response, jsonStr);
-    client.publish(topic_status, jsonStr.c_str());
+    publishMessage(topic_status, jsonStr);
+  }
+  else if (cmd == "list_templates") {
+    // One reply with the whole template table: bit n of the bitmap (byte n/8, LSB first) = slot n stored
+    uint16_t capacity = finger.capacity ? finger.capacity : 300;
+    size_t bytesLen = capacity / 8 + 1;
+    uint8_t* bits = (uint8_t*)calloc(bytesLen, 1);
+    if (!bits) return;
+    for (uint16_t slot = 1; slot <= capacity; slot++) {
+      if (finger.loadModel(slot) == FINGERPRINT_OK) {
+        bits[slot / 8] |= (1 << (slot % 8));
+      }
+    }
+    String hex;
+    hex.reserve(bytesLen * 2);
+    const char* digits = "0123456789abcdef";
+    for (size_t i = 0; i < bytesLen; i++) {
+      hex += digits[bits[i] >> 4];
+      hex += digits[bits[i] & 0x0F];
+    }
+    free(bits);
+
+    DynamicJsonDocument response(bytesLen * 2 + 128);
+    response["command"] = "list_templates";
+    response["capacity"] = capacity;
+    response["bitmap"] = hex;
+    String jsonStr;
+    serializeJson(response, jsonStr);
+    client.publish(topic_templates, jsonStr.c_str());
+    Serial.println("[SLOTS] Template table reported");
+  }
+  else if (cmd == "delete_templates") {
+    // Same bitmap layout as list_templates; sent by Django's slot allocator
+    String hex = doc["bitmap"] | "";
+    int deleted = 0;
+    for (unsigned int i = 0; i + 1 < hex.length(); i += 2) {
+      uint8_t value = (uint8_t)strtoul(hex.substring(i, i + 2).c_str(), nullptr, 16);
+      for (uint8_t bit = 0; bit < 8; bit++) {
+        if (value & (1 << bit)) {
+          uint16_t slot = (i / 2) * 8 + bit;
+          if (slot > 0 && finger.deleteModel(slot) == FINGERPRINT_OK) {
+            deleted++;
+          }
+        }
+      }
+    }
+    StaticJsonDocument<128> response;
+    response["command"] = "delete_templates";
+    response["status"] = "success";
+    response["deleted"] = deleted;
+    String jsonStr;
+    serializeJson(response, jsonStr);
+    publishMessage(topic_status, jsonStr);
+    Serial.println("[SLOTS] Deleted " + String(deleted) + " template(s)");
   }
   else if (cmd == "clear_all") {
     Serial.println("Clear all fingerprints command received!");
@@ -633,7 +708,7 @@ void handleCommand(JsonDocument& doc) {
     response["status"] = "success";
     String jsonStr;
     serializeJson(response, jsonStr);
-    client.publish(topic_status, jsonStr.c_str());
+    publishMessage(topic_status, jsonStr);
   }
 }
 
@@ -728,7 +803,7 @@ void attendanceScanning() {
 
             String jsonStr;
             serializeJson(doc, jsonStr);
-            client.publish(topic_fingerprint_result, jsonStr.c_str());
+            publishMessage(topic_fingerprint_result, jsonStr);
             Serial.println("Hint published to Django: " + jsonStr);
             lastHintMs = millis();
           }
@@ -753,7 +828,7 @@ void attendanceScanning() {
 
             String jsonStr;
             serializeJson(doc, jsonStr);
-            client.publish(topic_fingerprint_result, jsonStr.c_str());
+            publishMessage(topic_fingerprint_result, jsonStr);
             Serial.println("Hint published to Django: " + jsonStr);
             lastHintMs = millis();
           }
@@ -835,7 +910,7 @@ void attendanceScanning() {
 
                 String jsonStr;
                 serializeJson(doc, jsonStr);
-                client.publish(topic_fingerprint_result, jsonStr.c_str());
+                publishMessage(topic_fingerprint_result, jsonStr);
                 Serial.println("Hint published to Django: " + jsonStr);
                 lastHintMs = millis();
               }
@@ -855,18 +930,23 @@ void attendanceScanning() {
 
         // Publish the matched fingerprint slot to Django
         // Django will look up which student has this fingerprint_id
-        StaticJsonDocument<256> doc;
-        doc["fingerprint_id"] = fingerprintID;
-        doc["confidence"] = confidence;
-        doc["timestamp"] = millis();
-        doc["mode"] = "attendance";
-        doc["match_type"] = "hardware";  // Indicate this is hardware-matched (accurate)
+        if (compactPayloads) {
+          publishCompactDetection(fingerprintID, confidence, "attendance", 1);
+          Serial.println("Match published to Django (stable, compact): ID " + String(fingerprintID));
+        } else {
+          StaticJsonDocument<256> doc;
+          doc["fingerprint_id"] = fingerprintID;
+          doc["confidence"] = confidence;
+          doc["timestamp"] = millis();
+          doc["mode"] = "attendance";
+          doc["match_type"] = "hardware";  // Indicate this is hardware-matched (accurate)
 
-        String jsonStr;
-        serializeJson(doc, jsonStr);
+          String jsonStr;
+          serializeJson(doc, jsonStr);
 
-        client.publish(topic_fingerprint_result, jsonStr.c_str());
-        Serial.println("Match published to Django (stable): " + jsonStr);
+          publishMessage(topic_fingerprint_result, jsonStr);
+          Serial.println("Match published to Django (stable): " + jsonStr);
+        }
 
         lastPublishMs = millis();
         requireFingerRemoval = true;
@@ -883,17 +963,22 @@ void attendanceScanning() {
         // Publish an explicit "unregistered" event so the frontend can show a warning.
         // Use fingerprint_id=-1 as the sentinel value.
         if (millis() - lastPublishMs >= MIN_PUBLISH_INTERVAL) {
-          StaticJsonDocument<256> doc;
-          doc["fingerprint_id"] = -1;
-          doc["confidence"] = 0;
-          doc["timestamp"] = millis();
-          doc["mode"] = "attendance";
-          doc["match_type"] = "hardware";
+          if (compactPayloads) {
+            publishCompactDetection(-1, 0, "attendance", 1);
+            Serial.println("Unregistered published to Django (compact)");
+          } else {
+            StaticJsonDocument<256> doc;
+            doc["fingerprint_id"] = -1;
+            doc["confidence"] = 0;
+            doc["timestamp"] = millis();
+            doc["mode"] = "attendance";
+            doc["match_type"] = "hardware";
 
-          String jsonStr;
-          serializeJson(doc, jsonStr);
-          client.publish(topic_fingerprint_result, jsonStr.c_str());
-          Serial.println("Unregistered published to Django: " + jsonStr);
+            String jsonStr;
+            serializeJson(doc, jsonStr);
+            publishMessage(topic_fingerprint_result, jsonStr);
+            Serial.println("Unregistered published to Django: " + jsonStr);
+          }
 
           lastPublishMs = millis();
           requireFingerRemoval = true;
@@ -916,7 +1001,7 @@ void attendanceScanning() {
 
           String jsonStr;
           serializeJson(doc, jsonStr);
-          client.publish(topic_fingerprint_result, jsonStr.c_str());
+          publishMessage(topic_fingerprint_result, jsonStr);
           Serial.println("Hint published to Django: " + jsonStr);
           lastHintMs = millis();
         }
@@ -940,7 +1025,7 @@ void attendanceScanning() {
 
         String jsonStr;
         serializeJson(doc, jsonStr);
-        client.publish(topic_fingerprint_result, jsonStr.c_str());
+        publishMessage(topic_fingerprint_result, jsonStr);
         Serial.println("Hint published to Django: " + jsonStr);
         lastHintMs = millis();
       }
@@ -964,7 +1049,7 @@ void attendanceScanning() {
 
       String jsonStr;
       serializeJson(doc, jsonStr);
-      client.publish(topic_fingerprint_result, jsonStr.c_str());
+      publishMessage(topic_fingerprint_result, jsonStr);
       Serial.println("Hint published to Django: " + jsonStr);
       lastHintMs = millis();
     }
@@ -986,7 +1071,7 @@ void publishStatus() {
   
   String jsonStr;
   serializeJson(doc, jsonStr);
-  client.publish(topic_status, jsonStr.c_str());
+  publishMessage(topic_status, jsonStr);
   
   Serial.println("Status published: " + jsonStr);
 }
@@ -1113,7 +1198,7 @@ void enrollFingerprint() {
         response["step"] = 1;
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
         
         // Reset scan - go back to waiting for scan 1
@@ -1146,7 +1231,7 @@ void enrollFingerprint() {
       serializeJson(response, jsonStr);
       Serial.println("[MQTT PUBLISH] Sending scan 1/3 progress to frontend...");
       Serial.println("[MQTT PAYLOAD] " + jsonStr);
-      client.publish(topic_enroll_response, jsonStr.c_str());
+      publishMessage(topic_enroll_response, jsonStr);
       client.loop();  // Process MQTT immediately after publish
       Serial.println("[MQTT] ✓ Scan 1/3 progress published");
       
@@ -1177,7 +1262,7 @@ void enrollFingerprint() {
         response["slot"] = enrollID;
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();  // Process MQTT immediately
       }
       
@@ -1188,7 +1273,7 @@ void enrollFingerprint() {
         response["message"] = "No finger detected. Enrollment timeout.";
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();  // Process MQTT immediately
         
         Serial.println("\n========================================");
@@ -1254,7 +1339,7 @@ void enrollFingerprint() {
         response["message"] = "Timeout: No fingerprint detected within 30 seconds";
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
         
         enrollmentInProgress = false;
@@ -1325,7 +1410,7 @@ void enrollFingerprint() {
         response["step"] = 2;
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
         
         // Reset scan 2 - go back to waiting for scan 2
@@ -1355,7 +1440,7 @@ void enrollFingerprint() {
       serializeJson(response, jsonStr);
       Serial.println("[MQTT PUBLISH] Sending scan 2/3 progress to frontend...");
       Serial.println("[MQTT PAYLOAD] " + jsonStr);
-      client.publish(topic_enroll_response, jsonStr.c_str());
+      publishMessage(topic_enroll_response, jsonStr);
       client.loop();  // Process MQTT immediately after publish
       Serial.println("[MQTT] ✓ Scan 2/3 progress published");
       
@@ -1385,7 +1470,7 @@ void enrollFingerprint() {
         response["slot"] = enrollID;
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();  // Process MQTT immediately
       }
       
@@ -1401,7 +1486,7 @@ void enrollFingerprint() {
         response["message"] = "Timeout during scan 2";
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
         
         enrollmentInProgress = false;
@@ -1437,7 +1522,7 @@ void enrollFingerprint() {
         response["message"] = "Timeout during scan 2";
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
         
         enrollmentInProgress = false;
@@ -1508,7 +1593,7 @@ void enrollFingerprint() {
         response["step"] = 3;
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
         
         // Reset scan 3 - go back to waiting for scan 3
@@ -1537,7 +1622,7 @@ void enrollFingerprint() {
       serializeJson(scan3_response, scan3_json);
       Serial.println("[MQTT PUBLISH] Sending scan 3/3 complete to frontend...");
       Serial.println("[MQTT PAYLOAD] " + scan3_json);
-      client.publish(topic_enroll_response, scan3_json.c_str());
+      publishMessage(topic_enroll_response, scan3_json);
       client.loop();
       
       // IMPORTANT: Create the fingerprint model NOW (before asking the user to confirm).
@@ -1560,7 +1645,7 @@ void enrollFingerprint() {
         response["slot"] = enrollID;
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
 
         // Reset state for retry
@@ -1599,7 +1684,7 @@ void enrollFingerprint() {
       serializeJson(confirmation_response, confirmation_json);
       Serial.println("[MQTT PUBLISH] Sending ready_for_confirmation to frontend...");
       Serial.println("[MQTT PAYLOAD] " + confirmation_json);
-      client.publish(topic_enroll_response, confirmation_json.c_str());
+      publishMessage(topic_enroll_response, confirmation_json);
       client.loop();
       Serial.println("[MQTT] ✓ Ready for confirmation message published and processed\n");
       
@@ -1628,7 +1713,7 @@ void enrollFingerprint() {
         response["slot"] = enrollID;
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();  // Process MQTT immediately
       }
       
@@ -1644,7 +1729,7 @@ void enrollFingerprint() {
         response["message"] = "Timeout during scan 3";
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
         
         enrollmentInProgress = false;
@@ -1683,7 +1768,7 @@ void enrollFingerprint() {
         response["message"] = "Timeout during scan 3";
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
         
         enrollmentInProgress = false;
@@ -1705,7 +1790,7 @@ void enrollFingerprint() {
         response["slot"] = enrollID;
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
         enrollmentInProgress = false;
         enrollmentConfirmed = false;
@@ -1745,7 +1830,7 @@ void enrollFingerprint() {
           response["success"] = true;
           String jsonStr;
           serializeJson(response, jsonStr);
-          client.publish(topic_enroll_response, jsonStr.c_str());
+          publishMessage(topic_enroll_response, jsonStr);
           client.loop();  // Process MQTT immediately
           
           // Enrollment complete - reset ALL state flags for next user
@@ -1778,7 +1863,7 @@ void enrollFingerprint() {
         response["template_id"] = enrollmentTemplateID;
         String jsonStr;
         serializeJson(response, jsonStr);
-        client.publish(topic_enroll_response, jsonStr.c_str());
+        publishMessage(topic_enroll_response, jsonStr);
         client.loop();
         
         // Reset state for retry
@@ -1804,8 +1889,62 @@ void enrollFingerprint() {
   // If not confirmed yet, just stay in waiting state
 }
 
+// ==================== PAYLOAD CODEC ====================
+// Django sends {"codec": "json" | "compact1"} on the retained config topic (BiometricDevice.payload_codec)
+void handleConfig(JsonDocument& doc) {
+  String codec = doc["codec"] | "json";
+  compactPayloads = (codec == "compact1");
+  Serial.println("[CONFIG] Payload codec: " + codec);
+}
+
+// Publish a JSON message for Django stamped with a msg_id, so broker redeliveries and
+// retries can be recognised and dropped server-side
+bool publishMessage(const char* topic, const String& json) {
+  String msgId = String(bootId, HEX) + "-" + String(++msgSeq);
+  if (!json.startsWith("{")) {
+    return client.publish(topic, json.c_str());
+  }
+  String stamped = String("{\"msg_id\":\"") + msgId + "\"" + (json.length() > 2 ? "," : "") + json.substring(1);
+  return client.publish(topic, stamped.c_str());
+}
+
+// Compact v1 detection frame, big-endian (layout in dashboard/mqtt_codec.py):
+// C1 01 | id:int16 | confidence:uint16 | timestamp:uint32 | mode:uint8 | match_type:uint8 | reason_len:uint8 |
+// boot:uint32 | seq:uint32 (msg_id)
+bool publishCompactDetection(int fingerprintID, int confidence, const char* mode, uint8_t matchType) {
+  uint8_t frame[21];
+  uint16_t id = (uint16_t)(int16_t)fingerprintID;
+  uint16_t conf = (uint16_t)constrain(confidence, 0, 0xFFFF);
+  uint32_t ts = millis();
+  frame[0] = 0xC1;
+  frame[1] = 0x01;
+  frame[2] = id >> 8;
+  frame[3] = id & 0xFF;
+  frame[4] = conf >> 8;
+  frame[5] = conf & 0xFF;
+  frame[6] = (ts >> 24) & 0xFF;
+  frame[7] = (ts >> 16) & 0xFF;
+  frame[8] = (ts >> 8) & 0xFF;
+  frame[9] = ts & 0xFF;
+  frame[10] = (strcmp(mode, "registration") == 0) ? 1 : 0;
+  frame[11] = matchType;  // 0=none, 1=hardware, 2=hint
+  frame[12] = 0;          // No reason text
+  uint32_t seq = ++msgSeq;
+  for (int i = 0; i < 4; i++) {
+    frame[13 + i] = (bootId >> (24 - 8 * i)) & 0xFF;
+    frame[17 + i] = (seq >> (24 - 8 * i)) & 0xFF;
+  }
+  return client.publish(topic_fingerprint_result, frame, sizeof(frame));
+}
+
 // ==================== PUBLISH FINGERPRINT DETECTION ====================
 void publishFingerprintDetection(int fingerprintID, int confidence) {
+  if (compactPayloads) {
+    publishCompactDetection(fingerprintID, confidence, (detectionMode == 1) ? "registration" : "attendance", 0);
+    Serial.println("Fingerprint published (compact): ID " + String(fingerprintID));
+    return;
+  }
+
   StaticJsonDocument<256> doc;
   doc["fingerprint_id"] = fingerprintID;
   doc["confidence"] = confidence;
@@ -1814,7 +1953,7 @@ void publishFingerprintDetection(int fingerprintID, int confidence) {
   
   String jsonStr;
   serializeJson(doc, jsonStr);
-  client.publish(topic_fingerprint_result, jsonStr.c_str());
+  publishMessage(topic_fingerprint_result, jsonStr);
   
   Serial.println("Fingerprint published: " + jsonStr);
 }